@@ -94,6 +94,17 @@ DATABASES = {
     }
 }
 
+# Caché compartida por todos los procesos (catálogo versionado, PDFs de
+# facturas). Con varios servidores, apuntar a Redis/Memcached, p. ej.
+# CACHE_BACKEND=django.core.cache.backends.redis.RedisCache
+# CACHE_LOCATION=redis://127.0.0.1:6379/1
+CACHES = {
+    'default': {
+        'BACKEND': config('CACHE_BACKEND', default='django.core.cache.backends.filebased.FileBasedCache'),
+        'LOCATION': config('CACHE_LOCATION', default=str(BASE_DIR / 'var' / 'cache')),
+    }
+}
+
 # Validaciones de contraseña
 AUTH_PASSWORD_VALIDATORS = [
     {'NAME': 'django.contrib.auth.password_validation.UserAttributeSimilarityValidator'},
@@ -4,9 +4,10 @@ from rest_framework.response import Response
 from .models import Drogueria
 from .serializers import DrogueriaSerializer
 from .permissions import IsOwnerOrAdmin
+from inventario.mixins import EagerLoadingMixin
 
 
-class DrogueriaViewSet(viewsets.ModelViewSet):
+class DrogueriaViewSet(EagerLoadingMixin, viewsets.ModelViewSet):
     queryset = Drogueria.objects.all()
     serializer_class = DrogueriaSerializer
     permission_classes = [IsOwnerOrAdmin]
@@ -0,0 +1,70 @@
+"""Envío de facturas por correo a través de la cola (``mensajes.cola_correo``).
+
+A fin de mes hay que reenviar decenas de facturas; una petición por
+factura generaba y enviaba todo en serie. ``encolar_lote`` encola de una
+vez (``bulk_create``) las facturas de un filtro bajo un id de ``lote``:
+
+- el worker toma los correos por lotes y los envía por una sola conexión
+  SMTP; los PDFs del lote se preparan juntos (``pdf.adjuntos_lote``, en el
+  pool de procesos si faltan en caché)
+- ``correo_enviado`` se marca con un ``UPDATE`` por lote enviado
+  (``pdf.marcar_enviadas``)
+- cada correo lleva la referencia ``factura:<id>``: una factura que ya
+  tiene un correo pendiente no se vuelve a encolar
+- el avance se consulta con ``cola_correo.progreso(lote)``
+"""
+import uuid
+
+from django.conf import settings
+from rest_framework.exceptions import ValidationError
+
+from mensajes import cola_correo
+
+ENVIO_MAX = getattr(settings, 'FACTURACION_ENVIO_LOTE_MAX', 2000)
+
+
+def referencia(factura_id):
+    return f'factura:{factura_id}'
+
+
+def _correo(factura, lote=''):
+    return {
+        'asunto': f'Factura #{factura.id}',
+        'cuerpo': f'Estimado/a {factura.cliente.username},\nAdjuntamos su factura #{factura.id}.',
+        'destinatarios': [factura.cliente.email],
+        'adjuntos': [{'ruta': 'facturacion.pdf.adjunto', 'args': [factura.id], 'preparar': 'facturacion.pdf.adjuntos_lote'}],
+        'al_enviar': {'ruta': 'facturacion.pdf.marcar_enviadas', 'args': [factura.id]},
+        'lote': lote,
+        'referencia': referencia(factura.id),
+    }
+
+
+def encolar(factura):
+    """Encola el correo de una factura (con ``cliente`` cargado) y lo devuelve."""
+    return cola_correo.encolar(**_correo(factura))
+
+
+def encolar_lote(facturas):
+    """Encola un correo por factura de ``facturas`` (queryset). Devuelve el resumen con el id de ``lote``.
+
+    Se omiten las facturas cuyo cliente no tiene correo y las que ya están
+    en la cola. Lanza ``ValidationError`` si el filtro abarca más de
+    ``ENVIO_MAX`` facturas.
+    """
+    filas = list(
+        facturas.select_related('cliente').only('id', 'cliente__username', 'cliente__email').order_by('pk')[:ENVIO_MAX + 1]
+    )
+    if len(filas) > ENVIO_MAX:
+        raise ValidationError({'detail': f'Máximo {ENVIO_MAX} facturas por envío; acota el filtro.'})
+
+    con_correo = [f for f in filas if f.cliente.email]
+    ya_en_cola = cola_correo.en_cola(referencia(f.id) for f in con_correo)
+    nuevas = [f for f in con_correo if referencia(f.id) not in ya_en_cola]
+    lote = uuid.uuid4().hex if nuevas else None
+    cola_correo.encolar_varios([_correo(f, lote) for f in nuevas])
+    return {
+        'lote': lote,
+        'encoladas': len(nuevas),
+        'sin_correo': len(filas) - len(con_correo),
+        'ya_en_cola': len(ya_en_cola),
+    }
@@ -0,0 +1,29 @@
+from datetime import date
+
+from django.core.management.base import BaseCommand, CommandError
+
+from facturacion.ventas import reconstruir
+
+
+def _fecha(valor):
+    try:
+        return date.fromisoformat(valor)
+    except ValueError:
+        raise CommandError(f"Fecha inválida: {valor} (formato AAAA-MM-DD)")
+
+
+class Command(BaseCommand):
+    help = "Recalcula las tablas diarias de ventas desde las facturas (backfill o corrección de un rango)."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--desde', type=_fecha, help="Primer día (AAAA-MM-DD); por defecto la primera factura.")
+        parser.add_argument('--hasta', type=_fecha, help="Último día (AAAA-MM-DD); por defecto la última factura.")
+        parser.add_argument('--lote', type=int, default=31, help="Días recalculados por transacción (por defecto 31).")
+
+    def handle(self, *args, **options):
+        if options['lote'] < 1:
+            raise CommandError("--lote debe ser al menos 1")
+        resultado = reconstruir(options['desde'], options['hasta'], dias=options['lote'])
+        self.stdout.write(self.style.SUCCESS(
+            f"Ventas reconstruidas: {resultado['dias']} días, {resultado['filas']} filas."
+        ))
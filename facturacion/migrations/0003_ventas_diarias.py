@@ -0,0 +1,65 @@
+# Generated by Django 5.2.8 on 2026-10-18 12:56
+
+import django.db.models.deletion
+import django.db.models.functions.comparison
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('droguerias', '0001_initial'),
+        ('facturacion', '0002_initial'),
+        ('inventario', '0015_transferencias'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='VentaDiariaCanal',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('fecha', models.DateField()),
+                ('metodo_pago', models.CharField(max_length=50)),
+                ('facturas', models.IntegerField(default=0)),
+                ('unidades', models.BigIntegerField(default=0)),
+                ('ingresos', models.DecimalField(decimal_places=2, default=0, max_digits=18)),
+                ('empleado', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='ventas_diarias', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'indexes': [models.Index(fields=['fecha'], name='venta_canal_fecha_idx')],
+                'constraints': [models.UniqueConstraint(models.F('fecha'), django.db.models.functions.comparison.Coalesce('empleado', 0), models.F('metodo_pago'), name='unique_venta_dia_canal')],
+            },
+        ),
+        migrations.CreateModel(
+            name='VentaDiariaGrupo',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('fecha', models.DateField()),
+                ('unidades', models.BigIntegerField(default=0)),
+                ('ingresos', models.DecimalField(decimal_places=2, default=0, max_digits=18)),
+                ('lineas', models.IntegerField(default=0)),
+                ('categoria', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='ventas_diarias', to='inventario.categoria')),
+                ('drogueria', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='ventas_diarias', to='droguerias.drogueria')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['fecha'], name='venta_grupo_fecha_idx')],
+                'constraints': [models.UniqueConstraint(models.F('fecha'), django.db.models.functions.comparison.Coalesce('drogueria', 0), django.db.models.functions.comparison.Coalesce('categoria', 0), name='unique_venta_dia_grupo')],
+            },
+        ),
+        migrations.CreateModel(
+            name='VentaDiariaMedicamento',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('fecha', models.DateField()),
+                ('unidades', models.BigIntegerField(default=0)),
+                ('ingresos', models.DecimalField(decimal_places=2, default=0, max_digits=18)),
+                ('lineas', models.IntegerField(default=0)),
+                ('medicamento', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='ventas_diarias', to='inventario.medicamento')),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('fecha', 'medicamento'), name='unique_venta_dia_medicamento')],
+            },
+        ),
+    ]
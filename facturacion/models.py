@@ -1,6 +1,8 @@
 from django.db import models
+from django.db.models.functions import Coalesce
 from usuarios.models import Usuario
-from inventario.models import Medicamento
+from inventario.models import Categoria, Medicamento
+from droguerias.models import Drogueria
 
 class Factura(models.Model):
     cliente = models.ForeignKey(Usuario, on_delete=models.CASCADE, related_name="facturas")
@@ -29,3 +31,68 @@ class DetalleFactura(models.Model):
 
     def __str__(self):
         return f"{self.medicamento.nombre} ({self.cantidad})"
+
+
+# =========================
+# 📈 VENTAS DIARIAS (ROLLUPS)
+# =========================
+# Se mantienen incrementalmente al registrar facturas (ver facturacion/ventas.py)
+# y se reconstruyen con ``manage.py reconstruir_ventas``.
+class VentaDiariaMedicamento(models.Model):
+    """Unidades e ingresos de un medicamento en un día."""
+    fecha = models.DateField()
+    medicamento = models.ForeignKey(Medicamento, on_delete=models.CASCADE, related_name='ventas_diarias')
+    unidades = models.BigIntegerField(default=0)
+    ingresos = models.DecimalField(max_digits=18, decimal_places=2, default=0)
+    lineas = models.IntegerField(default=0)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['fecha', 'medicamento'], name='unique_venta_dia_medicamento'),
+        ]
+
+    def __str__(self):
+        return f"{self.fecha} {self.medicamento_id}: {self.unidades} u."
+
+
+class VentaDiariaGrupo(models.Model):
+    """Unidades e ingresos de un día por droguería y categoría (las del medicamento vendido)."""
+    fecha = models.DateField()
+    drogueria = models.ForeignKey(Drogueria, on_delete=models.CASCADE, null=True, blank=True, related_name='ventas_diarias')
+    categoria = models.ForeignKey(Categoria, on_delete=models.CASCADE, null=True, blank=True, related_name='ventas_diarias')
+    unidades = models.BigIntegerField(default=0)
+    ingresos = models.DecimalField(max_digits=18, decimal_places=2, default=0)
+    lineas = models.IntegerField(default=0)
+
+    class Meta:
+        indexes = [models.Index(fields=['fecha'], name='venta_grupo_fecha_idx')]
+        constraints = [
+            # COALESCE: una sola fila por día para "sin droguería"/"sin categoría"
+            models.UniqueConstraint(
+                'fecha', Coalesce('drogueria', 0), Coalesce('categoria', 0), name='unique_venta_dia_grupo'
+            ),
+        ]
+
+    def __str__(self):
+        return f"{self.fecha} {self.drogueria_id}/{self.categoria_id}: {self.ingresos}"
+
+
+class VentaDiariaCanal(models.Model):
+    """Facturas, unidades e ingresos de un día por empleado y método de pago."""
+    fecha = models.DateField()
+    empleado = models.ForeignKey(Usuario, on_delete=models.CASCADE, null=True, blank=True, related_name='ventas_diarias')
+    metodo_pago = models.CharField(max_length=50)
+    facturas = models.IntegerField(default=0)
+    unidades = models.BigIntegerField(default=0)
+    ingresos = models.DecimalField(max_digits=18, decimal_places=2, default=0)
+
+    class Meta:
+        indexes = [models.Index(fields=['fecha'], name='venta_canal_fecha_idx')]
+        constraints = [
+            models.UniqueConstraint(
+                'fecha', Coalesce('empleado', 0), 'metodo_pago', name='unique_venta_dia_canal'
+            ),
+        ]
+
+    def __str__(self):
+        return f"{self.fecha} {self.empleado_id}/{self.metodo_pago}: {self.ingresos}"
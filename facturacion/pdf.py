@@ -0,0 +1,288 @@
+"""Servicio de PDF de facturas: paginado, cacheado y por lotes.
+
+- ``datos(ids)``: el contenido de las facturas como dicts simples, con dos
+  consultas en total (facturas con cliente; detalles con medicamento)
+- ``renderizar(datos)``: PDF paginado; la cabecera de la tabla se repite en
+  cada página y el pie indica "Página i de n", así las facturas largas ya no
+  se dibujan fuera de la hoja
+- ``pdf_factura(id)``: bytes del PDF, cacheados bajo una huella SHA-256 del
+  contenido: si la factura no cambió, reenviar el correo no vuelve a dibujar
+  nada, y si cambió la clave es otra y la versión vieja caduca sola
+- ``zip_facturas(ids)``: muchos PDFs como ZIP en streaming; los que no
+  están en caché se dibujan en un pool de procesos y se van escribiendo en
+  el orden pedido a medida que terminan
+- ``adjunto``/``adjuntos_lote``/``marcar_enviadas``: enganches con la cola
+  de correo (ver facturacion/correo.py)
+"""
+import hashlib
+import json
+import multiprocessing
+import os
+import threading
+import zipfile
+from concurrent.futures import ProcessPoolExecutor
+from io import BytesIO
+
+from django.conf import settings
+from django.core.cache import cache
+from reportlab.lib.pagesizes import letter
+from reportlab.pdfbase.pdfmetrics import stringWidth
+from reportlab.pdfgen import canvas
+
+LOTE_MAX = getattr(settings, 'FACTURACION_PDF_LOTE_MAX', 500)
+# subir si cambia el dibujo: invalida todos los PDFs cacheados
+VERSION_DIBUJO = 2
+
+_PREFIJO = 'factura_pdf'
+_ANCHO, _ALTO = letter
+_FILA = 20
+_MARGEN_INFERIOR = 60
+# primera fila de la tabla en la primera página (debajo de los datos de la factura) y en las siguientes
+_Y_PRIMERA, _Y_SIGUIENTES = _ALTO - 220, _ALTO - 100
+_FILAS_PRIMERA = int((_Y_PRIMERA - _MARGEN_INFERIOR) // _FILA) + 1
+_FILAS_SIGUIENTES = int((_Y_SIGUIENTES - _MARGEN_INFERIOR) // _FILA) + 1
+_COLUMNAS = ((50, 'Medicamento'), (250, 'Cantidad'), (350, 'Precio Unitario'), (470, 'Subtotal'))
+
+
+def _config(nombre, defecto):
+    return getattr(settings, f'FACTURACION_PDF_{nombre}', defecto)
+
+
+class _Contadores:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def sumar(self, campo, n=1):
+        with self._lock:
+            setattr(self, campo, getattr(self, campo) + n)
+
+    def info(self):
+        with self._lock:
+            return {'hits': self.hits, 'misses': self.misses}
+
+
+contadores = _Contadores()
+
+
+# =========================
+# Contenido
+# =========================
+def datos(ids):
+    """``{id: dict}`` con lo que se imprime de cada factura (sin modelos: se puede enviar a otro proceso)."""
+    from django.db.models import Prefetch
+    from .models import DetalleFactura, Factura
+
+    detalles = DetalleFactura.objects.select_related('medicamento').only(
+        'factura_id', 'cantidad', 'precio_unitario', 'subtotal', 'medicamento__nombre'
+    ).order_by('pk')
+    facturas = Factura.objects.filter(pk__in=ids).select_related('cliente').prefetch_related(
+        Prefetch('detalles', queryset=detalles)
+    )
+    return {
+        f.pk: {
+            'id': f.pk,
+            'cliente': f.cliente.nombre_completo or f.cliente.username,
+            'fecha': f.fecha_emision.strftime('%Y-%m-%d %H:%M:%S'),
+            'metodo_pago': f.metodo_pago,
+            'direccion_entrega': f.direccion_entrega or '',
+            'observaciones': f.observaciones or 'N/A',
+            'total': f'{f.total:.2f}',
+            'lineas': [
+                [d.medicamento.nombre, d.cantidad, f'{d.precio_unitario:.2f}', f'{d.subtotal:.2f}']
+                for d in f.detalles.all()
+            ],
+        }
+        for f in facturas
+    }
+
+
+def huella(contenido):
+    texto = json.dumps([VERSION_DIBUJO, contenido], sort_keys=True, ensure_ascii=False)
+    return hashlib.sha256(texto.encode('utf-8')).hexdigest()
+
+
+def _clave(contenido):
+    return f'{_PREFIJO}:{huella(contenido)}'
+
+
+# =========================
+# Dibujo
+# =========================
+def _paginas(lineas):
+    """Reparte las líneas por página; el total necesita dos filas libres en la última."""
+    paginas, resto, capacidad = [], list(lineas), _FILAS_PRIMERA
+    while True:
+        paginas.append(resto[:capacidad])
+        resto = resto[capacidad:]
+        if not resto:
+            break
+        capacidad = _FILAS_SIGUIENTES
+    if len(paginas[-1]) + 2 > capacidad:
+        paginas.append([])
+    return paginas
+
+
+def _recortar(texto, ancho, fuente='Helvetica', tamano=12):
+    """Recorta ``texto`` para que quepa en ``ancho`` puntos (los nombres largos pisaban la columna siguiente)."""
+    texto = str(texto)
+    if stringWidth(texto, fuente, tamano) <= ancho:
+        return texto
+    while texto and stringWidth(texto + '…', fuente, tamano) > ancho:
+        texto = texto[:-1]
+    return texto + '…'
+
+
+def _cabecera_tabla(c, y):
+    c.setFont('Helvetica-Bold', 12)
+    for x, titulo in _COLUMNAS:
+        c.drawString(x, y, titulo)
+    c.setFont('Helvetica', 12)
+
+
+def renderizar(contenido):
+    """Bytes del PDF de una factura (``contenido`` como lo devuelve ``datos``)."""
+    buffer = BytesIO()
+    # invariant: mismo contenido, mismos bytes (sin fecha de creación ni id aleatorio)
+    c = canvas.Canvas(buffer, pagesize=letter, invariant=1)
+    paginas = _paginas(contenido['lineas'])
+
+    for n, lineas in enumerate(paginas, start=1):
+        if n == 1:
+            c.setFont('Helvetica-Bold', 16)
+            c.drawString(50, _ALTO - 50, f"Factura #{contenido['id']}")
+            c.setFont('Helvetica', 12)
+            c.drawString(50, _ALTO - 80, _recortar(f"Cliente: {contenido['cliente']}", 500))
+            c.drawString(50, _ALTO - 100, f"Fecha: {contenido['fecha']}")
+            c.drawString(50, _ALTO - 120, f"Método de pago: {contenido['metodo_pago']}")
+            c.drawString(50, _ALTO - 140, _recortar(f"Dirección de entrega: {contenido['direccion_entrega']}", 500))
+            c.drawString(50, _ALTO - 160, _recortar(f"Observaciones: {contenido['observaciones']}", 500))
+            y = _Y_PRIMERA
+        else:
+            c.setFont('Helvetica-Bold', 14)
+            c.drawString(50, _ALTO - 50, f"Factura #{contenido['id']} (continuación)")
+            y = _Y_SIGUIENTES
+        _cabecera_tabla(c, y + _FILA)
+
+        for nombre, cantidad, precio, subtotal in lineas:
+            c.drawString(50, y, _recortar(nombre, 190))
+            c.drawString(250, y, str(cantidad))
+            c.drawString(350, y, precio)
+            c.drawString(470, y, subtotal)
+            y -= _FILA
+
+        if n == len(paginas):
+            c.setFont('Helvetica-Bold', 12)
+            c.drawString(50, y - 10, f"Total: {contenido['total']}")
+        c.setFont('Helvetica', 9)
+        c.drawRightString(_ANCHO - 50, 30, f"Página {n} de {len(paginas)}")
+        c.showPage()
+
+    c.save()
+    return buffer.getvalue()
+
+
+# =========================
+# Caché
+# =========================
+def pdf_factura(factura_id):
+    """PDF de una factura, desde caché si su contenido no cambió. ``None`` si no existe."""
+    contenido = datos([factura_id]).get(factura_id)
+    if contenido is None:
+        return None
+    clave = _clave(contenido)
+    pdf = cache.get(clave)
+    if pdf is not None:
+        contadores.sumar('hits')
+        return pdf
+    contadores.sumar('misses')
+    pdf = renderizar(contenido)
+    cache.set(clave, pdf, _config('CACHE_TIMEOUT', 24 * 3600))
+    return pdf
+
+
+def adjunto(factura_id):
+    """``(nombre, bytes, mime)`` para adjuntar la factura a un correo de la cola (``mensajes.cola_correo``)."""
+    return f'factura_{factura_id}.pdf', pdf_factura(factura_id), 'application/pdf'
+
+
+def adjuntos_lote(args):
+    """Preparación de ``adjunto`` para un lote de la cola: todos los PDFs de una vez (en paralelo si faltan muchos)."""
+    return {(factura_id,): (f'factura_{factura_id}.pdf', pdf, 'application/pdf') for factura_id, pdf in pdfs([a[0] for a in args])}
+
+
+def marcar_enviadas(args):
+    """Acción ``al_enviar`` de la cola de correo: ``args`` = ``[[factura_id], ...]`` de los enviados."""
+    from .models import Factura
+    Factura.objects.filter(pk__in=[a[0] for a in args]).update(correo_enviado=True)
+
+
+def _procesos():
+    return max(1, _config('PROCESOS', min(4, os.cpu_count() or 1)))
+
+
+def _renderizar_varios(contenidos):
+    """Dibuja ``contenidos`` en orden; con suficientes se reparten en un pool de procesos."""
+    procesos = _procesos()
+    if procesos == 1 or len(contenidos) < _config('MIN_POOL', 8):
+        yield from map(renderizar, contenidos)
+        return
+    # spawn: el proceso web tiene hilos y conexiones abiertas que no deben heredarse con fork
+    with ProcessPoolExecutor(max_workers=procesos, mp_context=multiprocessing.get_context('spawn')) as pool:
+        yield from pool.map(renderizar, contenidos, chunksize=max(1, len(contenidos) // (procesos * 4)))
+
+
+def pdfs(ids):
+    """``(factura_id, bytes)`` en el orden de ``ids`` (los inexistentes se omiten)."""
+    todos = datos(ids)
+    orden = [i for i in dict.fromkeys(ids) if i in todos]
+    claves = {i: _clave(todos[i]) for i in orden}
+    en_cache = cache.get_many(list(claves.values()))
+    faltan = [i for i in orden if claves[i] not in en_cache]
+    contadores.sumar('hits', len(orden) - len(faltan))
+    contadores.sumar('misses', len(faltan))
+
+    dibujados = _renderizar_varios([todos[i] for i in faltan])
+    timeout = _config('CACHE_TIMEOUT', 24 * 3600)
+    for i in orden:
+        if claves[i] in en_cache:
+            yield i, en_cache[claves[i]]
+            continue
+        pdf = next(dibujados)
+        # a la caché en cuanto está listo: si el cliente corta la descarga, lo dibujado no se pierde
+        cache.set(claves[i], pdf, timeout)
+        yield i, pdf
+
+
+# =========================
+# ZIP en streaming
+# =========================
+class _Salida:
+    """Destino no posicionable para ``zipfile``: acumula lo escrito hasta que se recoge."""
+
+    def __init__(self):
+        self.partes = []
+
+    def write(self, bloque):
+        self.partes.append(bytes(bloque))
+        return len(bloque)
+
+    def flush(self):
+        pass
+
+    def recoger(self):
+        bloque = b''.join(self.partes)
+        self.partes = []
+        return bloque
+
+
+def zip_facturas(ids):
+    """Genera el ZIP (en bloques de bytes) con un ``factura_<id>.pdf`` por factura."""
+    salida = _Salida()
+    # los PDF ya van comprimidos: guardarlos tal cual
+    with zipfile.ZipFile(salida, 'w', compression=zipfile.ZIP_STORED) as archivo:
+        for factura_id, pdf in pdfs(ids):
+            archivo.writestr(f'factura_{factura_id}.pdf', pdf)
+            yield salida.recoger()
+    yield salida.recoger()
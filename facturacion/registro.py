@@ -0,0 +1,88 @@
+"""Registro de facturas de venta en una sola transacción.
+
+Antes cada línea era un ``get`` del medicamento y un ``DetalleFactura``
+guardado con el precio, el subtotal y el total que mandaba el cliente, y
+el inventario no se enteraba de la venta. ``registrar`` hace todo por
+conjuntos, con un número de consultas que no depende de las líneas:
+
+- una lectura bloqueada de todos los medicamentos de la factura
+- precios tomados de ``Medicamento.precio_venta`` (lo que envíe el cliente
+  se ignora) y total calculado en la misma pasada
+- ``bulk_create`` de los detalles
+- las salidas de inventario con ``movimientos.registrar_lote`` (``UPDATE``
+  por bloques, movimientos, auditoría y alertas de stock bajo)
+- la venta se suma a las tablas diarias de ``ventas``
+
+Si alguna línea no es válida o no tiene stock disponible no se escribe nada.
+"""
+from collections import OrderedDict
+from decimal import Decimal
+
+from django.conf import settings
+from django.db import transaction
+from rest_framework.exceptions import ValidationError
+
+from inventario import auditoria
+from inventario.movimientos import registrar_lote
+
+from . import ventas
+
+LINEAS_MAX = getattr(settings, 'FACTURACION_MAX_LINEAS', 500)
+_BLOQUE = 500
+
+
+def registrar(cliente, lineas, empleado=None, **campos):
+    """Crea la factura de ``cliente`` con ``lineas`` (dicts con ``medicamento_id`` y ``cantidad``).
+
+    ``campos``: ``metodo_pago``, ``direccion_entrega``, ``observaciones``.
+    Devuelve la factura; lanza ``ValidationError`` (con el índice de las
+    líneas que fallan) sin escribir nada.
+    """
+    from inventario.models import Medicamento
+    from .models import DetalleFactura, Factura
+
+    pedidas = OrderedDict()
+    for l in lineas:
+        pedidas[l['medicamento_id']] = pedidas.get(l['medicamento_id'], 0) + l['cantidad']
+
+    with transaction.atomic():
+        # bloqueo en orden de pk, como transferencias y préstamos
+        meds = {m.pk: m for m in Medicamento.objects.select_for_update().filter(pk__in=list(pedidas)).order_by('pk')}
+        errores = {}
+        for n, l in enumerate(lineas):
+            med = meds.get(l['medicamento_id'])
+            if med is None:
+                errores[n] = 'No existe'
+            elif not med.estado:
+                errores[n] = f'{med.nombre} está inactivo'
+            elif med.stock_disponible < pedidas[med.pk]:
+                errores[n] = f'Stock insuficiente para {med.nombre}: disponibles {med.stock_disponible}, solicitado {pedidas[med.pk]}'
+        if errores:
+            raise ValidationError({'detalles': errores})
+
+        detalles, total = [], Decimal('0.00')
+        for l in lineas:
+            precio = meds[l['medicamento_id']].precio_venta
+            subtotal = precio * l['cantidad']
+            detalles.append(DetalleFactura(
+                medicamento_id=l['medicamento_id'], cantidad=l['cantidad'], precio_unitario=precio, subtotal=subtotal,
+            ))
+            total += subtotal
+
+        factura = Factura.objects.create(cliente=cliente, empleado=empleado, total=total, **campos)
+        for d in detalles:
+            d.factura = factura
+        DetalleFactura.objects.bulk_create(detalles, batch_size=_BLOQUE)
+
+        registrar_lote([
+            {'medicamento_id': pk, 'tipo_movimiento': 'salida', 'cantidad': cantidad, 'observacion': f'Factura #{factura.pk}'}
+            for pk, cantidad in pedidas.items()
+        ], usuario=empleado)
+        ventas.acumular([factura.pk])
+
+        auditoria.registrar(
+            'factura_registrada', model_name='Factura', object_id=factura.pk, user=empleado,
+            message=f"Factura {factura.pk}: {len(detalles)} líneas, total {total}",
+            data={'cliente': cliente.pk, 'lineas': len(detalles), 'total': str(total)},
+        )
+    return factura
@@ -1,7 +1,12 @@
+from datetime import timedelta
+
+from django.db import transaction
+from django.utils import timezone
 from rest_framework import serializers
 from .models import Factura, DetalleFactura
 from usuarios.models import Usuario
 from inventario.models import Medicamento
+from . import pdf, registro, ventas
 
 
 # =========================
@@ -51,6 +56,8 @@ class FacturaSerializer(serializers.ModelSerializer):
             'detalles',
         ]
         read_only_fields = ['fecha_emision', 'cliente_nombre']
+        # relaciones que usa get_cliente_nombre (ver inventario.mixins)
+        eager_select = ('cliente',)
 
     def get_cliente_nombre(self, obj):
         return obj.cliente.nombre_completo or obj.cliente.username
@@ -60,13 +67,15 @@ class FacturaSerializer(serializers.ModelSerializer):
     # =========================
     def create(self, validated_data):
         detalles_data = validated_data.pop('detalles', [])
-        factura = Factura.objects.create(**validated_data)
+        with transaction.atomic():
+            factura = Factura.objects.create(**validated_data)
 
-        for detalle_data in detalles_data:
-            DetalleFactura.objects.create(
-                factura=factura,
-                **detalle_data
-            )
+            for detalle_data in detalles_data:
+                DetalleFactura.objects.create(
+                    factura=factura,
+                    **detalle_data
+                )
+            ventas.acumular([factura.pk])
 
         return factura
 
@@ -76,18 +85,111 @@ class FacturaSerializer(serializers.ModelSerializer):
     def update(self, instance, validated_data):
         detalles_data = validated_data.pop('detalles', None)
 
-        # Actualizar los campos principales
-        for attr, value in validated_data.items():
-            setattr(instance, attr, value)
-        instance.save()
+        with ventas.cambiando([instance.pk]):
+            # Actualizar los campos principales
+            for attr, value in validated_data.items():
+                setattr(instance, attr, value)
+            instance.save()
 
-        # Si vienen detalles, reemplazarlos
-        if detalles_data is not None:
-            instance.detalles.all().delete()
-            for detalle_data in detalles_data:
-                DetalleFactura.objects.create(
-                    factura=instance,
-                    **detalle_data
-                )
+            # Si vienen detalles, reemplazarlos
+            if detalles_data is not None:
+                instance.detalles.all().delete()
+                for detalle_data in detalles_data:
+                    DetalleFactura.objects.create(
+                        factura=instance,
+                        **detalle_data
+                    )
 
         return instance
+
+
+# =========================
+# 🧾 SERIALIZER REGISTRO DE FACTURA
+# =========================
+class LineaRegistroSerializer(serializers.Serializer):
+    # id plano: todas las líneas se resuelven con una lectura en registro.registrar
+    medicamento = serializers.IntegerField(source='medicamento_id', min_value=1)
+    cantidad = serializers.IntegerField(min_value=1, default=1)
+
+
+class RegistrarFacturaSerializer(serializers.Serializer):
+    """Entrada de ``/registrar/``: precios, subtotales y total los pone el servidor."""
+    cliente = serializers.PrimaryKeyRelatedField(queryset=Usuario.objects.all())
+    metodo_pago = serializers.ChoiceField(choices=Factura._meta.get_field('metodo_pago').choices, default='efectivo')
+    direccion_entrega = serializers.CharField(max_length=255, required=False, allow_blank=True, default='')
+    observaciones = serializers.CharField(required=False, allow_blank=True, default='')
+    detalles = LineaRegistroSerializer(many=True, allow_empty=False)
+
+    def validate_detalles(self, value):
+        if len(value) > registro.LINEAS_MAX:
+            raise serializers.ValidationError(f'Máximo {registro.LINEAS_MAX} líneas por factura.')
+        return value
+
+    def create(self, validated_data):
+        request = self.context.get('request')
+        empleado = request.user if request and request.user.is_authenticated else None
+        lineas = validated_data.pop('detalles')
+        cliente = validated_data.pop('cliente')
+        return registro.registrar(cliente, lineas, empleado=empleado, **validated_data)
+
+
+class PdfLoteSerializer(serializers.Serializer):
+    ids = serializers.ListField(child=serializers.IntegerField(min_value=1), allow_empty=False)
+
+    def validate_ids(self, value):
+        if len(value) > pdf.LOTE_MAX:
+            raise serializers.ValidationError(f'Máximo {pdf.LOTE_MAX} facturas por lote.')
+        return value
+
+
+class EnvioLoteSerializer(serializers.Serializer):
+    """Filtro del envío masivo por correo; sin filtros, todas las facturas aún no enviadas."""
+    fecha_from = serializers.DateField(required=False)
+    fecha_to = serializers.DateField(required=False)
+    cliente = serializers.PrimaryKeyRelatedField(queryset=Usuario.objects.all(), required=False)
+    solo_pendientes = serializers.BooleanField(default=True)
+
+    def validate(self, attrs):
+        if attrs.get('fecha_from') and attrs.get('fecha_to') and attrs['fecha_from'] > attrs['fecha_to']:
+            raise serializers.ValidationError({'fecha_to': 'Debe ser posterior a fecha_from.'})
+        return attrs
+
+    def filtrar(self, facturas):
+        datos = self.validated_data
+        if 'fecha_from' in datos:
+            facturas = facturas.filter(fecha_emision__date__gte=datos['fecha_from'])
+        if 'fecha_to' in datos:
+            facturas = facturas.filter(fecha_emision__date__lte=datos['fecha_to'])
+        if 'cliente' in datos:
+            facturas = facturas.filter(cliente=datos['cliente'])
+        if datos['solo_pendientes']:
+            facturas = facturas.filter(correo_enviado=False)
+        return facturas
+
+
+# =========================
+# 📈 SERIALIZER FILTROS DE ANALÍTICA
+# =========================
+class VentasFiltroSerializer(serializers.Serializer):
+    """Parámetros de ``/ventas/``: por defecto los últimos ``ventas.DIAS_DEFECTO`` días."""
+    desde = serializers.DateField(required=False)
+    hasta = serializers.DateField(required=False)
+    drogueria = serializers.IntegerField(min_value=1, required=False)
+    categoria = serializers.IntegerField(min_value=1, required=False)
+    empleado = serializers.IntegerField(min_value=1, required=False)
+    metodo_pago = serializers.ChoiceField(choices=Factura._meta.get_field('metodo_pago').choices, required=False)
+    por_dia = serializers.BooleanField(default=False)
+    limite = serializers.IntegerField(min_value=1, max_value=1000, default=50)
+
+    def validate(self, attrs):
+        attrs['hasta'] = attrs.get('hasta') or timezone.localdate()
+        attrs['desde'] = attrs.get('desde') or attrs['hasta'] - timedelta(days=ventas.DIAS_DEFECTO - 1)
+        if attrs['desde'] > attrs['hasta']:
+            raise serializers.ValidationError({'hasta': 'Debe ser posterior a desde.'})
+        if (attrs['hasta'] - attrs['desde']).days >= ventas.DIAS_MAX:
+            raise serializers.ValidationError({'desde': f'Máximo {ventas.DIAS_MAX} días por consulta.'})
+        return attrs
+
+    @property
+    def filtros(self):
+        return {c: self.validated_data[c] for c in ('drogueria', 'categoria', 'empleado', 'metodo_pago') if c in self.validated_data}
@@ -1,3 +1,310 @@
-from django.test import TestCase
+from rest_framework.test import APITestCase
+from usuarios.models import Usuario
+from inventario.models import Medicamento
+from .models import Factura, DetalleFactura
 
-# Create your tests here.
+
+class FacturaQueryCountTests(APITestCase):
+    ENDPOINTS = ('/api/facturas/facturas/', '/api/facturas/lista/', '/api/facturas/mis-facturas/')
+
+    def setUp(self):
+        self.empleado = Usuario.objects.create_user(username='fac_emp', password='x', email='fe@example.com', rol='admin')
+        self.meds = [Medicamento.objects.create(nombre=f'FM{i}', precio_venta=3.0, stock_actual=50) for i in range(3)]
+        self._crear_facturas(3)
+        self.client.force_authenticate(self.empleado)
+
+    def _crear_facturas(self, n):
+        for i in range(n):
+            cliente = Usuario.objects.create_user(
+                username=f'fac_cli_{Factura.objects.count()}', password='x', email=f'c{i}@example.com', num_doc=None
+            )
+            factura = Factura.objects.create(cliente=cliente, empleado=self.empleado, total=9, metodo_pago='efectivo')
+            for med in self.meds:
+                DetalleFactura.objects.create(factura=factura, medicamento=med, cantidad=1, precio_unitario=3, subtotal=3)
+
+    def test_factura_listings_use_constant_queries(self):
+        for url in self.ENDPOINTS:
+            with self.subTest(url=url):
+                # facturas (con cliente en JOIN) + detalles (con medicamento en JOIN)
+                with self.assertNumQueries(2):
+                    resp = self.client.get(url)
+                self.assertEqual(resp.status_code, 200)
+
+        self._crear_facturas(4)
+        for url in self.ENDPOINTS:
+            with self.subTest(url=url, facturas=7):
+                with self.assertNumQueries(2):
+                    self.client.get(url)
+
+        with self.assertNumQueries(1):
+            self.client.get('/api/facturas/detalles/')
+
+
+class RegistrarFacturaTests(APITestCase):
+    def setUp(self):
+        from droguerias.models import Drogueria
+        self.empleado = Usuario.objects.create_user(username='reg_emp', password='x', email='re@example.com', rol='empleado')
+        self.cliente = Usuario.objects.create_user(username='reg_cli', password='x', email='rc@example.com', rol='cliente')
+        d1 = Drogueria.objects.create(codigo='F1', nombre='Facturas')
+        self.meds = Medicamento.objects.bulk_create(
+            Medicamento(nombre=f'RF{i}', precio_venta=10 + i, stock_actual=20, stock_minimo=0, drogueria=d1) for i in range(100)
+        )
+        self.client.force_authenticate(self.empleado)
+
+    def _registrar(self, meds, cantidad=2, **extra):
+        return self.client.post('/api/facturas/registrar/', {
+            'cliente': self.cliente.id,
+            'metodo_pago': 'tarjeta',
+            'detalles': [
+                {'medicamento': m.id, 'cantidad': cantidad, 'precio_unitario': 1, 'subtotal': 1} for m in meds
+            ],
+            'total': 1,
+            **extra,
+        }, format='json')
+
+    def test_server_prices_and_stock_exit(self):
+        from inventario.models import MovimientoInventario
+        resp = self._registrar(self.meds[:3])
+        self.assertEqual(resp.status_code, 201, resp.content)
+        factura = Factura.objects.get(pk=resp.json()['factura_id'])
+        self.assertEqual(factura.total, (10 + 11 + 12) * 2)
+        self.assertEqual(factura.empleado, self.empleado)
+        detalle = factura.detalles.get(medicamento=self.meds[1])
+        self.assertEqual((detalle.precio_unitario, detalle.subtotal), (11, 22))
+        self.assertEqual(Medicamento.objects.get(pk=self.meds[0].pk).stock_actual, 18)
+        self.assertEqual(
+            MovimientoInventario.objects.filter(tipo_movimiento='salida', observacion=f'Factura #{factura.pk}').count(), 3
+        )
+
+    def test_constant_queries(self):
+        from django.db import connection
+        from django.test.utils import CaptureQueriesContext
+        consultas = []
+        for meds in (self.meds[:1], self.meds[:5], self.meds):  # el primero calienta cachés de un solo uso
+            with CaptureQueriesContext(connection) as ctx:
+                resp = self._registrar(meds, cantidad=1)
+            self.assertEqual(resp.status_code, 201, resp.content)
+            consultas.append(len(ctx))
+        self.assertEqual(consultas[1], consultas[2])
+
+    def test_invalid_lines_write_nothing(self):
+        Medicamento.objects.filter(pk=self.meds[2].pk).update(stock_reservado=19)
+        resp = self._registrar([self.meds[0], self.meds[2]], cantidad=2)
+        self.assertEqual(resp.status_code, 400)
+        self.assertIn('1', resp.json()['detalles'])
+        resp = self.client.post('/api/facturas/registrar/', {
+            'cliente': self.cliente.id, 'detalles': [{'medicamento': 999999, 'cantidad': 1}],
+        }, format='json')
+        self.assertEqual(resp.status_code, 400)
+        self.assertFalse(Factura.objects.exists())
+        self.assertEqual(Medicamento.objects.get(pk=self.meds[0].pk).stock_actual, 20)
+
+
+class FacturaPdfTests(APITestCase):
+    def setUp(self):
+        from django.core.cache import cache
+        cache.clear()
+        self.empleado = Usuario.objects.create_user(username='pdf_emp', password='x', email='pe@example.com', rol='empleado')
+        self.cliente = Usuario.objects.create_user(username='pdf_cli', password='x', email='pc@example.com', rol='cliente')
+        self.meds = Medicamento.objects.bulk_create(
+            Medicamento(nombre=f'Medicamento de nombre bastante largo número {i}', precio_venta=2, stock_actual=5) for i in range(70)
+        )
+        self.facturas = []
+        for n in (70, 3):
+            factura = Factura.objects.create(cliente=self.cliente, empleado=self.empleado, total=2 * n, metodo_pago='efectivo')
+            DetalleFactura.objects.bulk_create(
+                DetalleFactura(factura=factura, medicamento=m, cantidad=1, precio_unitario=2, subtotal=2) for m in self.meds[:n]
+            )
+            self.facturas.append(factura)
+        self.client.force_authenticate(self.empleado)
+
+    @staticmethod
+    def _paginas(pdf_bytes):
+        import re
+        return len(re.findall(rb'/Type /Page\b(?!s)', pdf_bytes))
+
+    def test_long_invoice_paginates_and_is_cached(self):
+        from . import pdf
+        larga, corta = self.facturas
+        resp = self.client.get(f'/api/facturas/facturas/{larga.id}/pdf/')
+        self.assertEqual(resp.status_code, 200)
+        self.assertEqual(resp['Content-Type'], 'application/pdf')
+        self.assertEqual(self._paginas(resp.content), 3)
+        self.assertEqual(self._paginas(pdf.pdf_factura(corta.id)), 1)
+
+        antes = pdf.contadores.info()
+        with self.assertNumQueries(2):  # factura + detalles, sin dibujar
+            self.assertEqual(pdf.pdf_factura(larga.id), resp.content)
+        self.assertEqual(pdf.contadores.info()['hits'] - antes['hits'], 1)
+
+        # cambia el contenido: otra huella, se vuelve a dibujar
+        Factura.objects.filter(pk=larga.pk).update(observaciones='Entregar en portería')
+        pdf.pdf_factura(larga.id)
+        self.assertEqual(pdf.contadores.info()['misses'] - antes['misses'], 1)
+
+    def test_batch_zip(self):
+        import io
+        import zipfile
+        from django.test import override_settings
+        ids = [f.id for f in reversed(self.facturas)] + [999999]
+        for min_pool in (8, 1):  # en el proceso y en el pool
+            with self.subTest(min_pool=min_pool), override_settings(FACTURACION_PDF_MIN_POOL=min_pool, FACTURACION_PDF_PROCESOS=2):
+                from django.core.cache import cache
+                cache.clear()
+                resp = self.client.post('/api/facturas/facturas/pdf-lote/', {'ids': ids}, format='json')
+                self.assertEqual(resp.status_code, 200)
+                archivo = zipfile.ZipFile(io.BytesIO(b''.join(resp.streaming_content)))
+                self.assertEqual(archivo.namelist(), [f'factura_{i}.pdf' for i in ids[:2]])
+                self.assertEqual(self._paginas(archivo.read(f'factura_{self.facturas[0].id}.pdf')), 3)
+
+        self.client.force_authenticate(self.cliente)
+        self.assertEqual(self.client.post('/api/facturas/facturas/pdf-lote/', {'ids': ids}, format='json').status_code, 403)
+
+
+class EnvioLoteTests(APITestCase):
+    def setUp(self):
+        from django.core.cache import cache
+        cache.clear()
+        self.empleado = Usuario.objects.create_user(username='env_emp', password='x', email='ee@example.com', rol='empleado')
+        self.clientes = [
+            Usuario.objects.create_user(username=f'env_cli{i}', password='x', email=f'c{i}@example.com', rol='cliente')
+            for i in range(2)
+        ]
+        sin_correo = Usuario.objects.create_user(username='env_sin', password='x', email='', rol='cliente')
+        self.facturas = [
+            Factura.objects.create(cliente=self.clientes[i % 2], total=0, metodo_pago='efectivo') for i in range(10)
+        ]
+        Factura.objects.create(cliente=sin_correo, total=0, metodo_pago='efectivo')
+        Factura.objects.create(cliente=self.clientes[0], total=0, metodo_pago='efectivo', correo_enviado=True)
+        self.client.force_authenticate(self.empleado)
+
+    def _enviar(self, **filtro):
+        return self.client.post('/api/facturas/facturas/enviar-lote/', filtro, format='json')
+
+    def test_bulk_send_marks_sent_once_per_batch_and_reports_progress(self):
+        from django.core import mail
+        from django.db import connection
+        from django.test import override_settings
+        from django.test.utils import CaptureQueriesContext
+        from mensajes import cola_correo
+
+        resp = self._enviar()
+        self.assertEqual(resp.status_code, 202, resp.content)
+        resumen = resp.json()
+        self.assertEqual((resumen['encoladas'], resumen['sin_correo'], resumen['ya_en_cola']), (10, 1, 0))
+        url = f"/api/facturas/facturas/envios/{resumen['lote']}/"
+        self.assertEqual(self.client.get(url).json()['porcentaje'], 0)
+
+        # los PDFs que faltan en caché se dibujan juntos, en el pool de procesos
+        with override_settings(FACTURACION_PDF_MIN_POOL=2, FACTURACION_PDF_PROCESOS=2), \
+                CaptureQueriesContext(connection) as consultas:
+            self.assertEqual(cola_correo.procesar(lote=6)['enviados'], 6)
+        marcas = [q['sql'] for q in consultas.captured_queries
+                  if q['sql'].startswith('UPDATE') and 'facturacion_factura' in q['sql']]
+        self.assertEqual(len(marcas), 1)
+        progreso = self.client.get(url).json()
+        self.assertEqual((progreso['terminados'], progreso['porcentaje'], progreso['completo']), (6, 60.0, False))
+
+        cola_correo.drenar()
+        self.assertTrue(self.client.get(url).json()['completo'])
+        self.assertEqual(len(mail.outbox), 10)
+        self.assertTrue(all(m.attachments[0][0].endswith('.pdf') for m in mail.outbox))
+        self.assertFalse(Factura.objects.filter(pk__in=[f.pk for f in self.facturas], correo_enviado=False).exists())
+
+    def test_filter_and_no_duplicates(self):
+        primero = self._enviar(cliente=self.clientes[0].pk).json()
+        self.assertEqual(primero['encoladas'], 5)
+        # las del primer cliente ya están en cola: solo entran las del segundo
+        segundo = self._enviar().json()
+        self.assertEqual((segundo['encoladas'], segundo['ya_en_cola']), (5, 5))
+        self.assertEqual(self._enviar(fecha_to='2000-01-01').json(), {'lote': None, 'encoladas': 0, 'sin_correo': 0, 'ya_en_cola': 0})
+        self.assertEqual(self._enviar(fecha_from='2030-01-02', fecha_to='2030-01-01').status_code, 400)
+        self.assertEqual(self.client.get('/api/facturas/facturas/envios/' + '0' * 32 + '/').status_code, 404)
+
+        self.client.force_authenticate(self.clientes[0])
+        self.assertEqual(self._enviar().status_code, 403)
+
+
+class VentasRollupTests(APITestCase):
+    def setUp(self):
+        from droguerias.models import Drogueria
+        from inventario.models import Categoria
+        self.empleado = Usuario.objects.create_user(username='ven_emp', password='x', email='ve@example.com', rol='empleado')
+        self.cliente = Usuario.objects.create_user(username='ven_cli', password='x', email='vc@example.com', rol='cliente')
+        self.d1 = Drogueria.objects.create(codigo='V1', nombre='Centro')
+        self.d2 = Drogueria.objects.create(codigo='V2', nombre='Norte')
+        c1 = Categoria.objects.create(nombre='Analgésicos')
+        c2 = Categoria.objects.create(nombre='Vitaminas')
+        self.m1, self.m2, self.m3 = (
+            Medicamento.objects.create(nombre=n, precio_venta=p, stock_actual=50, stock_minimo=0, drogueria=d, categoria=c)
+            for n, p, d, c in (('V-A', 10, self.d1, c1), ('V-B', 5, self.d1, c2), ('V-C', 7, self.d2, c1))
+        )
+        self.client.force_authenticate(self.empleado)
+
+    def _registrar(self, metodo_pago, lineas):
+        resp = self.client.post('/api/facturas/registrar/', {
+            'cliente': self.cliente.id, 'metodo_pago': metodo_pago,
+            'detalles': [{'medicamento': m.id, 'cantidad': n} for m, n in lineas],
+        }, format='json')
+        self.assertEqual(resp.status_code, 201, resp.content)
+        return resp.json()['factura_id']
+
+    @staticmethod
+    def _filas():
+        from .models import VentaDiariaCanal, VentaDiariaGrupo, VentaDiariaMedicamento
+        return [
+            sorted(modelo.objects.values_list(*campos), key=str)
+            for modelo, campos in (
+                (VentaDiariaMedicamento, ('fecha', 'medicamento_id', 'unidades', 'ingresos', 'lineas')),
+                (VentaDiariaGrupo, ('fecha', 'drogueria_id', 'categoria_id', 'unidades', 'ingresos', 'lineas')),
+                (VentaDiariaCanal, ('fecha', 'empleado_id', 'metodo_pago', 'facturas', 'unidades', 'ingresos')),
+            )
+        ]
+
+    def test_rollups_follow_invoices_and_match_rebuild(self):
+        from . import ventas
+        self._registrar('efectivo', [(self.m1, 2), (self.m2, 1)])
+        tarjeta = self._registrar('tarjeta', [(self.m1, 1), (self.m3, 3)])
+
+        with self.assertNumQueries(2):  # serie por día + totales
+            resumen = self.client.get('/api/facturas/ventas/').json()
+        self.assertEqual(resumen['totales'], {'facturas': 2, 'unidades': 7, 'ingresos': 56})
+        self.assertEqual(len(resumen['dias']), 1)
+
+        with self.assertNumQueries(1):
+            droguerias = self.client.get('/api/facturas/ventas/drogueria/').json()['resultados']
+        self.assertEqual(
+            [(f['drogueria_nombre'], f['unidades'], f['ingresos']) for f in droguerias],
+            [('Centro', 4, 35), ('Norte', 3, 21)],
+        )
+        productos = self.client.get('/api/facturas/ventas/medicamento/', {'drogueria': self.d1.pk}).json()['resultados']
+        self.assertEqual([(f['medicamento'], f['unidades'], f['lineas']) for f in productos], [(self.m1.pk, 3, 2), (self.m2.pk, 1, 1)])
+        pagos = self.client.get('/api/facturas/ventas/metodo_pago/', {'por_dia': 'true'}).json()['resultados']
+        self.assertEqual([(f['metodo_pago'], f['facturas']) for f in pagos], [('tarjeta', 1), ('efectivo', 1)])
+
+        incremental = self._filas()
+        self.assertEqual(ventas.reconstruir(), {'dias': 1, 'filas': 3 + 3 + 2})
+        self.assertEqual(self._filas(), incremental)
+
+        # borrar una factura la descuenta; las filas que quedan en cero desaparecen
+        self.assertEqual(self.client.delete(f'/api/facturas/facturas/{tarjeta}/').status_code, 204)
+        canales = self._filas()[2]
+        self.assertEqual([(c[2], c[3]) for c in canales], [('efectivo', 1)])
+        self.assertEqual(self.client.get('/api/facturas/ventas/').json()['totales']['ingresos'], 25)
+
+    def test_rebuild_command_and_validation(self):
+        from io import StringIO
+        from django.core.management import call_command
+        from .models import VentaDiariaMedicamento
+        self._registrar('efectivo', [(self.m1, 1)])
+        VentaDiariaMedicamento.objects.all().delete()
+        salida = StringIO()
+        call_command('reconstruir_ventas', '--lote', '7', stdout=salida)
+        self.assertIn('1 días', salida.getvalue())
+        self.assertEqual(VentaDiariaMedicamento.objects.get().unidades, 1)
+
+        self.assertEqual(self.client.get('/api/facturas/ventas/cliente/').status_code, 404)
+        self.assertEqual(self.client.get('/api/facturas/ventas/empleado/', {'drogueria': self.d1.pk}).status_code, 400)
+        self.assertEqual(self.client.get('/api/facturas/ventas/', {'desde': '2026-02-02', 'hasta': '2026-02-01'}).status_code, 400)
+        self.client.force_authenticate(self.cliente)
+        self.assertEqual(self.client.get('/api/facturas/ventas/').status_code, 403)
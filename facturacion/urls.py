@@ -9,7 +9,9 @@ from .views import (
     DetalleFacturaListView,
     HistorialFacturasView,
     MisFacturasView,
-    EnviarFacturaEmailView
+    EnviarFacturaEmailView,
+    VentasResumenView,
+    VentasPorDimensionView,
 )
 
 router = DefaultRouter()
@@ -30,5 +32,9 @@ urlpatterns = [
     path('cliente/historial/', HistorialFacturasView.as_view(), name='historial-cliente'),
     path('mis-facturas/', MisFacturasView.as_view(), name='mis-facturas'),
 
+    # Analítica de ventas (rollups diarios)
+    path('ventas/', VentasResumenView.as_view(), name='ventas-resumen'),
+    path('ventas/<str:dimension>/', VentasPorDimensionView.as_view(), name='ventas-dimension'),
+
     path("facturas/enviar-email/<int:factura_id>/", EnviarFacturaEmailView.as_view(), name="enviar-factura-email"),
 ]
@@ -0,0 +1,273 @@
+"""Tablas diarias de ventas (rollups) y consultas de analítica sobre ellas.
+
+Responder "unidades e ingresos por medicamento, día y droguería" recorría
+todos los ``DetalleFactura`` unidos a ``Factura``. Las ventas se acumulan
+por día (el día local de ``fecha_emision``) en tres tablas:
+
+- ``VentaDiariaMedicamento``: (fecha, medicamento)
+- ``VentaDiariaGrupo``: (fecha, droguería, categoría) del medicamento vendido
+- ``VentaDiariaCanal``: (fecha, empleado, método de pago), con el número de
+  facturas
+
+``acumular(ids)`` suma las facturas ``ids`` al registrarlas y
+``descontar(ids)`` las resta antes de borrarlas; ``cambiando(ids)`` hace
+las dos cosas alrededor de una edición. Cada tabla se actualiza con un
+número fijo de consultas: las filas que falten se insertan a cero con
+``ignore_conflicts``, se bloquean en orden de pk y se guardan con un
+``bulk_update``. ``reconstruir(desde, hasta)`` (``manage.py
+reconstruir_ventas``) las recalcula por rangos de días desde las facturas.
+"""
+from contextlib import contextmanager
+from datetime import datetime, time, timedelta
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Count, Max, Min, Q, Sum
+from django.db.models.functions import TruncDate
+from django.utils import timezone
+from rest_framework.exceptions import ValidationError
+
+DIAS_DEFECTO = 30
+DIAS_MAX = getattr(settings, 'FACTURACION_VENTAS_MAX_DIAS', 731)
+_BLOQUE = 500
+
+
+# =========================
+# Agregados desde las facturas
+# =========================
+def _por_medicamento(facturas):
+    from .models import DetalleFactura
+
+    filas = (
+        DetalleFactura.objects.filter(factura__in=facturas).order_by()
+        .values('medicamento_id', fecha=TruncDate('factura__fecha_emision'))
+        .annotate(unidades=Sum('cantidad'), ingresos=Sum('subtotal'), lineas=Count('id'))
+    )
+    return {
+        (f['fecha'], f['medicamento_id']): {'unidades': f['unidades'], 'ingresos': f['ingresos'], 'lineas': f['lineas']}
+        for f in filas
+    }
+
+
+def _por_grupo(facturas):
+    from .models import DetalleFactura
+
+    filas = (
+        DetalleFactura.objects.filter(factura__in=facturas).order_by()
+        .values('medicamento__drogueria_id', 'medicamento__categoria_id', fecha=TruncDate('factura__fecha_emision'))
+        .annotate(unidades=Sum('cantidad'), ingresos=Sum('subtotal'), lineas=Count('id'))
+    )
+    return {
+        (f['fecha'], f['medicamento__drogueria_id'], f['medicamento__categoria_id']): {
+            'unidades': f['unidades'], 'ingresos': f['ingresos'], 'lineas': f['lineas'],
+        }
+        for f in filas
+    }
+
+
+def _por_canal(facturas):
+    from .models import DetalleFactura, Factura
+
+    # facturas y unidades por separado: sumar el total a través del JOIN con los detalles lo multiplicaría
+    claves = ('empleado_id', 'metodo_pago')
+    filas = {
+        (f['fecha'], f['empleado_id'], f['metodo_pago']): {'facturas': f['facturas'], 'unidades': 0, 'ingresos': f['ingresos']}
+        for f in Factura.objects.filter(pk__in=facturas).order_by()
+        .values(*claves, fecha=TruncDate('fecha_emision'))
+        .annotate(facturas=Count('id'), ingresos=Sum('total'))
+    }
+    for f in (
+        DetalleFactura.objects.filter(factura__in=facturas).order_by()
+        .values('factura__empleado_id', 'factura__metodo_pago', fecha=TruncDate('factura__fecha_emision'))
+        .annotate(unidades=Sum('cantidad'))
+    ):
+        filas[(f['fecha'], f['factura__empleado_id'], f['factura__metodo_pago'])]['unidades'] = f['unidades']
+    return filas
+
+
+def _tablas():
+    from .models import VentaDiariaCanal, VentaDiariaGrupo, VentaDiariaMedicamento
+
+    # (modelo, campos clave, agregado, campo que llega a 0 cuando la fila ya no cuenta nada)
+    return (
+        (VentaDiariaMedicamento, ('fecha', 'medicamento_id'), _por_medicamento, 'lineas'),
+        (VentaDiariaGrupo, ('fecha', 'drogueria_id', 'categoria_id'), _por_grupo, 'lineas'),
+        (VentaDiariaCanal, ('fecha', 'empleado_id', 'metodo_pago'), _por_canal, 'facturas'),
+    )
+
+
+# =========================
+# Mantenimiento incremental
+# =========================
+def _filtro(claves, filas):
+    q = Q()
+    for n, campo in enumerate(claves):
+        valores = {k[n] for k in filas}
+        condicion = Q(**{f'{campo}__in': valores - {None}})
+        if None in valores:
+            condicion |= Q(**{f'{campo}__isnull': True})
+        q &= condicion
+    return q
+
+
+def _aplicar(modelo, claves, contador, filas, signo):
+    if not filas:
+        return
+    if signo > 0:
+        # inserción a cero sin pisar las existentes: dos registros concurrentes no chocan en la clave única
+        modelo.objects.bulk_create(
+            [modelo(**dict(zip(claves, k))) for k in filas], ignore_conflicts=True, batch_size=_BLOQUE
+        )
+    existentes = {
+        tuple(getattr(f, c) for c in claves): f
+        for f in modelo.objects.select_for_update().filter(_filtro(claves, filas)).order_by('pk')
+    }
+    cambiadas = []
+    for clave, sumas in filas.items():
+        fila = existentes.get(clave)
+        if fila is None:  # descontar algo que nunca se acumuló (rollup sin reconstruir)
+            continue
+        for campo, valor in sumas.items():
+            setattr(fila, campo, getattr(fila, campo) + signo * (valor or 0))
+        cambiadas.append(fila)
+    campos = list(next(iter(filas.values())))
+    modelo.objects.bulk_update(cambiadas, campos, batch_size=_BLOQUE)
+    if signo < 0:
+        modelo.objects.filter(pk__in=[f.pk for f in cambiadas], **{f'{contador}__lte': 0}).delete()
+
+
+def _mover(ids, signo):
+    from .models import Factura
+
+    ids = list(ids)
+    if not ids:
+        return
+    facturas = Factura.objects.filter(pk__in=ids).values('pk')
+    with transaction.atomic():
+        for modelo, claves, agregado, contador in _tablas():
+            _aplicar(modelo, claves, contador, agregado(facturas), signo)
+
+
+def acumular(ids):
+    """Suma a los rollups las facturas ``ids`` (ya guardadas con sus detalles)."""
+    _mover(ids, 1)
+
+
+def descontar(ids):
+    """Resta de los rollups las facturas ``ids`` (antes de borrarlas o cambiarlas)."""
+    _mover(ids, -1)
+
+
+@contextmanager
+def cambiando(ids):
+    """Envuelve una edición de las facturas ``ids``: resta lo que había y suma lo que queda."""
+    with transaction.atomic():
+        descontar(ids)
+        yield
+        acumular(ids)
+
+
+# =========================
+# Reconstrucción
+# =========================
+def _inicio_dia(dia):
+    return timezone.make_aware(datetime.combine(dia, time.min))
+
+
+def reconstruir(desde=None, hasta=None, dias=31):
+    """Recalcula los rollups entre ``desde`` y ``hasta`` (incluidos), ``dias`` por transacción.
+
+    Sin fechas abarca todas las facturas. Devuelve ``{'dias', 'filas'}``.
+    """
+    from .models import Factura
+
+    if desde is None or hasta is None:
+        rango = Factura.objects.aggregate(primera=Min('fecha_emision'), ultima=Max('fecha_emision'))
+        if rango['primera'] is None:
+            return {'dias': 0, 'filas': 0}
+        desde = desde or timezone.localdate(rango['primera'])
+        hasta = hasta or timezone.localdate(rango['ultima'])
+
+    filas, dia = 0, desde
+    while dia <= hasta:
+        fin = min(hasta, dia + timedelta(days=dias - 1))
+        facturas = Factura.objects.filter(
+            fecha_emision__gte=_inicio_dia(dia), fecha_emision__lt=_inicio_dia(fin + timedelta(days=1))
+        ).values('pk')
+        with transaction.atomic():
+            for modelo, claves, agregado, _ in _tablas():
+                modelo.objects.filter(fecha__gte=dia, fecha__lte=fin).delete()
+                nuevas = [
+                    modelo(**dict(zip(claves, clave)), **sumas) for clave, sumas in agregado(facturas).items()
+                ]
+                modelo.objects.bulk_create(nuevas, batch_size=_BLOQUE)
+                filas += len(nuevas)
+        dia = fin + timedelta(days=1)
+    return {'dias': (hasta - desde).days + 1, 'filas': filas}
+
+
+# =========================
+# Consultas
+# =========================
+# dimensión -> (tabla, campo, campo con el nombre, filtros admitidos)
+DIMENSIONES = {
+    'medicamento': ('VentaDiariaMedicamento', 'medicamento_id', 'medicamento__nombre',
+                    {'drogueria': 'medicamento__drogueria_id', 'categoria': 'medicamento__categoria_id'}),
+    'categoria': ('VentaDiariaGrupo', 'categoria_id', 'categoria__nombre',
+                  {'drogueria': 'drogueria_id', 'categoria': 'categoria_id'}),
+    'drogueria': ('VentaDiariaGrupo', 'drogueria_id', 'drogueria__nombre',
+                  {'drogueria': 'drogueria_id', 'categoria': 'categoria_id'}),
+    'empleado': ('VentaDiariaCanal', 'empleado_id', 'empleado__username',
+                 {'empleado': 'empleado_id', 'metodo_pago': 'metodo_pago'}),
+    'metodo_pago': ('VentaDiariaCanal', 'metodo_pago', None,
+                    {'empleado': 'empleado_id', 'metodo_pago': 'metodo_pago'}),
+}
+
+
+def _sumas(modelo):
+    return [c for c in ('facturas', 'unidades', 'ingresos', 'lineas') if any(f.name == c for f in modelo._meta.fields)]
+
+
+def serie(desde, hasta):
+    """Totales por día (facturas, unidades, ingresos) y del rango, desde ``VentaDiariaCanal``."""
+    from .models import VentaDiariaCanal
+
+    qs = VentaDiariaCanal.objects.filter(fecha__gte=desde, fecha__lte=hasta).order_by()
+    campos = ('facturas', 'unidades', 'ingresos')
+    dias = qs.values('fecha').annotate(**{f'total_{c}': Sum(c) for c in campos}).order_by('fecha')
+    totales = qs.aggregate(**{c: Sum(c) for c in campos})
+    return {
+        'desde': desde,
+        'hasta': hasta,
+        'totales': {c: totales[c] or 0 for c in campos},
+        'dias': [{'fecha': d['fecha'], **{c: d[f'total_{c}'] for c in campos}} for d in dias],
+    }
+
+
+def ranking(dimension, desde, hasta, filtros=None, por_dia=False, limite=50):
+    """Hasta ``limite`` filas de ``dimension`` en el rango, de más a menos ingresos (por día si ``por_dia``)."""
+    from . import models
+
+    tabla, campo, nombre, admitidos = DIMENSIONES[dimension]
+    modelo = getattr(models, tabla)
+    filtros = filtros or {}
+    sobrantes = set(filtros) - set(admitidos)
+    if sobrantes:
+        raise ValidationError({c: f'No se puede filtrar por {c} en la dimensión {dimension}.' for c in sorted(sobrantes)})
+
+    qs = modelo.objects.filter(
+        fecha__gte=desde, fecha__lte=hasta, **{admitidos[c]: v for c, v in filtros.items()}
+    ).order_by()
+    grupos = (['fecha'] if por_dia else []) + [campo] + ([nombre] if nombre else [])
+    sumas = _sumas(modelo)
+    orden = (['fecha'] if por_dia else []) + ['-total_ingresos', campo]
+    filas = qs.values(*grupos).annotate(**{f'total_{c}': Sum(c) for c in sumas}).order_by(*orden)[:limite]
+    return [
+        {
+            **({'fecha': f['fecha']} if por_dia else {}),
+            dimension: f[campo],
+            **({f'{dimension}_nombre': f[nombre]} if nombre else {}),
+            **{c: f[f'total_{c}'] for c in sumas},
+        }
+        for f in filas
+    ]
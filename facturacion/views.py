@@ -1,23 +1,29 @@
 from typing import Any
+from django.db import transaction
 from django.db.models import QuerySet
 from rest_framework import viewsets, generics, permissions, status
 from rest_framework.views import APIView
 from rest_framework.response import Response
+from rest_framework.decorators import action
+from django.http import HttpResponse, StreamingHttpResponse
 from django.shortcuts import get_object_or_404
 
 from .models import Factura, DetalleFactura
-from inventario.models import Medicamento
-from usuarios.models import Usuario
-from .serializers import FacturaSerializer, DetalleFacturaSerializer
+from .serializers import (
+    FacturaSerializer, DetalleFacturaSerializer, RegistrarFacturaSerializer, PdfLoteSerializer, EnvioLoteSerializer,
+    VentasFiltroSerializer,
+)
+from . import correo as correo_facturas, pdf as pdf_facturas, ventas
 from .permissions import EsEmpleadoOAdministrador
-from .utils.pdf_generator import generar_pdf_factura
-from django.core.mail import EmailMessage
+from inventario.mixins import EagerLoadingMixin
+from inventario.permissions import EsEmpleadoOPermisoAdmin
+from mensajes import cola_correo
 
 
 # ======================================================
 # 🔹 CRUD DE FACTURAS (EMPLEADO + ADMIN)
 # ======================================================
-class FacturaViewSet(viewsets.ModelViewSet):
+class FacturaViewSet(EagerLoadingMixin, viewsets.ModelViewSet):
     queryset = Factura.objects.all().order_by('-fecha_emision')
     serializer_class = FacturaSerializer
     permission_classes = [EsEmpleadoOAdministrador]
@@ -30,65 +36,104 @@ class FacturaViewSet(viewsets.ModelViewSet):
         empleado = self.request.user if self.request.user.is_authenticated else None
         serializer.save(empleado=empleado)
 
+    def perform_destroy(self, instance) -> None:
+        with transaction.atomic():
+            ventas.descontar([instance.pk])
+            instance.delete()
+
+    @action(detail=True, methods=["get"])
+    def pdf(self, request, pk=None):
+        """PDF de la factura (paginado y cacheado por contenido, ver facturacion/pdf.py)."""
+        factura = self.get_object()
+        respuesta = HttpResponse(pdf_facturas.pdf_factura(factura.pk), content_type="application/pdf")
+        respuesta["Content-Disposition"] = f'inline; filename="factura_{factura.pk}.pdf"'
+        return respuesta
+
+    @action(detail=False, methods=["post"], url_path="pdf-lote")
+    def pdf_lote(self, request):
+        """ZIP en streaming con el PDF de cada factura. Body: ``{"ids": [1, 2, ...]}``."""
+        if getattr(request.user, "rol", None) not in ("admin", "empleado"):
+            return Response({"detail": "Solo empleados o administradores."}, status=status.HTTP_403_FORBIDDEN)
+        serializer = PdfLoteSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        respuesta = StreamingHttpResponse(
+            pdf_facturas.zip_facturas(serializer.validated_data["ids"]), content_type="application/zip"
+        )
+        respuesta["Content-Disposition"] = 'attachment; filename="facturas.zip"'
+        return respuesta
+
+    @action(detail=False, methods=["post"], url_path="enviar-lote")
+    def enviar_lote(self, request):
+        """Encola el correo de las facturas filtradas (``fecha_from``, ``fecha_to``, ``cliente``, ``solo_pendientes``)."""
+        if getattr(request.user, "rol", None) not in ("admin", "empleado"):
+            return Response({"detail": "Solo empleados o administradores."}, status=status.HTTP_403_FORBIDDEN)
+        serializer = EnvioLoteSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        resumen = correo_facturas.encolar_lote(serializer.filtrar(Factura.objects.all()))
+        return Response(resumen, status=status.HTTP_202_ACCEPTED)
+
+    @action(detail=False, methods=["get"], url_path=r"envios/(?P<lote>[0-9a-f]{32})")
+    def envio(self, request, lote=None):
+        """Avance de un envío masivo: correos por estado y porcentaje terminado."""
+        if getattr(request.user, "rol", None) not in ("admin", "empleado"):
+            return Response({"detail": "Solo empleados o administradores."}, status=status.HTTP_403_FORBIDDEN)
+        progreso = cola_correo.progreso(lote)
+        if progreso is None:
+            return Response({"detail": "Envío no encontrado."}, status=status.HTTP_404_NOT_FOUND)
+        return Response(progreso)
+
 
 # ======================================================
 # 🔹 CRUD DE DETALLES (PROTEGIDO)
 # ======================================================
-class DetalleFacturaViewSet(viewsets.ModelViewSet):
+class DetalleFacturaViewSet(EagerLoadingMixin, viewsets.ModelViewSet):
     queryset = DetalleFactura.objects.all()
     serializer_class = DetalleFacturaSerializer
     permission_classes = [EsEmpleadoOAdministrador]
 
+    # cada cambio de un detalle rehace la venta de su factura en los rollups (ver facturacion/ventas.py)
+    def perform_update(self, serializer) -> None:
+        with ventas.cambiando([serializer.instance.factura_id]):
+            serializer.save()
+
+    def perform_destroy(self, instance) -> None:
+        with ventas.cambiando([instance.factura_id]):
+            instance.delete()
+
 
 # ======================================================
 # 🧾 REGISTRO MANUAL DE FACTURA (USADO POR TU PANEL)
 # ======================================================
 class RegistrarFacturaView(APIView):
+    """
+    Registra una venta: precios desde el inventario y salida de stock en la misma transacción.
+    Ejemplo JSON:
+    {
+        "cliente": 1,
+        "metodo_pago": "efectivo",
+        "detalles": [
+            {"medicamento": 2, "cantidad": 3},
+            {"medicamento": 5, "cantidad": 1}
+        ]
+    }
+    ``precio_unitario``, ``subtotal`` y ``total`` enviados por el cliente se ignoran.
+    """
     permission_classes = [EsEmpleadoOAdministrador]
 
     def post(self, request) -> Response:
-        data = request.data
-
-        try:
-            # Obtener cliente por ID
-            cliente_id = data.get("cliente")
-            cliente = get_object_or_404(Usuario, id=cliente_id)
-
-            # Crear factura
-            factura = Factura.objects.create(
-                cliente=cliente,
-                empleado=request.user if request.user.is_authenticated else None,
-                metodo_pago=data.get("metodo_pago", "efectivo"),
-                direccion_entrega=data.get("direccion_entrega", ""),
-                observaciones=data.get("observaciones", ""),
-                total=data.get("total", 0)
-            )
-
-            # Crear detalles
-            detalles = data.get("detalles", [])
-            for d in detalles:
-                medicamento = get_object_or_404(Medicamento, id=d.get("medicamento"))
-
-                DetalleFactura.objects.create(
-                    factura=factura,
-                    medicamento=medicamento,
-                    cantidad=d.get("cantidad", 1),
-                    precio_unitario=d.get("precio_unitario", 0),
-                    subtotal=d.get("subtotal", 0)
-                )
-            return Response(
-                {"mensaje": "Factura registrada correctamente", "factura_id": factura.cliente},
-                status=status.HTTP_201_CREATED
-            )
-
-        except Exception as e:
-            return Response({"error": str(e)}, status=status.HTTP_400_BAD_REQUEST)
+        serializer = RegistrarFacturaSerializer(data=request.data, context={"request": request})
+        serializer.is_valid(raise_exception=True)
+        factura = serializer.save()
+        return Response(
+            {"mensaje": "Factura registrada correctamente", "factura_id": factura.id, "total": str(factura.total)},
+            status=status.HTTP_201_CREATED
+        )
 
 
 # ======================================================
 # 📋 LISTAR TODAS LAS FACTURAS (ADMIN / EMPLEADO)
 # ======================================================
-class FacturaListView(generics.ListAPIView):
+class FacturaListView(EagerLoadingMixin, generics.ListAPIView):
     serializer_class = FacturaSerializer
     permission_classes = [EsEmpleadoOAdministrador]
 
@@ -99,7 +144,7 @@ class FacturaListView(generics.ListAPIView):
 # ======================================================
 # 💊 LISTAR DETALLES
 # ======================================================
-class DetalleFacturaListView(generics.ListAPIView):
+class DetalleFacturaListView(EagerLoadingMixin, generics.ListAPIView):
     serializer_class = DetalleFacturaSerializer
     permission_classes = [EsEmpleadoOAdministrador]
 
@@ -110,7 +155,7 @@ class DetalleFacturaListView(generics.ListAPIView):
 # ======================================================
 # 🧍 FACTURAS DEL CLIENTE AUTENTICADO
 # ======================================================
-class HistorialFacturasView(generics.ListAPIView):
+class HistorialFacturasView(EagerLoadingMixin, generics.ListAPIView):
     serializer_class = FacturaSerializer
     permission_classes = [permissions.IsAuthenticated]
 
@@ -121,7 +166,7 @@ class HistorialFacturasView(generics.ListAPIView):
 # ======================================================
 # 👨‍💼 FACTURAS SEGÚN EL ROL DEL USUARIO
 # ======================================================
-class MisFacturasView(generics.ListAPIView):
+class MisFacturasView(EagerLoadingMixin, generics.ListAPIView):
     serializer_class = FacturaSerializer
     permission_classes = [permissions.IsAuthenticated]
 
@@ -142,31 +187,54 @@ class MisFacturasView(generics.ListAPIView):
 
 
 
+# ======================================================
+# 📈 ANALÍTICA DE VENTAS (SOBRE LOS ROLLUPS DIARIOS)
+# ======================================================
+class VentasResumenView(APIView):
+    """Totales por día y del rango: ``?desde=&hasta=`` (por defecto los últimos 30 días)."""
+    permission_classes = [EsEmpleadoOPermisoAdmin]
+
+    def get(self, request):
+        filtro = VentasFiltroSerializer(data=request.query_params)
+        filtro.is_valid(raise_exception=True)
+        return Response(ventas.serie(filtro.validated_data["desde"], filtro.validated_data["hasta"]))
+
+
+class VentasPorDimensionView(APIView):
+    """
+    Ranking por ``medicamento``, ``categoria``, ``drogueria``, ``empleado`` o ``metodo_pago``.
+    Parámetros: desde, hasta, limite, por_dia y los filtros que admita la dimensión
+    (drogueria/categoria en productos, empleado/metodo_pago en canales).
+    """
+    permission_classes = [EsEmpleadoOPermisoAdmin]
+
+    def get(self, request, dimension):
+        if dimension not in ventas.DIMENSIONES:
+            return Response(
+                {"detail": f"Dimensión desconocida. Opciones: {', '.join(ventas.DIMENSIONES)}."},
+                status=status.HTTP_404_NOT_FOUND,
+            )
+        filtro = VentasFiltroSerializer(data=request.query_params)
+        filtro.is_valid(raise_exception=True)
+        datos = filtro.validated_data
+        filas = ventas.ranking(
+            dimension, datos["desde"], datos["hasta"], filtro.filtros, por_dia=datos["por_dia"], limite=datos["limite"]
+        )
+        return Response({"dimension": dimension, "desde": datos["desde"], "hasta": datos["hasta"], "resultados": filas})
+
+
 class EnviarFacturaEmailView(APIView):
     permission_classes = [permissions.IsAuthenticated]  # Solo empleados/admins
 
     def post(self, request, factura_id):
-        factura = get_object_or_404(Factura, id=factura_id)
+        factura = get_object_or_404(Factura.objects.select_related("cliente"), id=factura_id)
 
         if not factura.cliente.email:
             return Response({"error": "El cliente no tiene correo registrado."}, status=status.HTTP_400_BAD_REQUEST)
 
-        # Generar PDF
-        pdf_buffer = generar_pdf_factura(factura)
-
-        # Crear email
-        email = EmailMessage(
-            subject=f"Factura #{factura.id}",
-            body=f"Estimado/a {factura.cliente.username},\nAdjuntamos su factura #{factura.id}.",
-            from_email="tu_correo@dominio.com",
-            to=[factura.cliente.email],
+        # el worker (manage.py enviar_correos) genera el PDF, lo envía y marca correo_enviado
+        correo = correo_facturas.encolar(factura)
+        return Response(
+            {"mensaje": "Factura en cola de envío", "correo_id": correo.id},
+            status=status.HTTP_202_ACCEPTED,
         )
-        email.attach(f"factura_{factura.id}.pdf", pdf_buffer.read(), "application/pdf")
-
-        try:
-            email.send()
-            factura.correo_enviado = True
-            factura.save()
-            return Response({"mensaje": "Factura enviada por email correctamente"})
-        except Exception as e:
-            return Response({"error": str(e)}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
\ No newline at end of file
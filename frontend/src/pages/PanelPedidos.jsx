@@ -29,33 +29,14 @@ export default function PanelPedidos() {
     setLoading(true);
     setError(null);
     try {
-      const data = await obtenerPedidos();
-
-      // ✅ Asegúrate de que sea un array
-      let listaPedidos = Array.isArray(data) ? data : [];
-
-      // Aplicar filtros localmente (si no está implementado en backend)
-      if (busqueda) {
-        listaPedidos = listaPedidos.filter((p) => {
-          const nombre = obtenerNombreCliente(p);
-          return (
-            nombre.toLowerCase().includes(busqueda.toLowerCase()) ||
-            p.id.toString().includes(busqueda)
-          );
-        });
-      }
-
-      if (estadoFiltro) {
-        listaPedidos = listaPedidos.filter((p) => p.estado === estadoFiltro);
-      }
-
-      // Aplicar paginación
-      const inicio = (page - 1) * pageSize;
-      const fin = inicio + pageSize;
-      const paginados = listaPedidos.slice(inicio, fin);
-
-      setPedidos(paginados);
-      setTotalCount(listaPedidos.length);
+      // Filtros y paginación en el backend
+      const params = { page, page_size: pageSize };
+      if (busqueda) params.buscar = busqueda;
+      if (estadoFiltro) params.estado = estadoFiltro;
+      const data = await obtenerPedidos(params);
+
+      setPedidos(Array.isArray(data?.results) ? data.results : []);
+      setTotalCount(data?.count ?? 0);
     } catch (e) {
       console.error("Error al cargar pedidos:", e);
       setError("Error del servidor. Revisa la consola.");
@@ -66,6 +47,9 @@ export default function PanelPedidos() {
 
   // ✅ Extrae el nombre del cliente de forma segura
   const obtenerNombreCliente = (pedido) => {
+    if (pedido.cliente_nombre) {
+      return pedido.cliente_nombre;
+    }
     if (typeof pedido.cliente === "string") {
       return pedido.cliente;
     }
@@ -10,8 +10,10 @@ const getAuthHeaders = () => {
   };
 };
 
-export const obtenerPedidos = async () => {
-  const res = await API.get("pedidos/listar/", getAuthHeaders());
+// Listado paginado: params = { page, page_size, estado, cliente, fecha_from, fecha_to, buscar, expand }
+// Respuesta: { count, next, previous, results }
+export const obtenerPedidos = async (params = {}) => {
+  const res = await API.get("pedidos/listar/", { ...getAuthHeaders(), params });
   return res.data;
 };
 
@@ -76,3 +76,31 @@ class AuditLogAdmin(admin.ModelAdmin):
     list_display = ('id', 'action', 'model_name', 'object_id', 'user', 'created_at')
     list_filter = ('action', 'model_name', 'user')
     search_fields = ('message',)
+
+
+from .models import ResumenInventario
+
+
+@admin.register(ResumenInventario)
+class ResumenInventarioAdmin(admin.ModelAdmin):
+    list_display = ('id', 'drogueria', 'categoria', 'skus', 'unidades', 'valor_venta', 'valor_costo', 'bajo_stock', 'vencidos', 'actualizado')
+    list_filter = ('drogueria',)
+    readonly_fields = ('actualizado',)
+
+
+from .models import OrdenTransferencia, LineaTransferencia
+
+
+class LineaTransferenciaInline(admin.TabularInline):
+    model = LineaTransferencia
+    extra = 0
+    raw_id_fields = ('medicamento_origen', 'medicamento_destino')
+
+
+@admin.register(OrdenTransferencia)
+class OrdenTransferenciaAdmin(admin.ModelAdmin):
+    list_display = ('id', 'origen', 'destino', 'estado', 'solicitante', 'fecha_solicitud', 'fecha_respuesta')
+    list_filter = ('estado', 'origen', 'destino')
+    search_fields = ('origen__codigo', 'destino__codigo', 'nota')
+    readonly_fields = ('fecha_solicitud', 'fecha_respuesta')
+    inlines = [LineaTransferenciaInline]
@@ -0,0 +1,412 @@
+"""Archivo mensual del ``AuditLog`` en segmentos JSONL comprimidos.
+
+``archivar()`` (``manage.py archivar_auditoria``, pensado para un cron
+mensual) saca de la tabla las filas anteriores a los últimos
+``INVENTARIO_AUDIT_HOT_MONTHS`` meses y las escribe, por mes, en
+``INVENTARIO_AUDIT_ARCHIVE_DIR``:
+
+- ``AAAA-MM.pNNN.jsonl.gz``: una fila por línea, por ``created_at``
+- ``AAAA-MM.pNNN.idx.json``: filas, rango de fechas y de ids, los valores
+  de ``action``, ``model_name`` y ``user`` presentes en el segmento y las
+  filas por cada combinación de los tres (``grupos``)
+
+El índice se escribe después de los datos y las filas se borran de la
+tabla después del índice; un segmento sin índice se ignora y un borrado
+interrumpido se completa en la siguiente ejecución.
+
+Las consultas leen solo los segmentos cuyo índice puede contener filas
+que cumplan los filtros, y de esos solo los que caen en la página pedida
+(ver ``ListaCombinada``). El total sale de ``grupos`` sin abrir ningún
+segmento, salvo en los que un filtro de fechas corta a medias o con
+``object_id``; esos se cuentan leyéndolos una vez por proceso.
+"""
+import gzip
+import json
+import os
+import threading
+from datetime import datetime, time as dtime
+from pathlib import Path
+
+from django.conf import settings
+from django.utils import timezone
+from django.utils.dateparse import parse_date, parse_datetime
+
+HOT_MONTHS = getattr(settings, 'INVENTARIO_AUDIT_HOT_MONTHS', 3)
+
+_CAMPOS = ('id', 'action', 'model_name', 'object_id', 'user_id', 'message', 'data', 'created_at')
+
+_cache_indices = {'firma': None, 'indices': []}
+# (segmento, filtros) -> filas que cumplen; los segmentos no cambian una vez escritos
+_cache_conteos = {}
+_CONTEOS_MAX = 4096
+_cache_lock = threading.Lock()
+
+
+def _directorio():
+    return Path(getattr(settings, 'INVENTARIO_AUDIT_ARCHIVE_DIR', Path(settings.BASE_DIR) / 'var' / 'auditoria_archivo'))
+
+
+def _inicio_mes(fecha):
+    return fecha.replace(day=1, hour=0, minute=0, second=0, microsecond=0)
+
+
+def _sumar_meses(fecha, meses):
+    total = fecha.year * 12 + fecha.month - 1 + meses
+    return fecha.replace(year=total // 12, month=total % 12 + 1)
+
+
+def limite_activo(meses=None, ahora=None):
+    """Primer instante que se conserva en la tabla."""
+    ahora = timezone.localtime(ahora or timezone.now())
+    return _sumar_meses(_inicio_mes(ahora), -(HOT_MONTHS if meses is None else meses))
+
+
+# -- escritura --------------------------------------------------------------
+def _serializar(fila):
+    return {c: (fila[c].isoformat() if c == 'created_at' else fila[c]) for c in _CAMPOS}
+
+
+def _siguiente_parte(directorio, mes):
+    partes = [int(p.name.split('.p')[1].split('.')[0]) for p in directorio.glob(f'{mes}.p*.idx.json')]
+    return max(partes, default=0) + 1
+
+
+def _escribir_segmento(directorio, mes, filas):
+    """Escribe ``filas`` (iterador de dicts) como un segmento del mes. Devuelve su índice o ``None``."""
+    base = f'{mes}.p{_siguiente_parte(directorio, mes):03d}'
+    datos = directorio / f'{base}.jsonl.gz'
+    tmp = directorio / f'{base}.jsonl.gz.tmp'
+    indice = {
+        'segmento': datos.name, 'filas': 0, 'desde': None, 'hasta': None,
+        'id_min': None, 'id_max': None, 'actions': set(), 'model_names': set(), 'users': set(),
+    }
+    grupos = {}
+    with gzip.open(tmp, 'wt', encoding='utf-8') as f:
+        for fila in filas:
+            fila = _serializar(fila)
+            f.write(json.dumps(fila, default=str) + '\n')
+            indice['filas'] += 1
+            indice['desde'] = indice['desde'] or fila['created_at']
+            indice['hasta'] = fila['created_at']
+            indice['id_min'] = fila['id'] if indice['id_min'] is None else min(indice['id_min'], fila['id'])
+            indice['id_max'] = fila['id'] if indice['id_max'] is None else max(indice['id_max'], fila['id'])
+            indice['actions'].add(fila['action'])
+            indice['model_names'].add(fila['model_name'])
+            indice['users'].add(fila['user_id'])
+            clave = (fila['action'], fila['model_name'], fila['user_id'])
+            grupos[clave] = grupos.get(clave, 0) + 1
+    if not indice['filas']:
+        tmp.unlink()
+        return None
+    os.replace(tmp, datos)
+    for clave in ('actions', 'model_names', 'users'):
+        indice[clave] = sorted(indice[clave], key=lambda v: (v is None, str(v)))
+    indice['grupos'] = [[*clave, n] for clave, n in sorted(grupos.items(), key=lambda g: tuple(str(v) for v in g[0]))]
+    tmp_idx = directorio / f'{base}.idx.json.tmp'
+    tmp_idx.write_text(json.dumps(indice), encoding='utf-8')
+    os.replace(tmp_idx, directorio / f'{base}.idx.json')
+    return indice
+
+
+def _borrar_archivadas(indice):
+    from .models import AuditLog
+    return AuditLog.objects.filter(
+        created_at__gte=parse_datetime(indice['desde']),
+        created_at__lte=parse_datetime(indice['hasta']),
+        id__gte=indice['id_min'], id__lte=indice['id_max'],
+    ).delete()[0]
+
+
+def archivar(meses=None, ahora=None):
+    """Mueve al archivo las filas anteriores a ``limite_activo()``. Devuelve los índices creados."""
+    from .models import AuditLog
+
+    directorio = _directorio()
+    directorio.mkdir(parents=True, exist_ok=True)
+    # completar borrados de una ejecución interrumpida
+    for indice in indices():
+        _borrar_archivadas(indice)
+
+    limite = limite_activo(meses, ahora)
+    viejas = AuditLog.objects.filter(created_at__lt=limite)
+    creados = []
+    for mes in viejas.datetimes('created_at', 'month'):
+        fin = _sumar_meses(mes, 1)
+        filas = (
+            viejas.filter(created_at__gte=mes, created_at__lt=fin)
+            .order_by('created_at', 'id').values(*_CAMPOS).iterator(chunk_size=2000)
+        )
+        indice = _escribir_segmento(directorio, mes.strftime('%Y-%m'), filas)
+        if indice is not None:
+            _borrar_archivadas(indice)
+            creados.append(indice)
+    return creados
+
+
+# -- lectura ----------------------------------------------------------------
+def indices():
+    """Índices de todos los segmentos completos (cacheados mientras no cambie el directorio)."""
+    directorio = _directorio()
+    if not directorio.exists():
+        return []
+    rutas = sorted(directorio.glob('*.idx.json'))
+    firma = tuple((r.name, r.stat().st_mtime_ns) for r in rutas)
+    with _cache_lock:
+        if _cache_indices['firma'] != firma:
+            _cache_indices['indices'] = [json.loads(r.read_text(encoding='utf-8')) for r in rutas]
+            _cache_indices['firma'] = firma
+            _cache_conteos.clear()
+        return _cache_indices['indices']
+
+
+def _fecha(valor):
+    if not valor:
+        return None
+    dt = parse_datetime(valor)
+    if dt is None:
+        d = parse_date(valor)
+        if d is None:
+            return None
+        dt = datetime.combine(d, dtime.min)
+    if timezone.is_naive(dt):
+        dt = timezone.make_aware(dt)
+    return dt
+
+
+def _entero(valor):
+    try:
+        return int(valor) if valor not in (None, '') else None
+    except (TypeError, ValueError):
+        return None
+
+
+def filtros(params):
+    """Los mismos filtros que ``apply_audit_filters``, listos para comparar en Python."""
+    return {
+        'action': params.get('action') or None,
+        'model_name': params.get('model_name') or None,
+        'user_id': _entero(params.get('user')),
+        'object_id': _entero(params.get('object_id')),
+        'desde': _fecha(params.get('created_from')),
+        'hasta': _fecha(params.get('created_to')),
+    }
+
+
+def _puede_coincidir(indice, f):
+    if f['desde'] and parse_datetime(indice['hasta']) < f['desde']:
+        return False
+    if f['hasta'] and parse_datetime(indice['desde']) > f['hasta']:
+        return False
+    if f['action'] and f['action'] not in indice['actions']:
+        return False
+    if f['model_name'] and f['model_name'] not in indice['model_names']:
+        return False
+    if f['user_id'] is not None and f['user_id'] not in indice['users']:
+        return False
+    return True
+
+
+def _cubre_fechas(indice, f):
+    """Si el rango de fechas de los filtros contiene el segmento entero."""
+    if f['desde'] and parse_datetime(indice['desde']) < f['desde']:
+        return False
+    if f['hasta'] and parse_datetime(indice['hasta']) > f['hasta']:
+        return False
+    return True
+
+
+def _conteo_indice(indice, f):
+    """Filas del segmento que cumplen ``f`` según su índice, o ``None`` si hay que leerlo."""
+    if f['object_id'] is not None or not _cubre_fechas(indice, f):
+        return None
+    if 'grupos' in indice:
+        return sum(
+            n for action, model_name, user_id, n in indice['grupos']
+            if (f['action'] is None or action == f['action'])
+            and (f['model_name'] is None or model_name == f['model_name'])
+            and (f['user_id'] is None or user_id == f['user_id'])
+        )
+    # segmentos escritos antes de ``grupos``: solo si el filtro abarca el segmento entero
+    for filtro, clave in (('action', 'actions'), ('model_name', 'model_names'), ('user_id', 'users')):
+        if f[filtro] is not None and indice[clave] != [f[filtro]]:
+            return None
+    return indice['filas']
+
+
+def _clave_conteo(indice, f):
+    return indice['segmento'], tuple(sorted(f.items()))
+
+
+def _conteo_conocido(indice, f):
+    n = _conteo_indice(indice, f)
+    if n is None:
+        with _cache_lock:
+            n = _cache_conteos.get(_clave_conteo(indice, f))
+    return n
+
+
+def _recordar_conteo(indice, f, n):
+    with _cache_lock:
+        if len(_cache_conteos) >= _CONTEOS_MAX:
+            _cache_conteos.clear()
+        _cache_conteos[_clave_conteo(indice, f)] = n
+
+
+def segmentos(f):
+    return [i for i in indices() if _puede_coincidir(i, f)]
+
+
+def _leer(nombre):
+    with gzip.open(_directorio() / nombre, 'rt', encoding='utf-8') as fh:
+        for linea in fh:
+            yield json.loads(linea)
+
+
+def _cumple(fila, f, creado):
+    return (
+        (f['action'] is None or fila['action'] == f['action'])
+        and (f['model_name'] is None or fila['model_name'] == f['model_name'])
+        and (f['user_id'] is None or fila['user_id'] == f['user_id'])
+        and (f['object_id'] is None or fila['object_id'] == f['object_id'])
+        and (f['desde'] is None or creado >= f['desde'])
+        and (f['hasta'] is None or creado <= f['hasta'])
+    )
+
+
+def _instancia(fila, creado):
+    from .models import AuditLog
+    return AuditLog(**dict(fila, created_at=creado))
+
+
+def _con_usuarios(filas):
+    """Carga los usuarios de ``filas`` en una consulta (el serializer muestra ``user``)."""
+    from usuarios.models import Usuario
+    usuarios = Usuario.objects.in_bulk({a.user_id for a in filas if a.user_id})
+    for a in filas:
+        if a.user_id:
+            a.user = usuarios.get(a.user_id)
+    return filas
+
+
+def _filas_segmento(indice, f):
+    filas = []
+    for fila in _leer(indice['segmento']):
+        creado = parse_datetime(fila['created_at'])
+        if _cumple(fila, f, creado):
+            filas.append(_instancia(fila, creado))
+    _recordar_conteo(indice, f, len(filas))
+    return filas
+
+
+def _tramos(segs, descendente):
+    """Agrupa los segmentos cuyos rangos de fechas se solapan (partes de un mismo mes), en orden."""
+    tramos = []
+    for indice in sorted(segs, key=lambda i: (i['desde'], i['hasta'])):
+        if tramos and indice['desde'] <= tramos[-1]['hasta']:
+            tramos[-1]['segmentos'].append(indice)
+            tramos[-1]['hasta'] = max(tramos[-1]['hasta'], indice['hasta'])
+        else:
+            tramos.append({'hasta': indice['hasta'], 'segmentos': [indice]})
+    return [t['segmentos'] for t in (reversed(tramos) if descendente else tramos)]
+
+
+def buscar(f, inicio=0, fin=None, descendente=True):
+    """Filas archivadas ``[inicio:fin]`` que cumplen ``f``, por fecha, como ``AuditLog`` sin guardar.
+
+    Los tramos que quedan antes de ``inicio`` se saltan con su conteo y la
+    lectura se detiene al llegar a ``fin``: solo se abren los segmentos de
+    la página.
+    """
+    resultado, posicion = [], 0
+    for tramo in _tramos(segmentos(f), descendente):
+        if fin is not None and posicion >= fin:
+            break
+        conteos = [_conteo_conocido(i, f) for i in tramo]
+        if None not in conteos and posicion + sum(conteos) <= inicio:
+            posicion += sum(conteos)
+            continue
+        filas = [a for indice in tramo for a in _filas_segmento(indice, f)]
+        filas.sort(key=lambda a: (a.created_at, a.id), reverse=descendente)
+        desde = max(inicio - posicion, 0)
+        resultado += filas[desde:None if fin is None else fin - posicion]
+        posicion += len(filas)
+    return resultado
+
+
+def contar(f):
+    total = 0
+    for indice in segmentos(f):
+        n = _conteo_conocido(indice, f)
+        total += len(_filas_segmento(indice, f)) if n is None else n
+    return total
+
+
+def obtener(pk):
+    """Fila archivada con ese id, o ``None`` (solo lee el segmento cuyo rango la contiene)."""
+    for indice in indices():
+        if indice['id_min'] <= pk <= indice['id_max']:
+            for fila in _leer(indice['segmento']):
+                if fila['id'] == pk:
+                    return _con_usuarios([_instancia(fila, parse_datetime(fila['created_at']))])[0]
+    return None
+
+
+class ListaCombinada:
+    """Filas de la tabla y archivadas en un solo orden por ``created_at``, para el ``Paginator`` de Django.
+
+    Las archivadas son siempre anteriores a las de la tabla: con
+    ``-created_at`` van detrás de las activas y con ``created_at`` delante,
+    y el resultado es continuo. Solo se leen los segmentos de la página
+    pedida; ``count()`` sale de los índices (ver ``contar``).
+    """
+
+    def __init__(self, queryset, params, descendente=True):
+        self.queryset = queryset
+        self.filtros = filtros(params)
+        self.descendente = descendente
+        self._activas = None
+        self._archivadas = None
+
+    def _total_activas(self):
+        if self._activas is None:
+            self._activas = self.queryset.count()
+        return self._activas
+
+    def _total_archivadas(self):
+        if self._archivadas is None:
+            self._archivadas = contar(self.filtros)
+        return self._archivadas
+
+    def count(self):
+        return self._total_activas() + self._total_archivadas()
+
+    def __len__(self):
+        return self.count()
+
+    def _activas_rango(self, inicio, fin):
+        return list(self.queryset[inicio:fin]) if fin > inicio else []
+
+    def _archivadas_rango(self, inicio, fin):
+        if fin <= inicio:
+            return []
+        return _con_usuarios(buscar(self.filtros, inicio, fin, self.descendente))
+
+    def __getitem__(self, item):
+        if not isinstance(item, slice):
+            return list(self[item:item + 1])[0]
+        inicio, fin = item.start or 0, item.stop
+        if self.descendente:
+            activas = self._total_activas()
+            return (
+                self._activas_rango(inicio, min(fin, activas))
+                + self._archivadas_rango(max(inicio - activas, 0), fin - activas)
+            )
+        archivadas = self._total_archivadas()
+        return (
+            self._archivadas_rango(inicio, min(fin, archivadas))
+            + self._activas_rango(max(inicio - archivadas, 0), fin - archivadas)
+        )
+
+
+def hay_archivo(params):
+    return bool(segmentos(filtros(params)))
@@ -0,0 +1,255 @@
+"""Escritura diferida y por lotes del ``AuditLog``.
+
+Las señales ya no insertan una fila de auditoría dentro de cada petición.
+``registrar()`` arma el evento y, cuando la transacción hace commit, lo
+encola; un hilo en segundo plano lo vuelca con ``bulk_create`` cada
+``INVENTARIO_AUDIT_INTERVAL`` segundos o al juntar ``INVENTARIO_AUDIT_BATCH``
+eventos. Un rollback descarta el evento junto con lo que auditaba.
+
+Durabilidad: cada evento encolado se escribe también en un segmento
+``<pid>-<token>-<n>.jsonl`` de ``INVENTARIO_AUDIT_SPOOL_DIR``; el token es
+propio de cada proceso, así que un proceso que reutiliza el PID de otro caído
+(lo normal en contenedores) nunca escribe en sus segmentos. El segmento se
+borra solo después de insertar sus eventos, y cada evento lleva un UUID único
+(``AuditLog.evento``), así que reinsertar un segmento tras una caída no
+duplica filas. Antes de abrir su primer segmento, el proceso recupera los de
+procesos que ya no existen; también lo hace ``manage.py recuperar_auditoria``.
+
+``INVENTARIO_AUDIT_ASYNC = False`` vuelve a la inserción síncrona.
+"""
+import atexit
+import json
+import logging
+import os
+import threading
+import time
+import uuid
+from pathlib import Path
+
+from django.conf import settings
+from django.db import connection, transaction
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+
+logger = logging.getLogger(__name__)
+
+
+def _config(nombre, defecto):
+    return getattr(settings, f'INVENTARIO_AUDIT_{nombre}', defecto)
+
+
+def _spool_dir():
+    ruta = _config('SPOOL_DIR', Path(settings.BASE_DIR) / 'var' / 'auditoria')
+    return Path(ruta) if ruta else None
+
+
+def _evento(action, model_name=None, object_id=None, user=None, message=None, data=None):
+    return {
+        'evento': str(uuid.uuid4()),
+        'action': action,
+        'model_name': model_name,
+        'object_id': object_id,
+        'user_id': getattr(user, 'pk', user),
+        'message': message,
+        'data': data,
+        'created_at': timezone.now().isoformat(),
+    }
+
+
+def _fila(evento):
+    from .models import AuditLog
+    return AuditLog(**dict(evento, created_at=parse_datetime(evento['created_at'])))
+
+
+def insertar(eventos):
+    """Inserta ``eventos``; los que ya estaban (mismo UUID) se ignoran."""
+    from .models import AuditLog
+    AuditLog.objects.bulk_create([_fila(e) for e in eventos], batch_size=500, ignore_conflicts=True)
+
+
+def _pid_vivo(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+def recuperar(incluir_vivos=False):
+    """Inserta los segmentos que dejaron procesos caídos. Devuelve el número de eventos."""
+    directorio = _spool_dir()
+    if directorio is None or not directorio.exists():
+        return 0
+    total = 0
+    for segmento in sorted(directorio.glob('*.jsonl')):
+        partes = segmento.stem.split('-')
+        pid = int(partes[0])
+        token = partes[1] if len(partes) == 3 else None  # ``<pid>-<n>``: formato anterior
+        if token is not None and token == cola._token:
+            continue  # segmentos vivos de este mismo proceso
+        # mismo PID y otro token: un proceso caído cuyo PID heredó este
+        if pid != os.getpid() and not incluir_vivos and _pid_vivo(pid):
+            continue
+        eventos = []
+        try:
+            with open(segmento, encoding='utf-8') as f:
+                for linea in f:
+                    try:
+                        eventos.append(json.loads(linea))
+                    except ValueError:
+                        # última línea a medio escribir cuando cayó el proceso
+                        continue
+        except FileNotFoundError:
+            continue  # otro proceso lo recuperó primero
+        insertar(eventos)
+        segmento.unlink(missing_ok=True)
+        total += len(eventos)
+    return total
+
+
+class ColaAuditoria:
+    """Cola en memoria (con espejo en disco) y el hilo que la vuelca."""
+
+    def __init__(self):
+        self._cond = threading.Condition()
+        self._pendientes = []
+        self._segmento = None      # archivo abierto donde se escriben los nuevos eventos
+        self._cerrados = []        # segmentos con eventos tomados pero aún no confirmados
+        self._secuencia = 0
+        self._hilo = None
+        self._pid = None
+        self._token = None         # distingue este proceso de otro que tuvo su PID
+        self._recuperado = False
+        self.volcados = 0
+        self.fallos = 0
+        self.ultima_latencia = None
+        self.max_latencia = 0.0
+
+    # -- escritura ---------------------------------------------------------
+    def _abrir_segmento(self):
+        directorio = _spool_dir()
+        if directorio is None:
+            return None
+        directorio.mkdir(parents=True, exist_ok=True)
+        self._secuencia += 1
+        ruta = directorio / f'{os.getpid()}-{self._token}-{self._secuencia:06d}.jsonl'
+        return open(ruta, 'a', encoding='utf-8')
+
+    def encolar(self, evento):
+        with self._cond:
+            self._asegurar_hilo()
+            if self._segmento is None:
+                if not self._recuperado:
+                    self._recuperado = True
+                    try:
+                        recuperar()
+                    except Exception:
+                        logger.exception('No se pudieron recuperar segmentos de auditoría')
+                self._segmento = self._abrir_segmento()
+            if self._segmento is not None:
+                self._segmento.write(json.dumps(evento, default=str) + '\n')
+                self._segmento.flush()
+                if _config('FSYNC', False):
+                    os.fsync(self._segmento.fileno())
+            self._pendientes.append(evento)
+            if len(self._pendientes) >= _config('BATCH', 500):
+                self._cond.notify()
+
+    # -- volcado -----------------------------------------------------------
+    def flush(self):
+        """Inserta todo lo pendiente. Devuelve el número de eventos insertados."""
+        with self._cond:
+            eventos, self._pendientes = self._pendientes, []
+            if self._segmento is not None:
+                self._segmento.close()
+                self._cerrados.append(self._segmento.name)
+                self._segmento = None
+            cerrados, self._cerrados = self._cerrados, []
+        if not eventos and not cerrados:
+            return 0
+
+        inicio = time.monotonic()
+        try:
+            insertar(eventos)
+        except Exception:
+            logger.exception('No se pudo volcar la auditoría; se reintentará')
+            with self._cond:
+                self.fallos += 1
+                self._pendientes[:0] = eventos
+                self._cerrados[:0] = cerrados
+            return 0
+        for ruta in cerrados:
+            try:
+                os.unlink(ruta)
+            except FileNotFoundError:
+                pass
+
+        latencia = time.monotonic() - inicio
+        with self._cond:
+            self.volcados += len(eventos)
+            self.ultima_latencia = latencia
+            self.max_latencia = max(self.max_latencia, latencia)
+        return len(eventos)
+
+    def _asegurar_hilo(self):
+        # tras un fork (gunicorn --preload) el hilo del padre no existe en el hijo
+        if self._hilo is not None and self._hilo.is_alive() and self._pid == os.getpid():
+            return
+        if self._hilo is None:
+            atexit.register(self._al_salir)
+        if self._pid != os.getpid():
+            if self._segmento is not None:
+                # segmento heredado del padre en un fork: es suyo, no de este proceso
+                self._segmento.close()
+                self._segmento = None
+            self._token = uuid.uuid4().hex[:12]
+            self._recuperado = False
+        self._pid = os.getpid()
+        self._hilo = threading.Thread(target=self._trabajar, name='auditoria', daemon=True)
+        self._hilo.start()
+
+    def _al_salir(self):
+        try:
+            self.flush()
+        except Exception:
+            # lo que quede sigue en el segmento y se recupera en el próximo arranque
+            logger.exception('No se pudo volcar la auditoría al salir')
+
+    def _trabajar(self):
+        while True:
+            with self._cond:
+                self._cond.wait(timeout=_config('INTERVAL', 1.0))
+            try:
+                self.flush()
+            finally:
+                connection.close()
+
+    def info(self):
+        with self._cond:
+            antiguo = self._pendientes[0]['created_at'] if self._pendientes else None
+            return {
+                'pendientes': len(self._pendientes),
+                'mas_antiguo': antiguo,
+                'volcados': self.volcados,
+                'fallos': self.fallos,
+                'ultima_latencia_ms': round(self.ultima_latencia * 1000, 2) if self.ultima_latencia is not None else None,
+                'max_latencia_ms': round(self.max_latencia * 1000, 2),
+            }
+
+
+cola = ColaAuditoria()
+
+
+def registrar(action, model_name=None, object_id=None, user=None, message=None, data=None):
+    """Registra un evento de auditoría; se escribe cuando confirma la transacción en curso."""
+    try:
+        evento = _evento(action, model_name, object_id, user, message, data)
+        if not _config('ASYNC', True):
+            insertar([evento])
+            return
+        transaction.on_commit(lambda: cola.encolar(evento))
+    except Exception:
+        # la auditoría nunca debe romper la operación auditada
+        logger.exception('No se pudo registrar el evento de auditoría %s', action)
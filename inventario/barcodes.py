@@ -0,0 +1,123 @@
+"""Búsqueda por código de barras para los lectores del punto de venta.
+
+Consulta exacta sobre el índice (drogueria, codigo_barra) con una caché LRU
+en memoria del proceso por delante. Se cachea la respuesta ya serializada,
+así un escaneo repetido no toca la base de datos ni el serializer.
+
+La caché se invalida desde las señales de ``Medicamento`` (ver signals.py).
+Como es local a cada proceso, y los ``QuerySet.update()`` no disparan
+señales, las entradas caducan además a los ``BARCODE_CACHE_TTL`` segundos.
+"""
+import threading
+import time
+from collections import OrderedDict
+
+from django.conf import settings
+
+BARCODE_CACHE_SIZE = getattr(settings, 'INVENTARIO_BARCODE_CACHE_SIZE', 4096)
+BARCODE_CACHE_TTL = getattr(settings, 'INVENTARIO_BARCODE_CACHE_TTL', 300)
+
+_NO_ENCONTRADO = object()
+
+
+class LRUCache:
+    """Caché LRU acotada y segura entre hilos, con caducidad por entrada."""
+
+    def __init__(self, maxsize, ttl=None):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._datos = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key, default=None):
+        with self._lock:
+            item = self._datos.get(key)
+            if item is None or (self.ttl is not None and item[1] < time.monotonic()):
+                self.misses += 1
+                if item is not None:
+                    del self._datos[key]
+                return default
+            self._datos.move_to_end(key)
+            self.hits += 1
+            return item[0]
+
+    def set(self, key, value):
+        expira = time.monotonic() + self.ttl if self.ttl is not None else None
+        with self._lock:
+            self._datos[key] = (value, expira)
+            self._datos.move_to_end(key)
+            while len(self._datos) > self.maxsize:
+                self._datos.popitem(last=False)
+
+    def delete(self, key):
+        with self._lock:
+            self._datos.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._datos.clear()
+
+    def info(self):
+        with self._lock:
+            return {'hits': self.hits, 'misses': self.misses, 'size': len(self._datos), 'maxsize': self.maxsize}
+
+
+cache = LRUCache(BARCODE_CACHE_SIZE, BARCODE_CACHE_TTL)
+
+# pk -> clave actual, para poder invalidar el código anterior si cambia
+_claves_por_pk = {}
+_claves_lock = threading.Lock()
+
+
+def normalizar(codigo):
+    return (codigo or '').strip()
+
+
+def buscar_por_codigo(drogueria_id, codigo):
+    """Devuelve el medicamento serializado con ese código en la droguería, o ``None``."""
+    from .models import Medicamento
+    from .serializer import MedicamentoSerializer
+
+    clave = (int(drogueria_id), normalizar(codigo))
+    data = cache.get(clave, _NO_ENCONTRADO)
+    if data is not _NO_ENCONTRADO:
+        return data
+
+    med = (
+        Medicamento.objects.select_related('categoria', 'drogueria')
+        .filter(drogueria_id=clave[0], codigo_barra=clave[1], estado=True)
+        .order_by('id')
+        .first()
+    )
+    data = MedicamentoSerializer(med).data if med is not None else None
+    # también se cachean los códigos desconocidos: un lector que repite un
+    # código inexistente no debe golpear la base en cada escaneo
+    cache.set(clave, data)
+    if med is not None:
+        with _claves_lock:
+            if len(_claves_por_pk) >= 2 * cache.maxsize:
+                # el mapa ya no cabe junto a la caché: empezar de cero en ambos
+                _claves_por_pk.clear()
+                cache.clear()
+                cache.set(clave, data)
+            _claves_por_pk[med.pk] = clave
+    return data
+
+
+def invalidar_medicamento(instance):
+    """Descarta las entradas afectadas por un alta, cambio o baja de ``instance``."""
+    with _claves_lock:
+        anterior = _claves_por_pk.pop(instance.pk, None)
+    if anterior is not None:
+        cache.delete(anterior)
+    if instance.drogueria_id is not None and instance.codigo_barra:
+        cache.delete((instance.drogueria_id, normalizar(instance.codigo_barra)))
+
+
+def invalidar_todo():
+    """Para operaciones masivas (``QuerySet.update``, importaciones) que no emiten señales."""
+    with _claves_lock:
+        _claves_por_pk.clear()
+    cache.clear()
@@ -0,0 +1,139 @@
+"""Caché de respuestas del catálogo público con invalidación por versiones.
+
+Cada respuesta se guarda en la caché de Django bajo una clave que incluye los
+parámetros normalizados de la petición y las *versiones* de los ámbitos de los
+que depende:
+
+- ``drogueria:<id>`` / ``categoria:<id>``: medicamentos de esa droguería/categoría
+- ``estructura``: nombres de categorías y droguerías (aparecen anidados)
+- ``todos``: cualquier cambio del catálogo
+
+Invalidar es subir una versión: las claves viejas dejan de usarse y caducan
+solas. Los guardados individuales lo hacen desde signals.py; las operaciones
+masivas (``update()``/``bulk_create``) llaman a ``invalidar_catalogo`` con las
+droguerías y categorías que tocaron. Un listado filtrado por droguería sigue
+sirviéndose de caché aunque cambien medicamentos de otras sucursales.
+
+Versiones y respuestas viven en ``CACHES['default']``, que debe ser
+compartida por todos los procesos (ver settings.py): con una caché local por
+proceso, la versión subida en un worker no invalida lo que guardan los demás.
+Cada versión nueva es ``time.time_ns()`` y no un ``incr``, que en los backends
+de archivo no es atómico entre procesos; así dos invalidaciones simultáneas
+nunca dejan la misma versión.
+"""
+import hashlib
+import json
+import threading
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+from django.utils.http import urlencode
+from rest_framework import status
+from rest_framework.response import Response
+
+CATALOGO_CACHE_TIMEOUT = getattr(settings, 'INVENTARIO_CATALOGO_CACHE_TIMEOUT', 600)
+
+_PREFIJO = 'catalogo'
+
+
+class _Contadores:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.not_modified = 0
+
+    def sumar(self, campo):
+        with self._lock:
+            setattr(self, campo, getattr(self, campo) + 1)
+
+    def info(self):
+        with self._lock:
+            return {'hits': self.hits, 'misses': self.misses, 'not_modified': self.not_modified}
+
+
+contadores = _Contadores()
+
+
+def _clave_version(ambito):
+    return f'{_PREFIJO}:v:{ambito}'
+
+
+def versiones(ambitos):
+    claves = [_clave_version(a) for a in ambitos]
+    actuales = cache.get_many(claves)
+    for clave in claves:
+        if clave not in actuales:
+            # una versión desalojada nunca debe volver a un valor ya usado
+            cache.add(clave, time.time_ns(), None)
+            actuales[clave] = cache.get(clave)
+    return [actuales[c] for c in claves]
+
+
+def subir_version(*ambitos):
+    cache.set_many({_clave_version(a): time.time_ns() for a in ambitos}, None)
+
+
+def invalidar_catalogo(droguerias=(), categorias=(), estructura=False):
+    ambitos = ['todos']
+    ambitos += [f'drogueria:{d}' for d in set(droguerias) if d is not None]
+    ambitos += [f'categoria:{c}' for c in set(categorias) if c is not None]
+    if estructura:
+        ambitos.append('estructura')
+    subir_version(*ambitos)
+
+
+def ambitos_medicamentos(params):
+    """Ámbitos de un listado de medicamentos según sus filtros."""
+    for nombre in ('drogueria', 'categoria'):
+        valor = params.get(nombre)
+        if valor:
+            try:
+                return [f'{nombre}:{int(valor)}', 'estructura']
+            except ValueError:
+                break
+    return ['todos']
+
+
+def _normalizar(params):
+    return urlencode(sorted((k, v) for k, vs in params.lists() for v in vs if v != ''))
+
+
+class CatalogoCacheMixin:
+    """Cachea ``list()`` de vistas públicas de solo lectura y responde ``ETag``/304.
+
+    La vista define ``cache_ambitos`` (lista fija) o sobreescribe
+    ``get_cache_ambitos()``.
+    """
+    cache_ambitos = ('todos',)
+
+    def get_cache_ambitos(self):
+        return list(self.cache_ambitos)
+
+    def list(self, request, *args, **kwargs):
+        vers = versiones(self.get_cache_ambitos())
+        base = f'{self.__class__.__name__}|{request.get_host()}|{_normalizar(request.query_params)}|{vers}'
+        clave = f'{_PREFIJO}:r:' + hashlib.md5(base.encode('utf-8')).hexdigest()
+
+        entrada = cache.get(clave)
+        hit = entrada is not None
+        if not hit:
+            contadores.sumar('misses')
+            response = super().list(request, *args, **kwargs)
+            if response.status_code != status.HTTP_200_OK:
+                return response
+            data = response.data
+            cuerpo = json.dumps(data, sort_keys=True, default=str).encode('utf-8')
+            etag = '"%s"' % hashlib.md5(cuerpo).hexdigest()
+            entrada = (data, etag)
+            cache.set(clave, entrada, CATALOGO_CACHE_TIMEOUT)
+        else:
+            contadores.sumar('hits')
+
+        data, etag = entrada
+        headers = {'ETag': etag, 'X-Cache': 'HIT' if hit else 'MISS'}
+        if etag in [t.strip() for t in request.headers.get('If-None-Match', '').split(',')]:
+            contadores.sumar('not_modified')
+            return Response(status=status.HTTP_304_NOT_MODIFIED, headers=headers)
+        return Response(data, headers=headers)
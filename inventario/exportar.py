@@ -0,0 +1,105 @@
+"""Exportación completa en streaming (NDJSON o CSV, opcionalmente gzip).
+
+Para sacar todo el inventario o el historial de movimientos sin paginar:
+la respuesta es un ``StreamingHttpResponse`` que recorre el queryset con
+``values().iterator(chunk_size=...)`` y va escribiendo bloques de texto,
+así que la memoria no depende del número de filas (ni del servidor ni de
+Django, que no cachea los resultados de ``iterator()``).
+
+Parámetros: ``?formato=ndjson|csv`` (por defecto ndjson) y ``?gzip=1``.
+"""
+import csv
+import json
+import zlib
+
+from django.core.serializers.json import DjangoJSONEncoder
+from django.http import StreamingHttpResponse
+from django.utils import timezone
+
+CHUNK_SIZE = 2000
+_BLOQUE_BYTES = 64 * 1024
+
+FORMATOS = {
+    'ndjson': 'application/x-ndjson',
+    'csv': 'text/csv',
+}
+
+CAMPOS_MEDICAMENTO = (
+    'id', 'nombre', 'descripcion', 'categoria_id', 'categoria__nombre', 'drogueria_id', 'drogueria__nombre',
+    'precio_venta', 'costo_compra', 'lote', 'fecha_ingreso', 'proveedor', 'codigo_barra', 'ubicacion',
+    'stock_actual', 'stock_reservado', 'stock_minimo', 'fecha_vencimiento', 'estado',
+)
+
+CAMPOS_MOVIMIENTO = (
+    'id', 'fecha_movimiento', 'tipo_movimiento', 'cantidad', 'medicamento_id', 'medicamento__nombre',
+    'drogueria_id', 'usuario_id', 'observacion',
+)
+
+
+class _Eco:
+    """Pseudo-archivo para ``csv.writer``: devuelve lo escrito en vez de guardarlo."""
+
+    def write(self, valor):
+        return valor
+
+
+def _lineas_ndjson(filas, campos):
+    for fila in filas:
+        yield json.dumps(fila, cls=DjangoJSONEncoder, ensure_ascii=False) + '\n'
+
+
+def _lineas_csv(filas, campos):
+    writer = csv.writer(_Eco())
+    yield writer.writerow(campos)
+    for fila in filas:
+        yield writer.writerow([fila[c] for c in campos])
+
+
+def _bloques(lineas):
+    """Agrupa líneas en bloques de ~64 KB: menos escrituras al socket."""
+    buffer, tamano = [], 0
+    for linea in lineas:
+        dato = linea.encode('utf-8')
+        buffer.append(dato)
+        tamano += len(dato)
+        if tamano >= _BLOQUE_BYTES:
+            yield b''.join(buffer)
+            buffer, tamano = [], 0
+    if buffer:
+        yield b''.join(buffer)
+
+
+def _gzip(bloques):
+    comp = zlib.compressobj(6, zlib.DEFLATED, 31)  # wbits=31: formato gzip
+    for bloque in bloques:
+        salida = comp.compress(bloque)
+        if salida:
+            yield salida
+    yield comp.flush()
+
+
+def filas(queryset, campos, chunk_size=CHUNK_SIZE):
+    if not queryset.query.order_by and not queryset.query.extra_order_by:
+        # orden estable por clave primaria (sin el ``ordering`` del modelo)
+        queryset = queryset.order_by('pk')
+    return queryset.values(*campos).iterator(chunk_size=chunk_size)
+
+
+def respuesta(queryset, campos, nombre, params):
+    """``StreamingHttpResponse`` con ``queryset`` exportado según ``params``."""
+    formato = params.get('formato', 'ndjson')
+    if formato not in FORMATOS:
+        formato = 'ndjson'
+    comprimir = str(params.get('gzip', '')).lower() in ('1', 'true')
+
+    generar = _lineas_csv if formato == 'csv' else _lineas_ndjson
+    contenido = _bloques(generar(filas(queryset, campos), campos))
+    archivo = f"{nombre}-{timezone.localtime():%Y%m%d-%H%M%S}.{formato}"
+    if comprimir:
+        contenido = _gzip(contenido)
+        archivo += '.gz'
+    response = StreamingHttpResponse(
+        contenido, content_type='application/gzip' if comprimir else f'{FORMATOS[formato]}; charset=utf-8'
+    )
+    response['Content-Disposition'] = f'attachment; filename="{archivo}"'
+    return response
@@ -5,6 +5,8 @@ Centralizamos filtros para poder probar y mantenerlos fácilmente.
 from django.db.models import Q, F
 from django.utils import timezone
 
+from .search import buscar_medicamentos
+
 
 def apply_medicamento_filters(qs, params):
     nombre = params.get('nombre')
@@ -12,16 +14,11 @@ def apply_medicamento_filters(qs, params):
     drogueria = params.get('drogueria')
     estado = params.get('estado')
 
-    # búsqueda general (q) — si viene, usar sobre varios campos
+    # búsqueda general (q) — índice de texto completo sobre varios campos,
+    # ordenado por relevancia (ver search.py)
     qparam = params.get('q')
     if qparam:
-        qs = qs.filter(
-            Q(nombre__icontains=qparam) |
-            Q(descripcion__icontains=qparam) |
-            Q(codigo_barra__icontains=qparam) |
-            Q(proveedor__icontains=qparam) |
-            Q(lote__icontains=qparam)
-        )
+        qs = buscar_medicamentos(qs, qparam)
 
     if nombre and not qparam:
         qs = qs.filter(nombre__icontains=nombre)
@@ -0,0 +1,255 @@
+"""Importación masiva de medicamentos desde CSV o XLSX con upsert.
+
+Pensado para dar de alta una sucursal completa: en lugar de un
+``MedicamentoCreateView`` (y sus señales) por producto, el archivo se
+procesa por bloques de ``CHUNK`` filas:
+
+1. ``categoria`` y ``drogueria`` se resuelven con un diccionario cargado
+   una sola vez (droguería por código o por nombre, sin distinguir
+   mayúsculas)
+2. cada fila se valida con los campos del modelo; las inválidas van al
+   informe de errores con su número de fila
+3. las válidas se escriben con ``bulk_create(update_conflicts=True)`` sobre
+   ``unique_nombre_drogueria``: un medicamento que ya existe en esa
+   droguería se actualiza con las columnas presentes en el archivo
+
+Columnas obligatorias: ``nombre``, ``drogueria`` y ``precio_venta``. Los
+bloques acotan la memoria, no la transacción: todo el archivo se escribe en
+una sola, así un ``ArchivoInvalido`` a mitad de lectura (p. ej. un byte que
+no decodifica más allá de la muestra) no deja una importación a medias. Al
+final se reconstruye el resumen de inventario y se invalidan las cachés,
+porque ``bulk_create`` no emite señales.
+
+Un CSV se lee como UTF-8 y, si no lo es (Excel suele guardar en
+cp1252), con la codificación que detecte ``chardet``; si nada sirve el
+archivo se rechaza como ``ArchivoInvalido``. XLSX usa ``openpyxl``.
+"""
+import codecs
+import csv
+import io
+import time
+
+import chardet
+
+from django.core.exceptions import ValidationError
+from django.db import transaction
+
+from . import barcodes, resumen
+from .cache_catalogo import invalidar_catalogo
+
+CHUNK = 2000
+MAX_ERRORES = 1000
+# bytes leídos para decidir la codificación de un CSV
+MUESTRA = 64 * 1024
+
+OBLIGATORIAS = ('nombre', 'drogueria', 'precio_venta')
+CAMPOS = (
+    'nombre', 'descripcion', 'precio_venta', 'costo_compra', 'lote', 'fecha_ingreso', 'proveedor',
+    'codigo_barra', 'ubicacion', 'stock_actual', 'stock_minimo', 'fecha_vencimiento', 'estado', 'imagen_url',
+)
+_VERDADERO = {'1', 'true', 'si', 'sí', 'x', 'activo'}
+
+
+class ArchivoInvalido(ValueError):
+    pass
+
+
+# -- lectura ----------------------------------------------------------------
+def _normalizar_encabezado(valor):
+    return str(valor or '').strip().lower().replace(' ', '_')
+
+
+def _codificacion(muestra):
+    """UTF-8 si la muestra lo es; si no, la que detecte chardet (latin-1 como último recurso)."""
+    try:
+        # final=False: la muestra puede cortar un carácter multibyte
+        codecs.getincrementaldecoder('utf-8-sig')().decode(muestra, final=False)
+        return 'utf-8-sig'
+    except UnicodeDecodeError:
+        pass
+    detectada = chardet.detect(muestra)['encoding']
+    try:
+        codecs.getincrementaldecoder(detectada)().decode(muestra, final=False)
+        return detectada
+    except (TypeError, LookupError, UnicodeDecodeError):
+        return 'latin-1'
+
+
+def _filas_csv(archivo):
+    muestra = archivo.read(MUESTRA)
+    archivo.seek(0)
+    codificacion = _codificacion(muestra)
+    texto = io.TextIOWrapper(archivo, encoding=codificacion, newline='')
+    try:
+        inicio = texto.read(4096)
+        texto.seek(0)
+        try:
+            dialecto = csv.Sniffer().sniff(inicio, delimiters=',;\t')
+        except csv.Error:
+            dialecto = csv.excel
+        lector = csv.reader(texto, dialecto)
+        encabezados = [_normalizar_encabezado(h) for h in next(lector, [])]
+        for fila in lector:
+            if any(c.strip() for c in fila):
+                yield encabezados, fila
+    except UnicodeDecodeError:
+        # bytes fuera de la muestra que no encajan en la codificación elegida
+        raise ArchivoInvalido(f'El archivo no es texto {codificacion} válido; guárdelo como CSV UTF-8.')
+
+
+def _filas_xlsx(archivo):
+    try:
+        from openpyxl import load_workbook
+    except ImportError:
+        raise ArchivoInvalido('Para importar XLSX instale openpyxl, o exporte la hoja como CSV.')
+    libro = load_workbook(archivo, read_only=True, data_only=True)
+    filas = libro.active.iter_rows(values_only=True)
+    encabezados = [_normalizar_encabezado(h) for h in next(filas, ())]
+    for fila in filas:
+        if any(c not in (None, '') for c in fila):
+            yield encabezados, ['' if c is None else c for c in fila]
+    libro.close()
+
+
+def leer(archivo, nombre):
+    """Itera ``dict`` por fila (claves = encabezados normalizados)."""
+    lector = _filas_xlsx if nombre.lower().endswith('.xlsx') else _filas_csv
+    for encabezados, valores in lector(archivo):
+        faltan = [c for c in OBLIGATORIAS if c not in encabezados]
+        if faltan:
+            raise ArchivoInvalido(f"Faltan columnas obligatorias: {', '.join(faltan)}")
+        yield dict(zip(encabezados, valores))
+
+
+# -- validación -------------------------------------------------------------
+def _referencias():
+    from droguerias.models import Drogueria
+    from .models import Categoria
+
+    droguerias = {}
+    for pk, codigo, nombre in Drogueria.objects.values_list('id', 'codigo', 'nombre'):
+        droguerias.setdefault(str(nombre).strip().lower(), pk)
+        droguerias[str(codigo).strip().lower()] = pk  # el código manda si coincide con un nombre
+    categorias = {n.strip().lower(): pk for pk, n in Categoria.objects.values_list('id', 'nombre')}
+    return droguerias, categorias
+
+
+def _valor(campo, crudo):
+    if isinstance(crudo, str):
+        crudo = crudo.strip()
+    if crudo in ('', None):
+        if campo.has_default():
+            return campo.get_default()
+        if campo.null or campo.blank:
+            return None
+    if campo.name == 'estado' and isinstance(crudo, str):
+        crudo = crudo.lower() in _VERDADERO
+    if campo.get_internal_type() == 'DecimalField' and isinstance(crudo, str):
+        crudo = crudo.replace(',', '.')
+    return campo.clean(crudo, None)
+
+
+def validar(fila, campos_modelo, droguerias, categorias):
+    """Devuelve ``(datos, errores)`` de una fila ya leída."""
+    datos, errores = {}, {}
+    for nombre, campo in campos_modelo.items():
+        if nombre not in fila:
+            continue
+        try:
+            datos[nombre] = _valor(campo, fila[nombre])
+        except ValidationError as e:
+            errores[nombre] = e.messages
+    if not datos.get('nombre') and 'nombre' not in errores:
+        errores['nombre'] = ['Este campo es obligatorio.']
+    if datos.get('precio_venta') is None and 'precio_venta' not in errores:
+        errores['precio_venta'] = ['Este campo es obligatorio.']
+
+    drogueria = str(fila.get('drogueria') or '').strip().lower()
+    datos['drogueria_id'] = droguerias.get(drogueria)
+    if datos['drogueria_id'] is None:
+        errores['drogueria'] = [f"Droguería desconocida: {fila.get('drogueria')!r}"]
+
+    if 'categoria' in fila:
+        categoria = str(fila.get('categoria') or '').strip().lower()
+        datos['categoria_id'] = categorias.get(categoria) if categoria else None
+        if categoria and datos['categoria_id'] is None:
+            errores['categoria'] = [f"Categoría desconocida: {fila.get('categoria')!r}"]
+    return datos, errores
+
+
+# -- escritura --------------------------------------------------------------
+def _escribir(bloque, columnas):
+    from .models import Medicamento
+
+    objetos = [Medicamento(**datos) for datos in bloque.values()]
+    actualizar = sorted(columnas - {'nombre', 'drogueria_id'})
+    Medicamento.objects.bulk_create(
+        objetos,
+        batch_size=500,
+        update_conflicts=bool(actualizar),
+        ignore_conflicts=not actualizar,
+        unique_fields=['nombre', 'drogueria'] if actualizar else None,
+        update_fields=actualizar or None,
+    )
+
+
+def importar(archivo, nombre='importacion.csv', chunk=CHUNK):
+    """Importa ``archivo``. Devuelve ``{'filas', 'importadas', 'errores', 'errores_total', 'segundos'}``."""
+    from .models import Medicamento
+
+    inicio = time.monotonic()
+    droguerias, categorias = _referencias()
+    campos_modelo = {c: Medicamento._meta.get_field(c) for c in CAMPOS}
+
+    total = importadas = errores_total = 0
+    errores = []
+    droguerias_tocadas, categorias_tocadas = set(), set()
+    bloque = {}       # (nombre, drogueria_id) -> datos; la última fila repetida gana
+    filas_bloque = {}
+    columnas = set()
+
+    def volcar():
+        nonlocal importadas
+        if bloque:
+            _escribir(bloque, columnas)
+            importadas += len(bloque)
+            bloque.clear()
+            filas_bloque.clear()
+
+    try:
+        with transaction.atomic():
+            for numero, fila in enumerate(leer(archivo, nombre), start=2):  # fila 1 = encabezados
+                total += 1
+                datos, errs = validar(fila, campos_modelo, droguerias, categorias)
+                if errs:
+                    errores_total += 1
+                    if len(errores) < MAX_ERRORES:
+                        errores.append({'fila': numero, 'errores': errs})
+                    continue
+                clave = (datos['nombre'], datos['drogueria_id'])
+                if clave in filas_bloque:
+                    # el mismo producto dos veces en un bloque: ON CONFLICT no puede tocar una fila dos veces
+                    errores_total += 1
+                    if len(errores) < MAX_ERRORES:
+                        errores.append({'fila': filas_bloque[clave], 'errores': {'nombre': [f'Repetido en la fila {numero}; se usa esa.']}})
+                bloque[clave] = datos
+                filas_bloque[clave] = numero
+                columnas.update(datos)
+                droguerias_tocadas.add(datos['drogueria_id'])
+                categorias_tocadas.add(datos.get('categoria_id'))
+                if len(bloque) >= chunk:
+                    volcar()
+            volcar()
+    finally:
+        # una excepción revierte lo escrito; reconstruir igual deja todo consistente
+        if importadas:
+            resumen.reconstruir()
+            barcodes.invalidar_todo()
+            invalidar_catalogo(droguerias=droguerias_tocadas, categorias=categorias_tocadas)
+    return {
+        'filas': total,
+        'importadas': importadas,
+        'errores_total': errores_total,
+        'errores': errores,
+        'segundos': round(time.monotonic() - inicio, 2),
+    }
@@ -0,0 +1,21 @@
+from django.core.management.base import BaseCommand
+
+from inventario.archivo_auditoria import HOT_MONTHS, archivar, limite_activo
+
+
+class Command(BaseCommand):
+    help = "Mueve la auditoría de meses anteriores a segmentos JSONL comprimidos (ejecutar mensualmente)."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--meses', type=int, default=HOT_MONTHS,
+            help=f"Meses completos que se conservan en la tabla (por defecto {HOT_MONTHS}).",
+        )
+
+    def handle(self, *args, **options):
+        limite = limite_activo(options['meses'])
+        creados = archivar(options['meses'])
+        filas = sum(i['filas'] for i in creados)
+        self.stdout.write(self.style.SUCCESS(
+            f"Auditoría anterior a {limite:%Y-%m-%d} archivada: {filas} filas en {len(creados)} segmentos."
+        ))
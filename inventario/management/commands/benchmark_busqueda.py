@@ -0,0 +1,77 @@
+"""Benchmark de la búsqueda del catálogo (índice FTS vs. icontains).
+
+Crea ``--n`` medicamentos sintéticos dentro de una transacción que se revierte
+al final, así que puede ejecutarse contra la base de desarrollo sin dejar datos.
+
+    python manage.py benchmark_busqueda --n 100000
+"""
+import random
+import time
+from decimal import Decimal
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from inventario.models import Medicamento
+from inventario.search import _filtro_icontains, buscar_medicamentos
+
+PRINCIPIOS = [
+    'paracetamol', 'ibuprofeno', 'loratadina', 'acetaminofén', 'naproxeno', 'cetirizina',
+    'amoxicilina', 'omeprazol', 'losartán', 'metformina', 'diclofenaco', 'ketorolaco',
+]
+PRESENTACIONES = ['tabletas', 'jarabe', 'cápsulas', 'suspensión', 'gotas', 'crema']
+PROVEEDORES = ['Acme Farma', 'Delta Labs', 'Genfar', 'La Santé', 'Tecnoquímicas']
+CONSULTAS = ['para', 'ibupro 400', 'acetaminofen', 'genfar', 'jarabe', '77012', 'omeprazol cap']
+
+
+class Command(BaseCommand):
+    help = "Mide la latencia de la búsqueda ?q= del catálogo con N medicamentos."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--n', type=int, default=100_000)
+        parser.add_argument('--repeticiones', type=int, default=20)
+
+    def _medir(self, qs, repeticiones):
+        tiempos = []
+        for _ in range(repeticiones):
+            inicio = time.perf_counter()
+            # lo mismo que hace una página de /catalogo/?q=: COUNT + primeros 10
+            qs.count()
+            list(qs[:10])
+            tiempos.append((time.perf_counter() - inicio) * 1000)
+        tiempos.sort()
+        return tiempos[len(tiempos) // 2], tiempos[int(len(tiempos) * 0.95) - 1]
+
+    def handle(self, *args, **options):
+        n = options['n']
+        repeticiones = options['repeticiones']
+        rnd = random.Random(42)
+
+        with transaction.atomic():
+            inicio = time.perf_counter()
+            Medicamento.objects.bulk_create(
+                (
+                    Medicamento(
+                        nombre=f"{rnd.choice(PRINCIPIOS)} {rnd.choice([50, 100, 200, 400, 500])}mg bench-{i}",
+                        descripcion=f"{rnd.choice(PRINCIPIOS)} en {rnd.choice(PRESENTACIONES)}",
+                        codigo_barra=str(7701000000000 + i),
+                        proveedor=rnd.choice(PROVEEDORES),
+                        lote=f"L{i % 997}",
+                        precio_venta=Decimal('1000.00'),
+                    )
+                    for i in range(n)
+                ),
+                batch_size=5000,
+            )
+            self.stdout.write(f"{n} medicamentos insertados (con índice) en {time.perf_counter() - inicio:.1f}s")
+            base = Medicamento.objects.filter(estado=True)
+
+            self.stdout.write(f"{'consulta':<16}{'fts p50':>10}{'fts p95':>10}{'icontains p50':>16}{'icontains p95':>16}")
+            for consulta in CONSULTAS:
+                fts = self._medir(buscar_medicamentos(base, consulta), repeticiones)
+                like = self._medir(_filtro_icontains(base, consulta), repeticiones)
+                self.stdout.write(
+                    f"{consulta:<16}{fts[0]:>8.2f}ms{fts[1]:>8.2f}ms{like[0]:>14.2f}ms{like[1]:>14.2f}ms"
+                )
+
+            transaction.set_rollback(True)
@@ -0,0 +1,73 @@
+"""Benchmark de la importación masiva de medicamentos (CSV con upsert).
+
+Genera un CSV sintético de ``--filas`` filas repartidas entre ``--droguerias``
+sucursales y lo importa dos veces: la primera inserta todo y la segunda
+actualiza las mismas filas (precio y stock). Todo ocurre dentro de una
+transacción que se revierte al final.
+
+    python manage.py benchmark_importacion --filas 100000
+"""
+import csv
+import io
+import random
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from droguerias.models import Drogueria
+from inventario.importar import importar
+from inventario.models import Categoria
+
+CATEGORIAS = ['Analgésicos', 'Antibióticos', 'Antialérgicos', 'Dermatológicos', 'Vitaminas']
+PRINCIPIOS = ['paracetamol', 'ibuprofeno', 'loratadina', 'amoxicilina', 'omeprazol', 'losartán', 'metformina']
+
+
+def _csv(filas, droguerias, rnd, factor):
+    salida = io.StringIO()
+    writer = csv.writer(salida)
+    writer.writerow(['nombre', 'drogueria', 'categoria', 'precio_venta', 'costo_compra', 'stock_actual',
+                     'codigo_barra', 'fecha_vencimiento'])
+    for i in range(filas):
+        writer.writerow([
+            f"{PRINCIPIOS[i % len(PRINCIPIOS)]} {i // len(PRINCIPIOS)}",
+            droguerias[i % len(droguerias)],
+            rnd.choice(CATEGORIAS),
+            f"{rnd.randint(1000, 90000) * factor}.00",
+            f"{rnd.randint(500, 40000)}.00",
+            rnd.randint(0, 500),
+            str(7702000000000 + i),
+            f"202{rnd.randint(6, 9)}-{rnd.randint(1, 12):02d}-15",
+        ])
+    return io.BytesIO(salida.getvalue().encode('utf-8'))
+
+
+class Command(BaseCommand):
+    help = "Mide la importación CSV de N medicamentos (inserción y re-importación con upsert)."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--filas', type=int, default=100_000)
+        parser.add_argument('--droguerias', type=int, default=5)
+
+    def handle(self, *args, **options):
+        filas = options['filas']
+        rnd = random.Random(42)
+
+        with transaction.atomic():
+            codigos = [f'BENCH{i:02d}' for i in range(options['droguerias'])]
+            Drogueria.objects.bulk_create(Drogueria(nombre=f'Sucursal {c}', codigo=c) for c in codigos)
+            Categoria.objects.bulk_create(
+                Categoria(nombre=n) for n in CATEGORIAS if not Categoria.objects.filter(nombre=n).exists()
+            )
+
+            for etapa, factor in (('inserción', 1), ('upsert', 2)):
+                archivo = _csv(filas, codigos, rnd, factor)
+                inicio = time.perf_counter()
+                resultado = importar(archivo, 'bench.csv')
+                segundos = time.perf_counter() - inicio
+                self.stdout.write(
+                    f"{etapa:<10} {resultado['importadas']} filas en {segundos:.1f}s "
+                    f"({resultado['importadas'] / segundos:,.0f} filas/s), errores: {resultado['errores_total']}"
+                )
+
+            transaction.set_rollback(True)
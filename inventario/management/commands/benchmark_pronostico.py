@@ -0,0 +1,99 @@
+"""Benchmark del pronóstico de demanda: el trabajo completo de ``pronosticar_demanda``.
+
+Siembra ``--skus`` medicamentos con salidas sintéticas en ``--dias`` días
+(cada SKU vende en una fracción ``--densidad`` de los días) y ejecuta
+``calcular``: lectura del historial agregado, cálculo vectorizado,
+escritura de ``stock_minimo``, alertas y reconstrucción del resumen.
+Todo ocurre dentro de una transacción que se revierte al final.
+
+    python manage.py benchmark_pronostico --skus 100000 --dias 365
+
+``--solo-calculo`` mide únicamente ``estimar`` sobre arreglos en memoria.
+"""
+import time
+from datetime import datetime, timedelta
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from django.utils import timezone
+
+from droguerias.models import Drogueria
+from inventario.models import Medicamento, MovimientoInventario
+from inventario.pronostico import SinNumpy, _numpy, calcular, estimar
+
+_BLOQUE = 10_000
+
+
+class Command(BaseCommand):
+    help = "Mide el pronóstico de demanda sobre N SKUs × D días de salidas sintéticas."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--skus', type=int, default=100000)
+        parser.add_argument('--dias', type=int, default=365)
+        parser.add_argument('--densidad', type=float, default=0.3, help="Fracción de días con ventas de cada SKU.")
+        parser.add_argument('--solo-calculo', action='store_true', help="Mide solo estimar, sin base de datos.")
+
+    def handle(self, *args, **options):
+        try:
+            np = _numpy()
+        except SinNumpy as e:
+            raise CommandError(str(e))
+        skus, dias = options['skus'], options['dias']
+        rng = np.random.default_rng(0)
+        inicio = time.perf_counter()
+        celdas = np.flatnonzero(rng.random(skus * dias) < options['densidad'])
+        sku, dias_idx = celdas // dias, celdas % dias
+        cantidades = rng.poisson(3, len(celdas)) + 1
+        self.stdout.write(f"datos        {len(celdas):,} salidas generadas en {time.perf_counter() - inicio:.2f} s")
+
+        if options['solo_calculo']:
+            inicio = time.perf_counter()
+            ids, media, _, punto = estimar(sku + 1, dias_idx, cantidades, dias=dias)
+            self.stdout.write(
+                f"estimar      {len(ids):,} SKUs × {dias} días en {time.perf_counter() - inicio:.2f} s "
+                f"(demanda media {media.mean():.2f}/día, punto de reorden medio {punto.mean():.1f})"
+            )
+            return
+
+        with transaction.atomic():
+            inicio = time.perf_counter()
+            self._sembrar(skus, dias, sku, dias_idx, cantidades)
+            self.stdout.write(f"siembra      {skus:,} SKUs y {len(celdas):,} salidas en {time.perf_counter() - inicio:.1f} s")
+
+            informe = calcular(dias=dias)
+            self.stdout.write(
+                f"calcular     {informe['skus_con_historia']:,} SKUs, {informe['actualizados']:,} actualizados en "
+                f"{informe['segundos']:.2f} s (lectura {informe['segundos_lectura']:.2f} s, "
+                f"cálculo {informe['segundos_calculo']:.2f} s, escritura {informe.get('segundos_escritura', 0):.2f} s)"
+            )
+            transaction.set_rollback(True)
+
+    def _sembrar(self, skus, dias, sku, dias_idx, cantidades):
+        drogueria = Drogueria.objects.create(nombre='Sucursal benchmark', codigo='BENCH-PRONOSTICO')
+        meds = Medicamento.objects.bulk_create(
+            (Medicamento(nombre=f'Bench {i}', precio_venta=1, stock_actual=50, drogueria=drogueria) for i in range(skus)),
+            batch_size=_BLOQUE,
+        )
+        pks = [m.pk for m in meds]
+        # ~un valor de fecha por día: prepararlos una vez, no por fila
+        hoy = timezone.localdate()
+        campo = MovimientoInventario._meta.get_field('fecha_movimiento')
+        fechas = [
+            campo.get_db_prep_value(
+                timezone.make_aware(datetime.combine(hoy - timedelta(days=dias - 1 - d), datetime.min.time())) + timedelta(hours=12),
+                connection,
+            )
+            for d in range(dias)
+        ]
+        tabla = connection.ops.quote_name(MovimientoInventario._meta.db_table)
+        sql = (
+            f'INSERT INTO {tabla} (medicamento_id, drogueria_id, tipo_movimiento, cantidad, fecha_movimiento) '
+            f"VALUES (%s, {drogueria.pk}, 'salida', %s, %s)"
+        )
+        sku, dias_idx, cantidades = sku.tolist(), dias_idx.tolist(), cantidades.tolist()
+        with connection.cursor() as cursor:
+            for i in range(0, len(sku), _BLOQUE):
+                cursor.executemany(sql, [
+                    (pks[s], c, fechas[d])
+                    for s, d, c in zip(sku[i:i + _BLOQUE], dias_idx[i:i + _BLOQUE], cantidades[i:i + _BLOQUE])
+                ])
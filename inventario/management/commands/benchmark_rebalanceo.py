@@ -0,0 +1,60 @@
+"""Benchmark del optimizador de rebalanceo entre droguerías.
+
+Genera un inventario sintético (``--droguerias`` sucursales con el mismo
+catálogo de ``--productos`` productos, una fracción ``--faltantes`` por
+debajo de su punto de reorden) y mide ``asignar`` y ``agrupar``, lo que
+hace ``rebalanceo.proponer`` después de leer los medicamentos:
+
+    python manage.py benchmark_rebalanceo --droguerias 50 --productos 20000
+"""
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from inventario.pronostico import SinNumpy, _numpy
+from inventario.rebalanceo import OBJETIVO, agrupar, asignar
+
+
+class Command(BaseCommand):
+    help = "Mide el rebalanceo vectorizado sobre N droguerías × P productos sintéticos."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--droguerias', type=int, default=50)
+        parser.add_argument('--productos', type=int, default=20000)
+        parser.add_argument('--faltantes', type=float, default=0.1, help="Fracción de filas bajo el punto de reorden.")
+
+    def handle(self, *args, **options):
+        try:
+            np = _numpy()
+        except SinNumpy as e:
+            raise CommandError(str(e))
+        droguerias, productos = options['droguerias'], options['productos']
+        rng = np.random.default_rng(0)
+        filas = droguerias * productos
+        producto = np.tile(np.arange(productos), droguerias)
+        drogueria = np.repeat(np.arange(1, droguerias + 1), productos)
+        minimo = rng.integers(1, 50, filas)
+        bajo = rng.random(filas) < options['faltantes']
+        disponible = np.where(bajo, rng.integers(0, minimo + 1), minimo + rng.poisson(minimo))
+        nivel = np.ceil(minimo * OBJETIVO).astype(np.int64)
+        sobrante = np.maximum(disponible - nivel, 0)
+        faltante = np.where(disponible <= minimo, nivel - disponible, 0)
+        urgencia = disponible / minimo
+        ids = np.arange(1, filas + 1)
+
+        inicio = time.perf_counter()
+        origen, destino, cantidad = asignar(producto, sobrante, faltante, urgencia)
+        t_asignar = time.perf_counter() - inicio
+        inicio = time.perf_counter()
+        propuestas = agrupar(ids, drogueria, origen, destino, cantidad)
+        t_agrupar = time.perf_counter() - inicio
+
+        cubierto = int(cantidad.sum())
+        self.stdout.write(
+            f"datos        {filas:,} filas, {int((faltante > 0).sum()):,} faltantes por {int(faltante.sum()):,} unidades"
+        )
+        self.stdout.write(f"asignar      {len(cantidad):,} movimientos, {cubierto:,} unidades en {t_asignar:.2f} s")
+        self.stdout.write(
+            f"agrupar      {len(propuestas):,} propuestas, {sum(len(p['lineas']) for p in propuestas):,} líneas "
+            f"en {t_agrupar:.2f} s"
+        )
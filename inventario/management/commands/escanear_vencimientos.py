@@ -0,0 +1,27 @@
+from django.core.management.base import BaseCommand
+
+from inventario import auditoria, resumen
+from inventario.vencimientos import VENTANAS, escanear
+
+
+class Command(BaseCommand):
+    help = "Crea alertas de medicamentos vencidos y por vencer en todas las droguerías y corrige el resumen de inventario (ejecutar a diario)."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--ventanas', type=int, nargs='+', default=list(VENTANAS),
+            help="Ventanas en días para las alertas 'por vencer' (por defecto %s)." % ' '.join(map(str, VENTANAS)),
+        )
+
+    def handle(self, *args, **options):
+        informe = escanear(ventanas=options['ventanas'])
+        # el paso del día cambia qué cuenta como vencido en el resumen de inventario
+        informe['resumenes_corregidos'] = resumen.corregir_vencidos()
+        auditoria.registrar(action='vencimientos_escaneados', model_name='Medicamento', data=informe)
+        self.stdout.write(self.style.SUCCESS(
+            f"Vencimientos: {informe['revisados']} revisados, {informe['alertas_creadas']} alertas nuevas "
+            f"en {informe['segundos']} s."
+        ))
+        for clave, valor in informe.items():
+            if clave.startswith(('vencidos', 'por_vencer')):
+                self.stdout.write(f"  {clave}: {valor}")
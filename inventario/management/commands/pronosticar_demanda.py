@@ -0,0 +1,31 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from inventario.pronostico import DIAS, NIVEL_SERVICIO_Z, PLAZO_DIAS, SinNumpy, calcular
+
+
+class Command(BaseCommand):
+    help = "Recalcula stock_minimo (punto de reorden) desde la demanda de cada medicamento (ejecutar a diario)."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--dias', type=int, default=DIAS, help=f"Días de historial (por defecto {DIAS}).")
+        parser.add_argument(
+            '--plazo', type=int, default=PLAZO_DIAS, help=f"Días de reposición (por defecto {PLAZO_DIAS})."
+        )
+        parser.add_argument(
+            '--z', type=float, default=NIVEL_SERVICIO_Z,
+            help=f"Factor del stock de seguridad según el nivel de servicio (por defecto {NIVEL_SERVICIO_Z}).",
+        )
+        parser.add_argument('--simular', action='store_true', help="Calcula e informa sin escribir nada.")
+
+    def handle(self, *args, **options):
+        if options['dias'] < 1 or options['plazo'] < 1:
+            raise CommandError("--dias y --plazo deben ser al menos 1")
+        try:
+            informe = calcular(options['dias'], options['plazo'], options['z'], escribir=not options['simular'])
+        except SinNumpy as e:
+            raise CommandError(str(e))
+        verbo = "cambiarían" if options['simular'] else "actualizados"
+        self.stdout.write(self.style.SUCCESS(
+            f"Pronóstico: {informe['skus_con_historia']} SKUs con historia, {informe['actualizados']} {verbo} "
+            f"({informe['subieron']} suben), {informe['alertas_creadas']} alertas nuevas en {informe['segundos']} s."
+        ))
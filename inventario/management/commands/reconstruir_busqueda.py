@@ -0,0 +1,11 @@
+from django.core.management.base import BaseCommand
+
+from inventario.search import reconstruir_indice
+
+
+class Command(BaseCommand):
+    help = "Reconstruye el índice de texto completo del catálogo de medicamentos."
+
+    def handle(self, *args, **options):
+        reconstruir_indice()
+        self.stdout.write(self.style.SUCCESS("Índice de búsqueda reconstruido."))
@@ -0,0 +1,11 @@
+from django.core.management.base import BaseCommand
+
+from inventario.resumen import reconstruir
+
+
+class Command(BaseCommand):
+    help = "Recalcula el resumen de inventario por droguería y categoría con una sola consulta agregada."
+
+    def handle(self, *args, **options):
+        filas = reconstruir()
+        self.stdout.write(self.style.SUCCESS(f"Resumen de inventario reconstruido: {filas} filas."))
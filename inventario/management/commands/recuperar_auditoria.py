@@ -0,0 +1,17 @@
+from django.core.management.base import BaseCommand
+
+from inventario.auditoria import recuperar
+
+
+class Command(BaseCommand):
+    help = "Inserta los eventos de auditoría que quedaron en disco tras la caída de un proceso."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--todos', action='store_true',
+            help="Incluir segmentos de procesos vivos (los eventos duplicados se ignoran).",
+        )
+
+    def handle(self, *args, **options):
+        total = recuperar(incluir_vivos=options['todos'])
+        self.stdout.write(self.style.SUCCESS(f"Eventos de auditoría recuperados: {total}."))
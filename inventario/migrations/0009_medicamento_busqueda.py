@@ -0,0 +1,87 @@
+# Generated by Django 5.2.8 on 2026-10-18 11:55
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+COLS = 'nombre, descripcion, codigo_barra, proveedor, lote'
+NEW_COLS = 'new.nombre, new.descripcion, new.codigo_barra, new.proveedor, new.lote'
+OLD_COLS = 'old.nombre, old.descripcion, old.codigo_barra, old.proveedor, old.lote'
+
+SQLITE_FORWARD = [
+    f"""CREATE VIRTUAL TABLE inventario_medicamento_fts USING fts5(
+        {COLS},
+        content='inventario_medicamento', content_rowid='id',
+        tokenize="unicode61 remove_diacritics 2", prefix='2 3'
+    )""",
+    # ranking por defecto (columna oculta ``rank``): bm25 con pesos por columna
+    "INSERT INTO inventario_medicamento_fts(inventario_medicamento_fts, rank) VALUES ('rank', 'bm25(10.0, 2.0, 5.0, 1.0, 1.0)')",
+    f"""CREATE TRIGGER inventario_medicamento_fts_ai AFTER INSERT ON inventario_medicamento BEGIN
+        INSERT INTO inventario_medicamento_fts(rowid, {COLS}) VALUES (new.id, {NEW_COLS});
+    END""",
+    f"""CREATE TRIGGER inventario_medicamento_fts_ad AFTER DELETE ON inventario_medicamento BEGIN
+        INSERT INTO inventario_medicamento_fts(inventario_medicamento_fts, rowid, {COLS}) VALUES ('delete', old.id, {OLD_COLS});
+    END""",
+    # solo cambios en columnas indexadas: los updates de stock no tocan el índice
+    f"""CREATE TRIGGER inventario_medicamento_fts_au AFTER UPDATE OF {COLS} ON inventario_medicamento BEGIN
+        INSERT INTO inventario_medicamento_fts(inventario_medicamento_fts, rowid, {COLS}) VALUES ('delete', old.id, {OLD_COLS});
+        INSERT INTO inventario_medicamento_fts(rowid, {COLS}) VALUES (new.id, {NEW_COLS});
+    END""",
+    "INSERT INTO inventario_medicamento_fts(inventario_medicamento_fts) VALUES ('rebuild')",
+]
+
+SQLITE_REVERSE = [
+    "DROP TRIGGER IF EXISTS inventario_medicamento_fts_au",
+    "DROP TRIGGER IF EXISTS inventario_medicamento_fts_ad",
+    "DROP TRIGGER IF EXISTS inventario_medicamento_fts_ai",
+    "DROP TABLE IF EXISTS inventario_medicamento_fts",
+]
+
+# Copia congelada de inventario.search.TSVECTOR_SQL
+POSTGRES_FORWARD = [
+    """CREATE INDEX med_busqueda_gin ON inventario_medicamento USING GIN ((to_tsvector('spanish', """
+    """coalesce("inventario_medicamento"."nombre", '') || ' ' || """
+    """coalesce("inventario_medicamento"."descripcion", '') || ' ' || """
+    """coalesce("inventario_medicamento"."codigo_barra", '') || ' ' || """
+    """coalesce("inventario_medicamento"."proveedor", '') || ' ' || """
+    """coalesce("inventario_medicamento"."lote", ''))))""",
+]
+
+POSTGRES_REVERSE = [
+    "DROP INDEX IF EXISTS med_busqueda_gin",
+]
+
+
+def _ejecutar(schema_editor, por_motor):
+    for sql in por_motor.get(schema_editor.connection.vendor, []):
+        schema_editor.execute(sql)
+
+
+def crear_indice(apps, schema_editor):
+    _ejecutar(schema_editor, {'sqlite': SQLITE_FORWARD, 'postgresql': POSTGRES_FORWARD})
+
+
+def eliminar_indice(apps, schema_editor):
+    _ejecutar(schema_editor, {'sqlite': SQLITE_REVERSE, 'postgresql': POSTGRES_REVERSE})
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('inventario', '0008_add_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='MedicamentoBusqueda',
+            fields=[
+                ('medicamento', models.OneToOneField(db_column='rowid', db_constraint=False, on_delete=django.db.models.deletion.DO_NOTHING, primary_key=True, related_name='busqueda', serialize=False, to='inventario.medicamento')),
+                ('documento', models.TextField(db_column='inventario_medicamento_fts')),
+                ('rank', models.FloatField()),
+            ],
+            options={
+                'db_table': 'inventario_medicamento_fts',
+                'managed': False,
+            },
+        ),
+        migrations.RunPython(crear_indice, eliminar_indice),
+    ]
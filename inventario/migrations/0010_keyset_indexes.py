@@ -0,0 +1,28 @@
+# Generated by Django 5.2.8 on 2026-10-18 11:58
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('droguerias', '0001_initial'),
+        ('inventario', '0009_medicamento_busqueda'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='alerta',
+            index=models.Index(fields=['creado_en', 'id'], name='alert_creado_id_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='auditlog',
+            index=models.Index(fields=['created_at', 'id'], name='audit_created_id_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='movimientoinventario',
+            index=models.Index(fields=['fecha_movimiento', 'id'], name='mov_fecha_id_idx'),
+        ),
+    ]
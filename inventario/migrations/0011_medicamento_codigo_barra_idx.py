@@ -0,0 +1,18 @@
+# Generated by Django 5.2.8 on 2026-10-18 12:02
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('droguerias', '0001_initial'),
+        ('inventario', '0010_keyset_indexes'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='medicamento',
+            index=models.Index(fields=['drogueria', 'codigo_barra'], name='med_drog_barra_idx'),
+        ),
+    ]
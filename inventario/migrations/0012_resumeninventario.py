@@ -0,0 +1,65 @@
+# Generated by Django 5.2.8 on 2026-10-18 12:06
+
+import django.db.models.deletion
+import django.db.models.functions.comparison
+from django.db import migrations, models
+from django.db.models import Count, DecimalField, ExpressionWrapper, F, Q, Sum
+from django.utils import timezone
+
+
+def poblar(apps, schema_editor):
+    # sin esto el primer cambio de un medicamento existente restaría su aporte de una fila inexistente;
+    # la consulta se copia aquí (y no se importa de resumen.py) para que la migración no cambie con el código
+    Medicamento = apps.get_model('inventario', 'Medicamento')
+    ResumenInventario = apps.get_model('inventario', 'ResumenInventario')
+    dinero = DecimalField(max_digits=18, decimal_places=2)
+    grupos = Medicamento.objects.order_by().values('drogueria_id', 'categoria_id').annotate(
+        skus=Count('id'),
+        unidades=Sum('stock_actual'),
+        unidades_reservadas=Sum('stock_reservado'),
+        valor_venta=Sum(ExpressionWrapper(F('precio_venta') * F('stock_actual'), output_field=dinero)),
+        valor_costo=Sum(ExpressionWrapper(F('costo_compra') * F('stock_actual'), output_field=dinero)),
+        bajo_stock=Count('id', filter=Q(stock_actual__lte=F('stock_minimo'))),
+        vencidos=Count('id', filter=Q(fecha_vencimiento__lt=timezone.now().date())),
+    )
+    campos = ('skus', 'unidades', 'unidades_reservadas', 'valor_venta', 'valor_costo', 'bajo_stock', 'vencidos')
+    ResumenInventario.objects.bulk_create([
+        ResumenInventario(
+            drogueria_id=f['drogueria_id'],
+            categoria_id=f['categoria_id'],
+            **{k: f[k] or 0 for k in campos},
+        )
+        for f in grupos
+    ], batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('droguerias', '0001_initial'),
+        ('inventario', '0011_medicamento_codigo_barra_idx'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ResumenInventario',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('skus', models.IntegerField(default=0)),
+                ('unidades', models.BigIntegerField(default=0)),
+                ('unidades_reservadas', models.BigIntegerField(default=0)),
+                ('valor_venta', models.DecimalField(decimal_places=2, default=0, max_digits=18)),
+                ('valor_costo', models.DecimalField(decimal_places=2, default=0, max_digits=18)),
+                ('bajo_stock', models.IntegerField(default=0)),
+                ('vencidos', models.IntegerField(default=0)),
+                ('actualizado', models.DateTimeField(auto_now=True)),
+                ('categoria', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='resumenes_inventario', to='inventario.categoria')),
+                ('drogueria', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='resumenes_inventario', to='droguerias.drogueria')),
+            ],
+            options={
+                'ordering': ['drogueria', 'categoria'],
+                'constraints': [models.UniqueConstraint(django.db.models.functions.comparison.Coalesce('drogueria', 0), django.db.models.functions.comparison.Coalesce('categoria', 0), name='unique_resumen_drog_cat')],
+            },
+        ),
+        migrations.RunPython(poblar, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,24 @@
+# Generated by Django 5.2.8 on 2026-10-18 12:16
+
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('inventario', '0012_resumeninventario'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='auditlog',
+            name='evento',
+            field=models.UUIDField(blank=True, editable=False, null=True, unique=True),
+        ),
+        migrations.AlterField(
+            model_name='auditlog',
+            name='created_at',
+            field=models.DateTimeField(default=django.utils.timezone.now, editable=False),
+        ),
+    ]
@@ -0,0 +1,28 @@
+# Generated by Django 5.2.8 on 2026-10-18 12:20
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('droguerias', '0001_initial'),
+        ('inventario', '0013_auditlog_evento'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='alerta',
+            name='ventana_dias',
+            field=models.PositiveSmallIntegerField(blank=True, null=True),
+        ),
+        migrations.AlterField(
+            model_name='alerta',
+            name='tipo',
+            field=models.CharField(choices=[('low_stock', 'Stock bajo'), ('vencido', 'Vencido'), ('por_vencer', 'Por vencer'), ('prestamo', 'Prestamo'), ('info', 'Información')], max_length=30),
+        ),
+        migrations.AddIndex(
+            model_name='medicamento',
+            index=models.Index(fields=['fecha_vencimiento'], name='med_vencimiento_idx'),
+        ),
+    ]
@@ -0,0 +1,31 @@
+# Generated by Django 5.2.8 on 2026-10-18 13:00
+
+from importlib import import_module
+
+from django.db import migrations, models
+
+busqueda = import_module('inventario.migrations.0009_medicamento_busqueda')
+
+
+def restaurar_triggers(apps, schema_editor):
+    # en SQLite AddField rehace inventario_medicamento y se lleva los triggers del índice FTS5
+    if schema_editor.connection.vendor != 'sqlite':
+        return
+    for sql in busqueda.SQLITE_REVERSE[:3] + busqueda.SQLITE_FORWARD[2:]:
+        schema_editor.execute(sql)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('inventario', '0015_transferencias'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='medicamento',
+            name='stock_minimo_auto',
+            field=models.BooleanField(default=True),
+        ),
+        migrations.RunPython(restaurar_triggers, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,20 @@
+# Generated by Django 5.2.8 on 2026-10-18 13:31
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('droguerias', '0001_initial'),
+        ('inventario', '0016_stock_minimo_auto'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='movimientoinventario',
+            index=models.Index(fields=['tipo_movimiento', 'fecha_movimiento', 'medicamento', 'cantidad'], name='mov_tipo_fecha_med_cant_idx'),
+        ),
+    ]
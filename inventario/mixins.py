@@ -0,0 +1,184 @@
+"""Carga anticipada automática (select_related / prefetch_related / only) para vistas DRF.
+
+``optimizar_queryset(qs, SerializerClass)`` recorre los campos de lectura del
+serializer y deduce qué relaciones va a tocar:
+
+- serializer anidado o ``StringRelatedField`` sobre una FK  -> ``select_related``
+- serializer ``many=True`` o relación a-muchos               -> ``Prefetch`` con su
+  propio queryset optimizado (recursivo)
+- ``PrimaryKeyRelatedField``                                  -> nada, basta ``<fk>_id``
+- fuentes con puntos (``propietario.username``)               -> ``select_related`` de la cadena
+
+Si todos los campos de un nivel son columnas del modelo se aplica ``only()``;
+si hay campos calculados (``SerializerMethodField``, propiedades) ese nivel
+carga todas sus columnas. Las relaciones que usan los campos calculados se
+declaran en ``Meta.eager_select`` del serializer.
+"""
+from django.core.exceptions import FieldDoesNotExist
+from django.db.models import Prefetch
+from rest_framework import serializers
+from rest_framework.permissions import SAFE_METHODS
+
+_PLANES = {}
+
+
+class _Plan:
+    """Relaciones a cargar para un serializer sobre un modelo."""
+
+    def __init__(self, model):
+        self.model = model
+        self.select = set()
+        self.prefetch = {}       # ruta -> (modelo, plan | None)
+        self.only = {'': set()}  # prefijo -> columnas (None = todas)
+        self.modelos = {'': model}
+
+
+def _columnas(model):
+    return {f.name for f in model._meta.concrete_fields}
+
+
+def _analizar(serializer, model, plan, prefijo='', omitir=None):
+    """Rellena ``plan`` con lo que necesita ``serializer`` en el nivel ``prefijo``."""
+    columnas = plan.only[prefijo]
+    if columnas is not None:
+        columnas.add(model._meta.pk.name)
+        if omitir:
+            columnas.add(omitir)
+
+    for extra in getattr(getattr(serializer, 'Meta', None), 'eager_select', ()):
+        plan.select.add(prefijo + extra)
+        _marcar_sin_restriccion(plan, model, prefijo, extra.split('__'))
+
+    for campo in serializer.fields.values():
+        if campo.write_only:
+            continue
+        if campo.source == '*':
+            # SerializerMethodField o similar: dependencias desconocidas
+            plan.only[prefijo] = columnas = None
+            continue
+
+        attrs = campo.source_attrs
+        try:
+            model_field = model._meta.get_field(attrs[0])
+        except FieldDoesNotExist:
+            # propiedad o método del modelo
+            plan.only[prefijo] = columnas = None
+            continue
+        if attrs[0] == omitir:
+            # relación de vuelta al padre de un prefetch: Django ya la asigna
+            continue
+
+        ruta = prefijo + model_field.name
+
+        if not model_field.is_relation:
+            if columnas is not None:
+                columnas.add(model_field.name)
+            continue
+
+        if len(attrs) > 1:
+            # fuente con puntos: seguir la cadena de FKs y cargarla completa
+            if model_field.many_to_one or model_field.one_to_one:
+                plan.select.add(ruta)
+                if columnas is not None and model_field.concrete:
+                    columnas.add(model_field.name)
+                _marcar_sin_restriccion(plan, model, prefijo, attrs)
+            continue
+
+        if model_field.many_to_one or model_field.one_to_one:
+            if columnas is not None and model_field.concrete:
+                columnas.add(model_field.name)
+            if isinstance(campo, serializers.PrimaryKeyRelatedField):
+                continue
+            plan.select.add(ruta)
+            hijo = model_field.related_model
+            plan.modelos[ruta + '__'] = hijo
+            if isinstance(campo, serializers.BaseSerializer):
+                plan.only.setdefault(ruta + '__', set())
+                _analizar(campo, hijo, plan, ruta + '__')
+            else:
+                plan.only[ruta + '__'] = None
+            continue
+
+        # relaciones a muchos (FK inversa o M2M)
+        hijo = model_field.related_model
+        inverso = model_field.field.name if model_field.one_to_many else None
+        if isinstance(campo, serializers.ListSerializer) and isinstance(campo.child, serializers.BaseSerializer):
+            sub = _Plan(hijo)
+            _analizar(campo.child, hijo, sub, omitir=inverso)
+            plan.prefetch[ruta] = (hijo, sub)
+        else:
+            plan.prefetch[ruta] = (hijo, None)
+
+
+def _marcar_sin_restriccion(plan, model, prefijo, attrs):
+    """Registra los modelos de una cadena de FKs para cargarlos con todas sus columnas."""
+    actual = model
+    ruta = prefijo
+    for attr in attrs:
+        try:
+            model_field = actual._meta.get_field(attr)
+        except FieldDoesNotExist:
+            return
+        if not model_field.is_relation or not (model_field.many_to_one or model_field.one_to_one):
+            return
+        if plan.only.get(ruta) is not None and model_field.concrete:
+            plan.only[ruta].add(model_field.name)
+        ruta = ruta + model_field.name + '__'
+        actual = model_field.related_model
+        plan.modelos[ruta] = actual
+        plan.only[ruta] = None
+        plan.select.add(ruta[:-2])
+
+
+def _plan_para(serializer_class):
+    plan = _PLANES.get(serializer_class)
+    if plan is None:
+        model = serializer_class.Meta.model
+        plan = _Plan(model)
+        _analizar(serializer_class(), model, plan)
+        _PLANES[serializer_class] = plan
+    return plan
+
+
+def _aplicar(qs, plan, usar_only=True):
+    if plan.select:
+        qs = qs.select_related(*sorted(plan.select))
+    for ruta, (hijo, sub) in sorted(plan.prefetch.items()):
+        sub_qs = hijo._default_manager.all()
+        if sub is not None:
+            sub_qs = _aplicar(sub_qs, sub, usar_only)
+        qs = qs.prefetch_related(Prefetch(ruta, queryset=sub_qs))
+    niveles = {p: c for p, c in plan.only.items() if not p or p[:-2] in plan.select}
+    if usar_only and any(c is not None for c in niveles.values()):
+        campos = []
+        for prefijo, columnas in niveles.items():
+            if columnas is None:
+                columnas = _columnas(plan.modelos[prefijo])
+            campos.extend(prefijo + c for c in columnas)
+        qs = qs.only(*sorted(campos))
+    return qs
+
+
+def optimizar_queryset(qs, serializer_class, usar_only=True):
+    """Aplica a ``qs`` la carga anticipada que necesita ``serializer_class``."""
+    if serializer_class is None or not issubclass(serializer_class, serializers.ModelSerializer):
+        return qs
+    return _aplicar(qs, _plan_para(serializer_class), usar_only)
+
+
+class EagerLoadingMixin:
+    """Optimiza el queryset de la vista según su serializer.
+
+    Se engancha en ``filter_queryset``, por donde pasan tanto ``list()`` como
+    ``get_object()``, así funciona aunque la vista sobreescriba
+    ``get_queryset`` sin llamar a ``super()``. ``only()`` se aplica solo en
+    lecturas, para que las escrituras guarden instancias completas.
+    """
+
+    def filter_queryset(self, queryset):
+        queryset = super().filter_queryset(queryset)
+        return optimizar_queryset(
+            queryset,
+            self.get_serializer_class(),
+            usar_only=self.request.method in SAFE_METHODS,
+        )
@@ -1,4 +1,5 @@
 from django.db import models
+from django.db.models.functions import Coalesce
 from django.utils import timezone
 from usuarios.models import Usuario  # relación con usuarios
 from droguerias.models import Drogueria
@@ -48,6 +49,8 @@ class Medicamento(models.Model):
     stock_reservado = models.PositiveIntegerField(default=0)
     stock_actual = models.PositiveIntegerField(default=0)
     stock_minimo = models.PositiveIntegerField(default=10)
+    # el pronóstico de demanda (inventario/pronostico.py) recalcula stock_minimo; False = fijado a mano
+    stock_minimo_auto = models.BooleanField(default=True)
     fecha_vencimiento = models.DateField(null=True, blank=True)
     estado = models.BooleanField(default=True)
     imagen_url = models.CharField(max_length=500, blank=True, null=True)
@@ -63,6 +66,10 @@ class Medicamento(models.Model):
         indexes = [
             models.Index(fields=['drogueria', 'categoria', 'nombre'], name='med_drog_cat_nom_idx'),
             models.Index(fields=['stock_actual'], name='med_stock_idx'),
+            # búsqueda exacta por código de barras (punto de venta)
+            models.Index(fields=['drogueria', 'codigo_barra'], name='med_drog_barra_idx'),
+            # escaneo de vencimientos por rango de fechas (ver vencimientos.py)
+            models.Index(fields=['fecha_vencimiento'], name='med_vencimiento_idx'),
         ]
 
     @property
@@ -92,6 +99,64 @@ class Medicamento(models.Model):
         return bool(self.fecha_vencimiento and self.fecha_vencimiento < timezone.now().date())
 
 
+class MedicamentoBusqueda(models.Model):
+    """Índice de texto completo (FTS5) del catálogo — ver inventario/search.py.
+
+    La tabla virtual la crea la migración 0009 (solo en SQLite) y la mantienen
+    triggers sobre ``inventario_medicamento``; Django solo la consulta.
+    """
+    medicamento = models.OneToOneField(
+        Medicamento,
+        primary_key=True,
+        db_column='rowid',
+        db_constraint=False,
+        on_delete=models.DO_NOTHING,
+        related_name='busqueda'
+    )
+    # columna oculta de FTS5 con el nombre de la tabla (destino del MATCH)
+    documento = models.TextField(db_column='inventario_medicamento_fts')
+    rank = models.FloatField()
+
+    class Meta:
+        managed = False
+        db_table = 'inventario_medicamento_fts'
+
+
+# =========================
+# 📊 RESUMEN DE INVENTARIO (materializado)
+# =========================
+class ResumenInventario(models.Model):
+    """Totales de inventario por droguería y categoría.
+
+    Se mantiene incrementalmente desde las señales de Medicamento (ver
+    inventario/resumen.py) y se puede reconstruir con
+    ``manage.py reconstruir_resumen_inventario``.
+    """
+    drogueria = models.ForeignKey(Drogueria, on_delete=models.CASCADE, null=True, blank=True, related_name='resumenes_inventario')
+    categoria = models.ForeignKey(Categoria, on_delete=models.CASCADE, null=True, blank=True, related_name='resumenes_inventario')
+    skus = models.IntegerField(default=0)
+    unidades = models.BigIntegerField(default=0)
+    unidades_reservadas = models.BigIntegerField(default=0)
+    valor_venta = models.DecimalField(max_digits=18, decimal_places=2, default=0)
+    valor_costo = models.DecimalField(max_digits=18, decimal_places=2, default=0)
+    bajo_stock = models.IntegerField(default=0)
+    # vencidos a la fecha del último cambio o reconstrucción
+    vencidos = models.IntegerField(default=0)
+    actualizado = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        ordering = ['drogueria', 'categoria']
+        constraints = [
+            # COALESCE: una sola fila para "sin droguería"/"sin categoría"
+            models.UniqueConstraint(
+                Coalesce('drogueria', 0), Coalesce('categoria', 0), name='unique_resumen_drog_cat'
+            ),
+        ]
+
+    def __str__(self):
+        return f"Resumen {self.drogueria_id}/{self.categoria_id}: {self.skus} SKUs"
+
+
 # =========================
 # 📦 MOVIMIENTOS DE INVENTARIO
 # =========================
@@ -133,26 +198,41 @@ class MovimientoInventario(models.Model):
     # Actualiza stock al guardar
     # =========================
     def save(self, *args, **kwargs):
-        """Ajusta automáticamente el stock del medicamento."""
-        if not self.pk:  # solo al crear el movimiento
+        """Ajusta automáticamente el stock del medicamento.
+
+        El cambio es un UPDATE condicional sobre las columnas de stock (ver
+        stock.py): una salida mayor que el stock disponible (sin lo
+        reservado) lanza ``StockInsuficiente`` y no se registra el
+        movimiento. ``consumir_reserva=True`` hace que la salida entregue
+        unidades ya reservadas.
+        """
+        from django.db import transaction
+        from . import stock
+
+        # si es entrada desde una transferencia, podemos liberar reservados
+        transferencia_release = kwargs.pop('transferencia_release', False)
+        consumir_reserva = kwargs.pop('consumir_reserva', False)
+        if self.pk:
+            super().save(*args, **kwargs)
+            return
+        with transaction.atomic():  # solo al crear el movimiento
             if self.tipo_movimiento == "entrada":
-                # entrada incrementa stock_actual
-                self.medicamento.stock_actual += self.cantidad
-                # si es entrada desde una transferencia, podemos liberar reservados
-                if kwargs.get('transferencia_release'):
-                    self.medicamento.stock_reservado = max(self.medicamento.stock_reservado - self.cantidad, 0)
+                stock.sumar(self.medicamento, self.cantidad)
+                if transferencia_release:
+                    stock.liberar(self.medicamento, self.cantidad)
+            elif self.tipo_movimiento == "salida" and consumir_reserva:
+                stock.consumir_reserva(self.medicamento, self.cantidad)
             elif self.tipo_movimiento == "salida":
-                # salida reduce stock_actual (y si se desea reservar, usar otro flujo)
-                self.medicamento.stock_actual -= self.cantidad
-                # prevenir stock negativo
-                if self.medicamento.stock_actual < 0:
-                    self.medicamento.stock_actual = 0
-            self.medicamento.save()
-        super().save(*args, **kwargs)
+                stock.descontar(self.medicamento, self.cantidad)
+            super().save(*args, **kwargs)
 
     class Meta:
         indexes = [
             models.Index(fields=['medicamento', 'drogueria', 'fecha_movimiento'], name='mov_med_drog_fecha_idx'),
+            # paginación por cursor (KeysetPagination)
+            models.Index(fields=['fecha_movimiento', 'id'], name='mov_fecha_id_idx'),
+            # pronóstico de demanda: salidas por día leídas solo del índice (ver pronostico._historial)
+            models.Index(fields=['tipo_movimiento', 'fecha_movimiento', 'medicamento', 'cantidad'], name='mov_tipo_fecha_med_cant_idx'),
         ]
 
 
@@ -160,7 +240,9 @@ class Alerta(models.Model):
     TIPOS = [
         ('low_stock', 'Stock bajo'),
         ('vencido', 'Vencido'),
+        ('por_vencer', 'Por vencer'),
         ('prestamo', 'Prestamo'),
+        ('transferencia', 'Transferencia'),
         ('info', 'Información'),
     ]
 
@@ -177,11 +259,14 @@ class Alerta(models.Model):
     drogueria = models.ForeignKey(Drogueria, on_delete=models.SET_NULL, null=True, blank=True, related_name='alertas')
     creado_en = models.DateTimeField(auto_now_add=True)
     leido = models.BooleanField(default=False)
+    # alertas 'por_vencer': ventana (en días) en la que entró el medicamento
+    ventana_dias = models.PositiveSmallIntegerField(null=True, blank=True)
 
     class Meta:
         ordering = ['-creado_en']
         indexes = [
             models.Index(fields=['medicamento', 'drogueria', 'tipo', 'creado_en'], name='alert_med_drog_tipo_idx'),
+            models.Index(fields=['creado_en', 'id'], name='alert_creado_id_idx'),
         ]
 
     def __str__(self):
@@ -196,12 +281,16 @@ class AuditLog(models.Model):
     user = models.ForeignKey(Usuario, on_delete=models.SET_NULL, null=True, blank=True)
     message = models.TextField(blank=True, null=True)
     data = models.JSONField(blank=True, null=True)
-    created_at = models.DateTimeField(auto_now_add=True)
+    # hora del evento, no de la inserción (ver auditoria.py)
+    created_at = models.DateTimeField(default=timezone.now, editable=False)
+    # identificador del evento: reinsertar un segmento recuperado no duplica filas
+    evento = models.UUIDField(unique=True, null=True, blank=True, editable=False)
 
     class Meta:
         ordering = ['-created_at']
         indexes = [
             models.Index(fields=['model_name', 'object_id', 'created_at'], name='audit_model_obj_idx'),
+            models.Index(fields=['created_at', 'id'], name='audit_created_id_idx'),
         ]
 
     def __str__(self):
@@ -276,15 +365,12 @@ class Prestamo(models.Model):
 
         Lanza ValueError si no hay stock disponible suficiente.
         """
-        disponible = self.medicamento_origen.stock_actual - self.medicamento_origen.stock_reservado
-        if self.cantidad > disponible:
-            raise ValueError('Stock insuficiente para reservar')
-        self.medicamento_origen.stock_reservado += self.cantidad
-        self.medicamento_origen.save()
+        from . import stock
+        stock.reservar(self.medicamento_origen, self.cantidad)
 
     def liberar_reserva(self):
-        self.medicamento_origen.stock_reservado = max(self.medicamento_origen.stock_reservado - self.cantidad, 0)
-        self.medicamento_origen.save()
+        from . import stock
+        stock.liberar(self.medicamento_origen, self.cantidad)
 
     def aceptar(self, user=None):
         """Acepta la solicitud: crea movimientos de salida/entrada y actualiza estado."""
@@ -316,14 +402,15 @@ class Prestamo(models.Model):
             origen_med = Medicamento.objects.select_for_update().get(pk=self.medicamento_origen.pk)
             dest_med = Medicamento.objects.select_for_update().get(pk=self.medicamento_destino.pk)
 
-            # Crear movimiento salida en origen (ajusta stock_actual en 'origen_med')
-            MovimientoInventario.objects.create(
+            # Crear movimiento salida en origen: entrega las unidades reservadas
+            # por la solicitud (baja stock_actual y stock_reservado en 'origen_med')
+            MovimientoInventario(
                 medicamento=origen_med,
                 drogueria=self.origen,
                 tipo_movimiento='salida',
                 cantidad=self.cantidad,
                 usuario=user
-            )
+            ).save(consumir_reserva=True)
 
             # Crear movimiento entrada en destino (ajusta stock_actual en 'dest_med')
             MovimientoInventario.objects.create(
@@ -334,9 +421,6 @@ class Prestamo(models.Model):
                 usuario=user
             )
 
-            # Reducir la reserva en la instancia bloqueada para no sobrescribir cambios
-            origen_med.stock_reservado = max(origen_med.stock_reservado - self.cantidad, 0)
-            origen_med.save()
             self.estado = 'accepted'
             self.respondedor = user
             from django.utils.timezone import now
@@ -355,3 +439,48 @@ class Prestamo(models.Model):
         self.fecha_respuesta = now()
         self.save()
 
+
+
+class OrdenTransferencia(models.Model):
+    """Traslado de varios productos entre dos droguerías (un ``Prestamo`` con líneas).
+
+    La reserva, la aceptación y el rechazo se hacen por conjuntos para toda
+    la orden; ver ``inventario/transferencias.py``.
+    """
+    ESTADO = Prestamo.ESTADO
+
+    origen = models.ForeignKey(Drogueria, on_delete=models.CASCADE, related_name='transferencias_origen')
+    destino = models.ForeignKey(Drogueria, on_delete=models.CASCADE, related_name='transferencias_destino')
+    estado = models.CharField(max_length=20, choices=ESTADO, default='pending')
+    solicitante = models.ForeignKey(Usuario, on_delete=models.SET_NULL, null=True, blank=True, related_name='transferencias_solicitadas')
+    respondedor = models.ForeignKey(Usuario, on_delete=models.SET_NULL, null=True, blank=True, related_name='transferencias_respondidas')
+    fecha_solicitud = models.DateTimeField(auto_now_add=True)
+    fecha_respuesta = models.DateTimeField(null=True, blank=True)
+    nota = models.TextField(blank=True, null=True)
+
+    class Meta:
+        ordering = ['-fecha_solicitud']
+        indexes = [
+            models.Index(fields=['origen', 'destino', 'estado', 'fecha_solicitud'], name='transf_origen_dest_estado_idx'),
+        ]
+
+    def __str__(self):
+        return f"Transferencia {self.id}: {self.origen_id}->{self.destino_id} [{self.estado}]"
+
+
+class LineaTransferencia(models.Model):
+    orden = models.ForeignKey(OrdenTransferencia, on_delete=models.CASCADE, related_name='lineas')
+    medicamento_origen = models.ForeignKey(Medicamento, on_delete=models.CASCADE, related_name='lineas_transferencia_origen')
+    # se resuelve (o se crea) al aceptar si no se indicó
+    medicamento_destino = models.ForeignKey(
+        Medicamento, on_delete=models.CASCADE, related_name='lineas_transferencia_destino', null=True, blank=True
+    )
+    cantidad = models.PositiveIntegerField()
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['orden', 'medicamento_origen'], name='unique_linea_transferencia'),
+        ]
+
+    def __str__(self):
+        return f"{self.medicamento_origen_id} x{self.cantidad}"
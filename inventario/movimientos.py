@@ -0,0 +1,156 @@
+"""Ingreso masivo de movimientos de inventario (recepciones de mercancía, conteos).
+
+``MovimientoInventario.save()`` carga el medicamento, lo guarda y dispara
+señales que escriben la auditoría y consultan alertas: unas cuatro consultas
+por línea. ``registrar_lote`` hace el mismo trabajo por conjuntos, dentro de
+una sola transacción:
+
+- una lectura (bloqueada) de los medicamentos afectados
+- ``UPDATE ... SET stock_actual = stock_actual + delta`` por bloques
+- ``bulk_create`` de movimientos, auditoría y alertas de stock bajo
+  (evaluadas una vez por medicamento, con el stock final)
+
+El stock sigue las mismas reglas que el alta individual: ``entrada`` suma,
+``ajuste`` solo queda registrado y una ``salida`` mayor que el stock
+disponible en ese punto del lote rechaza el lote entero.
+"""
+from collections import OrderedDict
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Case, F, IntegerField, Value, When
+from django.db.models.functions import Greatest
+from django.utils import timezone
+from rest_framework.exceptions import ValidationError
+
+from . import barcodes, resumen
+from .cache_catalogo import invalidar_catalogo
+
+LOTE_MAX_LINEAS = getattr(settings, 'INVENTARIO_LOTE_MAX_LINEAS', 5000)
+_BLOQUE = 500
+
+
+def _aplicar(stock, tipo, cantidad):
+    if tipo == 'entrada':
+        return stock + cantidad
+    if tipo == 'salida':
+        return stock - cantidad
+    return stock
+
+
+def alertas_stock_bajo(meds, pks, drogueria_id=None):
+    """Alertas ``low_stock`` (sin guardar) para los ``pks`` de ``meds`` que quedaron bajo mínimo.
+
+    Una evaluación por medicamento con su ``stock_actual`` final; se omiten
+    los que ya tienen una alerta sin leer.
+    """
+    from .models import Alerta
+
+    bajos = [pk for pk in pks if meds[pk].stock_actual <= meds[pk].stock_minimo]
+    if not bajos:
+        return []
+    con_alerta = set(
+        Alerta.objects.filter(tipo='low_stock', leido=False, medicamento_id__in=bajos)
+        .values_list('medicamento_id', flat=True)
+    )
+    return [
+        Alerta(
+            tipo='low_stock',
+            nivel='warning',
+            mensaje=f"Stock bajo para {meds[pk].nombre}: {meds[pk].stock_actual} <= {meds[pk].stock_minimo}",
+            medicamento=meds[pk],
+            drogueria_id=drogueria_id or meds[pk].drogueria_id,
+        )
+        for pk in bajos if pk not in con_alerta
+    ]
+
+
+def registrar_lote(lineas, usuario=None, drogueria=None):
+    """Registra ``lineas`` (dicts con ``medicamento_id``, ``tipo_movimiento``,
+    ``cantidad`` y ``observacion`` opcional) como un único lote.
+
+    Si no se indica ``drogueria`` cada movimiento queda en la del medicamento.
+    Devuelve ``{'movimientos': [...], 'alertas': [...]}``; con un medicamento
+    inexistente o sin stock para una salida lanza ``ValidationError`` y no se
+    escribe nada.
+    """
+    from .models import Alerta, AuditLog, Medicamento, MovimientoInventario
+
+    ids = list(OrderedDict.fromkeys(l['medicamento_id'] for l in lineas))
+    ahora = timezone.now()
+
+    with transaction.atomic():
+        meds = Medicamento.objects.select_for_update().in_bulk(ids)
+        faltantes = [i for i in ids if i not in meds]
+        if faltantes:
+            raise ValidationError({'movimientos': f'Medicamentos inexistentes: {faltantes}'})
+
+        anteriores = {pk: resumen.valores(m) for pk, m in meds.items()}
+        stock = {pk: m.stock_actual for pk, m in meds.items()}
+        sin_stock = []
+        for n, l in enumerate(lineas):
+            pk = l['medicamento_id']
+            stock[pk] = _aplicar(stock[pk], l['tipo_movimiento'], l['cantidad'])
+            # una salida no puede tomar unidades reservadas (pedidos, préstamos, transferencias)
+            if l['tipo_movimiento'] == 'salida' and stock[pk] < meds[pk].stock_reservado:
+                sin_stock.append(n)
+                stock[pk] += l['cantidad']
+        if sin_stock:
+            raise ValidationError({'movimientos': f'Stock insuficiente en las líneas: {sin_stock}'})
+
+        deltas = {pk: stock[pk] - meds[pk].stock_actual for pk in ids if stock[pk] != meds[pk].stock_actual}
+        cambiados = list(deltas)
+        for i in range(0, len(cambiados), _BLOQUE):
+            bloque = cambiados[i:i + _BLOQUE]
+            Medicamento.objects.filter(pk__in=bloque).update(stock_actual=Greatest(
+                Case(
+                    *[When(pk=pk, then=F('stock_actual') + Value(deltas[pk])) for pk in bloque],
+                    output_field=IntegerField(),
+                ),
+                Value(0),
+            ))
+        for pk, m in meds.items():
+            m.stock_actual = stock[pk]
+
+        movimientos = MovimientoInventario.objects.bulk_create([
+            MovimientoInventario(
+                medicamento=meds[l['medicamento_id']],
+                drogueria_id=drogueria.pk if drogueria else meds[l['medicamento_id']].drogueria_id,
+                tipo_movimiento=l['tipo_movimiento'],
+                cantidad=l['cantidad'],
+                fecha_movimiento=ahora,
+                usuario=usuario,
+                observacion=l.get('observacion') or None,
+            )
+            for l in lineas
+        ], batch_size=_BLOQUE)
+
+        AuditLog.objects.bulk_create([
+            AuditLog(
+                action='movimiento_creado',
+                model_name='MovimientoInventario',
+                object_id=mov.pk,
+                user=usuario,
+                message=f"Movimiento {mov.tipo_movimiento} {mov.cantidad} para {mov.medicamento.nombre}",
+                data={'medicamento': mov.medicamento_id, 'drogueria': mov.drogueria_id},
+            )
+            for mov in movimientos
+        ], batch_size=_BLOQUE)
+
+        alertas = Alerta.objects.bulk_create(
+            alertas_stock_bajo(meds, ids, drogueria_id=drogueria.pk if drogueria else None)
+        )
+
+        # el UPDATE no emite señales: mantener el resumen a mano
+        resumen.registrar_cambios(
+            (anteriores[pk], resumen.valores(meds[pk])) for pk in cambiados
+        )
+
+    if cambiados:
+        for pk in cambiados:
+            barcodes.invalidar_medicamento(meds[pk])
+        invalidar_catalogo(
+            droguerias={meds[pk].drogueria_id for pk in cambiados},
+            categorias={meds[pk].categoria_id for pk in cambiados},
+        )
+    return {'movimientos': movimientos, 'alertas': alertas}
@@ -1,7 +1,148 @@
-from rest_framework.pagination import PageNumberPagination
+import base64
+import json
+from collections import OrderedDict
+
+from django.core.exceptions import ValidationError as DjangoValidationError
+from django.db.models import Q
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import BasePagination, PageNumberPagination
+from rest_framework.response import Response
+from rest_framework.utils.urls import remove_query_param, replace_query_param
 
 
 class StandardResultsSetPagination(PageNumberPagination):
     page_size = 10
     page_size_query_param = 'page_size'
     max_page_size = 100
+
+
+class KeysetPagination(BasePagination):
+    """Paginación por cursor sobre (``view.keyset_field``, ``id``), más reciente primero.
+
+    Cada página es un ``WHERE (campo, id) < (cursor) ORDER BY campo DESC, id DESC
+    LIMIT n`` servido por el índice (campo, id): no hay ``COUNT(*)`` ni
+    ``OFFSET``, así que la página 10.000 cuesta lo mismo que la primera.
+    La respuesta tiene la forma ``{"next", "previous", "results"}``.
+    """
+    page_size = StandardResultsSetPagination.page_size
+    page_size_query_param = 'page_size'
+    max_page_size = StandardResultsSetPagination.max_page_size
+    cursor_query_param = 'cursor'
+    invalid_cursor_message = 'Cursor inválido'
+
+    def get_page_size(self, request):
+        try:
+            size = int(request.query_params[self.page_size_query_param])
+        except (KeyError, ValueError):
+            return self.page_size
+        return min(size, self.max_page_size) if size > 0 else self.page_size
+
+    def decode_cursor(self, request):
+        encoded = request.query_params.get(self.cursor_query_param)
+        if not encoded:
+            return None
+        try:
+            data = json.loads(base64.urlsafe_b64decode(encoded.encode('ascii')).decode('utf-8'))
+            # to_python lanza ValidationError con un valor bien codificado pero absurdo
+            valor = self.model_field.to_python(data['v'])
+            if valor is None:
+                raise ValueError(data)
+            return valor, int(data['id']), bool(data.get('r'))
+        except (TypeError, ValueError, KeyError, UnicodeError, DjangoValidationError):
+            raise NotFound(self.invalid_cursor_message)
+
+    def encode_cursor(self, obj, reverse):
+        valor = getattr(obj, self.field)
+        data = {'v': valor.isoformat() if hasattr(valor, 'isoformat') else valor, 'id': obj.pk, 'r': reverse}
+        encoded = base64.urlsafe_b64encode(json.dumps(data).encode('utf-8')).decode('ascii')
+        return replace_query_param(self.base_url, self.cursor_query_param, encoded)
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.field = getattr(view, 'keyset_field', 'id')
+        self.model_field = queryset.model._meta.get_field(self.field)
+        self.base_url = request.build_absolute_uri()
+        size = self.get_page_size(request)
+        cursor = self.decode_cursor(request)
+        f = self.field
+
+        if cursor is None:
+            rows = list(queryset.order_by(f'-{f}', '-id')[:size + 1])
+            self.has_next, self.has_previous = len(rows) > size, False
+            rows = rows[:size]
+        else:
+            valor, pk, reverse = cursor
+            if not reverse:
+                # el ``__lte`` redundante acota el rango del índice; el OR desempata por id
+                rows = list(
+                    queryset.filter(**{f'{f}__lte': valor})
+                    .filter(Q(**{f'{f}__lt': valor}) | Q(**{f: valor, 'id__lt': pk}))
+                    .order_by(f'-{f}', '-id')[:size + 1]
+                )
+                self.has_next, self.has_previous = len(rows) > size, True
+                rows = rows[:size]
+            else:
+                rows = list(
+                    queryset.filter(**{f'{f}__gte': valor})
+                    .filter(Q(**{f'{f}__gt': valor}) | Q(**{f: valor, 'id__gt': pk}))
+                    .order_by(f, 'id')[:size + 1]
+                )
+                self.has_next, self.has_previous = True, len(rows) > size
+                rows = rows[:size][::-1]
+
+        self.page = rows
+        return rows
+
+    def get_next_link(self):
+        if not self.has_next or not self.page:
+            return None
+        return self.encode_cursor(self.page[-1], reverse=False)
+
+    def get_previous_link(self):
+        if not self.has_previous:
+            return None
+        if not self.page:
+            return remove_query_param(self.base_url, self.cursor_query_param)
+        return self.encode_cursor(self.page[0], reverse=True)
+
+    def get_paginated_response(self, data):
+        return Response(OrderedDict([
+            ('next', self.get_next_link()),
+            ('previous', self.get_previous_link()),
+            ('results', data),
+        ]))
+
+    def get_paginated_response_schema(self, schema):
+        return {
+            'type': 'object',
+            'required': ['results'],
+            'properties': {
+                'next': {'type': 'string', 'nullable': True, 'format': 'uri'},
+                'previous': {'type': 'string', 'nullable': True, 'format': 'uri'},
+                'results': schema,
+            },
+        }
+
+
+class PageOrCursorPagination(StandardResultsSetPagination):
+    """Paginación por número de página (por defecto) o por cursor, a elección del cliente.
+
+    ``?paginacion=cursor`` (o un ``?cursor=`` recibido en un enlace ``next``)
+    activa ``KeysetPagination``; sin ellos la respuesta es la de siempre, con
+    ``count`` y ``?page=N``.
+    """
+    mode_query_param = 'paginacion'
+
+    def use_cursor(self, request):
+        params = request.query_params
+        return params.get(self.mode_query_param) == 'cursor' or KeysetPagination.cursor_query_param in params
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.keyset = KeysetPagination() if self.use_cursor(request) else None
+        if self.keyset is not None:
+            return self.keyset.paginate_queryset(queryset, request, view)
+        return super().paginate_queryset(queryset, request, view)
+
+    def get_paginated_response(self, data):
+        if self.keyset is not None:
+            return self.keyset.get_paginated_response(data)
+        return super().get_paginated_response(data)
@@ -0,0 +1,247 @@
+"""Respuesta por lote a solicitudes de préstamo (aceptar o rechazar muchas a la vez).
+
+``Prestamo.aceptar`` atiende una solicitud por petición: ``get_or_create``
+del medicamento destino, dos bloqueos, dos ``MovimientoInventario.save()``
+con sus señales y tres ``save()`` más. ``responder_lote`` hace lo mismo por
+conjuntos, en una sola transacción:
+
+1. bloquea las solicitudes (en orden de id) y descarta las que no están
+   pendientes o que el usuario no puede responder
+2. busca con una consulta los medicamentos destino que faltan
+3. bloquea **todos** los medicamentos implicados en orden de clave primaria,
+   así dos lotes que comparten productos nunca se esperan en círculo, y
+   comprueba el stock de cada origen
+4. crea con un ``bulk_create`` los destinos que no existen, solo para las
+   solicitudes que se aceptan: una rechazada por falta de stock no deja un
+   producto vacío en la droguería destino
+5. aplica los cambios de stock con ``UPDATE`` por bloques y crea
+   movimientos, auditoría y alertas con ``bulk_create``
+
+Una solicitud cuyo origen ya no tiene stock se informa como error y el
+resto del lote sigue adelante.
+"""
+from django.db import transaction
+from django.db.models import Case, F, IntegerField, Value, When
+from django.db.models.functions import Greatest
+from django.utils import timezone
+
+from . import barcodes, resumen
+from .cache_catalogo import invalidar_catalogo
+from .movimientos import alertas_stock_bajo
+
+ACCIONES = ('accept', 'reject')
+LOTE_MAX = 1000
+_BLOQUE = 500
+
+
+def puede_responder(usuario, origen, destino):
+    """Admin, superusuario o propietario de alguna de las dos droguerías."""
+    return bool(
+        usuario.is_superuser
+        or getattr(usuario, 'rol', None) == 'admin'
+        or (destino is not None and destino.propietario_id == usuario.pk)
+        or (origen is not None and origen.propietario_id == usuario.pk)
+    )
+
+
+def resolver_destinos(items, meds_origen, destino_de, crear=True):
+    """Asigna ``medicamento_destino_id`` a los ``items`` que no lo tienen: el producto con el
+    mismo nombre en la droguería ``destino_de(item)``, creado si no existe. Devuelve los ids creados.
+
+    Con ``crear=False`` solo asigna los que ya existen; el resto queda en ``None``.
+    """
+    from .models import Medicamento
+
+    faltan = [p for p in items if p.medicamento_destino_id is None]
+    if not faltan:
+        return []
+    claves = {(meds_origen[p.medicamento_origen_id].nombre, destino_de(p)) for p in faltan}
+
+    def existentes():
+        qs = Medicamento.objects.filter(
+            nombre__in={n for n, _ in claves}, drogueria_id__in={d for _, d in claves}
+        ).values_list('nombre', 'drogueria_id', 'id')
+        return {(n, d): pk for n, d, pk in qs if (n, d) in claves}
+
+    encontrados = existentes()
+    nuevos = {}
+    for p in faltan if crear else ():
+        origen = meds_origen[p.medicamento_origen_id]
+        clave = (origen.nombre, destino_de(p))
+        if clave not in encontrados and clave not in nuevos:
+            nuevos[clave] = Medicamento(
+                nombre=origen.nombre, drogueria_id=clave[1], descripcion=origen.descripcion,
+                categoria_id=origen.categoria_id, precio_venta=origen.precio_venta,
+                costo_compra=origen.costo_compra, stock_actual=0,
+            )
+    creados = []
+    if nuevos:
+        # ignore_conflicts: otro proceso pudo crear el mismo producto entretanto
+        Medicamento.objects.bulk_create(nuevos.values(), batch_size=_BLOQUE, ignore_conflicts=True)
+        encontrados = existentes()
+        creados = [encontrados[c] for c in nuevos]
+    for p in faltan:
+        p.medicamento_destino_id = encontrados.get((meds_origen[p.medicamento_origen_id].nombre, destino_de(p)))
+    return creados
+
+
+def actualizar_stock(deltas):
+    """``UPDATE`` por bloques de ``{pk: (delta_actual, delta_reservado)}``."""
+    from .models import Medicamento
+
+    pks = [pk for pk, (a, r) in deltas.items() if a or r]
+    for i in range(0, len(pks), _BLOQUE):
+        bloque = pks[i:i + _BLOQUE]
+
+        def columna(nombre, posicion):
+            return Greatest(
+                Case(
+                    *[When(pk=pk, then=F(nombre) + Value(deltas[pk][posicion])) for pk in bloque],
+                    output_field=IntegerField(),
+                ),
+                Value(0),
+            )
+        Medicamento.objects.filter(pk__in=bloque).update(
+            stock_actual=columna('stock_actual', 0), stock_reservado=columna('stock_reservado', 1)
+        )
+    return pks
+
+
+def responder_lote(ids, accion, usuario, nota=None):
+    """Acepta (``accion='accept'``) o rechaza (``'reject'``) los préstamos ``ids``.
+
+    Devuelve ``{'procesados': [ids], 'errores': {id: motivo}}``.
+    """
+    from droguerias.models import Drogueria
+    from .models import Alerta, AuditLog, Medicamento, MovimientoInventario, Prestamo
+
+    aceptar = accion == 'accept'
+    ahora = timezone.now()
+    errores = {}
+
+    with transaction.atomic():
+        prestamos = list(Prestamo.objects.select_for_update().filter(pk__in=ids).order_by('pk'))
+        for pk in set(ids) - {p.pk for p in prestamos}:
+            errores[pk] = 'No existe'
+        droguerias = Drogueria.objects.in_bulk({p.origen_id for p in prestamos} | {p.destino_id for p in prestamos})
+        validos = []
+        for p in prestamos:
+            if p.estado != 'pending':
+                errores[p.pk] = f'Solo solicitudes pendientes pueden responderse (estado: {p.estado})'
+            elif not puede_responder(usuario, droguerias.get(p.origen_id), droguerias.get(p.destino_id)):
+                errores[p.pk] = 'No autorizado'
+            else:
+                validos.append(p)
+        if not validos:
+            return {'procesados': [], 'errores': errores}
+
+        meds_origen = Medicamento.objects.in_bulk({p.medicamento_origen_id for p in validos})
+        if aceptar:
+            # solo los que existen: los que faltan se crean tras comprobar el stock
+            resolver_destinos(validos, meds_origen, lambda p: p.destino_id, crear=False)
+
+        # un solo bloqueo de todos los medicamentos, en orden de pk
+        implicados = {p.medicamento_origen_id for p in validos}
+        if aceptar:
+            implicados |= {p.medicamento_destino_id for p in validos} - {None}
+        meds = {m.pk: m for m in Medicamento.objects.select_for_update().filter(pk__in=implicados).order_by('pk')}
+        anteriores = {pk: resumen.valores(m) for pk, m in meds.items()}
+
+        actual = {pk: m.stock_actual for pk, m in meds.items()}
+        reservado = {pk: m.stock_reservado for pk, m in meds.items()}
+        procesados = []
+        for p in validos:
+            origen = p.medicamento_origen_id
+            if aceptar:
+                if actual[origen] < p.cantidad:
+                    errores[p.pk] = f'Stock insuficiente para {meds[origen].nombre}'
+                    continue
+                actual[origen] -= p.cantidad
+            reservado[origen] = max(reservado[origen] - p.cantidad, 0)
+            procesados.append(p)
+
+        creados = []
+        if aceptar:
+            creados = resolver_destinos(procesados, meds_origen, lambda p: p.destino_id)
+            # destinos nuevos (o creados entretanto por otro proceso): aún sin bloquear
+            faltan = {p.medicamento_destino_id for p in procesados} - set(meds)
+            for m in Medicamento.objects.select_for_update().filter(pk__in=faltan).order_by('pk'):
+                meds[m.pk] = m
+                anteriores[m.pk] = None if m.pk in creados else resumen.valores(m)
+                actual[m.pk], reservado[m.pk] = m.stock_actual, m.stock_reservado
+            for p in procesados:
+                actual[p.medicamento_destino_id] += p.cantidad
+
+        cambiados = actualizar_stock({
+            pk: (actual[pk] - m.stock_actual, reservado[pk] - m.stock_reservado) for pk, m in meds.items()
+        })
+        for pk, m in meds.items():
+            m.stock_actual, m.stock_reservado = actual[pk], reservado[pk]
+
+        estado = 'accepted' if aceptar else 'rejected'
+        for p in procesados:
+            p.estado, p.respondedor, p.fecha_respuesta = estado, usuario, ahora
+            if not aceptar:
+                p.nota = nota or p.nota
+        Prestamo.objects.bulk_update(
+            procesados, ['estado', 'respondedor', 'fecha_respuesta', 'medicamento_destino', 'nota'], batch_size=_BLOQUE
+        )
+
+        auditoria = [
+            AuditLog(
+                action=f'prestamo_{"aceptado" if aceptar else "rechazado"}',
+                model_name='Prestamo', object_id=p.pk, user=usuario,
+                message=f"Prestamo {p.pk} {'aceptado' if aceptar else 'rechazado'}: {meds[p.medicamento_origen_id].nombre} x{p.cantidad}",
+                data={'origen': p.origen_id, 'destino': p.destino_id, 'lote': True},
+            )
+            for p in procesados
+        ]
+        alertas = []
+        if aceptar and procesados:
+            movimientos = MovimientoInventario.objects.bulk_create([
+                MovimientoInventario(
+                    medicamento_id=med_id, drogueria_id=drogueria_id, tipo_movimiento=tipo,
+                    cantidad=p.cantidad, usuario=usuario, fecha_movimiento=ahora,
+                )
+                for p in procesados
+                for med_id, drogueria_id, tipo in (
+                    (p.medicamento_origen_id, p.origen_id, 'salida'),
+                    (p.medicamento_destino_id, p.destino_id, 'entrada'),
+                )
+            ], batch_size=_BLOQUE)
+            auditoria += [
+                AuditLog(
+                    action='movimiento_creado', model_name='MovimientoInventario', object_id=mov.pk,
+                    user=usuario,
+                    message=f"Movimiento {mov.tipo_movimiento} {mov.cantidad} para {meds[mov.medicamento_id].nombre}",
+                    data={'medicamento': mov.medicamento_id, 'drogueria': mov.drogueria_id},
+                )
+                for mov in movimientos
+            ]
+            alertas += [
+                Alerta(
+                    tipo='prestamo', nivel='info', medicamento_id=p.medicamento_destino_id, drogueria_id=p.destino_id,
+                    mensaje=(
+                        f"Préstamo aceptado: {meds[p.medicamento_origen_id].nombre} x{p.cantidad} "
+                        f"{droguerias[p.origen_id].codigo} → {droguerias[p.destino_id].codigo}"
+                    ),
+                )
+                for p in procesados
+            ]
+            # stock bajo en los orígenes, evaluado una vez con el stock final
+            alertas += alertas_stock_bajo(meds, sorted({p.medicamento_origen_id for p in procesados}))
+        AuditLog.objects.bulk_create(auditoria, batch_size=_BLOQUE)
+        Alerta.objects.bulk_create(alertas, batch_size=_BLOQUE)
+
+        # ni el UPDATE ni bulk_create emiten señales: mantener el resumen a mano
+        tocados = set(cambiados) | set(creados)
+        resumen.registrar_cambios((anteriores[pk], resumen.valores(meds[pk])) for pk in tocados)
+
+    if tocados:
+        for pk in tocados:
+            barcodes.invalidar_medicamento(meds[pk])
+        invalidar_catalogo(
+            droguerias={meds[pk].drogueria_id for pk in tocados},
+            categorias={meds[pk].categoria_id for pk in tocados},
+        )
+    return {'procesados': [p.pk for p in procesados], 'errores': errores}
@@ -0,0 +1,191 @@
+"""Pronóstico de demanda y punto de reorden dinámico (``stock_minimo``).
+
+``stock_minimo`` era un 10 fijo para todo el catálogo: un producto que sale
+cien veces al día y otro que sale una vez al mes avisaban igual. ``calcular``
+(``manage.py pronosticar_demanda``, a diario) lo ajusta a la demanda real:
+
+- las salidas de los últimos ``DIAS`` días, ya sumadas por medicamento y
+  día en la base, volcadas en arreglos de NumPy
+- por medicamento (cada uno es de una droguería: SKU por sucursal) la
+  demanda diaria media μ y su desviación σ, contando en cero los días sin
+  salidas desde la primera observada (al menos ``DIAS_MIN``)
+- punto de reorden = ⌈μ·L + z·σ·√L⌉, con L = ``PLAZO_DIAS`` de reposición
+  y z según el nivel de servicio
+- se guarda en ``stock_minimo`` con un ``UPDATE`` por valor nuevo (solo
+  los que tienen ``stock_minimo_auto`` y salidas en la ventana):
+  ``verificar_stock``, las alertas de stock bajo y el resumen de inventario
+  usan así el umbral calculado, y los que ya quedan por debajo reciben su
+  alerta
+
+Todo el cálculo es vectorizado (``estimar``) y el historial se lee día a
+día directamente a arreglos; ``manage.py benchmark_pronostico`` mide
+el trabajo completo (lectura, cálculo y escritura) sobre datos sembrados.
+NumPy está en requirements.txt; se importa al usarlo para que una
+instalación sin él falle con ``SinNumpy`` solo aquí y no al cargar la API.
+"""
+import math
+import time
+from collections import defaultdict
+from datetime import datetime, timedelta
+
+from django.conf import settings
+from django.db import connection, transaction
+from django.db.models import Sum
+from django.utils import timezone
+
+from . import auditoria, barcodes, resumen
+from .cache_catalogo import invalidar_catalogo
+from .movimientos import alertas_stock_bajo
+
+DIAS = getattr(settings, 'INVENTARIO_PRONOSTICO_DIAS', 365)
+DIAS_MIN = getattr(settings, 'INVENTARIO_PRONOSTICO_DIAS_MIN', 28)
+PLAZO_DIAS = getattr(settings, 'INVENTARIO_REPOSICION_DIAS', 7)
+# z de la normal: 1.65 ≈ 95 % de ciclos de reposición sin quiebre
+NIVEL_SERVICIO_Z = getattr(settings, 'INVENTARIO_NIVEL_SERVICIO_Z', 1.65)
+_BLOQUE = 500
+
+
+class SinNumpy(RuntimeError):
+    pass
+
+
+def _numpy():
+    try:
+        import numpy
+    except ImportError:
+        raise SinNumpy('Falta numpy: pip install -r requirements.txt')
+    return numpy
+
+
+def estimar(medicamentos, dias_idx, cantidades, dias=DIAS, plazo=PLAZO_DIAS, z=NIVEL_SERVICIO_Z, dias_min=DIAS_MIN):
+    """Demanda y punto de reorden por medicamento a partir de arreglos paralelos.
+
+    ``medicamentos``/``dias_idx``/``cantidades``: una entrada por salida (o
+    por medicamento y día ya sumados), con ``dias_idx`` en ``[0, dias)`` y
+    ``dias - 1`` = hoy. Devuelve ``(ids, media, desviacion, punto)``
+    ordenados por id.
+    """
+    np = _numpy()
+    medicamentos = np.asarray(medicamentos, dtype=np.int64)
+    dias_idx = np.asarray(dias_idx, dtype=np.int64)
+    cantidades = np.asarray(cantidades, dtype=np.float64)
+    if not len(medicamentos):
+        vacio = np.empty(0)
+        return np.empty(0, dtype=np.int64), vacio, vacio, np.empty(0, dtype=np.int64)
+
+    ids, sku = np.unique(medicamentos, return_inverse=True)
+    # total por (sku, día): la varianza es de la demanda diaria, no de cada movimiento
+    claves, por_clave = np.unique(sku * dias + dias_idx, return_inverse=True)
+    diarios = np.bincount(por_clave, weights=cantidades)
+    sku_dia = claves // dias
+    suma = np.bincount(sku_dia, weights=diarios, minlength=len(ids))
+    suma2 = np.bincount(sku_dia, weights=diarios * diarios, minlength=len(ids))
+    # claves ordenadas: la primera de cada sku es su primer día con salidas
+    _, primeras = np.unique(sku_dia, return_index=True)
+    observados = np.clip(dias - claves[primeras] % dias, min(dias_min, dias), dias)
+
+    media = suma / observados
+    desviacion = np.sqrt(np.maximum(suma2 / observados - media * media, 0))
+    punto = np.ceil(media * plazo + z * desviacion * math.sqrt(plazo) - 1e-9).astype(np.int64)
+    return ids, media, desviacion, punto
+
+
+def _inicio_dia(dia):
+    return timezone.make_aware(datetime.combine(dia, datetime.min.time()))
+
+
+def _historial(dias, hoy):
+    """Salidas de la ventana sumadas por medicamento y día, en tres arreglos paralelos.
+
+    Una consulta por día local con ``GROUP BY medicamento``, resuelta solo
+    con el índice ``mov_tipo_fecha_med_cant_idx``: el día sale del rango y no
+    de truncar cada fila (en SQLite, una función Python por movimiento). Las
+    filas se leen con el cursor, sin instanciar nada, directo a arreglos.
+    """
+    from .models import MovimientoInventario
+
+    np = _numpy()
+    inicio = hoy - timedelta(days=dias - 1)
+    salidas = MovimientoInventario.objects.filter(tipo_movimiento='salida').order_by()
+    medicamentos, dias_idx, totales = [], [], []
+    with connection.cursor() as cursor:
+        for d in range(dias):
+            rango = {'fecha_movimiento__gte': _inicio_dia(inicio + timedelta(days=d))}
+            if d < dias - 1:
+                # el último día queda abierto: una salida con fecha futura (reloj desfasado) cuenta como de hoy
+                rango['fecha_movimiento__lt'] = _inicio_dia(inicio + timedelta(days=d + 1))
+            consulta = salidas.filter(**rango).values('medicamento_id').annotate(total=Sum('cantidad'))
+            cursor.execute(*consulta.values_list('medicamento_id', 'total').query.sql_with_params())
+            filas = np.array(cursor.fetchall(), dtype=np.int64).reshape(-1, 2)
+            if len(filas):
+                medicamentos.append(filas[:, 0])
+                totales.append(filas[:, 1].astype(np.float64))
+                dias_idx.append(np.full(len(filas), d, dtype=np.int64))
+    if not medicamentos:
+        return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.int64), np.empty(0)
+    return np.concatenate(medicamentos), np.concatenate(dias_idx), np.concatenate(totales)
+
+
+def calcular(dias=None, plazo=None, z=None, escribir=True):
+    """Recalcula ``stock_minimo`` de los medicamentos automáticos con salidas en la ventana.
+
+    Con ``escribir=False`` solo informa cuántos cambiarían. Devuelve un resumen.
+    """
+    from .models import Alerta, Medicamento
+
+    inicio = time.monotonic()
+    dias, plazo = dias or DIAS, plazo or PLAZO_DIAS
+    z = NIVEL_SERVICIO_Z if z is None else z
+    historial = _historial(dias, timezone.localdate())
+    lectura = time.monotonic()
+    ids, media, _, punto = estimar(*historial, dias=dias, plazo=plazo, z=z)
+    sugeridos = dict(zip(ids.tolist(), punto.tolist()))
+    calculo = time.monotonic()
+
+    # tuplas, no instancias: con 100k SKUs construir modelos (y sus señales post_init) pesa más que el cálculo
+    actuales = {
+        pk: (minimo, stock, drogueria_id, categoria_id)
+        for pk, minimo, stock, drogueria_id, categoria_id in Medicamento.objects.filter(stock_minimo_auto=True)
+        .values_list('id', 'stock_minimo', 'stock_actual', 'drogueria_id', 'categoria_id').iterator(chunk_size=5000)
+        if pk in sugeridos
+    }
+    cambiados = [pk for pk, fila in actuales.items() if fila[0] != sugeridos[pk]]
+    informe = {
+        'skus_con_historia': len(sugeridos),
+        'actualizados': len(cambiados),
+        'subieron': sum(1 for pk in cambiados if sugeridos[pk] > actuales[pk][0]),
+        'demanda_media_diaria': round(float(media.mean()), 3) if len(media) else 0,
+        'alertas_creadas': 0,
+        'segundos_lectura': round(lectura - inicio, 3),
+        'segundos_calculo': round(calculo - lectura, 3),
+    }
+    if escribir and cambiados:
+        # solo los que quedan bajo el nuevo mínimo pueden necesitar alerta: esos sí como instancias
+        bajos = [pk for pk in cambiados if actuales[pk][1] <= sugeridos[pk]]
+        with transaction.atomic():
+            # un UPDATE por valor nuevo (son pocos distintos) en vez del CASE por fila de bulk_update
+            por_valor = defaultdict(list)
+            for pk in cambiados:
+                por_valor[sugeridos[pk]].append(pk)
+            for valor, pks in por_valor.items():
+                for i in range(0, len(pks), _BLOQUE):
+                    Medicamento.objects.filter(pk__in=pks[i:i + _BLOQUE]).update(stock_minimo=valor)
+            alertas = []
+            for i in range(0, len(bajos), _BLOQUE):
+                meds = Medicamento.objects.only('id', 'nombre', 'stock_actual', 'stock_minimo', 'drogueria_id').in_bulk(
+                    bajos[i:i + _BLOQUE]
+                )
+                alertas += alertas_stock_bajo(meds, list(meds))
+            Alerta.objects.bulk_create(alertas, batch_size=_BLOQUE)
+        informe['alertas_creadas'] = len(alertas)
+
+        # update() no dispara señales: el resumen y las cachés se rehacen aquí
+        resumen.reconstruir()
+        barcodes.invalidar_todo()
+        invalidar_catalogo(
+            droguerias={actuales[pk][2] for pk in cambiados}, categorias={actuales[pk][3] for pk in cambiados}
+        )
+        informe['segundos_escritura'] = round(time.monotonic() - calculo, 3)
+        auditoria.registrar(action='pronostico_calculado', model_name='Medicamento', data=informe)
+    informe['segundos'] = round(time.monotonic() - inicio, 3)
+    return informe
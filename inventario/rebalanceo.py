@@ -0,0 +1,250 @@
+"""Rebalanceo de stock entre droguerías: propuestas de transferencia calculadas.
+
+Cada préstamo empezaba como una solicitud manual aunque otra sucursal
+tuviera de sobra lo que a esta le falta. ``proponer`` mira todas las
+droguerías a la vez:
+
+- **faltante**: medicamento con disponible (``stock_actual - stock_reservado``)
+  en o por debajo de ``stock_minimo``, el punto de reorden; pide hasta
+  ``⌈stock_minimo · OBJETIVO⌉``, menos lo que ya viene en préstamos u
+  órdenes pendientes
+- **sobrante**: lo que pasa de ``⌈stock_minimo · OBJETIVO⌉`` en otra
+  sucursal (un donante nunca queda por debajo de ese nivel; los vencidos no
+  donan)
+- el mismo producto en distintas droguerías se reconoce por
+  ``codigo_barra`` y, si no tiene, por ``nombre`` normalizado (un nombre
+  sin código adopta el código que ese nombre tenga en otra sucursal)
+
+La asignación es un problema de transporte por producto que ``asignar``
+resuelve vectorizado con NumPy para todos los productos a la vez (regla de
+la esquina noroeste sobre sumas acumuladas): los faltantes más urgentes se
+cubren primero con los mayores sobrantes, lo que mueve el máximo de
+unidades con pocas líneas. El resultado son propuestas con el formato de
+``OrdenTransferenciaSerializer`` (una por origen y destino, como mucho
+``transferencias.LINEAS_MAX`` líneas), que ``crear_lote`` registra de una vez.
+
+Usa NumPy (requirements.txt) con la misma importación diferida que el
+pronóstico de demanda (``pronostico.SinNumpy``).
+"""
+import time
+
+from django.conf import settings
+from django.db.models import ExpressionWrapper, F, FloatField, Q, Sum
+from django.utils import timezone
+from rest_framework.exceptions import ValidationError
+
+from . import barcodes, transferencias
+from .pronostico import _numpy
+
+OBJETIVO = getattr(settings, 'INVENTARIO_REBALANCEO_OBJETIVO', 1.5)
+LOTE_MAX = getattr(settings, 'INVENTARIO_REBALANCEO_LOTE_MAX', 200)
+_BLOQUE = 500
+
+
+# =========================
+# Transporte vectorizado
+# =========================
+def asignar(producto, sobrante, faltante, urgencia):
+    """Reparte ``sobrante`` entre ``faltante`` del mismo ``producto``.
+
+    Arreglos paralelos, una fila por medicamento en una droguería: los
+    donantes tienen ``sobrante > 0`` y los receptores ``faltante > 0``;
+    ``urgencia`` ordena a los receptores (menor = antes). Devuelve
+    ``(origen, destino, cantidad)`` como índices de fila.
+    """
+    np = _numpy()
+    producto = np.asarray(producto, dtype=np.int64)
+    sobrante = np.asarray(sobrante, dtype=np.int64)
+    faltante = np.asarray(faltante, dtype=np.int64)
+    urgencia = np.asarray(urgencia, dtype=np.float64)
+    vacio = np.empty(0, dtype=np.int64)
+
+    donantes = np.flatnonzero(sobrante > 0)
+    receptores = np.flatnonzero(faltante > 0)
+    if not len(donantes) or not len(receptores):
+        return vacio, vacio, vacio
+    # por producto: mayores sobrantes primero / receptores más urgentes primero
+    donantes = donantes[np.lexsort((-sobrante[donantes], producto[donantes]))]
+    receptores = receptores[np.lexsort((urgencia[receptores], producto[receptores]))]
+
+    n = int(max(producto[donantes].max(), producto[receptores].max())) + 1
+    oferta = np.bincount(producto[donantes], weights=sobrante[donantes], minlength=n).astype(np.int64)
+    demanda = np.bincount(producto[receptores], weights=faltante[receptores], minlength=n).astype(np.int64)
+    movido = np.minimum(oferta, demanda)
+    # cada producto ocupa [inicio, inicio + movido) en una recta común a todos
+    inicio = np.concatenate(([0], np.cumsum(movido)[:-1]))
+
+    def extremos(filas, cantidades):
+        p = producto[filas]
+        acumulado = np.cumsum(cantidades)
+        antes = np.concatenate(([0], np.cumsum(np.bincount(p, weights=cantidades, minlength=n).astype(np.int64))[:-1]))
+        return inicio[p] + np.minimum(acumulado - antes[p], movido[p])
+
+    fin_donante = extremos(donantes, sobrante[donantes])
+    fin_receptor = extremos(receptores, faltante[receptores])
+    # cada tramo entre dos extremos consecutivos es un único par (donante, receptor)
+    cortes = np.unique(np.concatenate((fin_donante, fin_receptor)))
+    cortes = cortes[cortes > 0]
+    desde = np.concatenate(([0], cortes))[:-1]
+    cantidad = cortes - desde
+    origen = donantes[np.searchsorted(fin_donante, desde, side='right')]
+    destino = receptores[np.searchsorted(fin_receptor, desde, side='right')]
+    return origen, destino, cantidad
+
+
+# =========================
+# Datos
+# =========================
+def _clave_nombre(nombre):
+    return ' '.join((nombre or '').casefold().split())
+
+
+def _en_camino(ids):
+    """Unidades que ya vienen hacia los medicamentos ``ids`` en préstamos y órdenes pendientes."""
+    from .models import LineaTransferencia, Prestamo
+
+    pendiente = {}
+    for i in range(0, len(ids), _BLOQUE):
+        bloque = ids[i:i + _BLOQUE]
+        for qs in (
+            Prestamo.objects.filter(estado='pending', medicamento_destino_id__in=bloque),
+            LineaTransferencia.objects.filter(orden__estado='pending', medicamento_destino_id__in=bloque),
+        ):
+            for med, total in qs.order_by().values('medicamento_destino_id').annotate(total=Sum('cantidad')).values_list(
+                'medicamento_destino_id', 'total'
+            ):
+                pendiente[med] = pendiente.get(med, 0) + total
+    return pendiente
+
+
+def _cargar(droguerias, objetivo):
+    """Medicamentos activos que pueden donar o necesitan recibir, en arreglos."""
+    from .models import Medicamento
+
+    np = _numpy()
+    nivel = ExpressionWrapper(F('stock_minimo') * objetivo, output_field=FloatField())
+    qs = Medicamento.objects.filter(estado=True, drogueria__isnull=False, drogueria__activo=True).filter(
+        Q(stock_minimo__gt=0, stock_actual__lte=F('stock_minimo') + F('stock_reservado'))
+        | (Q(stock_actual__gt=ExpressionWrapper(F('stock_reservado') + nivel, output_field=FloatField()))
+           & ~Q(fecha_vencimiento__lt=timezone.localdate()))
+    )
+    if droguerias is not None:
+        qs = qs.filter(drogueria_id__in=droguerias)
+    filas = list(qs.order_by().values_list(
+        'id', 'drogueria_id', 'nombre', 'codigo_barra', 'stock_actual', 'stock_reservado', 'stock_minimo'
+    ))
+    if not filas:
+        return None
+    ids, drogs, nombres, codigos, actual, reservado, minimo = zip(*filas)
+
+    codigos = [barcodes.normalizar(c) for c in codigos]
+    nombres = [_clave_nombre(n) for n in nombres]
+    codigo_de_nombre = {}
+    for n, c in zip(nombres, codigos):
+        if c:
+            # un nombre con dos códigos distintos es ambiguo: no se usa para emparejar
+            codigo_de_nombre[n] = c if codigo_de_nombre.get(n, c) == c else None
+    claves = [
+        f'c:{c}' if c else (f'c:{codigo_de_nombre[n]}' if codigo_de_nombre.get(n) else f'n:{n}')
+        for n, c in zip(nombres, codigos)
+    ]
+    indices = {}
+    producto = np.array([indices.setdefault(k, len(indices)) for k in claves], dtype=np.int64)
+
+    disponible = np.maximum(np.array(actual, dtype=np.int64) - np.array(reservado, dtype=np.int64), 0)
+    minimo = np.array(minimo, dtype=np.int64)
+    nivel = np.ceil(minimo * objetivo).astype(np.int64)
+    faltante = np.where((minimo > 0) & (disponible <= minimo), nivel - disponible, 0)
+    pendiente = _en_camino([i for i, f in zip(ids, faltante.tolist()) if f > 0])
+    if pendiente:
+        faltante = np.maximum(faltante - np.array([pendiente.get(i, 0) for i in ids], dtype=np.int64), 0)
+    return {
+        'ids': np.array(ids, dtype=np.int64),
+        'droguerias': np.array(drogs, dtype=np.int64),
+        'producto': producto,
+        'sobrante': np.maximum(disponible - nivel, 0),
+        'faltante': faltante,
+        # 0 = sin nada disponible
+        'urgencia': disponible / np.maximum(minimo, 1),
+    }
+
+
+def agrupar(ids, droguerias, origen, destino, cantidad, minimo=1):
+    """Arma las propuestas: una por origen → destino, con una línea por par de medicamentos.
+
+    Se parte en varias órdenes cada ``LINEAS_MAX`` líneas o cuando un mismo
+    medicamento de origen abastece a dos filas de la droguería destino.
+    """
+    np = _numpy()
+    validos = (cantidad >= minimo) & (droguerias[origen] != droguerias[destino])
+    origen, destino, cantidad = origen[validos], destino[validos], cantidad[validos]
+    orden = np.lexsort((ids[origen], droguerias[destino], droguerias[origen]))
+    origen, destino, cantidad = origen[orden], destino[orden], cantidad[orden]
+
+    propuestas, abiertas, clave = [], [], None
+    for o, d, n in zip(origen.tolist(), destino.tolist(), cantidad.tolist()):
+        par = (int(droguerias[o]), int(droguerias[d]))
+        if par != clave:
+            clave, abiertas = par, []
+        med_origen = int(ids[o])
+        # una orden admite una línea por medicamento de origen (transferencias.crear suma las repetidas):
+        # si el mismo origen abastece a dos filas de la sucursal destino, la segunda va en otra orden
+        propuesta = next(
+            (p for p in abiertas if med_origen not in p['_origenes'] and len(p['lineas']) < transferencias.LINEAS_MAX),
+            None,
+        )
+        if propuesta is None:
+            propuesta = {'origen': par[0], 'destino': par[1], 'lineas': [], '_origenes': set()}
+            abiertas.append(propuesta)
+            propuestas.append(propuesta)
+        propuesta['_origenes'].add(med_origen)
+        propuesta['lineas'].append({'medicamento_origen': med_origen, 'medicamento_destino': int(ids[d]), 'cantidad': n})
+    for p in propuestas:
+        del p['_origenes']
+    return propuestas
+
+
+def proponer(droguerias=None, objetivo=None, minimo=1):
+    """Propuestas de transferencia entre ``droguerias`` (todas si es ``None``). Devuelve un resumen."""
+    inicio = time.monotonic()
+    objetivo = OBJETIVO if objetivo is None else objetivo
+    datos = _cargar(droguerias, objetivo)
+    if datos is None:
+        propuestas, filas = [], 0
+    else:
+        filas = len(datos['ids'])
+        origen, destino, cantidad = asignar(datos['producto'], datos['sobrante'], datos['faltante'], datos['urgencia'])
+        propuestas = agrupar(datos['ids'], datos['droguerias'], origen, destino, cantidad, minimo=minimo)
+    return {
+        'medicamentos_revisados': filas,
+        'propuestas': propuestas,
+        'lineas': sum(len(p['lineas']) for p in propuestas),
+        'unidades': sum(l['cantidad'] for p in propuestas for l in p['lineas']),
+        'segundos': round(time.monotonic() - inicio, 3),
+    }
+
+
+# =========================
+# Envío por lote
+# =========================
+def crear_lote(propuestas, usuario=None):
+    """Crea una ``OrdenTransferencia`` por propuesta (``origen``/``destino`` ya resueltos a droguerías).
+
+    Cada orden es todo o nada por sí misma (``transferencias.crear``): una
+    propuesta que ya no se puede reservar se informa en ``errores`` con su
+    índice y el resto sigue. Devuelve ``{'creadas': [ids], 'errores': {i: detalle}}``.
+    """
+    from .prestamos import puede_responder
+
+    creadas, errores = [], {}
+    for i, p in enumerate(propuestas):
+        if usuario is not None and not puede_responder(usuario, p['origen'], p['destino']):
+            errores[i] = 'No autorizado'
+            continue
+        try:
+            orden = transferencias.crear(p['origen'], p['destino'], p['lineas'], usuario=usuario, nota=p.get('nota'))
+        except ValidationError as e:
+            errores[i] = e.detail
+        else:
+            creadas.append(orden.pk)
+    return {'creadas': creadas, 'errores': errores}
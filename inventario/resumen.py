@@ -0,0 +1,166 @@
+"""Mantenimiento del resumen materializado de inventario (``ResumenInventario``).
+
+Cada medicamento aporta a la fila de su (droguería, categoría):
+
+    skus=1, unidades=stock_actual, unidades_reservadas=stock_reservado,
+    valor_venta=precio_venta*stock_actual, valor_costo=costo_compra*stock_actual,
+    bajo_stock=1 si stock_actual <= stock_minimo, vencidos=1 si ya venció
+
+Al guardar un medicamento se resta su aporte anterior y se suma el nuevo con
+``UPDATE ... SET campo = campo + delta``; así movimientos, préstamos y
+cambios de precio actualizan el resumen sin recorrer la tabla.
+
+``vencidos`` es la excepción: el aporte anterior se recalcula con la fecha de
+hoy, así que un producto que venció después de contarse descuadra el
+contador (hasta dejarlo negativo si se borra). ``corregir_vencidos()``, que
+corre con el escaneo diario de vencimientos, recalcula los grupos que no
+cuadran.
+"""
+from collections import defaultdict
+from decimal import Decimal
+
+from django.db import transaction
+from django.db.models import Count, DecimalField, ExpressionWrapper, F, Q, Sum
+from django.utils import timezone
+
+CAMPOS_ORIGINALES = (
+    'drogueria_id', 'categoria_id', 'stock_actual', 'stock_reservado',
+    'stock_minimo', 'precio_venta', 'costo_compra', 'fecha_vencimiento',
+)
+
+CAMPOS_RESUMEN = ('skus', 'unidades', 'unidades_reservadas', 'valor_venta', 'valor_costo', 'bajo_stock', 'vencidos')
+
+
+def valores(instance):
+    """Valores de ``instance`` que afectan al resumen, o ``None`` si hay campos diferidos."""
+    datos = instance.__dict__
+    if any(c not in datos for c in CAMPOS_ORIGINALES):
+        return None
+    return {c: datos[c] for c in CAMPOS_ORIGINALES}
+
+
+def _decimal(valor):
+    # str(): los float asignados en Python no deben arrastrar error binario
+    return Decimal(str(valor or 0)).quantize(Decimal('0.01'))
+
+
+def aporte(v, hoy=None):
+    hoy = hoy or timezone.now().date()
+    stock = v['stock_actual'] or 0
+    return {
+        'skus': 1,
+        'unidades': stock,
+        'unidades_reservadas': v['stock_reservado'] or 0,
+        'valor_venta': _decimal(v['precio_venta']) * stock,
+        'valor_costo': _decimal(v['costo_compra']) * stock,
+        'bajo_stock': 1 if stock <= (v['stock_minimo'] or 0) else 0,
+        'vencidos': 1 if v['fecha_vencimiento'] and v['fecha_vencimiento'] < hoy else 0,
+    }
+
+
+def aplicar_delta(drogueria_id, categoria_id, delta):
+    """Suma ``delta`` a la fila (droguería, categoría), creándola si no existe."""
+    from .models import ResumenInventario
+
+    delta = {k: v for k, v in delta.items() if v}
+    if not delta:
+        return
+    fila = ResumenInventario.objects.filter(drogueria_id=drogueria_id, categoria_id=categoria_id)
+    sumar = {k: F(k) + v for k, v in delta.items()}
+    with transaction.atomic():
+        creada = False
+        if not fila.update(**sumar, actualizado=timezone.now()):
+            # fila a cero sin pisar otra que se cree a la vez (clave única con Coalesce), y luego el UPDATE
+            ResumenInventario.objects.bulk_create(
+                [ResumenInventario(drogueria_id=drogueria_id, categoria_id=categoria_id)], ignore_conflicts=True
+            )
+            fila.update(**sumar, actualizado=timezone.now())
+            creada = True
+        if creada or delta.get('skus', 0) < 0:
+            # el grupo se quedó sin medicamentos: igual que en reconstruir(), sin fila
+            fila.filter(skus__lte=0).delete()
+
+
+def registrar_cambio(anterior, actual):
+    """Aplica el cambio de un medicamento de ``anterior`` a ``actual`` (dicts de ``valores``; ``None`` = no existía)."""
+    registrar_cambios([(anterior, actual)])
+
+
+def registrar_cambios(cambios):
+    """Como ``registrar_cambio`` para muchos medicamentos, con una actualización por grupo."""
+    hoy = timezone.now().date()
+    deltas = defaultdict(lambda: dict.fromkeys(CAMPOS_RESUMEN, 0))
+    for anterior, actual in cambios:
+        for v, signo in ((anterior, -1), (actual, 1)):
+            if v:
+                delta = deltas[(v['drogueria_id'], v['categoria_id'])]
+                for k, valor in aporte(v, hoy).items():
+                    delta[k] += signo * valor
+    for (drogueria_id, categoria_id), delta in deltas.items():
+        aplicar_delta(drogueria_id, categoria_id, delta)
+
+
+def recalcular_grupo(drogueria_id, categoria_id, hoy=None):
+    """Recalcula una sola fila desde la tabla de medicamentos (si no se conoce el estado anterior)."""
+    from .models import Medicamento, ResumenInventario
+
+    fila = next(iter(_agregado(
+        Medicamento.objects.filter(drogueria_id=drogueria_id, categoria_id=categoria_id), hoy
+    )), None)
+    if fila is None:
+        ResumenInventario.objects.filter(drogueria_id=drogueria_id, categoria_id=categoria_id).delete()
+        return
+    datos = {k: fila[k] or 0 for k in CAMPOS_RESUMEN}
+    ResumenInventario.objects.update_or_create(drogueria_id=drogueria_id, categoria_id=categoria_id, defaults=datos)
+
+
+def _agregado(qs, hoy=None):
+    hoy = hoy or timezone.now().date()
+    dinero = DecimalField(max_digits=18, decimal_places=2)
+    return qs.order_by().values('drogueria_id', 'categoria_id').annotate(
+        skus=Count('id'),
+        unidades=Sum('stock_actual'),
+        unidades_reservadas=Sum('stock_reservado'),
+        valor_venta=Sum(ExpressionWrapper(F('precio_venta') * F('stock_actual'), output_field=dinero)),
+        valor_costo=Sum(ExpressionWrapper(F('costo_compra') * F('stock_actual'), output_field=dinero)),
+        bajo_stock=Count('id', filter=Q(stock_actual__lte=F('stock_minimo'))),
+        vencidos=Count('id', filter=Q(fecha_vencimiento__lt=hoy)),
+    )
+
+
+def corregir_vencidos(hoy=None):
+    """Recalcula los grupos cuyo ``vencidos`` no coincide con la tabla. Devuelve cuántos eran."""
+    from .models import Medicamento, ResumenInventario
+
+    hoy = hoy or timezone.now().date()
+    reales = {
+        (d, c): n for d, c, n in
+        Medicamento.objects.order_by().values('drogueria_id', 'categoria_id')
+        .annotate(n=Count('id', filter=Q(fecha_vencimiento__lt=hoy)))
+        .values_list('drogueria_id', 'categoria_id', 'n')
+    }
+    guardados = {
+        (d, c): n for d, c, n in ResumenInventario.objects.values_list('drogueria_id', 'categoria_id', 'vencidos')
+    }
+    grupos = [g for g in reales.keys() | guardados.keys() if reales.get(g) != guardados.get(g)]
+    for drogueria_id, categoria_id in grupos:
+        recalcular_grupo(drogueria_id, categoria_id, hoy)
+    return len(grupos)
+
+
+def reconstruir():
+    """Recalcula todo el resumen con una única consulta agregada. Devuelve el número de filas."""
+    from .models import Medicamento, ResumenInventario
+
+    filas = [
+        ResumenInventario(
+            drogueria_id=f['drogueria_id'],
+            categoria_id=f['categoria_id'],
+            **{k: f[k] or 0 for k in CAMPOS_RESUMEN},
+        )
+        for f in _agregado(Medicamento.objects.all())
+    ]
+    with transaction.atomic():
+        ResumenInventario.objects.all().delete()
+        ResumenInventario.objects.bulk_create(filas, batch_size=1000)
+    return len(filas)
@@ -0,0 +1,96 @@
+"""Búsqueda de texto completo sobre el catálogo de medicamentos.
+
+- SQLite: tabla virtual FTS5 ``inventario_medicamento_fts`` (external content
+  sobre ``inventario_medicamento``) mantenida por triggers, de modo que
+  ``save()``, ``bulk_create`` y ``QuerySet.update()`` la dejan sincronizada sin
+  código Python adicional. Los resultados se ordenan por ``bm25``.
+- PostgreSQL: índice GIN sobre la expresión ``TSVECTOR_SQL`` (ver migración
+  0009) y orden por ``ts_rank``.
+- Otros motores: se conserva el ``icontains`` sobre los mismos campos.
+"""
+import re
+
+from django.db import connection
+from django.db.models import BooleanField, FloatField, Q
+from django.db.models.expressions import RawSQL
+
+FTS_TABLE = 'inventario_medicamento_fts'
+
+# Campos indexados, en el mismo orden que las columnas de la tabla FTS5.
+CAMPOS = ('nombre', 'descripcion', 'codigo_barra', 'proveedor', 'lote')
+
+# Pesos bm25 por columna: el nombre y el código de barras pesan más que la
+# descripción o el proveedor.
+PESOS_BM25 = (10.0, 2.0, 5.0, 1.0, 1.0)
+
+# Debe coincidir exactamente con la expresión del índice GIN para que
+# PostgreSQL lo use.
+TSVECTOR_SQL = (
+    "to_tsvector('spanish', "
+    "coalesce(\"inventario_medicamento\".\"nombre\", '') || ' ' || "
+    "coalesce(\"inventario_medicamento\".\"descripcion\", '') || ' ' || "
+    "coalesce(\"inventario_medicamento\".\"codigo_barra\", '') || ' ' || "
+    "coalesce(\"inventario_medicamento\".\"proveedor\", '') || ' ' || "
+    "coalesce(\"inventario_medicamento\".\"lote\", ''))"
+)
+
+_TOKEN_RE = re.compile(r'\w+', re.UNICODE)
+
+
+def tokenizar(texto):
+    return _TOKEN_RE.findall(texto or '')
+
+
+def expresion_fts5(texto):
+    """Convierte el texto del usuario en una consulta FTS5 por prefijo.
+
+    Cada término se cita (evita que la sintaxis de FTS5 se interprete) y se
+    marca como prefijo para soportar búsqueda mientras se escribe:
+    ``"para" "500"*`` -> todos los términos deben aparecer (AND implícito).
+    """
+    return ' '.join(f'"{t}"*' for t in tokenizar(texto))
+
+
+def expresion_tsquery(texto):
+    return ' & '.join(f'{t}:*' for t in tokenizar(texto))
+
+
+def _filtro_icontains(qs, texto):
+    q = Q()
+    for campo in CAMPOS:
+        q |= Q(**{f'{campo}__icontains': texto})
+    return qs.filter(q)
+
+
+def buscar_medicamentos(qs, texto):
+    """Filtra ``qs`` por ``texto`` y lo ordena por relevancia (más relevante primero)."""
+    if not tokenizar(texto):
+        # solo signos de puntuación: no hay términos que indexar
+        return _filtro_icontains(qs, texto)
+
+    vendor = connection.vendor
+    if vendor == 'sqlite':
+        # el JOIN con la tabla FTS5 (relación inversa ``busqueda``) deja que
+        # SQLite recorra primero el índice invertido y luego busque cada
+        # medicamento por pk. En FTS5 ``tabla = 'consulta'`` equivale a MATCH.
+        return qs.filter(busqueda__documento=expresion_fts5(texto)).order_by('busqueda__rank', 'pk')
+    if vendor == 'postgresql':
+        tsquery = expresion_tsquery(texto)
+        return qs.filter(
+            RawSQL(f"{TSVECTOR_SQL} @@ to_tsquery('spanish', %s)", [tsquery], output_field=BooleanField())
+        ).annotate(
+            search_rank=RawSQL(f"ts_rank({TSVECTOR_SQL}, to_tsquery('spanish', %s))", [tsquery], output_field=FloatField())
+        ).order_by('-search_rank', 'pk')
+    return _filtro_icontains(qs, texto)
+
+
+def reconstruir_indice():
+    """Reconstruye el índice de búsqueda desde la tabla de medicamentos.
+
+    Solo hace falta tras cargas masivas hechas fuera del ORM con los triggers
+    desactivados (p. ej. ``.import`` de sqlite3) o si el índice se corrompe.
+    """
+    if connection.vendor != 'sqlite':
+        return
+    with connection.cursor() as cursor:
+        cursor.execute(f"INSERT INTO {FTS_TABLE}({FTS_TABLE}) VALUES ('rebuild')")
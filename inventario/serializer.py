@@ -1,5 +1,5 @@
 from rest_framework import serializers
-from .models import Medicamento, Categoria, MovimientoInventario
+from .models import Medicamento, Categoria, MovimientoInventario, ResumenInventario
 from droguerias.models import Drogueria
 
 
@@ -33,13 +33,22 @@ class MedicamentoSerializer(serializers.ModelSerializer):
         model = Medicamento
         fields = [
             'id', 'nombre', 'descripcion', 'precio_venta', 'costo_compra',
-            'stock_actual', 'stock_reservado', 'stock_minimo', 'categoria', 'categoria_id',
+            'stock_actual', 'stock_reservado', 'stock_minimo', 'stock_minimo_auto', 'categoria', 'categoria_id',
             'fecha_vencimiento', 'estado', 'imagen_url', 'drogueria', 'drogueria_id',
             'lote', 'fecha_ingreso', 'proveedor', 'codigo_barra', 'ubicacion',
             # calculados
             'stock_disponible', 'valor_total', 'costo_total', 'esta_vencido', 'stock_status'
         ]
 
+    def validate(self, attrs):
+        # un mínimo editado a mano deja de recalcularse con el pronóstico, salvo que se pida lo contrario
+        if (
+            self.instance is not None and 'stock_minimo' in attrs and 'stock_minimo_auto' not in attrs
+            and attrs['stock_minimo'] != self.instance.stock_minimo
+        ):
+            attrs['stock_minimo_auto'] = False
+        return attrs
+
     def to_representation(self, instance):
         data = super().to_representation(instance)
         # consistent formatting
@@ -83,6 +92,34 @@ class MovimientoInventarioSerializer(serializers.ModelSerializer):
             'medicamento', 'medicamento_id', 'drogueria', 'drogueria_id'
         ]
 
+    def create(self, validated_data):
+        from .stock import StockInsuficiente
+        try:
+            return super().create(validated_data)
+        except StockInsuficiente as e:
+            raise serializers.ValidationError({'cantidad': str(e)})
+
+
+class MovimientoLoteLineaSerializer(serializers.Serializer):
+    medicamento_id = serializers.IntegerField(min_value=1)
+    tipo_movimiento = serializers.ChoiceField(choices=MovimientoInventario.TIPO_MOVIMIENTO)
+    cantidad = serializers.IntegerField(min_value=1)
+    observacion = serializers.CharField(required=False, allow_blank=True, allow_null=True)
+
+
+class MovimientoLoteSerializer(serializers.Serializer):
+    """Entrada del endpoint de movimientos por lote (ver inventario/movimientos.py)."""
+    drogueria_id = serializers.PrimaryKeyRelatedField(
+        queryset=Drogueria.objects.all(), source='drogueria', required=False, allow_null=True
+    )
+    movimientos = MovimientoLoteLineaSerializer(many=True, allow_empty=False)
+
+    def validate_movimientos(self, value):
+        from .movimientos import LOTE_MAX_LINEAS
+        if len(value) > LOTE_MAX_LINEAS:
+            raise serializers.ValidationError(f'Máximo {LOTE_MAX_LINEAS} líneas por lote.')
+        return value
+
 
 class CategoriaConMedicamentosSerializer(serializers.ModelSerializer):
     medicamentos = MedicamentoSerializer(many=True, read_only=True)
@@ -107,3 +144,16 @@ class AuditLogSerializer(serializers.ModelSerializer):
     class Meta:
         model = getattr(__import__('inventario.models', fromlist=['AuditLog']), 'AuditLog')
         fields = ['id', 'action', 'model_name', 'object_id', 'user', 'message', 'data', 'created_at']
+
+
+class ResumenInventarioSerializer(serializers.ModelSerializer):
+    drogueria_nombre = serializers.CharField(source='drogueria.nombre', read_only=True, default=None)
+    categoria_nombre = serializers.CharField(source='categoria.nombre', read_only=True, default=None)
+
+    class Meta:
+        model = ResumenInventario
+        fields = [
+            'id', 'drogueria', 'drogueria_nombre', 'categoria', 'categoria_nombre',
+            'skus', 'unidades', 'unidades_reservadas', 'valor_venta', 'valor_costo',
+            'bajo_stock', 'vencidos', 'actualizado',
+        ]
@@ -1,6 +1,9 @@
+from django.db import transaction
 from rest_framework import serializers
 from .models import Prestamo, MovimientoInventario, Medicamento
 from droguerias.models import Drogueria
+from .stock import StockInsuficiente
+from .prestamos import ACCIONES, LOTE_MAX
 
 
 class PrestamoSerializer(serializers.ModelSerializer):
@@ -33,14 +36,31 @@ class PrestamoSerializer(serializers.ModelSerializer):
     def create(self, validated_data):
         request = self.context.get('request')
         user = getattr(request, 'user', None)
-        prestamo = Prestamo.objects.create(
-            medicamento_origen=validated_data['medicamento_origen'],
-            medicamento_destino=validated_data.get('medicamento_destino'),
-            cantidad=validated_data['cantidad'],
-            origen=validated_data['origen'],
-            destino=validated_data['destino'],
-            solicitante=user
-        )
-        # reservar stock en origen
-        prestamo.reservar()
+        with transaction.atomic():
+            prestamo = Prestamo.objects.create(
+                medicamento_origen=validated_data['medicamento_origen'],
+                medicamento_destino=validated_data.get('medicamento_destino'),
+                cantidad=validated_data['cantidad'],
+                origen=validated_data['origen'],
+                destino=validated_data['destino'],
+                solicitante=user
+            )
+            # reservar stock en origen (condicional: otra reserva pudo adelantarse a validate)
+            try:
+                prestamo.reservar()
+            except StockInsuficiente as e:
+                transaction.set_rollback(True)
+                raise serializers.ValidationError(str(e))
         return prestamo
+
+
+class PrestamoLoteSerializer(serializers.Serializer):
+    """Entrada del endpoint de respuesta por lote (ver inventario/prestamos.py)."""
+    accion = serializers.ChoiceField(choices=ACCIONES)
+    ids = serializers.ListField(child=serializers.IntegerField(min_value=1), allow_empty=False)
+    nota = serializers.CharField(required=False, allow_blank=True, allow_null=True)
+
+    def validate_ids(self, value):
+        if len(value) > LOTE_MAX:
+            raise serializers.ValidationError(f'Máximo {LOTE_MAX} préstamos por lote.')
+        return list(dict.fromkeys(value))
@@ -0,0 +1,77 @@
+from rest_framework import serializers
+from .models import OrdenTransferencia, LineaTransferencia
+from droguerias.models import Drogueria
+from . import rebalanceo, transferencias
+
+
+class LineaTransferenciaSerializer(serializers.ModelSerializer):
+    # ids planos: la orden completa se valida con una sola lectura en transferencias.crear
+    medicamento_origen = serializers.IntegerField(source='medicamento_origen_id', min_value=1)
+    medicamento_destino = serializers.IntegerField(source='medicamento_destino_id', min_value=1, required=False, allow_null=True)
+    cantidad = serializers.IntegerField(min_value=1)
+
+    class Meta:
+        model = LineaTransferencia
+        fields = ['id', 'medicamento_origen', 'medicamento_destino', 'cantidad']
+
+
+class OrdenTransferenciaSerializer(serializers.ModelSerializer):
+    origen = serializers.PrimaryKeyRelatedField(queryset=Drogueria.objects.all())
+    destino = serializers.PrimaryKeyRelatedField(queryset=Drogueria.objects.all())
+    lineas = LineaTransferenciaSerializer(many=True, allow_empty=False)
+
+    class Meta:
+        model = OrdenTransferencia
+        fields = ['id', 'origen', 'destino', 'estado', 'solicitante', 'respondedor', 'fecha_solicitud', 'fecha_respuesta', 'nota', 'lineas']
+        read_only_fields = ('estado', 'solicitante', 'respondedor', 'fecha_solicitud', 'fecha_respuesta')
+
+    def validate_lineas(self, value):
+        if len(value) > transferencias.LINEAS_MAX:
+            raise serializers.ValidationError(f'Máximo {transferencias.LINEAS_MAX} líneas por orden.')
+        return value
+
+    def create(self, validated_data):
+        request = self.context.get('request')
+        # reserva de todas las líneas por conjuntos (ver inventario/transferencias.py)
+        return transferencias.crear(
+            validated_data['origen'],
+            validated_data['destino'],
+            validated_data['lineas'],
+            usuario=getattr(request, 'user', None),
+            nota=validated_data.get('nota'),
+        )
+
+
+class PropuestaTransferenciaSerializer(serializers.Serializer):
+    """Una orden del lote: el formato de ``rebalanceo.proponer`` (o uno escrito a mano)."""
+    origen = serializers.PrimaryKeyRelatedField(queryset=Drogueria.objects.all())
+    destino = serializers.PrimaryKeyRelatedField(queryset=Drogueria.objects.all())
+    nota = serializers.CharField(required=False, allow_blank=True, allow_null=True)
+    lineas = LineaTransferenciaSerializer(many=True, allow_empty=False)
+
+    def validate_lineas(self, value):
+        if len(value) > transferencias.LINEAS_MAX:
+            raise serializers.ValidationError(f'Máximo {transferencias.LINEAS_MAX} líneas por orden.')
+        return value
+
+
+class TransferenciaLoteSerializer(serializers.Serializer):
+    propuestas = PropuestaTransferenciaSerializer(many=True, allow_empty=False)
+
+    def validate_propuestas(self, value):
+        if len(value) > rebalanceo.LOTE_MAX:
+            raise serializers.ValidationError(f'Máximo {rebalanceo.LOTE_MAX} órdenes por lote.')
+        return value
+
+
+class RebalanceoSerializer(serializers.Serializer):
+    """Parámetros de ``rebalanceo``: ``?droguerias=1,2,3&objetivo=1.5&minimo=1``."""
+    droguerias = serializers.CharField(required=False)
+    objetivo = serializers.FloatField(min_value=1, max_value=10, required=False)
+    minimo = serializers.IntegerField(min_value=1, default=1)
+
+    def validate_droguerias(self, value):
+        try:
+            return {int(v) for v in value.split(',') if v.strip()}
+        except ValueError:
+            raise serializers.ValidationError('Lista de ids separados por comas.')
@@ -1,7 +1,10 @@
-from django.db.models.signals import post_save
+from django.db.models.signals import post_init, post_save, post_delete
 from django.dispatch import receiver
 from django.utils import timezone
-from .models import MovimientoInventario, Medicamento, Alerta, Prestamo, AuditLog
+from droguerias.models import Drogueria
+from .models import MovimientoInventario, Medicamento, Alerta, Prestamo, Categoria
+from . import auditoria, barcodes, resumen
+from .cache_catalogo import invalidar_catalogo
 
 
 @receiver(post_save, sender=MovimientoInventario)
@@ -12,18 +15,15 @@ def movimiento_post_save(sender, instance: MovimientoInventario, created, **kwar
 
     med = instance.medicamento
 
-    # registrar auditoría básica del movimiento
-    try:
-        AuditLog.objects.create(
-            action='movimiento_creado',
-            model_name='MovimientoInventario',
-            object_id=instance.pk,
-            user=instance.usuario,
-            message=f"Movimiento {instance.tipo_movimiento} {instance.cantidad} para {med.nombre}",
-            data={'medicamento': med.id, 'drogueria': instance.drogueria.id if instance.drogueria else None}
-        )
-    except Exception:
-        pass
+    # registrar auditoría básica del movimiento (se escribe por lotes tras el commit)
+    auditoria.registrar(
+        action='movimiento_creado',
+        model_name='MovimientoInventario',
+        object_id=instance.pk,
+        user=instance.usuario_id,
+        message=f"Movimiento {instance.tipo_movimiento} {instance.cantidad} para {med.nombre}",
+        data={'medicamento': med.id, 'drogueria': instance.drogueria_id}
+    )
     # verificar stock bajo
     try:
         if med.stock_actual <= med.stock_minimo:
@@ -43,22 +43,63 @@ def movimiento_post_save(sender, instance: MovimientoInventario, created, **kwar
         pass
 
 
+# las alertas de vencimiento las crea el escaneo programado (vencimientos.py)
+
+
 @receiver(post_save, sender=Medicamento)
-def medicamento_post_save(sender, instance: Medicamento, created, **kwargs):
-    # verificación expiración
-    try:
-        if instance.esta_vencido():
-            exists = Alerta.objects.filter(tipo='vencido', medicamento=instance, leido=False).exists()
-            if not exists:
-                Alerta.objects.create(
-                    tipo='vencido',
-                    nivel='danger',
-                    mensaje=f"{instance.nombre} está vencido o su fecha de vencimiento ha pasado.",
-                    medicamento=instance,
-                    drogueria=instance.drogueria
-                )
-    except Exception:
-        pass
+@receiver(post_delete, sender=Medicamento)
+def medicamento_invalidar_codigo_barra(sender, instance: Medicamento, **kwargs):
+    # cualquier cambio (stock, precio, código) deja obsoleta la respuesta cacheada
+    barcodes.invalidar_medicamento(instance)
+
+
+@receiver(post_init, sender=Medicamento)
+def medicamento_post_init(sender, instance: Medicamento, **kwargs):
+    # recordar sucursal/categoría originales para invalidar también las de antes de un cambio
+    # __dict__ para no forzar la carga de campos diferidos (only())
+    instance._catalogo_original = (instance.__dict__.get('drogueria_id'), instance.__dict__.get('categoria_id'))
+    # valores que alimentan el resumen de inventario (None si hay campos diferidos)
+    instance._resumen_original = resumen.valores(instance) if instance.pk else None
+
+
+@receiver(post_save, sender=Medicamento)
+def medicamento_actualizar_resumen(sender, instance: Medicamento, created, **kwargs):
+    actual = resumen.valores(instance)
+    anterior = None if created else getattr(instance, '_resumen_original', None)
+    if actual is not None and (created or anterior is not None):
+        resumen.registrar_cambio(anterior, actual)
+    else:
+        # estado anterior desconocido (instancia con campos diferidos): recalcular su grupo
+        resumen.recalcular_grupo(instance.drogueria_id, instance.categoria_id)
+    instance._resumen_original = actual
+
+
+@receiver(post_delete, sender=Medicamento)
+def medicamento_borrado_resumen(sender, instance: Medicamento, **kwargs):
+    anterior = getattr(instance, '_resumen_original', None) or resumen.valores(instance)
+    if anterior is not None:
+        resumen.registrar_cambio(anterior, None)
+    else:
+        resumen.recalcular_grupo(instance.drogueria_id, instance.categoria_id)
+
+
+@receiver(post_save, sender=Medicamento)
+@receiver(post_delete, sender=Medicamento)
+def medicamento_invalidar_catalogo(sender, instance: Medicamento, **kwargs):
+    drogueria_orig, categoria_orig = getattr(instance, '_catalogo_original', (None, None))
+    invalidar_catalogo(
+        droguerias={instance.drogueria_id, drogueria_orig},
+        categorias={instance.categoria_id, categoria_orig},
+    )
+    instance._catalogo_original = (instance.drogueria_id, instance.categoria_id)
+
+
+@receiver(post_save, sender=Categoria)
+@receiver(post_delete, sender=Categoria)
+@receiver(post_save, sender=Drogueria)
+@receiver(post_delete, sender=Drogueria)
+def catalogo_estructura_cambiada(sender, instance, **kwargs):
+    invalidar_catalogo(estructura=True)
 
 
 @receiver(post_save, sender=Prestamo)
@@ -74,30 +115,24 @@ def prestamo_post_save(sender, instance: Prestamo, created, **kwargs):
                 drogueria=instance.destino
             )
             # auditoria del prestamo aceptado
-            try:
-                AuditLog.objects.create(
-                    action='prestamo_aceptado',
-                    model_name='Prestamo',
-                    object_id=instance.pk,
-                    user=instance.respondedor,
-                    message=f"Prestamo {instance.id} aceptado: {instance.medicamento_origen.nombre} x{instance.cantidad}",
-                    data={'origen': instance.origen.id, 'destino': instance.destino.id}
-                )
-            except Exception:
-                pass
-        except Exception:
-            # no queremos que una excepción aquí impida que otros handlers se ejecuten
-            pass
-    # si el prestamo fue rechazado
-    if not created and instance.estado == 'rejected':
-        try:
-            AuditLog.objects.create(
-                action='prestamo_rechazado',
+            auditoria.registrar(
+                action='prestamo_aceptado',
                 model_name='Prestamo',
                 object_id=instance.pk,
-                user=instance.respondedor,
-                message=f"Prestamo {instance.id} rechazado: {instance.medicamento_origen.nombre} x{instance.cantidad}",
-                data={'origen': instance.origen.id, 'destino': instance.destino.id}
+                user=instance.respondedor_id,
+                message=f"Prestamo {instance.id} aceptado: {instance.medicamento_origen.nombre} x{instance.cantidad}",
+                data={'origen': instance.origen_id, 'destino': instance.destino_id}
             )
         except Exception:
+            # no queremos que una excepción aquí impida que otros handlers se ejecuten
             pass
+    # si el prestamo fue rechazado
+    if not created and instance.estado == 'rejected':
+        auditoria.registrar(
+            action='prestamo_rechazado',
+            model_name='Prestamo',
+            object_id=instance.pk,
+            user=instance.respondedor_id,
+            message=f"Prestamo {instance.id} rechazado: {instance.medicamento_origen.nombre} x{instance.cantidad}",
+            data={'origen': instance.origen_id, 'destino': instance.destino_id}
+        )
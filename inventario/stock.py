@@ -0,0 +1,197 @@
+"""Cambios de stock atómicos.
+
+Las existencias no se modifican leyendo el medicamento, sumando en Python y
+guardando la fila entera (dos ventas simultáneas perderían una de las dos, y
+un ``save()`` completo pisaría el ``stock_reservado`` escrito por otro
+proceso). Cada cambio es un único
+
+    UPDATE ... SET stock_actual = stock_actual - n
+    WHERE id = %s AND stock_actual - stock_reservado >= n
+
+que solo toca las columnas de stock. Una salida corriente no puede tomar
+unidades reservadas por pedidos, préstamos o transferencias; la que entrega
+lo reservado usa ``consumir_reserva``, que baja ambas columnas a la vez. Si
+la condición no se cumple no se modifica nada y se lanza ``StockInsuficiente``.
+
+``reservar_varios`` y ``liberar_varios`` hacen lo mismo para muchos
+medicamentos a la vez (pedidos, transferencias), con un ``UPDATE`` por
+bloque.
+
+Como ``UPDATE`` no emite señales, aquí se actualizan también el resumen de
+inventario y las cachés de código de barras y de catálogo.
+"""
+from django.db import transaction
+from django.db.models import Case, F, IntegerField, Q, Value, When
+
+from . import barcodes, resumen
+from .cache_catalogo import invalidar_catalogo
+
+_BLOQUE = 500
+
+
+class StockInsuficiente(ValueError):
+    def __init__(self, mensaje='Stock insuficiente', faltantes=None):
+        super().__init__(mensaje)
+        # {medicamento_id: unidades disponibles} en las operaciones por conjuntos
+        self.faltantes = faltantes or {}
+
+
+def _cambiar(medicamento, condicion=Q(), actual=0, reservado=0):
+    """Aplica los incrementos si se cumple ``condicion``; devuelve si se aplicaron."""
+    from .models import Medicamento
+
+    cambios = {}
+    if actual:
+        cambios['stock_actual'] = F('stock_actual') + actual
+    if reservado:
+        cambios['stock_reservado'] = F('stock_reservado') + reservado
+    if not cambios:
+        return True
+
+    with transaction.atomic():
+        if not Medicamento.objects.filter(condicion, pk=medicamento.pk).update(**cambios):
+            return False
+        # la fila queda bloqueada hasta el commit: el estado anterior es el nuevo menos el incremento
+        nuevo = Medicamento.objects.filter(pk=medicamento.pk).values(*resumen.CAMPOS_ORIGINALES).get()
+        anterior = dict(
+            nuevo,
+            stock_actual=nuevo['stock_actual'] - actual,
+            stock_reservado=nuevo['stock_reservado'] - reservado,
+        )
+        resumen.registrar_cambio(anterior, nuevo)
+    _sincronizar(medicamento, nuevo)
+    return True
+
+
+def _sincronizar(medicamento, fila):
+    """Copia el stock de la base a la instancia y descarta lo cacheado."""
+    medicamento.stock_actual = fila['stock_actual']
+    medicamento.stock_reservado = fila['stock_reservado']
+    original = getattr(medicamento, '_resumen_original', None)
+    if original is not None:
+        original.update(stock_actual=fila['stock_actual'], stock_reservado=fila['stock_reservado'])
+    barcodes.invalidar_medicamento(medicamento)
+    invalidar_catalogo(droguerias={fila['drogueria_id']}, categorias={fila['categoria_id']})
+
+
+def sumar(medicamento, cantidad):
+    """Entrada de ``cantidad`` unidades."""
+    _cambiar(medicamento, actual=cantidad)
+
+
+def descontar(medicamento, cantidad):
+    """Salida de ``cantidad`` unidades disponibles; no toca las reservadas ni deja el stock en negativo."""
+    if not _cambiar(medicamento, Q(stock_actual__gte=F('stock_reservado') + cantidad), actual=-cantidad):
+        raise StockInsuficiente(f'Stock insuficiente para {medicamento.nombre}: se pidieron {cantidad} unidades')
+
+
+def consumir_reserva(medicamento, cantidad):
+    """Salida de ``cantidad`` unidades que ya estaban reservadas (la reserva baja con ellas)."""
+    condicion = Q(stock_actual__gte=cantidad, stock_reservado__gte=cantidad)
+    if not _cambiar(medicamento, condicion, actual=-cantidad, reservado=-cantidad):
+        raise StockInsuficiente(f'{medicamento.nombre} no tiene {cantidad} unidades reservadas')
+
+
+def reservar(medicamento, cantidad):
+    """Reserva ``cantidad`` unidades si hay disponibles (``stock_actual - stock_reservado``)."""
+    if not _cambiar(medicamento, Q(stock_actual__gte=F('stock_reservado') + cantidad), reservado=cantidad):
+        raise StockInsuficiente('Stock insuficiente para reservar')
+
+
+def liberar(medicamento, cantidad):
+    """Libera hasta ``cantidad`` unidades reservadas."""
+    from .models import Medicamento
+
+    if _cambiar(medicamento, Q(stock_reservado__gte=cantidad), reservado=-cantidad):
+        return
+    # se reservó menos de lo que se libera (datos editados a mano): dejar la reserva en cero
+    with transaction.atomic():
+        Medicamento.objects.filter(pk=medicamento.pk).update(stock_reservado=0)
+        fila = Medicamento.objects.filter(pk=medicamento.pk).values(*resumen.CAMPOS_ORIGINALES).get()
+        resumen.recalcular_grupo(fila['drogueria_id'], fila['categoria_id'])
+    _sincronizar(medicamento, fila)
+
+
+class _NoAlcanza(Exception):
+    pass
+
+
+def _por_cantidad(bloque, cantidades):
+    return Case(*[When(pk=pk, then=Value(cantidades[pk])) for pk in bloque], output_field=IntegerField())
+
+
+def _invalidar_filas(filas):
+    from .models import Medicamento
+    for f in filas:
+        barcodes.invalidar_medicamento(Medicamento(pk=f['pk'], drogueria_id=f['drogueria_id'], codigo_barra=f['codigo_barra']))
+    invalidar_catalogo(droguerias={f['drogueria_id'] for f in filas}, categorias={f['categoria_id'] for f in filas})
+
+
+def _filas(pks, bloquear=False):
+    from .models import Medicamento
+    qs = Medicamento.objects.filter(pk__in=pks).order_by('pk')
+    if bloquear:
+        qs = qs.select_for_update()
+    return {f['pk']: f for f in qs.values('pk', 'codigo_barra', *resumen.CAMPOS_ORIGINALES)}
+
+
+def _sin_extras(fila):
+    return {c: fila[c] for c in resumen.CAMPOS_ORIGINALES}
+
+
+def reservar_varios(cantidades):
+    """Reserva ``{medicamento_id: cantidad}`` de una vez, todo o nada.
+
+    Un ``UPDATE`` condicional por bloque de 500 medicamentos; si alguno no
+    tiene disponible se deshace todo y se lanza ``StockInsuficiente`` con
+    ``faltantes`` = ``{pk: disponible}`` de los que no alcanzan.
+    """
+    from .models import Medicamento
+
+    pks = sorted(cantidades)
+    try:
+        with transaction.atomic():
+            for i in range(0, len(pks), _BLOQUE):
+                bloque = pks[i:i + _BLOQUE]
+                incremento = _por_cantidad(bloque, cantidades)
+                reservados = Medicamento.objects.filter(
+                    pk__in=bloque, stock_actual__gte=F('stock_reservado') + incremento
+                ).update(stock_reservado=F('stock_reservado') + incremento)
+                if reservados != len(bloque):
+                    raise _NoAlcanza
+            # filas ya bloqueadas por el UPDATE: el estado anterior es el nuevo menos lo reservado
+            filas = _filas(pks)
+            resumen.registrar_cambios(
+                (dict(_sin_extras(f), stock_reservado=f['stock_reservado'] - cantidades[pk]), _sin_extras(f))
+                for pk, f in filas.items()
+            )
+    except _NoAlcanza:
+        disponibles = {pk: f['stock_actual'] - f['stock_reservado'] for pk, f in _filas(pks).items()}
+        raise StockInsuficiente('Stock insuficiente para reservar', faltantes={
+            pk: max(disponibles.get(pk, 0), 0) for pk in pks if disponibles.get(pk, 0) < cantidades[pk]
+        })
+    _invalidar_filas(filas.values())
+
+
+def liberar_varios(cantidades):
+    """Libera ``{medicamento_id: cantidad}`` reservadas (sin bajar de cero) con ``UPDATE`` por bloques."""
+    from .models import Medicamento
+
+    pks = sorted(pk for pk, n in cantidades.items() if n)
+    if not pks:
+        return
+    with transaction.atomic():
+        # bloqueo en orden de pk: el mismo orden que usan las transferencias y los préstamos
+        filas = _filas(pks, bloquear=True)
+        liberar = {pk: min(cantidades[pk], f['stock_reservado']) for pk, f in filas.items()}
+        for i in range(0, len(pks), _BLOQUE):
+            bloque = [pk for pk in pks[i:i + _BLOQUE] if liberar.get(pk)]
+            if bloque:
+                Medicamento.objects.filter(pk__in=bloque).update(
+                    stock_reservado=F('stock_reservado') - _por_cantidad(bloque, liberar)
+                )
+        resumen.registrar_cambios(
+            (_sin_extras(f), dict(_sin_extras(f), stock_reservado=f['stock_reservado'] - liberar[pk]))
+            for pk, f in filas.items() if liberar[pk]
+        )
+    _invalidar_filas(filas.values())
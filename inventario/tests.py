@@ -1,3 +1,9 @@
+import json
+import os
+import tempfile
+import uuid
+
+from django.test import TransactionTestCase, override_settings
 from rest_framework.test import APITestCase
 from usuarios.models import Usuario
 from droguerias.models import Drogueria
@@ -154,7 +160,11 @@ class PrestamoFlowTests(APITestCase):
         # crear prestamo directo y aceptar para comprobar audit log
         prestamo = Prestamo.objects.create(medicamento_origen=self.m1, cantidad=2, origen=self.d1, destino=self.d2, solicitante=self.user)
         prestamo.reservar()
-        prestamo.aceptar(user=self.user)
+        # la auditoría se encola al hacer commit y se escribe al volcar la cola
+        with self.captureOnCommitCallbacks(execute=True):
+            prestamo.aceptar(user=self.user)
+        from .auditoria import cola
+        cola.flush()
         assert AuditLog.objects.filter(action='prestamo_aceptado', model_name='Prestamo', object_id=prestamo.id).exists()
 
     def test_accept_requires_permission(self):
@@ -203,6 +213,24 @@ class PrestamoFlowTests(APITestCase):
         # p1 should be pending
         assert any(p['id'] == p1_id for p in items)
 
+    def test_ordinary_exits_cannot_take_reserved_units(self):
+        from .movimientos import registrar_lote
+        from .stock import StockInsuficiente
+        from rest_framework.exceptions import ValidationError
+        prestamo = Prestamo.objects.create(medicamento_origen=self.m1, cantidad=18, origen=self.d1, destino=self.d2, solicitante=self.user)
+        prestamo.reservar()
+
+        with self.assertRaises(StockInsuficiente):
+            MovimientoInventario.objects.create(medicamento=self.m1, tipo_movimiento='salida', cantidad=3)
+        with self.assertRaises(ValidationError):
+            registrar_lote([{'medicamento_id': self.m1.id, 'tipo_movimiento': 'salida', 'cantidad': 3}])
+        MovimientoInventario.objects.create(medicamento=self.m1, tipo_movimiento='salida', cantidad=2)
+
+        # aceptar entrega justo lo reservado
+        prestamo.aceptar(user=self.user)
+        self.m1.refresh_from_db()
+        self.assertEqual((self.m1.stock_actual, self.m1.stock_reservado), (0, 0))
+
 
 class MedicamentoSerializerTests(APITestCase):
     def test_medicamento_serializer_includes_computed_fields(self):
@@ -241,7 +269,10 @@ class AlertaSignalsTests(APITestCase):
 
     def test_auditlog_created_on_movimiento(self):
         med = Medicamento.objects.create(nombre='AuditMed', precio_venta=4.0, stock_actual=4, stock_minimo=3, drogueria=self.d1)
-        MovimientoInventario.objects.create(medicamento=med, drogueria=self.d1, tipo_movimiento='salida', cantidad=1)
+        with self.captureOnCommitCallbacks(execute=True):
+            MovimientoInventario.objects.create(medicamento=med, drogueria=self.d1, tipo_movimiento='salida', cantidad=1)
+        from .auditoria import cola
+        cola.flush()
         assert AuditLog.objects.filter(action='movimiento_creado', model_name='MovimientoInventario').exists()
 
     def test_alerts_api_list_and_mark_read(self):
@@ -296,6 +327,1391 @@ class AlertaSignalsTests(APITestCase):
         else:
             assert isinstance(r2data, list)
 
-from django.test import TestCase
 
-# Create your tests here.
+class BusquedaCatalogoTests(APITestCase):
+    def setUp(self):
+        self.d1 = Drogueria.objects.create(codigo='B1', nombre='Busqueda')
+        self.para = Medicamento.objects.create(nombre='Paracetamol 500mg', precio_venta=5.0, drogueria=self.d1, proveedor='Genfar')
+        self.otro = Medicamento.objects.create(
+            nombre='Dolex', descripcion='Contiene paracetamol', precio_venta=6.0, drogueria=self.d1, codigo_barra='7702001'
+        )
+        Medicamento.objects.create(nombre='Acetaminofén jarabe', precio_venta=7.0, drogueria=self.d1, lote='LX-99')
+
+    def _nombres(self, url):
+        resp = self.client.get(url)
+        assert resp.status_code == 200, resp.content
+        data = resp.json()
+        items = data['results'] if isinstance(data, dict) else data
+        return [i['nombre'] for i in items]
+
+    def test_prefix_search_ranks_nombre_first(self):
+        nombres = self._nombres('/api/inventario/catalogo/?q=parac')
+        self.assertEqual(nombres, ['Paracetamol 500mg', 'Dolex'])
+
+    def test_search_ignores_diacritics_and_matches_other_fields(self):
+        self.assertEqual(self._nombres('/api/inventario/catalogo/?q=acetaminofen'), ['Acetaminofén jarabe'])
+        self.assertEqual(self._nombres('/api/inventario/catalogo/?q=7702'), ['Dolex'])
+        self.assertEqual(self._nombres('/api/inventario/catalogo/?q=genfar'), ['Paracetamol 500mg'])
+        self.assertEqual(self._nombres('/api/inventario/catalogo/?q=lx-99'), ['Acetaminofén jarabe'])
+
+    def test_index_follows_bulk_operations(self):
+        Medicamento.objects.filter(pk=self.otro.pk).update(nombre='Ibuprofeno')
+        Medicamento.objects.bulk_create([Medicamento(nombre='Ibuprofeno jarabe', precio_venta=3.0, drogueria=self.d1)])
+        self.assertEqual(self._nombres('/api/inventario/catalogo/?q=dolex'), [])
+        self.assertEqual(sorted(self._nombres('/api/inventario/catalogo/?q=ibup')), ['Ibuprofeno', 'Ibuprofeno jarabe'])
+
+        self.para.delete()
+        self.assertEqual(self._nombres('/api/inventario/catalogo/?q=500mg'), [])
+
+
+class KeysetPaginationTests(APITestCase):
+    def setUp(self):
+        from django.utils import timezone
+        self.emp = Usuario.objects.create_user(username='emp_ks', password='x', email='emp_ks@example.com', rol='empleado')
+        self.d1 = Drogueria.objects.create(codigo='K1', nombre='Keyset')
+        self.med = Medicamento.objects.create(nombre='KeysetMed', precio_venta=1.0, stock_actual=500, stock_minimo=0, drogueria=self.d1)
+        ahora = timezone.now()
+        for i in range(25):
+            # varios movimientos comparten fecha para ejercitar el desempate por id
+            MovimientoInventario.objects.create(
+                medicamento=self.med, drogueria=self.d1, tipo_movimiento='salida', cantidad=1,
+                fecha_movimiento=ahora - timezone.timedelta(minutes=i // 3),
+            )
+        self.client.force_authenticate(self.emp)
+
+    def test_cursor_walks_every_row_once_without_count(self):
+        from django.db import connection
+        from django.test.utils import CaptureQueriesContext
+
+        esperado = list(MovimientoInventario.objects.order_by('-fecha_movimiento', '-id').values_list('id', flat=True))
+        vistos = []
+        url = '/api/inventario/movimientos/?paginacion=cursor&page_size=10'
+        paginas = []
+        while url:
+            with CaptureQueriesContext(connection) as ctx:
+                resp = self.client.get(url)
+            assert resp.status_code == 200, resp.content
+            assert not any('COUNT(' in q['sql'] for q in ctx.captured_queries)
+            data = resp.json()
+            assert 'count' not in data
+            vistos.extend(item['id'] for item in data['results'])
+            paginas.append(data)
+            url = data['next']
+        self.assertEqual(vistos, esperado)
+        self.assertEqual(len(paginas), 3)
+
+        # volver hacia atrás desde la última página devuelve la anterior
+        resp = self.client.get(paginas[-1]['previous'])
+        self.assertEqual([i['id'] for i in resp.json()['results']], esperado[10:20])
+
+    def test_page_number_mode_is_default(self):
+        resp = self.client.get('/api/inventario/movimientos/')
+        data = resp.json()
+        self.assertEqual(data['count'], 25)
+        resp = self.client.get('/api/inventario/movimientos/?cursor=no-es-un-cursor')
+        self.assertEqual(resp.status_code, 404)
+
+    def test_tampered_cursor_is_404(self):
+        import base64
+        import json
+        for data in ({'v': 'abc', 'id': 1}, {'v': None, 'id': 1}, {'v': '2026-01-01T00:00:00', 'id': 'x'}, [1, 2]):
+            cursor = base64.urlsafe_b64encode(json.dumps(data).encode()).decode()
+            resp = self.client.get(f'/api/inventario/movimientos/?paginacion=cursor&cursor={cursor}')
+            self.assertEqual(resp.status_code, 404, data)
+
+
+class QueryCountTests(APITestCase):
+    """Número de consultas por endpoint: no debe crecer con el número de filas (N+1)."""
+
+    def setUp(self):
+        from .models import Categoria
+        self.admin = Usuario.objects.create_user(username='qc_admin', password='x', email='qc@example.com', rol='admin')
+        self.d1 = Drogueria.objects.create(codigo='Q1', nombre='Query 1', propietario=self.admin)
+        self.d2 = Drogueria.objects.create(codigo='Q2', nombre='Query 2', propietario=self.admin)
+        self.categorias = [Categoria.objects.create(nombre=f'Cat {i}') for i in range(3)]
+        self._crear(8)
+        self.client.force_authenticate(self.admin)
+
+    def _crear(self, n):
+        inicio = Medicamento.objects.count()
+        for i in range(inicio, inicio + n):
+            med = Medicamento.objects.create(
+                nombre=f'QC {i}', precio_venta=10.0, stock_actual=100, stock_minimo=1,
+                categoria=self.categorias[i % 3], drogueria=self.d1 if i % 2 else self.d2,
+            )
+            MovimientoInventario.objects.create(medicamento=med, drogueria=med.drogueria, tipo_movimiento='salida', cantidad=1, usuario=self.admin)
+            Alerta.objects.create(tipo='info', mensaje='qc', medicamento=med, drogueria=med.drogueria)
+            # la auditoría de los movimientos se escribe en diferido (auditoria.py)
+            AuditLog.objects.create(action='qc', model_name='Medicamento', object_id=med.id, user=self.admin)
+            Prestamo.objects.create(medicamento_origen=med, cantidad=1, origen=med.drogueria, destino=self.d1, solicitante=self.admin)
+
+    # endpoint -> consultas esperadas (COUNT de la paginación + SELECT + prefetch)
+    ENDPOINTS = {
+        '/api/inventario/catalogo/': 2,
+        '/api/inventario/catalogo/?q=qc': 2,
+        '/api/inventario/medicamentos-crud/': 2,
+        '/api/inventario/medicamentos/': 1,
+        '/api/inventario/by-drogueria/': 1,
+        '/api/inventario/movimientos/': 2,
+        '/api/inventario/movimientos/?paginacion=cursor': 1,
+        '/api/inventario/alerts/': 2,
+        '/api/inventario/auditlogs/': 2,
+        '/api/inventario/prestamos/': 1,
+        '/api/inventario/categorias/': 1,
+        '/api/inventario/catalogo/categorias/': 1,
+        '/api/inventario/catalogo/categorias-con-medicamentos/': 2,
+        '/api/inventario/catalogo/droguerias/': 1,
+        '/api/droguerias/': 1,
+    }
+
+    def test_query_counts_do_not_grow_with_rows(self):
+        from django.core.cache import cache
+        # se mide el coste sin la caché del catálogo
+        for url, esperado in self.ENDPOINTS.items():
+            with self.subTest(url=url):
+                cache.clear()
+                with self.assertNumQueries(esperado):
+                    resp = self.client.get(url)
+                self.assertEqual(resp.status_code, 200, resp.content)
+
+        self._crear(6)
+        for url, esperado in self.ENDPOINTS.items():
+            with self.subTest(url=url, filas='+6'):
+                cache.clear()
+                with self.assertNumQueries(esperado):
+                    self.client.get(url)
+
+
+class CodigoBarraLookupTests(APITestCase):
+    def setUp(self):
+        from . import barcodes
+        barcodes.invalidar_todo()
+        self.emp = Usuario.objects.create_user(username='pos', password='x', email='pos@example.com', rol='empleado')
+        self.d1 = Drogueria.objects.create(codigo='CB1', nombre='Caja 1')
+        self.d2 = Drogueria.objects.create(codigo='CB2', nombre='Caja 2')
+        self.med = Medicamento.objects.create(nombre='Loratadina', precio_venta=8.0, stock_actual=30, drogueria=self.d1, codigo_barra='7701234')
+        Medicamento.objects.create(nombre='Loratadina', precio_venta=9.0, stock_actual=3, drogueria=self.d2, codigo_barra='7701234')
+        self.client.force_authenticate(self.emp)
+
+    def test_lookup_is_scoped_and_cached(self):
+        url = f'/api/inventario/codigo-barras/7701234/?drogueria={self.d1.id}'
+        resp = self.client.get(url)
+        self.assertEqual(resp.status_code, 200)
+        self.assertEqual(resp.json()['id'], self.med.id)
+        # segundo escaneo: servido desde la caché, sin consultas
+        with self.assertNumQueries(0):
+            resp = self.client.get(url)
+        self.assertEqual(resp.json()['stock_actual'], 30)
+
+        resp = self.client.get(f'/api/inventario/codigo-barras/7701234/?drogueria={self.d2.id}')
+        self.assertEqual(resp.json()['precio_venta'], '9.00')
+        self.assertEqual(self.client.get(f'/api/inventario/codigo-barras/000/?drogueria={self.d1.id}').status_code, 404)
+        self.assertEqual(self.client.get('/api/inventario/codigo-barras/7701234/').status_code, 400)
+
+    def test_saves_invalidate_cached_entries(self):
+        url = f'/api/inventario/codigo-barras/7701234/?drogueria={self.d1.id}'
+        self.client.get(url)
+        MovimientoInventario.objects.create(medicamento=self.med, drogueria=self.d1, tipo_movimiento='salida', cantidad=5)
+        self.assertEqual(self.client.get(url).json()['stock_actual'], 25)
+
+        # cambio de código: el anterior deja de resolver y el nuevo aparece
+        self.assertEqual(self.client.get(f'/api/inventario/codigo-barras/7709999/?drogueria={self.d1.id}').status_code, 404)
+        self.med.refresh_from_db()
+        self.med.codigo_barra = '7709999'
+        self.med.save()
+        self.assertEqual(self.client.get(url).status_code, 404)
+        self.assertEqual(self.client.get(f'/api/inventario/codigo-barras/7709999/?drogueria={self.d1.id}').status_code, 200)
+
+    def test_lru_cache_is_bounded(self):
+        from .barcodes import LRUCache
+        cache = LRUCache(maxsize=2)
+        cache.set('a', 1)
+        cache.set('b', 2)
+        cache.get('a')
+        cache.set('c', 3)
+        self.assertIsNone(cache.get('b'))
+        self.assertEqual((cache.get('a'), cache.get('c')), (1, 3))
+        self.assertEqual(cache.info()['size'], 2)
+
+
+class CatalogoCacheTests(APITestCase):
+    def setUp(self):
+        from django.core.cache import cache
+        cache.clear()
+        self.d1 = Drogueria.objects.create(codigo='CC1', nombre='Cache 1')
+        self.d2 = Drogueria.objects.create(codigo='CC2', nombre='Cache 2')
+        self.m1 = Medicamento.objects.create(nombre='Cacheado', precio_venta=10.0, stock_actual=5, drogueria=self.d1)
+        self.m2 = Medicamento.objects.create(nombre='Otro', precio_venta=10.0, stock_actual=5, drogueria=self.d2)
+
+    def test_hit_miss_and_etag(self):
+        url = f'/api/inventario/catalogo/?drogueria={self.d1.id}'
+        r1 = self.client.get(url)
+        self.assertEqual(r1['X-Cache'], 'MISS')
+        with self.assertNumQueries(0):
+            r2 = self.client.get(url + '&q=')  # parámetros vacíos se normalizan
+        self.assertEqual(r2['X-Cache'], 'HIT')
+        self.assertEqual(r1.json(), r2.json())
+
+        r3 = self.client.get(url, HTTP_IF_NONE_MATCH=r1['ETag'])
+        self.assertEqual(r3.status_code, 304)
+        self.assertEqual(r3['ETag'], r1['ETag'])
+
+    def test_invalidation_is_scoped_by_drogueria(self):
+        url = f'/api/inventario/catalogo/?drogueria={self.d1.id}'
+        etag = self.client.get(url)['ETag']
+        self.client.get('/api/inventario/catalogo/')
+
+        # un cambio en otra sucursal no invalida el listado de d1, sí el global
+        self.m2.precio_venta = 11
+        self.m2.save()
+        self.assertEqual(self.client.get(url)['X-Cache'], 'HIT')
+        self.assertEqual(self.client.get('/api/inventario/catalogo/')['X-Cache'], 'MISS')
+
+        # mover un medicamento de sucursal invalida la de origen
+        self.m1.drogueria = self.d2
+        self.m1.save()
+        resp = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(resp.status_code, 200)
+        self.assertEqual(resp.json()['results'], [])
+
+    def test_bulk_update_and_structure_changes(self):
+        from .cache_catalogo import invalidar_catalogo
+        url = f'/api/inventario/catalogo/?drogueria={self.d1.id}'
+        self.client.get(url)
+        qs = Medicamento.objects.filter(drogueria=self.d1)
+        qs.update(precio_venta=99)
+        invalidar_catalogo(droguerias=set(qs.values_list('drogueria_id', flat=True)))
+        self.assertEqual(self.client.get(url).json()['results'][0]['precio_venta'], '99.00')
+
+        self.client.get('/api/inventario/catalogo/droguerias/')
+        self.d1.nombre = 'Renombrada'
+        self.d1.save()
+        resp = self.client.get('/api/inventario/catalogo/droguerias/')
+        self.assertEqual(resp['X-Cache'], 'MISS')
+        self.assertIn('Renombrada', [d['nombre'] for d in resp.json()])
+
+
+class ResumenInventarioTests(APITestCase):
+    def setUp(self):
+        from .models import Categoria
+        self.user = Usuario.objects.create_user(username='valuador', password='x', email='val@example.com')
+        self.emp = Usuario.objects.create_user(username='emp_res', password='x', email='empres@example.com', rol='empleado')
+        self.d1 = Drogueria.objects.create(codigo='R1', nombre='Resumen 1', propietario=self.user)
+        self.d2 = Drogueria.objects.create(codigo='R2', nombre='Resumen 2', propietario=self.user)
+        self.cat = Categoria.objects.create(nombre='Analgésicos')
+        self.m1 = Medicamento.objects.create(nombre='Ibuprofeno', precio_venta=4.5, costo_compra=2, stock_actual=20, stock_minimo=5, drogueria=self.d1, categoria=self.cat)
+        self.m2 = Medicamento.objects.create(nombre='Ibuprofeno', precio_venta=4.5, costo_compra=2, stock_actual=3, drogueria=self.d2, categoria=self.cat)
+        Medicamento.objects.create(nombre='Gasas', precio_venta=1.25, stock_actual=100, drogueria=self.d1)
+
+    def _filas(self):
+        from .models import ResumenInventario
+        campos = ('drogueria_id', 'categoria_id', 'skus', 'unidades', 'unidades_reservadas', 'valor_venta', 'valor_costo', 'bajo_stock', 'vencidos')
+        return sorted(ResumenInventario.objects.values_list(*campos), key=lambda f: (f[0] or 0, f[1] or 0))
+
+    def assertCoincideConReconstruccion(self):
+        from .resumen import reconstruir
+        incremental = self._filas()
+        reconstruir()
+        self.assertEqual(incremental, self._filas())
+
+    def test_incremental_matches_rebuild(self):
+        from .models import ResumenInventario
+        fila = ResumenInventario.objects.get(drogueria=self.d1, categoria=self.cat)
+        self.assertEqual((fila.skus, fila.unidades, str(fila.valor_venta), str(fila.valor_costo)), (1, 20, '90.00', '40.00'))
+        self.assertCoincideConReconstruccion()
+
+        # movimiento, cambio de precio y de categoría
+        MovimientoInventario.objects.create(medicamento=self.m1, tipo_movimiento='salida', cantidad=16)
+        self.m2.precio_venta = 6
+        self.m2.save()
+        self.m1.refresh_from_db()
+        self.m1.categoria = None
+        self.m1.save()
+        self.assertCoincideConReconstruccion()
+
+        # préstamo aceptado entre sucursales y borrado
+        prestamo = Prestamo.objects.create(medicamento_origen=self.m1, cantidad=2, origen=self.d1, destino=self.d2, solicitante=self.user)
+        prestamo.reservar()
+        prestamo.aceptar(user=self.user)
+        Medicamento.objects.get(nombre='Gasas').delete()
+        self.assertCoincideConReconstruccion()
+
+    def test_migration_backfills_existing_inventory(self):
+        from importlib import import_module
+        from django.apps import apps
+        from .models import ResumenInventario
+        esperado = self._filas()
+        ResumenInventario.objects.all().delete()
+        import_module('inventario.migrations.0012_resumeninventario').poblar(apps, None)
+        self.assertEqual(self._filas(), esperado)
+
+    def test_delta_on_missing_row_does_not_leave_partial_row(self):
+        from .models import ResumenInventario
+        from .resumen import aplicar_delta
+        ResumenInventario.objects.filter(drogueria=self.d1, categoria=self.cat).delete()
+        # resumen desincronizado: un cambio de stock sin la fila del grupo no deja skus 0 ni unidades negativas
+        aplicar_delta(self.d1.id, self.cat.id, {'unidades': -4})
+        self.assertFalse(ResumenInventario.objects.filter(drogueria=self.d1, categoria=self.cat).exists())
+        # un grupo nuevo sí se crea, y una segunda escritura suma sobre la misma fila
+        aplicar_delta(self.d2.id, None, {'skus': 1, 'unidades': 7})
+        aplicar_delta(self.d2.id, None, {'skus': 1, 'unidades': 3})
+        fila = ResumenInventario.objects.get(drogueria=self.d2, categoria=None)
+        self.assertEqual((fila.skus, fila.unidades), (2, 10))
+
+    def test_daily_expiry_scan_corrects_expired_counter(self):
+        from datetime import timedelta
+        from io import StringIO
+        from django.core.management import call_command
+        from django.utils import timezone
+        from .models import ResumenInventario
+        from .resumen import corregir_vencidos
+        hoy = timezone.now().date()
+        m3 = Medicamento.objects.create(nombre='Naproxeno', precio_venta=3, stock_actual=8, drogueria=self.d2, categoria=self.cat)
+        # vence sin que nadie lo guarde y luego se borra: el aporte anterior resta un vencido que nunca se sumó
+        Medicamento.objects.filter(pk=self.m2.pk).update(fecha_vencimiento=hoy - timedelta(days=1))
+        Medicamento.objects.get(pk=self.m2.pk).delete()
+        self.assertEqual(ResumenInventario.objects.get(drogueria=self.d2, categoria=self.cat).vencidos, -1)
+
+        call_command('escanear_vencimientos', stdout=StringIO())
+        self.assertEqual(ResumenInventario.objects.get(drogueria=self.d2, categoria=self.cat).vencidos, 0)
+        self.assertCoincideConReconstruccion()
+
+        # vence hoy: mañana ya cuenta, solo se recalcula su grupo
+        Medicamento.objects.filter(pk=m3.pk).update(fecha_vencimiento=hoy)
+        self.assertEqual(corregir_vencidos(hoy=hoy), 0)
+        self.assertEqual(corregir_vencidos(hoy=hoy + timedelta(days=1)), 1)
+        self.assertEqual(ResumenInventario.objects.get(drogueria=self.d2, categoria=self.cat).vencidos, 1)
+
+    def test_endpoint(self):
+        self.client.force_authenticate(self.emp)
+        resp = self.client.get(f'/api/inventario/resumen/?drogueria={self.d1.id}')
+        self.assertEqual(resp.status_code, 200)
+        self.assertEqual(resp.json()['count'], 2)
+
+        resp = self.client.get('/api/inventario/resumen/por_drogueria/')
+        totales = {t['drogueria']: t for t in resp.json()}
+        self.assertEqual(totales[self.d1.id]['skus'], 2)
+        self.assertEqual(totales[self.d1.id]['unidades'], 120)
+        self.assertEqual(totales[self.d2.id]['bajo_stock'], 1)
+
+
+class MovimientoLoteTests(APITestCase):
+    def setUp(self):
+        self.emp = Usuario.objects.create_user(username='bodega', password='x', email='bodega@example.com', rol='empleado')
+        self.d1 = Drogueria.objects.create(codigo='L1', nombre='Lote 1')
+        self.meds = [
+            Medicamento.objects.create(nombre=f'Lote {i}', precio_venta=2.0, stock_actual=20, stock_minimo=5, drogueria=self.d1)
+            for i in range(30)
+        ]
+        self.client.force_authenticate(self.emp)
+
+    def _lote(self, lineas):
+        return self.client.post('/api/inventario/movimientos/lote/', {'movimientos': lineas}, format='json')
+
+    def test_batch_applies_stock_audit_and_alerts(self):
+        from django.db import connection
+        from django.test.utils import CaptureQueriesContext
+        from .resumen import reconstruir
+
+        lineas = [{'medicamento_id': m.id, 'tipo_movimiento': 'entrada', 'cantidad': 3} for m in self.meds]
+        # salidas sucesivas sobre el primero: 20+3-10-13 -> 0, +4 -> 4
+        lineas += [
+            {'medicamento_id': self.meds[0].id, 'tipo_movimiento': 'salida', 'cantidad': 10},
+            {'medicamento_id': self.meds[0].id, 'tipo_movimiento': 'salida', 'cantidad': 13},
+            {'medicamento_id': self.meds[0].id, 'tipo_movimiento': 'entrada', 'cantidad': 4},
+            {'medicamento_id': self.meds[1].id, 'tipo_movimiento': 'ajuste', 'cantidad': 1},
+        ]
+        with CaptureQueriesContext(connection) as ctx:
+            resp = self._lote(lineas)
+        self.assertEqual(resp.status_code, 201, resp.content)
+        # el número de consultas no depende de las líneas del lote
+        self.assertLess(len(ctx.captured_queries), 20)
+
+        self.assertEqual(resp.json()['creados'], len(lineas))
+        self.assertEqual(resp.json()['alertas'], 1)
+        self.meds[0].refresh_from_db()
+        self.meds[1].refresh_from_db()
+        self.assertEqual(self.meds[0].stock_actual, 4)
+        self.assertEqual(self.meds[1].stock_actual, 23)
+        self.assertEqual(MovimientoInventario.objects.filter(usuario=self.emp, drogueria=self.d1).count(), len(lineas))
+        self.assertEqual(AuditLog.objects.filter(action='movimiento_creado').count(), len(lineas))
+        self.assertEqual(Alerta.objects.filter(tipo='low_stock', medicamento=self.meds[0]).count(), 1)
+
+        # una segunda salida no duplica la alerta pendiente
+        self._lote([{'medicamento_id': self.meds[0].id, 'tipo_movimiento': 'salida', 'cantidad': 1}])
+        self.assertEqual(Alerta.objects.filter(tipo='low_stock', medicamento=self.meds[0]).count(), 1)
+
+        from .models import ResumenInventario
+        incremental = list(ResumenInventario.objects.values_list('unidades', 'valor_venta', 'bajo_stock'))
+        reconstruir()
+        self.assertEqual(incremental, list(ResumenInventario.objects.values_list('unidades', 'valor_venta', 'bajo_stock')))
+
+    def test_unknown_medicamento_rolls_back(self):
+        resp = self._lote([
+            {'medicamento_id': self.meds[0].id, 'tipo_movimiento': 'entrada', 'cantidad': 5},
+            {'medicamento_id': 999999, 'tipo_movimiento': 'entrada', 'cantidad': 5},
+        ])
+        self.assertEqual(resp.status_code, 400)
+        self.meds[0].refresh_from_db()
+        self.assertEqual(self.meds[0].stock_actual, 20)
+        self.assertFalse(MovimientoInventario.objects.exists())
+
+        # una salida mayor que el stock en su punto del lote rechaza el lote
+        resp = self._lote([
+            {'medicamento_id': self.meds[0].id, 'tipo_movimiento': 'salida', 'cantidad': 15},
+            {'medicamento_id': self.meds[0].id, 'tipo_movimiento': 'salida', 'cantidad': 15},
+            {'medicamento_id': self.meds[0].id, 'tipo_movimiento': 'entrada', 'cantidad': 50},
+        ])
+        self.assertEqual(resp.status_code, 400)
+        self.assertIn('[1]', str(resp.json()))
+        self.meds[0].refresh_from_db()
+        self.assertEqual(self.meds[0].stock_actual, 20)
+
+
+class StockConcurrenciaTests(TransactionTestCase):
+    """Varios hilos, cada uno con su conexión y su instancia (desactualizada) del medicamento."""
+    HILOS = 8
+    OPERACIONES = 10
+
+    def setUp(self):
+        self.drog = Drogueria.objects.create(codigo='CON', nombre='Concurrencia')
+
+    def tearDown(self):
+        # no dejar eventos de auditoría en la cola para las pruebas siguientes
+        from .auditoria import cola
+        cola.flush()
+
+    def _en_hilos(self, trabajo):
+        import threading
+        from django.db import connection
+
+        errores = []
+
+        def correr(n):
+            try:
+                trabajo(n)
+            except Exception as e:  # pragma: no cover - se reporta abajo
+                errores.append(e)
+            finally:
+                connection.close()
+
+        hilos = [threading.Thread(target=correr, args=(n,)) for n in range(self.HILOS)]
+        for h in hilos:
+            h.start()
+        for h in hilos:
+            h.join()
+        self.assertEqual(errores, [])
+
+    def _reintentar(self, fn):
+        # SQLite responde "database is locked" en vez de esperar: reintentar la transacción
+        import time
+        from django.db import OperationalError, transaction
+        while True:
+            try:
+                with transaction.atomic():
+                    return fn()
+            except OperationalError:
+                time.sleep(0.001)
+
+    def test_concurrent_sales_lose_no_updates(self):
+        med = Medicamento.objects.create(nombre='Concurrido', precio_venta=1.0, stock_actual=1000, stock_minimo=0, drogueria=self.drog)
+
+        def vender(n):
+            propio = self._reintentar(lambda: Medicamento.objects.get(pk=med.pk))
+            for _ in range(self.OPERACIONES):
+                self._reintentar(lambda: MovimientoInventario.objects.create(medicamento=propio, tipo_movimiento='salida', cantidad=1))
+
+        self._en_hilos(vender)
+        med.refresh_from_db()
+        total = self.HILOS * self.OPERACIONES
+        self.assertEqual(med.stock_actual, 1000 - total)
+        self.assertEqual(MovimientoInventario.objects.filter(medicamento=med).count(), total)
+
+    def test_concurrent_sales_never_go_negative(self):
+        from .stock import StockInsuficiente
+        med = Medicamento.objects.create(nombre='Escaso', precio_venta=1.0, stock_actual=30, drogueria=self.drog)
+        rechazadas = []
+
+        def vender(n):
+            propio = self._reintentar(lambda: Medicamento.objects.get(pk=med.pk))
+            for _ in range(self.OPERACIONES):
+                try:
+                    self._reintentar(lambda: MovimientoInventario.objects.create(medicamento=propio, tipo_movimiento='salida', cantidad=1))
+                except StockInsuficiente:
+                    rechazadas.append(n)
+
+        self._en_hilos(vender)
+        med.refresh_from_db()
+        self.assertEqual(med.stock_actual, 0)
+        self.assertEqual(MovimientoInventario.objects.filter(medicamento=med).count(), 30)
+        self.assertEqual(len(rechazadas), self.HILOS * self.OPERACIONES - 30)
+
+    def test_reservations_survive_concurrent_entries(self):
+        from . import stock
+        med = Medicamento.objects.create(nombre='Reservado', precio_venta=1.0, stock_actual=500, drogueria=self.drog)
+
+        def operar(n):
+            propio = self._reintentar(lambda: Medicamento.objects.get(pk=med.pk))
+            for _ in range(self.OPERACIONES):
+                if n % 2:
+                    self._reintentar(lambda: stock.reservar(propio, 1))
+                else:
+                    self._reintentar(lambda: MovimientoInventario.objects.create(medicamento=propio, tipo_movimiento='entrada', cantidad=1))
+
+        self._en_hilos(operar)
+        med.refresh_from_db()
+        mitad = self.HILOS // 2 * self.OPERACIONES
+        self.assertEqual(med.stock_actual, 500 + mitad)
+        self.assertEqual(med.stock_reservado, mitad)
+
+        from .resumen import reconstruir
+        from .models import ResumenInventario
+        incremental = list(ResumenInventario.objects.values_list('unidades', 'unidades_reservadas'))
+        reconstruir()
+        self.assertEqual(incremental, list(ResumenInventario.objects.values_list('unidades', 'unidades_reservadas')))
+
+
+_SPOOL_PRUEBAS = tempfile.mkdtemp(prefix='auditoria-')
+
+
+@override_settings(INVENTARIO_AUDIT_SPOOL_DIR=_SPOOL_PRUEBAS, INVENTARIO_AUDIT_INTERVAL=3600)
+class AuditoriaColaTests(APITestCase):
+    def setUp(self):
+        from .auditoria import cola
+        cola.flush()
+        self.user = Usuario.objects.create_user(username='auditor', password='x', email='aud@example.com', rol='empleado')
+        self.d1 = Drogueria.objects.create(codigo='AU1', nombre='Auditada')
+        self.med = Medicamento.objects.create(nombre='Auditado', precio_venta=3.0, stock_actual=50, stock_minimo=0, drogueria=self.d1)
+
+    def test_events_are_buffered_until_flush(self):
+        from .auditoria import cola
+        with self.captureOnCommitCallbacks(execute=True):
+            for _ in range(5):
+                MovimientoInventario.objects.create(medicamento=self.med, tipo_movimiento='salida', cantidad=1, usuario=self.user)
+        # encolados y en disco, todavía sin escribir en la base
+        self.assertEqual(AuditLog.objects.count(), 0)
+        self.assertEqual(cola.info()['pendientes'], 5)
+        self.assertTrue(os.listdir(_SPOOL_PRUEBAS))
+
+        with self.assertNumQueries(1):
+            self.assertEqual(cola.flush(), 5)
+        self.assertEqual(AuditLog.objects.filter(action='movimiento_creado', user=self.user).count(), 5)
+        self.assertEqual(os.listdir(_SPOOL_PRUEBAS), [])
+
+        self.client.force_authenticate(self.user)
+        info = self.client.get('/api/inventario/auditoria-stats/').json()
+        self.assertEqual(info['pendientes'], 0)
+        self.assertIsNotNone(info['ultima_latencia_ms'])
+
+    def test_rollback_discards_events(self):
+        from django.db import transaction
+        from .auditoria import cola
+        with self.captureOnCommitCallbacks(execute=True):
+            try:
+                with transaction.atomic():
+                    MovimientoInventario.objects.create(medicamento=self.med, tipo_movimiento='entrada', cantidad=1)
+                    raise RuntimeError
+            except RuntimeError:
+                pass
+        self.assertEqual(cola.info()['pendientes'], 0)
+
+    def test_recovery_replays_segments_without_duplicates(self):
+        from .auditoria import _evento, insertar, recuperar
+        ya_insertado = _evento('movimiento_creado', 'MovimientoInventario', 1, self.user)
+        insertar([ya_insertado])
+        nuevo = _evento('prestamo_aceptado', 'Prestamo', 2, self.user, data={'origen': 1})
+
+        # segmento de un proceso que ya no existe, con la última línea cortada
+        segmento = os.path.join(_SPOOL_PRUEBAS, f'{2 ** 22 + 7}-000001.jsonl')
+        with open(segmento, 'w', encoding='utf-8') as f:
+            f.write(json.dumps(ya_insertado) + '\n' + json.dumps(nuevo) + '\n' + '{"evento": "a')
+
+        self.assertEqual(recuperar(), 2)
+        self.assertFalse(os.path.exists(segmento))
+        self.assertEqual(AuditLog.objects.count(), 2)
+        self.assertEqual(AuditLog.objects.get(evento=uuid.UUID(nuevo['evento'])).data, {'origen': 1})
+
+    def test_segments_of_a_crashed_process_with_the_same_pid_are_recovered(self):
+        from .auditoria import _evento, cola
+        # el proceso anterior con este PID cayó (contenedor reiniciado)
+        huerfano = _evento('prestamo_aceptado', 'Prestamo', 3, self.user)
+        segmento = os.path.join(_SPOOL_PRUEBAS, f'{os.getpid()}-0123456789ab-000001.jsonl')
+        with open(segmento, 'w', encoding='utf-8') as f:
+            f.write(json.dumps(huerfano) + '\n')
+        cola._recuperado = False  # como al arrancar
+
+        propio = _evento('movimiento_creado', 'MovimientoInventario', 4, self.user)
+        cola.encolar(propio)
+        self.assertFalse(os.path.exists(segmento))
+        self.assertEqual(cola.flush(), 1)
+        self.assertEqual(
+            set(AuditLog.objects.values_list('evento', flat=True)),
+            {uuid.UUID(huerfano['evento']), uuid.UUID(propio['evento'])},
+        )
+        self.assertEqual(os.listdir(_SPOOL_PRUEBAS), [])
+
+
+_ARCHIVO_PRUEBAS = tempfile.mkdtemp(prefix='auditoria-archivo-')
+
+
+@override_settings(INVENTARIO_AUDIT_ARCHIVE_DIR=_ARCHIVO_PRUEBAS)
+class ArchivoAuditoriaTests(APITestCase):
+    def setUp(self):
+        import shutil
+        from datetime import datetime
+        from django.utils import timezone
+        shutil.rmtree(_ARCHIVO_PRUEBAS, ignore_errors=True)
+        self.admin = Usuario.objects.create_user(username='arch_admin', password='x', email='arch@example.com', rol='admin')
+        self.ahora = timezone.make_aware(datetime(2026, 6, 15, 12, 0))
+
+        def crear(action, mes, n):
+            for i in range(n):
+                AuditLog.objects.create(
+                    action=action, model_name='Prestamo', object_id=i, user=self.admin,
+                    created_at=timezone.make_aware(datetime(2026, mes, 1 + i, 10, 0)),
+                )
+
+        crear('prestamo_aceptado', 1, 3)
+        crear('prestamo_rechazado', 1, 2)
+        crear('prestamo_aceptado', 2, 4)
+        crear('prestamo_aceptado', 6, 2)   # mes en curso: se queda en la tabla
+        self.client.force_authenticate(self.admin)
+
+    def test_archive_moves_old_months_to_segments(self):
+        from .archivo_auditoria import archivar
+        creados = archivar(meses=3, ahora=self.ahora)
+        self.assertEqual([i['filas'] for i in creados], [5, 4])
+        self.assertEqual(creados[0]['actions'], ['prestamo_aceptado', 'prestamo_rechazado'])
+        self.assertEqual(AuditLog.objects.count(), 2)
+        self.assertEqual(sorted(f for f in os.listdir(_ARCHIVO_PRUEBAS)), [
+            '2026-01.p001.idx.json', '2026-01.p001.jsonl.gz',
+            '2026-02.p001.idx.json', '2026-02.p001.jsonl.gz',
+        ])
+        # volver a ejecutar no duplica nada
+        self.assertEqual(archivar(meses=3, ahora=self.ahora), [])
+
+    def test_api_spans_hot_and_archived_rows(self):
+        from datetime import datetime
+        from unittest import mock
+        from django.utils import timezone
+        from . import archivo_auditoria
+        archivo_auditoria.archivar(meses=3, ahora=self.ahora)
+
+        resp = self.client.get('/api/inventario/auditlogs/?page_size=100')
+        data = resp.json()
+        self.assertEqual(data['count'], 11)
+        fechas = [r['created_at'] for r in data['results']]
+        self.assertEqual(fechas, sorted(fechas, reverse=True))
+        self.assertEqual(data['results'][-1]['user'], str(self.admin))
+
+        # la primera página sale de la tabla: no se lee ningún segmento
+        with mock.patch.object(archivo_auditoria, '_leer', wraps=archivo_auditoria._leer) as leer:
+            resp = self.client.get('/api/inventario/auditlogs/?page_size=2')
+        self.assertEqual(resp.json()['count'], 11)
+        leer.assert_not_called()
+
+        # filtro que solo puede estar en enero: solo se lee ese segmento
+        with mock.patch.object(archivo_auditoria, '_leer', wraps=archivo_auditoria._leer) as leer:
+            resp = self.client.get('/api/inventario/auditlogs/?action=prestamo_rechazado')
+        self.assertEqual(resp.json()['count'], 2)
+        self.assertEqual([c.args[0] for c in leer.call_args_list], ['2026-01.p001.jsonl.gz'] * leer.call_count)
+
+        resp = self.client.get('/api/inventario/auditlogs/', {
+            'created_from': timezone.make_aware(datetime(2026, 2, 2)).isoformat(),
+            'created_to': timezone.make_aware(datetime(2026, 6, 1)).isoformat(),
+        })
+        self.assertEqual(resp.json()['count'], 3)
+
+        archivada = data['results'][-1]
+        resp = self.client.get(f"/api/inventario/auditlogs/{archivada['id']}/")
+        self.assertEqual(resp.status_code, 200)
+        self.assertEqual(resp.json()['action'], archivada['action'])
+
+
+    def test_pages_read_only_their_segments_and_counts_come_from_the_index(self):
+        from datetime import datetime
+        from unittest import mock
+        from django.utils import timezone
+        from . import archivo_auditoria
+        creados = archivo_auditoria.archivar(meses=3, ahora=self.ahora)
+        self.assertEqual(creados[0]['grupos'], [
+            ['prestamo_aceptado', 'Prestamo', self.admin.id, 3], ['prestamo_rechazado', 'Prestamo', self.admin.id, 2],
+        ])
+        url = '/api/inventario/auditlogs/'
+        # 2 activas, luego febrero (4) y enero (5): la página 3 de 2 son las filas 2 y 3 de febrero
+        with mock.patch.object(archivo_auditoria, '_leer', wraps=archivo_auditoria._leer) as leer:
+            resp = self.client.get(url, {'page_size': 2, 'page': 3})
+        self.assertEqual(resp.json()['count'], 11)
+        self.assertEqual([c.args[0] for c in leer.call_args_list], ['2026-02.p001.jsonl.gz'])
+        with mock.patch.object(archivo_auditoria, '_leer', wraps=archivo_auditoria._leer) as leer:
+            resp = self.client.get(url, {'page_size': 2, 'action': 'prestamo_aceptado', 'user': self.admin.id})
+        self.assertEqual(resp.json()['count'], 9)
+        leer.assert_not_called()
+
+        # un rango que corta febrero a medias: se lee una vez para contar y después ya no
+        params = {'page_size': 1, 'created_from': timezone.make_aware(datetime(2026, 2, 3)).isoformat()}
+        with mock.patch.object(archivo_auditoria, '_leer', wraps=archivo_auditoria._leer) as leer:
+            self.assertEqual(self.client.get(url, params).json()['count'], 4)
+            self.assertEqual(leer.call_count, 1)
+            self.assertEqual(self.client.get(url, params).json()['count'], 4)
+            self.assertEqual(leer.call_count, 1)
+
+    def test_ordering_with_archive(self):
+        from datetime import datetime
+        from django.utils import timezone
+        from . import archivo_auditoria
+        archivo_auditoria.archivar(meses=3, ahora=self.ahora)
+        # una fila de enero que llega tarde queda en un segundo segmento que se solapa con el primero
+        AuditLog.objects.create(
+            action='prestamo_aceptado', model_name='Prestamo', user=self.admin,
+            created_at=timezone.make_aware(datetime(2026, 1, 2, 12, 0)),
+        )
+        archivo_auditoria.archivar(meses=3, ahora=self.ahora)
+        url = '/api/inventario/auditlogs/'
+        for orden, invertido in (('-created_at', True), ('created_at', False)):
+            fechas = []
+            for pagina in (1, 2, 3):
+                resp = self.client.get(url, {'page_size': 5, 'page': pagina, 'ordering': orden})
+                self.assertEqual(resp.status_code, 200, resp.content)
+                fechas += [r['created_at'] for r in resp.json()['results']]
+            self.assertEqual(len(fechas), 12)
+            self.assertEqual(fechas, sorted(fechas, reverse=invertido))
+        self.assertEqual(self.client.get(url, {'ordering': 'created_at'}).json()['results'][0]['created_at'][:10], '2026-01-01')
+
+        resp = self.client.get(url, {'ordering': 'action'})
+        self.assertEqual(resp.status_code, 400)
+        # sin archivo que coincida cualquier orden vale
+        self.assertEqual(self.client.get(url, {'ordering': 'action', 'created_from': self.ahora.isoformat()}).status_code, 200)
+
+
+class VencimientosTests(APITestCase):
+    def setUp(self):
+        from datetime import date, timedelta
+        self.hoy = date(2026, 6, 15)
+        self.d1 = Drogueria.objects.create(codigo='V1', nombre='Venc 1')
+        self.d2 = Drogueria.objects.create(codigo='V2', nombre='Venc 2')
+
+        def med(nombre, dias, drog=self.d1, stock=10):
+            return Medicamento.objects.create(
+                nombre=nombre, precio_venta=1.0, stock_actual=stock, drogueria=drog,
+                fecha_vencimiento=self.hoy + timedelta(days=dias),
+            )
+
+        self.vencido = med('Vencido', -3)
+        self.en_20 = med('En20', 20, self.d2)
+        self.en_45 = med('En45', 45)
+        self.en_90 = med('En90', 90)
+        med('Lejano', 200)
+        med('SinStock', -10, stock=0)
+
+    def test_scan_creates_deduplicated_alerts_in_few_queries(self):
+        from .vencimientos import escanear
+        # guardar un vencido ya no consulta ni crea alertas
+        self.assertFalse(Alerta.objects.filter(tipo='vencido').exists())
+
+        with self.assertNumQueries(3):  # candidatos, pendientes y bulk_create
+            informe = escanear(hoy=self.hoy)
+        self.assertEqual(informe['revisados'], 4)
+        self.assertEqual(informe['alertas_creadas'], 4)
+        self.assertEqual((informe['vencidos'], informe['por_vencer_30'], informe['por_vencer_60'], informe['por_vencer_90']), (1, 1, 1, 1))
+        self.assertEqual(Alerta.objects.get(medicamento=self.vencido).nivel, 'danger')
+        alerta_20 = Alerta.objects.get(medicamento=self.en_20)
+        self.assertEqual((alerta_20.tipo, alerta_20.ventana_dias, alerta_20.drogueria_id), ('por_vencer', 30, self.d2.id))
+
+        # repetir el escaneo no duplica
+        self.assertEqual(escanear(hoy=self.hoy)['alertas_creadas'], 0)
+
+        # 20 días después solo En45 cambia de ventana (60 -> 30)
+        from datetime import timedelta
+        despues = self.hoy + timedelta(days=20)
+        self.assertEqual(escanear(hoy=despues)['alertas_creadas'], 1)
+        self.assertTrue(Alerta.objects.filter(medicamento=self.en_45, ventana_dias=30).exists())
+
+        # una alerta leída se vuelve a generar si el problema sigue
+        Alerta.objects.filter(medicamento=self.vencido).update(leido=True)
+        self.assertEqual(escanear(hoy=despues)['alertas_creadas'], 1)
+
+
+class ExportacionTests(APITestCase):
+    def setUp(self):
+        self.emp = Usuario.objects.create_user(username='export', password='x', email='export@example.com', rol='empleado')
+        self.d1 = Drogueria.objects.create(codigo='E1', nombre='Export 1')
+        self.d2 = Drogueria.objects.create(codigo='E2', nombre='Export 2')
+        for i in range(25):
+            med = Medicamento.objects.create(
+                nombre=f'Exp {i}', descripcion='con "comillas", y comas', precio_venta=1.5,
+                stock_actual=100, drogueria=self.d1 if i % 2 else self.d2,
+            )
+            MovimientoInventario.objects.create(medicamento=med, drogueria=med.drogueria, tipo_movimiento='salida', cantidad=i + 1)
+        self.client.force_authenticate(self.emp)
+
+    def _contenido(self, resp):
+        self.assertTrue(resp.streaming)
+        return b''.join(resp.streaming_content)
+
+    def test_ndjson_honours_filters(self):
+        resp = self.client.get(f'/api/inventario/medicamentos-crud/exportar/?drogueria={self.d1.id}')
+        self.assertEqual(resp.status_code, 200)
+        self.assertTrue(resp['Content-Type'].startswith('application/x-ndjson'))
+        filas = [json.loads(l) for l in self._contenido(resp).decode('utf-8').splitlines()]
+        self.assertEqual(len(filas), 12)
+        self.assertEqual({f['drogueria__nombre'] for f in filas}, {'Export 1'})
+        self.assertEqual(filas[0]['precio_venta'], '1.50')
+        self.assertEqual([f['id'] for f in filas], sorted(f['id'] for f in filas))
+
+    def test_csv_and_gzip(self):
+        import csv
+        import gzip
+        import io
+        resp = self.client.get('/api/inventario/movimientos/exportar/?formato=csv&gzip=1&tipo_movimiento=salida')
+        self.assertEqual(resp['Content-Type'], 'application/gzip')
+        self.assertIn('.csv.gz', resp['Content-Disposition'])
+        texto = gzip.decompress(self._contenido(resp)).decode('utf-8')
+        filas = list(csv.DictReader(io.StringIO(texto)))
+        self.assertEqual(len(filas), 25)
+        self.assertEqual(sum(int(f['cantidad']) for f in filas), sum(range(1, 26)))
+
+        resp = self.client.get('/api/inventario/medicamentos-crud/exportar/?formato=csv')
+        filas = list(csv.DictReader(io.StringIO(self._contenido(resp).decode('utf-8'))))
+        self.assertEqual(filas[0]['descripcion'], 'con "comillas", y comas')
+
+    def test_requires_staff(self):
+        self.client.force_authenticate(None)
+        self.assertIn(self.client.get('/api/inventario/movimientos/exportar/').status_code, (401, 403))
+
+
+class ImportacionTests(APITestCase):
+    def setUp(self):
+        from .models import Categoria, ResumenInventario
+        self.ResumenInventario = ResumenInventario
+        self.emp = Usuario.objects.create_user(username='import', password='x', email='import@example.com', rol='empleado')
+        self.d1 = Drogueria.objects.create(codigo='I1', nombre='Import Uno')
+        self.d2 = Drogueria.objects.create(codigo='I2', nombre='Import Dos')
+        self.cat = Categoria.objects.create(nombre='Analgésicos')
+        self.existente = Medicamento.objects.create(nombre='Dolex', precio_venta=5, stock_actual=3, drogueria=self.d1)
+        self.client.force_authenticate(self.emp)
+
+    def _subir(self, texto, nombre='inventario.csv'):
+        from django.core.files.uploadedfile import SimpleUploadedFile
+        archivo = SimpleUploadedFile(nombre, texto.encode('utf-8'), content_type='text/csv')
+        return self.client.post('/api/inventario/medicamentos-crud/importar/', {'archivo': archivo}, format='multipart')
+
+    def test_upsert_and_row_errors(self):
+        texto = (
+            'nombre,drogueria,categoria,precio_venta,stock_actual,fecha_vencimiento\n'
+            'Dolex,I1,analgésicos,7.50,40,2027-01-31\n'          # actualiza el existente
+            'Dolex,Import Dos,,6,10,\n'                           # mismo nombre, otra droguería: nuevo
+            'Advil,I1,Analgésicos,"12,5",5,\n'                    # coma decimal
+            'Malo,I9,,3,1,\n'                                     # droguería desconocida
+            'Sin precio,I1,,,1,\n'
+            'Raro,I1,Inexistente,3,-2,31/12/2027\n'
+            'Advil,I1,Analgésicos,13,6,\n'                        # repetido: gana esta fila
+        )
+        resp = self._subir(texto)
+        self.assertEqual(resp.status_code, 200, resp.content)
+        data = resp.json()
+        self.assertEqual((data['filas'], data['importadas'], data['errores_total']), (7, 3, 4))
+        errores = {e['fila']: e['errores'] for e in data['errores']}
+        self.assertIn('drogueria', errores[5])
+        self.assertIn('precio_venta', errores[6])
+        self.assertEqual(set(errores[7]), {'categoria', 'stock_actual', 'fecha_vencimiento'})
+        self.assertIn('nombre', errores[4])  # Advil de la fila 4, reemplazado por la 8
+
+        self.existente.refresh_from_db()
+        self.assertEqual((str(self.existente.precio_venta), self.existente.stock_actual), ('7.50', 40))
+        self.assertEqual(self.existente.categoria, self.cat)
+        self.assertEqual(str(self.existente.fecha_vencimiento), '2027-01-31')
+        advil = Medicamento.objects.get(nombre='Advil', drogueria=self.d1)
+        self.assertEqual((advil.precio_venta, advil.stock_actual, advil.stock_minimo), (13, 6, 10))
+        self.assertTrue(Medicamento.objects.filter(nombre='Dolex', drogueria=self.d2, categoria=None).exists())
+        self.assertEqual(Medicamento.objects.count(), 3)
+
+        # el resumen se reconstruye (bulk_create no emite señales)
+        fila = self.ResumenInventario.objects.get(drogueria=self.d1, categoria=self.cat)
+        self.assertEqual((fila.skus, fila.unidades), (2, 46))
+
+    def test_columns_not_in_file_are_kept(self):
+        self.existente.descripcion = 'tabletas'
+        self.existente.save()
+        resp = self._subir('nombre;drogueria;precio_venta\nDolex;I1;9\n')
+        self.assertEqual(resp.json()['importadas'], 1)
+        self.existente.refresh_from_db()
+        self.assertEqual((self.existente.precio_venta, self.existente.stock_actual, self.existente.descripcion), (9, 3, 'tabletas'))
+
+    def test_chunks_and_missing_columns(self):
+        from io import BytesIO
+        from .importar import ArchivoInvalido, importar
+        filas = ''.join(f'Med {i},I2,{i}\n' for i in range(25))
+        resultado = importar(BytesIO(('nombre,drogueria,precio_venta\n' + filas).encode()), chunk=10)
+        self.assertEqual(resultado['importadas'], 25)
+        self.assertEqual(Medicamento.objects.filter(drogueria=self.d2).count(), 25)
+
+        resp = self._subir('nombre,precio_venta\nX,1\n')
+        self.assertEqual(resp.status_code, 400)
+        self.assertIn('drogueria', resp.json()['detail'])
+        with self.assertRaises(ArchivoInvalido):
+            importar(BytesIO(b'nombre\nX\n'))
+
+    def test_legacy_encodings_and_undecodable_files(self):
+        from io import BytesIO
+        from unittest import mock
+        from django.core.files.uploadedfile import SimpleUploadedFile
+        from . import importar
+        # lo que guarda Excel en Windows: cp1252
+        texto = 'nombre;drogueria;precio_venta;descripcion\nAcetaminofén niños;I1;4;Jarabe pediátrico ñandú\n'
+        archivo = SimpleUploadedFile('excel.csv', texto.encode('cp1252'), content_type='text/csv')
+        resp = self.client.post('/api/inventario/medicamentos-crud/importar/', {'archivo': archivo}, format='multipart')
+        self.assertEqual(resp.status_code, 200, resp.content)
+        self.assertEqual(resp.json()['importadas'], 1)
+        med = Medicamento.objects.get(drogueria=self.d1, nombre='Acetaminofén niños')
+        self.assertEqual(med.descripcion, 'Jarabe pediátrico ñandú')
+
+        # UTF-8 en la muestra y bytes sueltos más adelante: 400, no 500, y nada escrito
+        filas = ''.join(f'Mëd {i},I2,1\n' for i in range(2000))
+        datos = ('nombre,drogueria,precio_venta\n' + filas).encode() + b'Mal\xff\xfe,I2,1\n'
+        with mock.patch.object(importar, 'MUESTRA', 40), self.assertRaises(importar.ArchivoInvalido):
+            importar.importar(BytesIO(datos), chunk=100)
+        self.assertFalse(Medicamento.objects.filter(drogueria=self.d2).exists())
+        self.assertEqual(sum(self.ResumenInventario.objects.filter(drogueria=self.d1).values_list('skus', flat=True)), 2)
+        self.assertFalse(self.ResumenInventario.objects.filter(drogueria=self.d2).exists())
+
+    def test_xlsx_import(self):
+        from django.core.files.uploadedfile import SimpleUploadedFile
+        from io import BytesIO
+        from openpyxl import Workbook
+        libro = Workbook()
+        hoja = libro.active
+        hoja.append(['Nombre', 'Drogueria', 'Precio venta', 'Stock actual', 'fecha_vencimiento'])
+        hoja.append(['Dolex', 'I1', 8.25, 12, None])
+        hoja.append([None, None, None, None, None])  # fila vacía: se ignora
+        hoja.append(['Noxpirin', 'Import Dos', 3, None, '2027-06-30'])
+        contenido = BytesIO()
+        libro.save(contenido)
+        archivo = SimpleUploadedFile('inventario.xlsx', contenido.getvalue())
+        resp = self.client.post('/api/inventario/medicamentos-crud/importar/', {'archivo': archivo}, format='multipart')
+        self.assertEqual(resp.status_code, 200, resp.content)
+        self.assertEqual((resp.json()['filas'], resp.json()['importadas']), (2, 2))
+        self.existente.refresh_from_db()
+        self.assertEqual((str(self.existente.precio_venta), self.existente.stock_actual), ('8.25', 12))
+        nuevo = Medicamento.objects.get(nombre='Noxpirin', drogueria=self.d2)
+        self.assertEqual(str(nuevo.fecha_vencimiento), '2027-06-30')
+
+    def test_requires_staff_and_file(self):
+        self.assertEqual(self.client.post('/api/inventario/medicamentos-crud/importar/', {}, format='multipart').status_code, 400)
+        self.client.force_authenticate(None)
+        self.assertIn(self._subir('nombre,drogueria,precio_venta\n').status_code, (401, 403))
+
+
+class PrestamoLoteTests(APITestCase):
+    def setUp(self):
+        self.owner = Usuario.objects.create_user(username='lote_owner', password='x', email='lo@example.com')
+        self.ajeno = Usuario.objects.create_user(username='lote_ajeno', password='x', email='la@example.com')
+        self.d1 = Drogueria.objects.create(codigo='L1', nombre='Lote 1', propietario=self.owner)
+        self.d2 = Drogueria.objects.create(codigo='L2', nombre='Lote 2', propietario=self.owner)
+        self.d3 = Drogueria.objects.create(codigo='L3', nombre='Lote 3', propietario=self.ajeno)
+        self.d4 = Drogueria.objects.create(codigo='L4', nombre='Lote 4', propietario=self.ajeno)
+        self.m1 = Medicamento.objects.create(nombre='Ibuprofeno', precio_venta=4, stock_actual=20, stock_minimo=5, drogueria=self.d1)
+        self.m2 = Medicamento.objects.create(nombre='Ibuprofeno', precio_venta=4, stock_actual=1, drogueria=self.d2)
+        self.m3 = Medicamento.objects.create(nombre='Loratadina', precio_venta=3, stock_actual=8, stock_minimo=1, drogueria=self.d1)
+        self.m4 = Medicamento.objects.create(nombre='Naproxeno', precio_venta=3, stock_actual=9, drogueria=self.d3)
+
+    def _prestamo(self, med, cantidad, destino, **kwargs):
+        p = Prestamo.objects.create(medicamento_origen=med, cantidad=cantidad, origen=med.drogueria, destino=destino, **kwargs)
+        p.reservar()
+        return p
+
+    def _resumen(self):
+        from .models import ResumenInventario
+        return sorted(ResumenInventario.objects.values_list('drogueria_id', 'categoria_id', 'skus', 'unidades', 'unidades_reservadas', 'bajo_stock'))
+
+    def test_accept_batch(self):
+        from . import resumen
+        p1 = self._prestamo(self.m1, 6, self.d2)                    # destino existente por nombre
+        p2 = self._prestamo(self.m1, 4, self.d2, medicamento_destino=self.m2)
+        p3 = self._prestamo(self.m3, 2, self.d2)                    # crea Loratadina en d2
+        p4 = self._prestamo(self.m3, 1, self.d2)                    # reutiliza la recién creada
+        ya = self._prestamo(self.m1, 1, self.d2)
+        ya.rechazar()
+        ajeno = self._prestamo(self.m4, 1, self.d4)
+
+        self.client.force_authenticate(self.owner)
+        resp = self.client.post('/api/inventario/prestamos/lote/', {
+            'accion': 'accept', 'ids': [p4.id, p1.id, p2.id, p3.id, ya.id, ajeno.id, 999999],
+        }, format='json')
+        self.assertEqual(resp.status_code, 200, resp.content)
+        data = resp.json()
+        self.assertEqual(data['procesados'], sorted([p1.id, p2.id, p3.id, p4.id]))
+        self.assertEqual(set(data['errores']), {str(ya.id), str(ajeno.id), '999999'})
+        self.assertEqual(data['errores'][str(ajeno.id)], 'No autorizado')
+
+        for m in (self.m1, self.m2, self.m3, self.m4):
+            m.refresh_from_db()
+        self.assertEqual((self.m1.stock_actual, self.m1.stock_reservado), (10, 0))
+        self.assertEqual(self.m2.stock_actual, 11)
+        self.assertEqual((self.m3.stock_actual, self.m3.stock_reservado), (5, 0))
+        self.assertEqual(self.m4.stock_reservado, 1)  # el ajeno no se tocó
+        lora = Medicamento.objects.get(nombre='Loratadina', drogueria=self.d2)
+        self.assertEqual((lora.stock_actual, lora.precio_venta), (3, 3))
+
+        for p in (p1, p2, p3, p4):
+            p.refresh_from_db()
+            self.assertEqual((p.estado, p.respondedor), ('accepted', self.owner))
+        self.assertEqual({p1.medicamento_destino_id, p2.medicamento_destino_id}, {self.m2.id})
+        self.assertEqual({p3.medicamento_destino_id, p4.medicamento_destino_id}, {lora.id})
+
+        self.assertEqual(MovimientoInventario.objects.filter(tipo_movimiento='salida').count(), 4)
+        self.assertEqual(MovimientoInventario.objects.filter(tipo_movimiento='entrada', drogueria=self.d2).count(), 4)
+        self.assertEqual(AuditLog.objects.filter(action='prestamo_aceptado').count(), 4)
+        self.assertEqual(AuditLog.objects.filter(action='movimiento_creado').count(), 8)
+        self.assertEqual(Alerta.objects.filter(tipo='prestamo', drogueria=self.d2).count(), 4)
+        self.assertFalse(Alerta.objects.filter(tipo='low_stock', medicamento=self.m1).exists())
+
+        # el resumen mantenido a mano coincide con una reconstrucción completa
+        antes = self._resumen()
+        resumen.reconstruir()
+        self.assertEqual(antes, self._resumen())
+
+    def test_insufficient_stock_skips_only_that_loan(self):
+        p1 = self._prestamo(self.m3, 5, self.d2)
+        p2 = self._prestamo(self.m3, 2, self.d2)
+        p3 = self._prestamo(self.m3, 1, self.d4)
+        Medicamento.objects.filter(pk=self.m3.pk).update(stock_actual=5)  # venta por fuera de la reserva
+        from .prestamos import responder_lote
+        resultado = responder_lote([p1.id, p2.id, p3.id], 'accept', self.owner)
+        self.assertEqual(resultado['procesados'], [p1.id])
+        self.assertIn('Stock insuficiente', resultado['errores'][p2.id])
+        # la rechazada no deja un producto vacío en su destino
+        self.assertIn('Stock insuficiente', resultado['errores'][p3.id])
+        self.assertFalse(Medicamento.objects.filter(drogueria=self.d4).exists())
+        self.assertTrue(Medicamento.objects.filter(nombre='Loratadina', drogueria=self.d2, stock_actual=5).exists())
+        self.m3.refresh_from_db()
+        self.assertEqual((self.m3.stock_actual, self.m3.stock_reservado), (0, 3))
+        self.assertTrue(Alerta.objects.filter(tipo='low_stock', medicamento=self.m3).exists())
+        p2.refresh_from_db()
+        self.assertEqual(p2.estado, 'pending')
+
+    def test_reject_batch_releases_reservations(self):
+        prestamos = [self._prestamo(self.m1, 2, self.d2) for _ in range(3)]
+        self.client.force_authenticate(self.owner)
+        resp = self.client.post('/api/inventario/prestamos/lote/', {
+            'accion': 'reject', 'ids': [p.id for p in prestamos], 'nota': 'sin transporte',
+        }, format='json')
+        self.assertEqual(resp.json()['procesados'], [p.id for p in prestamos])
+        self.m1.refresh_from_db()
+        self.assertEqual((self.m1.stock_actual, self.m1.stock_reservado), (20, 0))
+        self.assertEqual(set(Prestamo.objects.values_list('estado', 'nota')), {('rejected', 'sin transporte')})
+        self.assertEqual(MovimientoInventario.objects.count(), 0)
+        self.assertEqual(AuditLog.objects.filter(action='prestamo_rechazado').count(), 3)
+
+    def test_queries_do_not_grow_with_batch(self):
+        from django.db import connection
+        from django.test.utils import CaptureQueriesContext
+        from .prestamos import responder_lote
+
+        def medir(n):
+            ids = [self._prestamo(self.m1, 1, self.d2).id for _ in range(n)]
+            with CaptureQueriesContext(connection) as ctx:
+                self.assertEqual(len(responder_lote(ids, 'accept', self.owner)['procesados']), n)
+            return len(ctx)
+
+        self.assertEqual(medir(2), medir(10))
+
+    def test_invalid_payload(self):
+        self.client.force_authenticate(self.owner)
+        self.assertEqual(self.client.post('/api/inventario/prestamos/lote/', {'accion': 'borrar', 'ids': [1]}, format='json').status_code, 400)
+        self.assertEqual(self.client.post('/api/inventario/prestamos/lote/', {'accion': 'accept', 'ids': []}, format='json').status_code, 400)
+
+
+class TransferenciaTests(APITestCase):
+    def setUp(self):
+        from .models import OrdenTransferencia
+        self.OrdenTransferencia = OrdenTransferencia
+        self.owner = Usuario.objects.create_user(username='transf', password='x', email='transf@example.com')
+        self.otro = Usuario.objects.create_user(username='transf2', password='x', email='transf2@example.com')
+        self.d1 = Drogueria.objects.create(codigo='T1', nombre='Transf 1', propietario=self.owner)
+        self.d2 = Drogueria.objects.create(codigo='T2', nombre='Transf 2', propietario=self.owner)
+        self.meds = [
+            Medicamento.objects.create(nombre=f'Trans {i}', precio_venta=2, stock_actual=10, stock_minimo=3, drogueria=self.d1)
+            for i in range(6)
+        ]
+        self.dest0 = Medicamento.objects.create(nombre='Trans 0', precio_venta=2, stock_actual=1, drogueria=self.d2)
+        self.client.force_authenticate(self.owner)
+
+    def _crear(self, lineas):
+        return self.client.post('/api/inventario/transferencias/', {
+            'origen': self.d1.id, 'destino': self.d2.id, 'lineas': lineas,
+        }, format='json')
+
+    def _resumen(self):
+        from .models import ResumenInventario
+        return sorted(ResumenInventario.objects.values_list('drogueria_id', 'categoria_id', 'skus', 'unidades', 'unidades_reservadas', 'bajo_stock'))
+
+    def test_create_reserves_and_accept_moves_all_lines(self):
+        from . import resumen
+        lineas = [{'medicamento_origen': m.id, 'cantidad': 2} for m in self.meds[:4]]
+        lineas.append({'medicamento_origen': self.meds[0].id, 'cantidad': 1})  # repetido: se suma
+        resp = self._crear(lineas)
+        self.assertEqual(resp.status_code, 201, resp.content)
+        self.assertEqual(len(resp.json()['lineas']), 4)
+        orden_id = resp.json()['id']
+        self.assertEqual(
+            list(Medicamento.objects.filter(pk__in=[m.id for m in self.meds[:4]]).order_by('pk').values_list('stock_reservado', flat=True)),
+            [3, 2, 2, 2],
+        )
+
+        resp = self.client.post(f'/api/inventario/transferencias/{orden_id}/accept/')
+        self.assertEqual(resp.status_code, 200, resp.content)
+        origen = list(Medicamento.objects.filter(pk__in=[m.id for m in self.meds[:4]]).order_by('pk').values_list('stock_actual', 'stock_reservado'))
+        self.assertEqual(origen, [(7, 0), (8, 0), (8, 0), (8, 0)])
+        self.dest0.refresh_from_db()
+        self.assertEqual(self.dest0.stock_actual, 4)
+        self.assertEqual(Medicamento.objects.filter(drogueria=self.d2).count(), 4)  # tres creadas
+        self.assertEqual(MovimientoInventario.objects.filter(observacion=f'Transferencia {orden_id}').count(), 8)
+        self.assertTrue(Alerta.objects.filter(tipo='transferencia', drogueria=self.d2).exists())
+        self.assertEqual(self.OrdenTransferencia.objects.get(pk=orden_id).estado, 'accepted')
+        self.assertFalse(self.OrdenTransferencia.objects.get(pk=orden_id).lineas.filter(medicamento_destino=None).exists())
+
+        resp = self.client.post(f'/api/inventario/transferencias/{orden_id}/accept/')
+        self.assertEqual(resp.status_code, 400)
+
+        antes = self._resumen()
+        resumen.reconstruir()
+        self.assertEqual(antes, self._resumen())
+
+    def test_create_is_all_or_nothing(self):
+        Medicamento.objects.filter(pk=self.meds[2].pk).update(stock_reservado=9)
+        resp = self._crear([
+            {'medicamento_origen': self.meds[1].id, 'cantidad': 5},
+            {'medicamento_origen': self.meds[2].id, 'cantidad': 5},
+        ])
+        self.assertEqual(resp.status_code, 400)
+        self.assertEqual(list(resp.json()['lineas']), [str(self.meds[2].id)])
+        self.assertEqual(Medicamento.objects.get(pk=self.meds[1].pk).stock_reservado, 0)
+        self.assertFalse(self.OrdenTransferencia.objects.exists())
+
+        resp = self._crear([{'medicamento_origen': self.dest0.id, 'cantidad': 1}])
+        self.assertEqual(resp.status_code, 400)
+        self.assertIn('origen', resp.json()['lineas'][str(self.dest0.id)])
+
+    def test_reject_releases_and_permissions(self):
+        orden_id = self._crear([{'medicamento_origen': m.id, 'cantidad': 4} for m in self.meds[:3]]).json()['id']
+        self.client.force_authenticate(self.otro)
+        self.assertEqual(self.client.post(f'/api/inventario/transferencias/{orden_id}/reject/').status_code, 404)
+        self.client.force_authenticate(self.owner)
+        resp = self.client.post(f'/api/inventario/transferencias/{orden_id}/reject/', {'nota': 'no cabe'}, format='json')
+        self.assertEqual(resp.json()['estado'], 'rejected')
+        self.assertEqual(set(Medicamento.objects.filter(drogueria=self.d1).values_list('stock_actual', 'stock_reservado')), {(10, 0)})
+        self.assertEqual(self.OrdenTransferencia.objects.get(pk=orden_id).nota, 'no cabe')
+
+        orden_id = self._crear([{'medicamento_origen': self.meds[0].id, 'cantidad': 1}]).json()['id']
+        self.assertEqual(self.client.post(f'/api/inventario/transferencias/{orden_id}/cancel/').json()['estado'], 'cancelled')
+        self.assertEqual(Medicamento.objects.get(pk=self.meds[0].pk).stock_reservado, 0)
+
+    def test_query_count_independent_of_lines(self):
+        from django.db import connection
+        from django.test.utils import CaptureQueriesContext
+        from . import transferencias
+
+        def medir(meds):
+            with CaptureQueriesContext(connection) as crear:
+                orden = transferencias.crear(self.d1, self.d2, [
+                    {'medicamento_origen_id': m.id, 'cantidad': 1} for m in meds
+                ], usuario=self.owner)
+            with CaptureQueriesContext(connection) as aceptar:
+                transferencias.aceptar(orden.pk, self.owner)
+            return len(crear), len(aceptar)
+
+        self.assertEqual(medir(self.meds[:2]), medir(self.meds[2:6]))
+
+
+class PronosticoTests(APITestCase):
+    def setUp(self):
+        self.empleado = Usuario.objects.create_user(username='pro_emp', password='x', email='pro@example.com', rol='empleado')
+        self.d1 = Drogueria.objects.create(codigo='PR1', nombre='Pronóstico')
+
+    def test_estimate_is_daily_demand_and_reorder_point(self):
+        import math
+        from .pronostico import estimar
+        # sku 5: 2 por día los 28 días (dos movimientos el último); sku 9: 14 unidades un solo día
+        medicamentos = [5] * 29 + [9]
+        dias_idx = list(range(28)) + [27, 0]
+        cantidades = [2] * 27 + [1, 1, 14]
+        ids, media, desviacion, punto = estimar(medicamentos, dias_idx, cantidades, dias=28, plazo=7, z=1.65, dias_min=7)
+        self.assertEqual(ids.tolist(), [5, 9])
+        self.assertEqual(media.tolist(), [2.0, 0.5])
+        self.assertAlmostEqual(desviacion[0], 0)
+        self.assertAlmostEqual(desviacion[1], math.sqrt(14 ** 2 / 28 - 0.25))
+        self.assertEqual(punto.tolist(), [14, math.ceil(3.5 + 1.65 * desviacion[1] * math.sqrt(7))])
+
+        # un SKU nuevo se promedia desde su primera venta, no sobre toda la ventana
+        _, media, _, _ = estimar([3, 3], [20, 27], [4, 4], dias=28, dias_min=7)
+        self.assertEqual(media.tolist(), [1.0])
+
+    def test_job_updates_automatic_thresholds_and_alerts(self):
+        from datetime import timedelta
+        from django.utils import timezone
+        from .models import ResumenInventario
+        from .pronostico import calcular
+        auto, manual, sin_ventas = (
+            Medicamento.objects.create(nombre=n, precio_venta=1, stock_actual=50, drogueria=self.d1, stock_minimo_auto=a)
+            for n, a in (('PR-auto', True), ('PR-manual', False), ('PR-sin', True))
+        )
+        ahora = timezone.now()
+        MovimientoInventario.objects.bulk_create(
+            MovimientoInventario(medicamento=m, drogueria=self.d1, tipo_movimiento='salida', cantidad=10,
+                                 fecha_movimiento=ahora - timedelta(days=d))
+            for m in (auto, manual) for d in range(28)
+        )
+
+        simulado = calcular(dias=60, plazo=7, z=1.65, escribir=False)
+        self.assertEqual((simulado['skus_con_historia'], simulado['actualizados']), (2, 1))
+        self.assertEqual(Medicamento.objects.get(pk=auto.pk).stock_minimo, 10)
+
+        informe = calcular(dias=60, plazo=7, z=1.65)
+        self.assertEqual((informe['actualizados'], informe['alertas_creadas']), (1, 1))
+        minimos = dict(Medicamento.objects.values_list('nombre', 'stock_minimo'))
+        self.assertEqual(minimos, {'PR-auto': 70, 'PR-manual': 10, 'PR-sin': 10})
+        self.assertEqual(Medicamento.objects.get(pk=auto.pk).verificar_stock(), "Bajo stock ⚠️")
+        self.assertTrue(Alerta.objects.filter(tipo='low_stock', medicamento=auto).exists())
+        self.assertEqual(ResumenInventario.objects.get(drogueria=self.d1).bajo_stock, 1)
+        self.assertEqual(calcular(dias=60, plazo=7, z=1.65)['actualizados'], 0)
+
+    def test_history_is_summed_per_local_day(self):
+        from datetime import datetime, time, timedelta
+        from django.utils import timezone
+        from .pronostico import _historial
+        med = Medicamento.objects.create(nombre='PR-hist', precio_venta=1, stock_actual=500, drogueria=self.d1)
+        hoy = timezone.localdate()
+
+        def a_las(dias_atras, hora):
+            return timezone.make_aware(datetime.combine(hoy - timedelta(days=dias_atras), hora))
+        MovimientoInventario.objects.bulk_create(
+            MovimientoInventario(medicamento=med, tipo_movimiento=tipo, cantidad=n, fecha_movimiento=fecha)
+            for tipo, n, fecha in (
+                ('salida', 2, a_las(2, time.min)), ('salida', 3, a_las(2, time.max)),  # mismo día local
+                ('salida', 4, a_las(1, time(12))),
+                ('entrada', 50, a_las(1, time(13))),
+                ('salida', 6, a_las(-3, time(9))),   # fecha futura: cuenta como de hoy
+                ('salida', 9, a_las(10, time(9))),   # fuera de la ventana
+            )
+        )
+        medicamentos, dias_idx, totales = _historial(5, hoy)
+        self.assertEqual(
+            sorted(zip(medicamentos.tolist(), dias_idx.tolist(), totales.tolist())),
+            [(med.pk, 2, 5.0), (med.pk, 3, 4.0), (med.pk, 4, 6.0)],
+        )
+
+    def test_manual_edit_opts_out(self):
+        med = Medicamento.objects.create(nombre='PR-edit', precio_venta=1, stock_actual=5, drogueria=self.d1)
+        self.client.force_authenticate(self.empleado)
+        resp = self.client.patch(f'/api/inventario/medicamentos-crud/{med.pk}/', {'stock_minimo': 3}, format='json')
+        self.assertEqual(resp.status_code, 200, resp.content)
+        self.assertFalse(resp.json()['stock_minimo_auto'])
+
+
+class RebalanceoTests(APITestCase):
+    def setUp(self):
+        self.admin = Usuario.objects.create_user(username='reb_admin', password='x', email='reb@example.com', rol='admin')
+        self.otro = Usuario.objects.create_user(username='reb_otro', password='x', email='reb2@example.com')
+        self.d1 = Drogueria.objects.create(codigo='RB1', nombre='Rebalanceo 1')
+        self.d2 = Drogueria.objects.create(codigo='RB2', nombre='Rebalanceo 2')
+        self.d3 = Drogueria.objects.create(codigo='RB3', nombre='Rebalanceo 3', propietario=self.otro)
+
+        def med(drogueria, nombre, stock, minimo, codigo=None):
+            return Medicamento.objects.create(
+                nombre=nombre, codigo_barra=codigo, precio_venta=1, stock_actual=stock, stock_minimo=minimo, drogueria=drogueria
+            )
+        # amoxicilina: sobra en d1 (nivel objetivo ⌈10·1.5⌉ = 15), falta en d2 y, sin código, en d3
+        self.amox = med(self.d1, 'Amoxicilina 500', 100, 10, ' 7701234 ')
+        self.amox2 = med(self.d2, 'Amoxicilina 500', 2, 10, '7701234')
+        self.amox3 = med(self.d3, ' amoxicilina   500', 0, 4)
+        # ibuprofeno: d1 solo puede dar 5 sin bajar de su nivel objetivo
+        self.ibu = med(self.d1, 'Ibuprofeno', 20, 10, '8800')
+        self.ibu2 = med(self.d2, 'Ibuprofeno', 0, 10, '8800')
+        self.client.force_authenticate(self.admin)
+
+    def test_assign_covers_most_urgent_first_without_exceeding(self):
+        from .rebalanceo import asignar
+        # producto 0: donantes 0 (4) y 1 (6); receptores 2 (urgencia .5, pide 5) y 3 (urgencia 0, pide 7)
+        # producto 1: un donante sin receptores
+        origen, destino, cantidad = asignar(
+            producto=[0, 0, 0, 0, 1], sobrante=[4, 6, 0, 0, 9], faltante=[0, 0, 5, 7, 0], urgencia=[1, 1, .5, 0, 1]
+        )
+        self.assertEqual(
+            list(zip(origen.tolist(), destino.tolist(), cantidad.tolist())), [(1, 3, 6), (0, 3, 1), (0, 2, 3)]
+        )
+
+    def _por_par(self, propuestas):
+        return {(p['origen'], p['destino']): p['lineas'] for p in propuestas}
+
+    def test_proposals_match_by_barcode_and_name(self):
+        resp = self.client.get('/api/inventario/transferencias/rebalanceo/')
+        self.assertEqual(resp.status_code, 200, resp.content)
+        datos = resp.json()
+        por_par = self._por_par(datos['propuestas'])
+        self.assertEqual(set(por_par), {(self.d1.id, self.d2.id), (self.d1.id, self.d3.id)})
+        self.assertEqual(
+            sorted((l['medicamento_origen'], l['medicamento_destino'], l['cantidad']) for l in por_par[(self.d1.id, self.d2.id)]),
+            [(self.amox.id, self.amox2.id, 13), (self.ibu.id, self.ibu2.id, 5)],
+        )
+        self.assertEqual(
+            por_par[(self.d1.id, self.d3.id)],
+            [{'medicamento_origen': self.amox.id, 'medicamento_destino': self.amox3.id, 'cantidad': 6}],
+        )
+        self.assertEqual(datos['unidades'], 24)
+
+        resp = self.client.get('/api/inventario/transferencias/rebalanceo/', {'droguerias': f'{self.d1.id},{self.d2.id}', 'minimo': 6})
+        self.assertEqual(self._por_par(resp.json()['propuestas']), {
+            (self.d1.id, self.d2.id): [{'medicamento_origen': self.amox.id, 'medicamento_destino': self.amox2.id, 'cantidad': 13}],
+        })
+
+    def test_submit_proposals_in_bulk_reserves_stock(self):
+        propuestas = self.client.get('/api/inventario/transferencias/rebalanceo/').json()['propuestas']
+        resp = self.client.post('/api/inventario/transferencias/lote/', {'propuestas': propuestas}, format='json')
+        self.assertEqual(resp.status_code, 200, resp.content)
+        self.assertEqual(len(resp.json()['creadas']), 2)
+        self.assertEqual(resp.json()['errores'], {})
+        self.amox.refresh_from_db()
+        self.ibu.refresh_from_db()
+        self.assertEqual((self.amox.stock_reservado, self.ibu.stock_reservado), (19, 5))
+        # lo reservado ya no se vuelve a proponer
+        self.assertEqual(self.client.get('/api/inventario/transferencias/rebalanceo/').json()['propuestas'], [])
+
+    def test_two_receivers_of_one_product_in_a_branch_get_their_own_lines(self):
+        from .models import LineaTransferencia
+        # otra fila del mismo producto (mismo código) en d2: cada una recibe lo suyo, en su propia línea
+        amoxil = Medicamento.objects.create(
+            nombre='Amoxil 500 mg', codigo_barra='7701234', precio_venta=1, stock_actual=1, stock_minimo=2, drogueria=self.d2
+        )
+        propuestas = self.client.get(
+            '/api/inventario/transferencias/rebalanceo/', {'droguerias': f'{self.d1.id},{self.d2.id}'}
+        ).json()['propuestas']
+        lineas = sorted(
+            (l['medicamento_origen'], l['medicamento_destino'], l['cantidad']) for p in propuestas for l in p['lineas']
+        )
+        self.assertEqual(lineas, [(self.amox.id, self.amox2.id, 13), (self.amox.id, amoxil.id, 2), (self.ibu.id, self.ibu2.id, 5)])
+        # el mismo origen no se repite dentro de una orden
+        for p in propuestas:
+            origenes = [l['medicamento_origen'] for l in p['lineas']]
+            self.assertEqual(len(origenes), len(set(origenes)))
+
+        resp = self.client.post('/api/inventario/transferencias/lote/', {'propuestas': propuestas}, format='json')
+        self.assertEqual(len(resp.json()['creadas']), len(propuestas))
+        self.assertEqual(
+            sorted(LineaTransferencia.objects.values_list('medicamento_origen_id', 'medicamento_destino_id', 'cantidad')),
+            lineas,
+        )
+
+    def test_non_admin_only_sees_and_submits_own_branches(self):
+        self.client.force_authenticate(self.otro)
+        resp = self.client.get('/api/inventario/transferencias/rebalanceo/')
+        self.assertEqual(resp.status_code, 200, resp.content)
+        self.assertEqual(resp.json()['propuestas'], [])
+
+        resp = self.client.post('/api/inventario/transferencias/lote/', {'propuestas': [
+            {'origen': self.d1.id, 'destino': self.d2.id, 'lineas': [{'medicamento_origen': self.amox.id, 'cantidad': 1}]},
+            {'origen': self.d1.id, 'destino': self.d3.id, 'lineas': [{'medicamento_origen': self.amox.id, 'cantidad': 1}]},
+        ]}, format='json')
+        self.assertEqual(resp.status_code, 200, resp.content)
+        self.assertEqual(len(resp.json()['creadas']), 1)
+        self.assertEqual(list(resp.json()['errores']), ['0'])
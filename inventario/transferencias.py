@@ -0,0 +1,208 @@
+"""Órdenes de transferencia entre droguerías con varias líneas.
+
+Reabastecer una sucursal con 80 productos eran 80 ``Prestamo``: 80
+reservas y 80 aceptaciones. Una ``OrdenTransferencia`` agrupa las líneas y
+cada paso se hace por conjuntos, con un número de consultas que no depende
+de cuántas líneas tenga la orden:
+
+- ``crear``: valida todas las líneas con una lectura y reserva el stock con
+  ``stock.reservar_varios`` (un ``UPDATE`` condicional por bloque); si
+  alguna línea no tiene disponible no se reserva nada y se informa qué
+  líneas fallaron
+- ``aceptar``: bloquea todos los medicamentos en orden de pk, comprueba la
+  orden completa y mueve el stock (salida, entrada y liberación de la
+  reserva) con ``UPDATE`` por bloques y ``bulk_create`` de movimientos
+- ``rechazar``: libera las reservas de todas las líneas (``stock.liberar_varios``)
+
+Aceptar o rechazar es todo o nada para la orden.
+"""
+from collections import OrderedDict
+
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+from rest_framework.exceptions import ValidationError
+
+from . import auditoria, barcodes, resumen, stock
+from .cache_catalogo import invalidar_catalogo
+from .movimientos import alertas_stock_bajo
+from .prestamos import actualizar_stock, resolver_destinos
+
+LINEAS_MAX = getattr(settings, 'INVENTARIO_TRANSFERENCIA_MAX_LINEAS', 500)
+_BLOQUE = 500
+
+
+class OrdenNoPendiente(ValueError):
+    pass
+
+
+def _invalidar(meds):
+    if not meds:
+        return
+    for m in meds:
+        barcodes.invalidar_medicamento(m)
+    invalidar_catalogo(droguerias={m.drogueria_id for m in meds}, categorias={m.categoria_id for m in meds})
+
+
+def _bloquear(pks):
+    """Bloquea y devuelve ``{pk: Medicamento}``, siempre en orden de clave primaria."""
+    from .models import Medicamento
+    return {m.pk: m for m in Medicamento.objects.select_for_update().filter(pk__in=pks).order_by('pk')}
+
+
+def crear(origen, destino, lineas, usuario=None, nota=None):
+    """Crea la orden y reserva el stock de todas las ``lineas``.
+
+    ``lineas``: dicts con ``medicamento_origen_id``, ``cantidad`` y
+    ``medicamento_destino_id`` opcional; un producto repetido suma sus
+    cantidades. Lanza ``ValidationError`` sin escribir nada si alguna línea
+    no es válida o no tiene stock disponible.
+    """
+    from .models import LineaTransferencia, Medicamento, OrdenTransferencia
+
+    if origen.pk == destino.pk:
+        raise ValidationError({'destino': 'El destino debe ser distinto del origen.'})
+    cantidades, destinos = OrderedDict(), {}
+    for l in lineas:
+        pk = l['medicamento_origen_id']
+        cantidades[pk] = cantidades.get(pk, 0) + l['cantidad']
+        if l.get('medicamento_destino_id'):
+            destinos[pk] = l['medicamento_destino_id']
+
+    meds = Medicamento.objects.in_bulk(set(cantidades) | set(destinos.values()))
+    errores = {}
+    for pk in cantidades:
+        if pk not in meds:
+            errores[pk] = 'No existe'
+        elif meds[pk].drogueria_id != origen.pk:
+            errores[pk] = 'No pertenece a la droguería origen'
+        elif pk in destinos and getattr(meds.get(destinos[pk]), 'drogueria_id', None) != destino.pk:
+            errores[pk] = 'El medicamento_destino no pertenece a la droguería destino'
+    if errores:
+        raise ValidationError({'lineas': errores})
+
+    pks = list(cantidades)
+    with transaction.atomic():
+        try:
+            stock.reservar_varios(cantidades)
+        except stock.StockInsuficiente as e:
+            raise ValidationError({'lineas': {
+                pk: f'Disponible {disponible}, solicitado {cantidades[pk]}' for pk, disponible in e.faltantes.items()
+            } or str(e)})
+
+        orden = OrdenTransferencia.objects.create(origen=origen, destino=destino, solicitante=usuario, nota=nota)
+        LineaTransferencia.objects.bulk_create([
+            LineaTransferencia(
+                orden=orden, medicamento_origen_id=pk, medicamento_destino_id=destinos.get(pk), cantidad=cantidades[pk]
+            )
+            for pk in pks
+        ], batch_size=_BLOQUE)
+
+        auditoria.registrar(
+            'transferencia_creada', model_name='OrdenTransferencia', object_id=orden.pk, user=usuario,
+            message=f"Transferencia {orden.pk}: {len(pks)} productos {origen.codigo} → {destino.codigo}",
+            data={'origen': origen.pk, 'destino': destino.pk, 'lineas': len(pks), 'unidades': sum(cantidades.values())},
+        )
+    return orden
+
+
+def _tomar(orden_id):
+    from .models import OrdenTransferencia
+
+    orden = OrdenTransferencia.objects.select_for_update().select_related('origen', 'destino').get(pk=orden_id)
+    if orden.estado != 'pending':
+        raise OrdenNoPendiente(f'Solo órdenes pendientes pueden responderse (estado: {orden.estado})')
+    return orden, list(orden.lineas.all())
+
+
+def aceptar(orden_id, usuario=None):
+    """Mueve el stock de todas las líneas de la orden. Todo o nada."""
+    from .models import Alerta, AuditLog, LineaTransferencia, Medicamento, MovimientoInventario
+
+    ahora = timezone.now()
+    with transaction.atomic():
+        orden, lineas = _tomar(orden_id)
+        meds_origen = Medicamento.objects.in_bulk({l.medicamento_origen_id for l in lineas})
+        sin_destino = [l for l in lineas if l.medicamento_destino_id is None]
+        creados = resolver_destinos(lineas, meds_origen, lambda l: orden.destino_id)
+
+        meds = _bloquear({l.medicamento_origen_id for l in lineas} | {l.medicamento_destino_id for l in lineas})
+        faltan = {
+            l.medicamento_origen_id: f'Stock {meds[l.medicamento_origen_id].stock_actual}, solicitado {l.cantidad}'
+            for l in lineas if meds[l.medicamento_origen_id].stock_actual < l.cantidad
+        }
+        if faltan:
+            raise ValidationError({'lineas': faltan})
+
+        anteriores = {pk: (None if pk in creados else resumen.valores(m)) for pk, m in meds.items()}
+        deltas = {pk: [0, 0] for pk in meds}
+        for l in lineas:
+            deltas[l.medicamento_origen_id][0] -= l.cantidad
+            deltas[l.medicamento_origen_id][1] -= min(l.cantidad, meds[l.medicamento_origen_id].stock_reservado)
+            deltas[l.medicamento_destino_id][0] += l.cantidad
+        actualizar_stock(deltas)
+        for pk, m in meds.items():
+            m.stock_actual += deltas[pk][0]
+            m.stock_reservado += deltas[pk][1]
+
+        LineaTransferencia.objects.bulk_update(sin_destino, ['medicamento_destino'], batch_size=_BLOQUE)
+        orden.estado, orden.respondedor, orden.fecha_respuesta = 'accepted', usuario, ahora
+        orden.save(update_fields=['estado', 'respondedor', 'fecha_respuesta'])
+
+        observacion = f'Transferencia {orden.pk}'
+        movimientos = MovimientoInventario.objects.bulk_create([
+            MovimientoInventario(
+                medicamento_id=med_id, drogueria_id=drogueria_id, tipo_movimiento=tipo, cantidad=l.cantidad,
+                usuario=usuario, fecha_movimiento=ahora, observacion=observacion,
+            )
+            for l in lineas
+            for med_id, drogueria_id, tipo in (
+                (l.medicamento_origen_id, orden.origen_id, 'salida'),
+                (l.medicamento_destino_id, orden.destino_id, 'entrada'),
+            )
+        ], batch_size=_BLOQUE)
+        AuditLog.objects.bulk_create([
+            AuditLog(
+                action='movimiento_creado', model_name='MovimientoInventario', object_id=mov.pk, user=usuario,
+                message=f"Movimiento {mov.tipo_movimiento} {mov.cantidad} para {meds[mov.medicamento_id].nombre}",
+                data={'medicamento': mov.medicamento_id, 'drogueria': mov.drogueria_id},
+            )
+            for mov in movimientos
+        ] + [
+            AuditLog(
+                action='transferencia_aceptada', model_name='OrdenTransferencia', object_id=orden.pk, user=usuario,
+                message=f"Transferencia {orden.pk} aceptada: {len(lineas)} productos",
+                data={'origen': orden.origen_id, 'destino': orden.destino_id},
+            )
+        ], batch_size=_BLOQUE)
+        Alerta.objects.bulk_create([
+            Alerta(
+                tipo='transferencia', nivel='info', drogueria_id=orden.destino_id,
+                mensaje=(
+                    f"Transferencia aceptada: {len(lineas)} productos, {sum(l.cantidad for l in lineas)} unidades "
+                    f"{orden.origen.codigo} → {orden.destino.codigo}"
+                ),
+            ),
+            *alertas_stock_bajo(meds, sorted({l.medicamento_origen_id for l in lineas})),
+        ], batch_size=_BLOQUE)
+
+        resumen.registrar_cambios((anteriores[pk], resumen.valores(m)) for pk, m in meds.items())
+    _invalidar(list(meds.values()))
+    return orden
+
+
+def rechazar(orden_id, usuario=None, nota=None, estado='rejected'):
+    """Libera las reservas de la orden y la deja en ``estado`` (``rejected`` o ``cancelled``)."""
+    with transaction.atomic():
+        orden, lineas = _tomar(orden_id)
+        stock.liberar_varios({l.medicamento_origen_id: l.cantidad for l in lineas})
+        orden.estado, orden.respondedor, orden.fecha_respuesta = estado, usuario, timezone.now()
+        orden.nota = nota or orden.nota
+        orden.save(update_fields=['estado', 'respondedor', 'fecha_respuesta', 'nota'])
+        verbo = 'rechazada' if estado == 'rejected' else 'cancelada'
+        auditoria.registrar(
+            f'transferencia_{verbo}', model_name='OrdenTransferencia', object_id=orden.pk, user=usuario,
+            message=f"Transferencia {orden.pk} {verbo}: {len(lineas)} productos",
+            data={'origen': orden.origen_id, 'destino': orden.destino_id},
+        )
+    return orden
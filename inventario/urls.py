@@ -14,8 +14,13 @@ from .views import (
     ProveedoresListAPIView,
     DrogueriasListPublicAPIView,
     PrestamoViewSet,
+    OrdenTransferenciaViewSet,
     AlertaViewSet,
     AuditLogViewSet,
+    ResumenInventarioViewSet,
+    MedicamentoPorCodigoBarraAPIView,
+    CacheStatsAPIView,
+    AuditoriaStatsAPIView,
 )
 
 # =========================
@@ -26,8 +31,10 @@ router.register(r'categorias', CategoriaViewSet, basename='categoria')
 router.register(r'medicamentos-crud', MedicamentoViewSet, basename='medicamento-crud')
 router.register(r'movimientos', MovimientoInventarioViewSet, basename='movimiento-inventario')
 router.register(r'prestamos', PrestamoViewSet, basename='prestamo')
+router.register(r'transferencias', OrdenTransferenciaViewSet, basename='transferencia')
 router.register(r'alerts', AlertaViewSet, basename='alerta')
 router.register(r'auditlogs', AuditLogViewSet, basename='auditlog')
+router.register(r'resumen', ResumenInventarioViewSet, basename='resumen-inventario')
 
 # =========================
 # 🌐 URL patterns
@@ -45,6 +52,9 @@ urlpatterns = [
     path("catalogo/proveedores/", ProveedoresListAPIView.as_view(), name="catalogo_proveedores"),
     path("catalogo/droguerias/", DrogueriasListPublicAPIView.as_view(), name="catalogo_droguerias"),
     path("by-drogueria/", MedicamentosByDrogueriaListAPIView.as_view(), name="medicamentos_by_drogueria"),
+    path("cache-stats/", CacheStatsAPIView.as_view(), name="cache_stats"),
+    path("auditoria-stats/", AuditoriaStatsAPIView.as_view(), name="auditoria_stats"),
+    path("codigo-barras/<str:codigo>/", MedicamentoPorCodigoBarraAPIView.as_view(), name="medicamento_codigo_barra"),
 
     # 🔹 Incluye las rutas automáticas del router (CRUD)
     path("", include(router.urls)),
@@ -0,0 +1,85 @@
+"""Escaneo programado de vencimientos (``manage.py escanear_vencimientos``, cron diario).
+
+Reemplaza la comprobación que se hacía en cada ``Medicamento.save()``: un
+producto que cruzaba su fecha de vencimiento sin que nadie lo guardara no
+generaba alerta. El escaneo recorre todas las droguerías con unas pocas
+consultas por conjuntos:
+
+1. medicamentos con stock y ``fecha_vencimiento <= hoy + mayor ventana``
+   (rango sobre el índice ``med_vencimiento_idx``)
+2. alertas no leídas de esos medicamentos, para no duplicarlas
+3. ``bulk_create`` de las alertas nuevas
+
+Cada medicamento cae en ``vencido`` (ya venció) o en la menor ventana de
+``INVENTARIO_VENCIMIENTO_VENTANAS`` días que lo contiene; se alerta una vez
+por ventana mientras la alerta anterior siga sin leer.
+"""
+import time
+from datetime import timedelta
+
+from django.conf import settings
+from django.utils import timezone
+
+VENTANAS = tuple(sorted(getattr(settings, 'INVENTARIO_VENCIMIENTO_VENTANAS', (30, 60, 90))))
+
+
+def _ventana(dias, ventanas):
+    for v in ventanas:
+        if dias <= v:
+            return v
+    return None
+
+
+def escanear(hoy=None, ventanas=None):
+    """Crea las alertas de vencimiento pendientes. Devuelve un resumen del escaneo."""
+    from .models import Alerta, Medicamento
+
+    inicio = time.monotonic()
+    hoy = hoy or timezone.localdate()
+    ventanas = tuple(sorted(ventanas or VENTANAS))
+    limite = hoy + timedelta(days=ventanas[-1] if ventanas else 0)
+
+    candidatos = Medicamento.objects.filter(
+        fecha_vencimiento__isnull=False, fecha_vencimiento__lte=limite,
+        estado=True, stock_actual__gt=0,
+    )
+    filas = list(candidatos.values_list('id', 'nombre', 'drogueria_id', 'fecha_vencimiento'))
+
+    # alertas pendientes de los mismos medicamentos (join en lugar de una lista IN enorme)
+    pendientes = set(
+        Alerta.objects.filter(
+            leido=False, tipo__in=('vencido', 'por_vencer'),
+            medicamento__fecha_vencimiento__isnull=False, medicamento__fecha_vencimiento__lte=limite,
+        ).order_by().values_list('medicamento_id', 'tipo', 'ventana_dias')
+    )
+
+    nuevas = []
+    conteo = {'vencidos': 0, **{f'por_vencer_{v}': 0 for v in ventanas}}
+    for pk, nombre, drogueria_id, fecha in filas:
+        dias = (fecha - hoy).days
+        if dias < 0:
+            clave, ventana = 'vencido', None
+            nivel = 'danger'
+            mensaje = f"{nombre} está vencido o su fecha de vencimiento ha pasado."
+            conteo['vencidos'] += 1
+        else:
+            clave, ventana = 'por_vencer', _ventana(dias, ventanas)
+            nivel = 'warning' if ventana == ventanas[0] else 'info'
+            mensaje = f"{nombre} vence el {fecha:%Y-%m-%d} (en {dias} días)."
+            conteo[f'por_vencer_{ventana}'] += 1
+        if (pk, clave, ventana) in pendientes:
+            continue
+        nuevas.append(Alerta(
+            tipo=clave, nivel=nivel, mensaje=mensaje, medicamento_id=pk,
+            drogueria_id=drogueria_id, ventana_dias=ventana,
+        ))
+
+    Alerta.objects.bulk_create(nuevas, batch_size=500)
+
+    return {
+        'fecha': hoy.isoformat(),
+        'revisados': len(filas),
+        **conteo,
+        'alertas_creadas': len(nuevas),
+        'segundos': round(time.monotonic() - inicio, 3),
+    }
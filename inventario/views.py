@@ -3,6 +3,7 @@ from rest_framework.decorators import action
 from rest_framework.response import Response
 from .models import Medicamento, Categoria, MovimientoInventario, Prestamo
 from django.db.models import Q
+from django.http import Http404
 from .filters import (
     apply_medicamento_filters,
     apply_movimiento_filters,
@@ -16,23 +17,36 @@ from .serializer import (
     CategoriaConMedicamentosSerializer,
     MovimientoInventarioSerializer,
 )
-from .serializers_prestamo import PrestamoSerializer
+from .serializers_prestamo import PrestamoSerializer, PrestamoLoteSerializer
+from .serializers_transferencia import OrdenTransferenciaSerializer, RebalanceoSerializer, TransferenciaLoteSerializer
 from .models import Prestamo
 from .permissions import EsEmpleadoOPermisoAdmin
-from .serializer import AlertaSerializer, AuditLogSerializer
-from .models import Alerta, AuditLog
+from .serializer import AlertaSerializer, AuditLogSerializer, ResumenInventarioSerializer, MovimientoLoteSerializer
+from .models import Alerta, AuditLog, ResumenInventario
 from rest_framework import mixins
-from .pagination import StandardResultsSetPagination
+from .pagination import StandardResultsSetPagination, PageOrCursorPagination
+from .mixins import EagerLoadingMixin
+from .cache_catalogo import CatalogoCacheMixin, ambitos_medicamentos
+from . import cache_catalogo
 from rest_framework.views import APIView
 from rest_framework import status
 from rest_framework.response import Response
 from .serializer import DrogueriaNestedSerializer
 from droguerias.models import Drogueria
+from . import archivo_auditoria, auditoria, barcodes
+from .exportar import CAMPOS_MEDICAMENTO, CAMPOS_MOVIMIENTO, respuesta as respuesta_exportacion
+from .movimientos import registrar_lote
+from .prestamos import puede_responder, responder_lote
+from . import rebalanceo, transferencias
+from .pronostico import SinNumpy
+from .models import OrdenTransferencia
+from .importar import ArchivoInvalido, importar as importar_medicamentos
+from rest_framework.parsers import MultiPartParser
 
 # =========================
 # 🧩 CRUD DE CATEGORÍAS
 # =========================
-class CategoriaViewSet(viewsets.ModelViewSet):
+class CategoriaViewSet(EagerLoadingMixin, viewsets.ModelViewSet):
     queryset = Categoria.objects.all()
     serializer_class = CategoriaSerializer
     permission_classes = [EsEmpleadoOPermisoAdmin]
@@ -45,7 +59,7 @@ class CategoriaViewSet(viewsets.ModelViewSet):
 # =========================
 # 💊 CRUD DE MEDICAMENTOS
 # =========================
-class MedicamentoViewSet(viewsets.ModelViewSet):
+class MedicamentoViewSet(EagerLoadingMixin, viewsets.ModelViewSet):
     queryset = Medicamento.objects.all()
     serializer_class = MedicamentoSerializer
     permission_classes = [EsEmpleadoOPermisoAdmin]
@@ -69,10 +83,32 @@ class MedicamentoViewSet(viewsets.ModelViewSet):
 
         return apply_medicamento_filters(qs, self.request.query_params)
 
+    @action(detail=False, methods=['get'])
+    def exportar(self, request):
+        """Inventario completo en streaming: ?formato=ndjson|csv&gzip=1, mismos filtros que el listado."""
+        return respuesta_exportacion(self.get_queryset(), CAMPOS_MEDICAMENTO, 'medicamentos', request.query_params)
+
+    @action(detail=False, methods=['post'], parser_classes=[MultiPartParser])
+    def importar(self, request):
+        """Alta/actualización masiva desde CSV o XLSX (campo ``archivo``), upsert por (nombre, droguería)."""
+        archivo = request.FILES.get('archivo')
+        if archivo is None:
+            return Response({'detail': 'Adjunte el archivo en el campo "archivo".'}, status=status.HTTP_400_BAD_REQUEST)
+        try:
+            resultado = importar_medicamentos(archivo, archivo.name)
+        except ArchivoInvalido as e:
+            return Response({'detail': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+        auditoria.registrar(
+            'import', model_name='Medicamento', user=request.user,
+            message=f"Importación de {archivo.name}: {resultado['importadas']} filas, {resultado['errores_total']} con errores",
+            data={k: v for k, v in resultado.items() if k != 'errores'},
+        )
+        return Response(resultado)
+
 # =========================
 # 📦 CRUD DE MOVIMIENTOS DE INVENTARIO
 # =========================
-class MovimientoInventarioViewSet(viewsets.ModelViewSet):
+class MovimientoInventarioViewSet(EagerLoadingMixin, viewsets.ModelViewSet):
     queryset = MovimientoInventario.objects.all()
     serializer_class = MovimientoInventarioSerializer
     permission_classes = [EsEmpleadoOPermisoAdmin]
@@ -80,7 +116,9 @@ class MovimientoInventarioViewSet(viewsets.ModelViewSet):
     filter_backends = [filters.OrderingFilter]
     ordering_fields = ['fecha_movimiento', 'cantidad']
     ordering = ('-fecha_movimiento',)
-    pagination_class = StandardResultsSetPagination
+    # ?paginacion=cursor -> keyset sobre (fecha_movimiento, id)
+    pagination_class = PageOrCursorPagination
+    keyset_field = 'fecha_movimiento'
 
     def get_queryset(self):
         qs = super().get_queryset()
@@ -92,8 +130,33 @@ class MovimientoInventarioViewSet(viewsets.ModelViewSet):
 
         return apply_movimiento_filters(qs, self.request.query_params)
 
+    @action(detail=False, methods=['post'])
+    def lote(self, request):
+        """Registra muchos movimientos en una transacción (recepciones, conteos).
+
+        Body: ``{"drogueria_id": 1, "movimientos": [{"medicamento_id": 5,
+        "tipo_movimiento": "entrada", "cantidad": 10}, ...]}``
+        """
+        serializer = MovimientoLoteSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        resultado = registrar_lote(
+            serializer.validated_data['movimientos'],
+            usuario=request.user,
+            drogueria=serializer.validated_data.get('drogueria'),
+        )
+        return Response({
+            'creados': len(resultado['movimientos']),
+            'ids': [m.pk for m in resultado['movimientos']],
+            'alertas': len(resultado['alertas']),
+        }, status=status.HTTP_201_CREATED)
+
+    @action(detail=False, methods=['get'])
+    def exportar(self, request):
+        """Historial de movimientos en streaming: ?formato=ndjson|csv&gzip=1, mismos filtros que el listado."""
+        return respuesta_exportacion(self.get_queryset(), CAMPOS_MOVIMIENTO, 'movimientos', request.query_params)
+
 
-class PrestamoViewSet(viewsets.ModelViewSet):
+class PrestamoViewSet(EagerLoadingMixin, viewsets.ModelViewSet):
     queryset = Prestamo.objects.all()
     serializer_class = PrestamoSerializer
     permission_classes = [permissions.IsAuthenticated]
@@ -161,8 +224,102 @@ class PrestamoViewSet(viewsets.ModelViewSet):
             return Response({'detail': str(e)}, status=400)
         return Response({'detail': 'Prestamo rechazado'}, status=200)
 
+    @action(detail=False, methods=['post'])
+    def lote(self, request):
+        """Acepta o rechaza muchos préstamos pendientes en una transacción.
+
+        Body: ``{"accion": "accept"|"reject", "ids": [1, 2, ...], "nota": "..."}``.
+        Los que no se pueden procesar vuelven en ``errores`` con su motivo.
+        """
+        serializer = PrestamoLoteSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        resultado = responder_lote(
+            serializer.validated_data['ids'],
+            serializer.validated_data['accion'],
+            request.user,
+            nota=serializer.validated_data.get('nota'),
+        )
+        return Response(resultado, status=200)
+
+
+# =========================
+# 🚚 ÓRDENES DE TRANSFERENCIA (varias líneas)
+# =========================
+class OrdenTransferenciaViewSet(EagerLoadingMixin, mixins.CreateModelMixin, mixins.ListModelMixin,
+                                mixins.RetrieveModelMixin, viewsets.GenericViewSet):
+    """Transferencias con líneas: crear reserva todo, accept/reject/cancel responden la orden entera."""
+    queryset = OrdenTransferencia.objects.all()
+    serializer_class = OrdenTransferenciaSerializer
+    permission_classes = [permissions.IsAuthenticated]
+    pagination_class = StandardResultsSetPagination
+
+    def get_queryset(self):
+        user = self.request.user
+        qs = super().get_queryset()
+        if not (getattr(user, 'rol', None) == 'admin' or user.is_superuser):
+            qs = qs.filter(Q(solicitante=user) | Q(origen__propietario=user) | Q(destino__propietario=user))
+        return apply_prestamo_filters(qs, self.request.query_params)
+
+    def _responder(self, request, operacion, mensaje, **kwargs):
+        orden = self.get_object()
+        if not puede_responder(request.user, orden.origen, orden.destino):
+            return Response({'detail': 'No autorizado para responder esta transferencia'}, status=403)
+        try:
+            orden = operacion(orden.pk, request.user, **kwargs)
+        except transferencias.OrdenNoPendiente as e:
+            return Response({'detail': str(e)}, status=400)
+        return Response({'detail': mensaje, 'estado': orden.estado}, status=200)
+
+    @action(detail=True, methods=['post'])
+    def accept(self, request, pk=None):
+        return self._responder(request, transferencias.aceptar, 'Transferencia aceptada')
+
+    @action(detail=True, methods=['post'])
+    def reject(self, request, pk=None):
+        return self._responder(request, transferencias.rechazar, 'Transferencia rechazada', nota=request.data.get('nota'))
 
-class AlertaViewSet(viewsets.ReadOnlyModelViewSet):
+    @action(detail=True, methods=['post'])
+    def cancel(self, request, pk=None):
+        """El solicitante retira la orden y se liberan las reservas."""
+        orden = self.get_object()
+        if orden.solicitante_id != request.user.pk and not puede_responder(request.user, orden.origen, None):
+            return Response({'detail': 'No autorizado para cancelar esta transferencia'}, status=403)
+        try:
+            orden = transferencias.rechazar(orden.pk, request.user, estado='cancelled')
+        except transferencias.OrdenNoPendiente as e:
+            return Response({'detail': str(e)}, status=400)
+        return Response({'detail': 'Transferencia cancelada', 'estado': orden.estado}, status=200)
+
+    @action(detail=False, methods=['get'])
+    def rebalanceo(self, request):
+        """Propuestas de transferencia de sobrantes a faltantes (``?droguerias=1,2&objetivo=&minimo=``).
+
+        Un usuario que no es admin solo ve propuestas entre sus droguerías.
+        """
+        params = RebalanceoSerializer(data=request.query_params)
+        params.is_valid(raise_exception=True)
+        droguerias = params.validated_data.get('droguerias')
+        user = request.user
+        if not (getattr(user, 'rol', None) == 'admin' or user.is_superuser):
+            propias = set(Drogueria.objects.filter(propietario=user).values_list('id', flat=True))
+            droguerias = propias if droguerias is None else propias & droguerias
+        try:
+            resultado = rebalanceo.proponer(
+                droguerias, objetivo=params.validated_data.get('objetivo'), minimo=params.validated_data['minimo']
+            )
+        except SinNumpy as e:
+            return Response({'detail': str(e)}, status=503)
+        return Response(resultado, status=200)
+
+    @action(detail=False, methods=['post'])
+    def lote(self, request):
+        """Crea de una vez las órdenes de ``{"propuestas": [...]}`` (p. ej. las de ``rebalanceo``)."""
+        serializer = TransferenciaLoteSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        return Response(rebalanceo.crear_lote(serializer.validated_data['propuestas'], request.user), status=200)
+
+
+class AlertaViewSet(EagerLoadingMixin, viewsets.ReadOnlyModelViewSet):
     """List and retrieve alerts; allow marking as read via action.
 
     - list: returns alerts belonging to droguerias the user owns or all if admin
@@ -189,7 +346,8 @@ class AlertaViewSet(viewsets.ReadOnlyModelViewSet):
         return apply_alerta_filters(qs, self.request.query_params)
     filter_backends = [filters.OrderingFilter]
     ordering_fields = ['creado_en', 'nivel']
-    pagination_class = StandardResultsSetPagination
+    pagination_class = PageOrCursorPagination
+    keyset_field = 'creado_en'
     ordering = ('-creado_en',)
 
     @action(detail=True, methods=['post'], permission_classes=[permissions.IsAuthenticated])
@@ -200,35 +358,108 @@ class AlertaViewSet(viewsets.ReadOnlyModelViewSet):
         return Response({'detail': 'marked'}, status=200)
 
 
-class AuditLogViewSet(viewsets.ReadOnlyModelViewSet):
+class AuditLogViewSet(EagerLoadingMixin, viewsets.ReadOnlyModelViewSet):
+    """Auditoría: tabla activa más los meses archivados (ver archivo_auditoria.py).
+
+    Con paginación por página las filas archivadas que cumplen los filtros
+    se intercalan por fecha con las activas (``?ordering=`` solo admite
+    ``created_at``/``-created_at`` si hay archivo); ``?paginacion=cursor``
+    recorre solo la tabla activa.
+    """
     queryset = AuditLog.objects.all()
     serializer_class = AuditLogSerializer
 
-    def get_queryset(self):
+    def es_auditor(self):
         user = self.request.user
+        return user.is_superuser or getattr(user, 'rol', None) == 'admin'
+
+    def get_queryset(self):
         # only admin or superuser can view audit logs
-        if not (user.is_superuser or getattr(user, 'rol', None) == 'admin'):
+        if not self.es_auditor():
             return AuditLog.objects.none()
         qs = super().get_queryset()
-        action = self.request.query_params.get('action')
-        model_name = self.request.query_params.get('model_name')
-        user_id = self.request.query_params.get('user')
-        object_id = self.request.query_params.get('object_id')
-        created_from = self.request.query_params.get('created_from')
-        created_to = self.request.query_params.get('created_to')
-
         return apply_audit_filters(qs, self.request.query_params)
     filter_backends = [filters.OrderingFilter]
     ordering_fields = ['created_at', 'action', 'model_name']
-    pagination_class = StandardResultsSetPagination
+    pagination_class = PageOrCursorPagination
+    keyset_field = 'created_at'
     ordering = ('-created_at',)
 
+    def list(self, request, *args, **kwargs):
+        if (
+            not self.es_auditor()
+            or self.paginator.use_cursor(request)
+            or not archivo_auditoria.hay_archivo(request.query_params)
+        ):
+            return super().list(request, *args, **kwargs)
+        # tabla y archivo solo se pueden intercalar por fecha
+        orden = filters.OrderingFilter().get_ordering(request, self.get_queryset(), self) or self.ordering
+        if list(orden) not in (['created_at'], ['-created_at']):
+            return Response(
+                {'detail': 'Con filas archivadas solo se puede ordenar por created_at o -created_at.'},
+                status=status.HTTP_400_BAD_REQUEST,
+            )
+        filas = archivo_auditoria.ListaCombinada(
+            self.filter_queryset(self.get_queryset()), request.query_params, descendente=orden[0] == '-created_at'
+        )
+        page = self.paginate_queryset(filas)
+        return self.get_paginated_response(self.get_serializer(page, many=True).data)
+
+    def get_object(self):
+        try:
+            return super().get_object()
+        except Http404:
+            pk = str(self.kwargs.get('pk', ''))
+            archivada = archivo_auditoria.obtener(int(pk)) if self.es_auditor() and pk.isdigit() else None
+            if archivada is None:
+                raise
+            return archivada
+
+class ResumenInventarioViewSet(EagerLoadingMixin, viewsets.ReadOnlyModelViewSet):
+    """Valoración de inventario por droguería y categoría (tabla materializada).
+
+    - list: filas (drogueria, categoria); filtros ?drogueria= y ?categoria=
+    - por_drogueria: totales por droguería sumando sus categorías
+    """
+    queryset = ResumenInventario.objects.all()
+    serializer_class = ResumenInventarioSerializer
+    permission_classes = [EsEmpleadoOPermisoAdmin]
+    pagination_class = StandardResultsSetPagination
+
+    def get_queryset(self):
+        qs = super().get_queryset()
+        drogueria = self.request.query_params.get('drogueria')
+        categoria = self.request.query_params.get('categoria')
+        if drogueria:
+            qs = qs.filter(drogueria_id=drogueria)
+        if categoria:
+            qs = qs.filter(categoria_id=categoria)
+        return qs
+
+    @action(detail=False, methods=['get'])
+    def por_drogueria(self, request):
+        from django.db.models import Sum
+        campos = ['skus', 'unidades', 'unidades_reservadas', 'valor_venta', 'valor_costo', 'bajo_stock', 'vencidos']
+        filas = (
+            self.get_queryset().order_by('drogueria_id')
+            .values('drogueria_id', 'drogueria__nombre')
+            .annotate(**{f'total_{c}': Sum(c) for c in campos})
+        )
+        return Response([
+            {
+                'drogueria': f['drogueria_id'],
+                'drogueria_nombre': f['drogueria__nombre'],
+                **{c: f[f'total_{c}'] for c in campos},
+            }
+            for f in filas
+        ])
+
 # =========================
 # 🔐 VISTAS BASADAS EN GENERICS
 # =========================
 
 # 🔹 Listar medicamentos (solo empleados o admins)
-class MedicamentoListView(generics.ListAPIView):
+class MedicamentoListView(EagerLoadingMixin, generics.ListAPIView):
     queryset = Medicamento.objects.filter(estado=True)
     serializer_class = MedicamentoSerializer
     permission_classes = [permissions.IsAuthenticated]
@@ -240,12 +471,12 @@ class MedicamentoCreateView(generics.CreateAPIView):
     permission_classes = [EsEmpleadoOPermisoAdmin]
 
 # 🔹 Ver, actualizar o eliminar medicamento
-class MedicamentoDetailView(generics.RetrieveUpdateDestroyAPIView):
+class MedicamentoDetailView(EagerLoadingMixin, generics.RetrieveUpdateDestroyAPIView):
     queryset = Medicamento.objects.all()
     serializer_class = MedicamentoSerializer
     permission_classes = [EsEmpleadoOPermisoAdmin]
 
-class MedicamentoListPublicAPIView(generics.ListAPIView):
+class MedicamentoListPublicAPIView(CatalogoCacheMixin, EagerLoadingMixin, generics.ListAPIView):
     queryset = Medicamento.objects.filter(estado=True)
     serializer_class = MedicamentoSerializer
     permission_classes = [permissions.AllowAny]
@@ -259,20 +490,25 @@ class MedicamentoListPublicAPIView(generics.ListAPIView):
         qs = Medicamento.objects.filter(estado=True)
         return apply_medicamento_filters(qs, self.request.query_params)
 
+    def get_cache_ambitos(self):
+        return ambitos_medicamentos(self.request.query_params)
+
 # 🔹 Lista de categorías activas
-class CategoriaListPublicAPIView(generics.ListAPIView):
+class CategoriaListPublicAPIView(CatalogoCacheMixin, EagerLoadingMixin, generics.ListAPIView):
     queryset = Categoria.objects.filter(activo=True)
     serializer_class = CategoriaSerializer
     permission_classes = [permissions.AllowAny]
+    cache_ambitos = ('estructura',)
 
 # 🔹 Opcional: Categorías con sus medicamentos anidados
-class CategoriaConMedicamentosListAPIView(generics.ListAPIView):
+class CategoriaConMedicamentosListAPIView(CatalogoCacheMixin, EagerLoadingMixin, generics.ListAPIView):
     queryset = Categoria.objects.filter(activo=True)
     serializer_class = CategoriaConMedicamentosSerializer
     permission_classes = [permissions.AllowAny]
+    cache_ambitos = ('todos',)
 
 
-class MedicamentosByDrogueriaListAPIView(generics.ListAPIView):
+class MedicamentosByDrogueriaListAPIView(EagerLoadingMixin, generics.ListAPIView):
     """Lista medicamentos filtrados por drogueria (query param: ?drogueria=<id>)."""
     serializer_class = MedicamentoSerializer
     permission_classes = [permissions.IsAuthenticated]
@@ -308,8 +544,49 @@ class ProveedoresListAPIView(generics.ListAPIView):
         return Response(list(qs), status=status.HTTP_200_OK)
 
 
-class DrogueriasListPublicAPIView(generics.ListAPIView):
+class DrogueriasListPublicAPIView(CatalogoCacheMixin, EagerLoadingMixin, generics.ListAPIView):
     """Lista líquida de droguerías pública (para selector en UI)."""
     queryset = Drogueria.objects.all()
     serializer_class = DrogueriaNestedSerializer
     permission_classes = [permissions.AllowAny]
+    cache_ambitos = ('estructura',)
+
+
+class MedicamentoPorCodigoBarraAPIView(APIView):
+    """Búsqueda exacta por código de barras para el punto de venta.
+
+    GET /api/inventario/codigo-barras/<codigo>/?drogueria=<id>
+    Sin ``drogueria`` se usa la droguería activa del usuario.
+    """
+    permission_classes = [EsEmpleadoOPermisoAdmin]
+
+    def get(self, request, codigo):
+        drogueria_id = request.query_params.get('drogueria') or getattr(request.user, 'active_drogueria_id', None)
+        if not drogueria_id:
+            return Response({'detail': 'drogueria requerida'}, status=status.HTTP_400_BAD_REQUEST)
+        try:
+            data = barcodes.buscar_por_codigo(drogueria_id, codigo)
+        except ValueError:
+            return Response({'detail': 'drogueria inválida'}, status=status.HTTP_400_BAD_REQUEST)
+        if data is None:
+            return Response({'detail': 'Código de barras no encontrado'}, status=status.HTTP_404_NOT_FOUND)
+        return Response(data)
+
+
+class CacheStatsAPIView(APIView):
+    """Contadores de las cachés del catálogo y del lector de códigos de barras."""
+    permission_classes = [EsEmpleadoOPermisoAdmin]
+
+    def get(self, request):
+        return Response({
+            'catalogo': cache_catalogo.contadores.info(),
+            'codigo_barras': barcodes.cache.info(),
+        })
+
+
+class AuditoriaStatsAPIView(APIView):
+    """Estado de la cola de auditoría: eventos pendientes y latencia de volcado."""
+    permission_classes = [EsEmpleadoOPermisoAdmin]
+
+    def get(self, request):
+        return Response(auditoria.cola.info())
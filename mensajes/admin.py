@@ -1,5 +1,5 @@
 from django.contrib import admin
-from .models import Mensaje
+from .models import Mensaje, CorreoSaliente
 
 @admin.register(Mensaje)
 class MensajeAdmin(admin.ModelAdmin):
@@ -12,3 +12,12 @@ class MensajeAdmin(admin.ModelAdmin):
     @admin.action(description="Marcar como leído")
     def marcar_como_leido(self, request, queryset):
         queryset.update(leido=True)
+
+
+@admin.register(CorreoSaliente)
+class CorreoSalienteAdmin(admin.ModelAdmin):
+    list_display = ('id', 'asunto', 'estado', 'intentos', 'proximo_intento', 'creado_en', 'enviado_en')
+    list_filter = ('estado',)
+    search_fields = ('asunto', 'lote', 'referencia')
+    ordering = ('-creado_en',)
+    readonly_fields = ('creado_en', 'enviado_en', 'ultimo_error')
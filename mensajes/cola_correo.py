@@ -0,0 +1,291 @@
+"""Cola persistente de correos salientes.
+
+Enviar dentro de la petición ataba la latencia de la API al servidor de
+correo: una sesión SMTP/TLS nueva por correo. Ahora las vistas llaman a
+``encolar`` (una fila ``CorreoSaliente``) y responden enseguida con el id;
+el worker (``manage.py enviar_correos``) llama a ``procesar``:
+
+- toma un lote con ``select_for_update(skip_locked=True)`` y lo marca
+  ``enviando`` con un plazo (``LEASE``): si el worker muere, al vencer el
+  plazo otro lo vuelve a tomar
+- abre **una** conexión y envía todo el lote con ``send_messages`` sobre
+  ella; si un envío falla la sesión se reabre para el siguiente
+- un fallo reprograma el correo con espera exponencial (``REINTENTO_BASE``
+  · 2^(intentos-1), hasta ``REINTENTO_MAX``, con ±20 % de azar) y tras
+  ``MAX_INTENTOS`` lo deja ``fallido``
+- el resultado del lote se guarda con un ``bulk_update``
+
+Adjuntos y acciones posteriores se guardan como ``{"ruta", "args"}``: el
+adjunto (p. ej. el PDF de una factura) se genera al enviar, y las acciones
+``al_enviar`` se llaman una vez por ruta con los ``args`` de todos los
+correos enviados del lote. Un adjunto puede indicar además ``"preparar"``:
+una función que recibe los ``args`` de todo el lote y devuelve
+``{tuple(args): (nombre, bytes, mime)}``, para generarlos juntos (los PDFs
+de facturas se dibujan en paralelo) en lugar de uno por correo.
+
+Los envíos masivos marcan sus correos con un ``lote`` (``progreso``) y una
+``referencia`` del objeto de origen (``en_cola`` evita encolarlo dos veces).
+"""
+import logging
+import random
+import threading
+from collections import defaultdict
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.mail import EmailMessage, get_connection
+from django.db import transaction
+from django.db.models import Count
+from django.utils import timezone
+from django.utils.module_loading import import_string
+
+logger = logging.getLogger(__name__)
+
+
+def _config(nombre, defecto):
+    return getattr(settings, f'MENSAJES_CORREO_{nombre}', defecto)
+
+
+class _Contadores:
+    """Resultados de este proceso (el estado de la cola sale de la base, ver ``info``)."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.enviados = 0
+        self.reintentos = 0
+        self.fallidos = 0
+        self.conexiones = 0
+
+    def sumar(self, campo, n=1):
+        with self._lock:
+            setattr(self, campo, getattr(self, campo) + n)
+
+    def info(self):
+        with self._lock:
+            return {
+                'enviados': self.enviados,
+                'reintentos': self.reintentos,
+                'fallidos': self.fallidos,
+                'conexiones': self.conexiones,
+            }
+
+
+contadores = _Contadores()
+
+
+def _correo(asunto, cuerpo, destinatarios, remitente=None, adjuntos=(), al_enviar=None, lote='', referencia='', ahora=None):
+    from .models import CorreoSaliente
+    return CorreoSaliente(
+        asunto=asunto,
+        cuerpo=cuerpo,
+        remitente=remitente or '',
+        destinatarios=list(destinatarios),
+        adjuntos=list(adjuntos),
+        al_enviar=al_enviar,
+        lote=lote,
+        referencia=referencia,
+        proximo_intento=ahora or timezone.now(),
+    )
+
+
+def encolar(asunto, cuerpo, destinatarios, remitente=None, adjuntos=(), al_enviar=None, lote='', referencia=''):
+    """Deja un correo en la cola y lo devuelve (su ``pk`` es el id del trabajo)."""
+    correo = _correo(asunto, cuerpo, destinatarios, remitente, adjuntos, al_enviar, lote, referencia)
+    correo.save()
+    return correo
+
+
+def encolar_varios(correos):
+    """Encola ``correos`` (dicts con los argumentos de ``encolar``) con un ``bulk_create``."""
+    from .models import CorreoSaliente
+    ahora = timezone.now()
+    return CorreoSaliente.objects.bulk_create([_correo(ahora=ahora, **c) for c in correos], batch_size=500)
+
+
+def _llamar(referencia):
+    return import_string(referencia['ruta'])(*referencia.get('args', []))
+
+
+def _clave_adjunto(adjunto):
+    return adjunto['ruta'], tuple(adjunto.get('args', []))
+
+
+def _preparar(correos):
+    """Genera de una vez los adjuntos que declaran ``preparar``; ``{(ruta, args): adjunto}``."""
+    pendientes = defaultdict(list)
+    for correo in correos:
+        for adjunto in correo.adjuntos:
+            if adjunto.get('preparar'):
+                pendientes[(adjunto['preparar'], adjunto['ruta'])].append(adjunto.get('args', []))
+    preparados = {}
+    for (preparar, ruta), args in pendientes.items():
+        try:
+            for clave, valor in import_string(preparar)(args).items():
+                preparados[(ruta, tuple(clave))] = valor
+        except Exception:
+            # sin preparación cada correo genera su adjunto (y un fallo real se reintenta ahí)
+            logger.exception('Falló la preparación de adjuntos %s', preparar)
+    return preparados
+
+
+def _mensaje(correo, conexion, preparados):
+    mensaje = EmailMessage(
+        subject=correo.asunto,
+        body=correo.cuerpo,
+        from_email=correo.remitente or None,
+        to=correo.destinatarios,
+        connection=conexion,
+    )
+    for adjunto in correo.adjuntos:
+        listo = preparados.get(_clave_adjunto(adjunto))
+        mensaje.attach(*(listo or _llamar(adjunto)))
+    return mensaje
+
+
+def _espera(intentos):
+    base = _config('REINTENTO_BASE', 60)
+    segundos = min(_config('REINTENTO_MAX', 3600), base * 2 ** (intentos - 1))
+    return timedelta(seconds=segundos * random.uniform(0.8, 1.2))
+
+
+def _tomar(lote, ahora):
+    from .models import CorreoSaliente
+
+    with transaction.atomic():
+        ids = list(
+            CorreoSaliente.objects.select_for_update(skip_locked=True)
+            .filter(estado__in=('pendiente', 'enviando'), proximo_intento__lte=ahora)
+            .order_by('proximo_intento').values_list('id', flat=True)[:lote]
+        )
+        if ids:
+            CorreoSaliente.objects.filter(pk__in=ids).update(
+                estado='enviando', proximo_intento=ahora + timedelta(seconds=_config('LEASE', 300))
+            )
+    return list(CorreoSaliente.objects.filter(pk__in=ids).order_by('pk'))
+
+
+def _fallo(correo, error, ahora):
+    correo.intentos += 1
+    correo.ultimo_error = f'{type(error).__name__}: {error}'[:2000]
+    if correo.intentos >= _config('MAX_INTENTOS', 5):
+        correo.estado = 'fallido'
+        contadores.sumar('fallidos')
+    else:
+        correo.estado = 'pendiente'
+        correo.proximo_intento = ahora + _espera(correo.intentos)
+        contadores.sumar('reintentos')
+
+
+def _abrir(conexion):
+    conexion.open()
+    contadores.sumar('conexiones')
+
+
+def procesar(lote=None, ahora=None):
+    """Envía un lote de correos pendientes por una sola conexión. Devuelve un resumen."""
+    from .models import CorreoSaliente
+
+    ahora = ahora or timezone.now()
+    correos = _tomar(lote or _config('LOTE', 100), ahora)
+    if not correos:
+        return {'enviados': 0, 'reintentos': 0, 'fallidos': 0}
+
+    preparados = _preparar(correos)
+    conexion = get_connection(fail_silently=False)
+    try:
+        _abrir(conexion)
+    except Exception as e:
+        # sin servidor no se envía nada: todo el lote vuelve a la cola
+        logger.warning('No se pudo abrir la conexión de correo: %s', e)
+        for correo in correos:
+            _fallo(correo, e, ahora)
+    else:
+        try:
+            for correo in correos:
+                try:
+                    conexion.send_messages([_mensaje(correo, conexion, preparados)])
+                except Exception as e:
+                    logger.warning('Fallo al enviar el correo %s: %s', correo.pk, e)
+                    _fallo(correo, e, ahora)
+                    # la sesión pudo quedar rota: reabrirla para el siguiente
+                    conexion.close()
+                    try:
+                        _abrir(conexion)
+                    except Exception:
+                        pass
+                else:
+                    correo.estado, correo.enviado_en, correo.ultimo_error = 'enviado', timezone.now(), ''
+                    correo.intentos += 1
+                    contadores.sumar('enviados')
+        finally:
+            conexion.close()
+
+    CorreoSaliente.objects.bulk_update(
+        correos, ['estado', 'intentos', 'proximo_intento', 'ultimo_error', 'enviado_en'], batch_size=500
+    )
+
+    acciones = defaultdict(list)
+    for correo in correos:
+        if correo.estado == 'enviado' and correo.al_enviar:
+            acciones[correo.al_enviar['ruta']].append(correo.al_enviar.get('args', []))
+    for ruta, args in acciones.items():
+        try:
+            import_string(ruta)(args)
+        except Exception:
+            # el correo ya salió: un fallo aquí no debe reenviarlo
+            logger.exception('Falló la acción posterior al envío %s', ruta)
+
+    estados = [correo.estado for correo in correos]
+    return {'enviados': estados.count('enviado'), 'reintentos': estados.count('pendiente'), 'fallidos': estados.count('fallido')}
+
+
+def drenar(lote=None):
+    """Procesa lotes hasta que no quede nada listo para enviar. Devuelve el total."""
+    total = {'enviados': 0, 'reintentos': 0, 'fallidos': 0}
+    while True:
+        resultado = procesar(lote)
+        for clave, n in resultado.items():
+            total[clave] += n
+        if not any(resultado.values()):
+            return total
+
+
+def info(ahora=None):
+    """Correos por estado, listos para enviar y contadores del proceso."""
+    from .models import CorreoSaliente
+
+    ahora = ahora or timezone.now()
+    por_estado = dict(CorreoSaliente.objects.values_list('estado').annotate(n=Count('id')))
+    return {
+        'por_estado': {estado: por_estado.get(estado, 0) for estado, _ in CorreoSaliente.ESTADOS},
+        'listos': CorreoSaliente.objects.filter(estado__in=('pendiente', 'enviando'), proximo_intento__lte=ahora).count(),
+        'proceso': contadores.info(),
+    }
+
+
+def en_cola(referencias):
+    """Las ``referencias`` que ya tienen un correo pendiente o enviándose."""
+    from .models import CorreoSaliente
+    return set(
+        CorreoSaliente.objects.filter(referencia__in=list(referencias), estado__in=('pendiente', 'enviando'))
+        .values_list('referencia', flat=True)
+    )
+
+
+def progreso(lote):
+    """Avance de un envío masivo: ``None`` si el lote no existe."""
+    from .models import CorreoSaliente
+
+    por_estado = dict(CorreoSaliente.objects.filter(lote=lote).values_list('estado').annotate(n=Count('id')))
+    total = sum(por_estado.values())
+    if not total:
+        return None
+    terminados = por_estado.get('enviado', 0) + por_estado.get('fallido', 0)
+    return {
+        'lote': lote,
+        'total': total,
+        'por_estado': {estado: por_estado.get(estado, 0) for estado, _ in CorreoSaliente.ESTADOS},
+        'terminados': terminados,
+        'porcentaje': round(100 * terminados / total, 1),
+        'completo': terminados == total,
+    }
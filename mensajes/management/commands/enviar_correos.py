@@ -0,0 +1,33 @@
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections
+
+from mensajes import cola_correo
+
+
+class Command(BaseCommand):
+    help = "Envía los correos de la cola por una conexión SMTP reutilizada (cron, o --cada N como worker)."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--lote', type=int, default=None, help='Correos por conexión (MENSAJES_CORREO_LOTE, 100).')
+        parser.add_argument('--cada', type=float, default=0, help='Repetir cada N segundos en lugar de salir.')
+
+    def _enviar(self, lote):
+        informe = cola_correo.drenar(lote)
+        if any(informe.values()):
+            self.stdout.write(self.style.SUCCESS(
+                f"Correos: {informe['enviados']} enviados, {informe['reintentos']} reprogramados, "
+                f"{informe['fallidos']} fallidos."
+            ))
+        return informe
+
+    def handle(self, *args, **options):
+        if not options['cada']:
+            if not any(self._enviar(options['lote']).values()):
+                self.stdout.write("Correos: nada pendiente.")
+            return
+        while True:
+            close_old_connections()
+            self._enviar(options['lote'])
+            time.sleep(options['cada'])
@@ -0,0 +1,34 @@
+# Generated by Django 5.2.8 on 2026-10-18 12:48
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('mensajes', '0003_resena_remove_mensaje_aprobado_para_reseña_and_more'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CorreoSaliente',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('asunto', models.CharField(max_length=255)),
+                ('cuerpo', models.TextField()),
+                ('remitente', models.CharField(blank=True, max_length=255)),
+                ('destinatarios', models.JSONField(default=list)),
+                ('adjuntos', models.JSONField(blank=True, default=list)),
+                ('al_enviar', models.JSONField(blank=True, null=True)),
+                ('estado', models.CharField(choices=[('pendiente', 'Pendiente'), ('enviando', 'Enviando'), ('enviado', 'Enviado'), ('fallido', 'Fallido')], default='pendiente', max_length=20)),
+                ('intentos', models.PositiveSmallIntegerField(default=0)),
+                ('proximo_intento', models.DateTimeField()),
+                ('ultimo_error', models.TextField(blank=True)),
+                ('creado_en', models.DateTimeField(auto_now_add=True)),
+                ('enviado_en', models.DateTimeField(blank=True, null=True)),
+            ],
+            options={
+                'indexes': [models.Index(fields=['estado', 'proximo_intento'], name='correo_estado_prox_idx')],
+            },
+        ),
+    ]
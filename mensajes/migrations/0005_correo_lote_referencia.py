@@ -0,0 +1,23 @@
+# Generated by Django 5.2.8 on 2026-10-18 12:51
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('mensajes', '0004_cola_correo'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='correosaliente',
+            name='lote',
+            field=models.CharField(blank=True, db_index=True, max_length=32),
+        ),
+        migrations.AddField(
+            model_name='correosaliente',
+            name='referencia',
+            field=models.CharField(blank=True, db_index=True, max_length=64),
+        ),
+    ]
@@ -21,4 +21,44 @@ class Resena(models.Model):
     fecha = models.DateTimeField(auto_now_add=True)
 
     def __str__(self):
-        return f"{self.nombre} ({self.calificacion}⭐)"
\ No newline at end of file
+        return f"{self.nombre} ({self.calificacion}⭐)"
+
+# 📤 Cola de correos salientes
+class CorreoSaliente(models.Model):
+    """Correo pendiente de envío; lo despacha el worker (``manage.py enviar_correos``).
+
+    Los adjuntos y la acción posterior al envío se guardan como rutas a
+    funciones (``{"ruta": "modulo.funcion", "args": [...]}``) y se resuelven
+    al enviar: la cola no guarda PDFs, y un reintento usa datos actuales.
+    Ver ``mensajes/cola_correo.py``.
+    """
+    ESTADOS = [
+        ("pendiente", "Pendiente"),
+        ("enviando", "Enviando"),
+        ("enviado", "Enviado"),
+        ("fallido", "Fallido"),
+    ]
+    asunto = models.CharField(max_length=255)
+    cuerpo = models.TextField()
+    remitente = models.CharField(max_length=255, blank=True)
+    destinatarios = models.JSONField(default=list)
+    adjuntos = models.JSONField(default=list, blank=True)
+    al_enviar = models.JSONField(null=True, blank=True)
+    # envío masivo al que pertenece (progreso) y objeto de origen ("factura:5", evita duplicados en cola)
+    lote = models.CharField(max_length=32, blank=True, db_index=True)
+    referencia = models.CharField(max_length=64, blank=True, db_index=True)
+    estado = models.CharField(max_length=20, choices=ESTADOS, default="pendiente")
+    intentos = models.PositiveSmallIntegerField(default=0)
+    proximo_intento = models.DateTimeField()
+    ultimo_error = models.TextField(blank=True)
+    creado_en = models.DateTimeField(auto_now_add=True)
+    enviado_en = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        indexes = [
+            # el worker toma los que tocan: rango (estado, proximo_intento)
+            models.Index(fields=["estado", "proximo_intento"], name="correo_estado_prox_idx"),
+        ]
+
+    def __str__(self):
+        return f"Correo #{self.pk} [{self.estado}] {self.asunto}"
@@ -1,5 +1,5 @@
 from rest_framework import serializers
-from .models import Mensaje, Resena
+from .models import Mensaje, Resena, CorreoSaliente
 
 class MensajeSerializer(serializers.ModelSerializer):
     class Meta:
@@ -10,4 +10,11 @@ class MensajeSerializer(serializers.ModelSerializer):
 class ResenaSerializer(serializers.ModelSerializer):
     class Meta:
         model = Resena
-        fields = '__all__'
\ No newline at end of file
+        fields = '__all__'
+
+
+class CorreoSalienteSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = CorreoSaliente
+        fields = ['id', 'asunto', 'destinatarios', 'estado', 'lote', 'referencia', 'intentos', 'proximo_intento', 'ultimo_error', 'creado_en', 'enviado_en']
+        read_only_fields = fields
@@ -1,3 +1,159 @@
-from django.test import TestCase
+import socket
+import socketserver
+import threading
+from datetime import timedelta
 
-# Create your tests here.
+from django.core import mail
+from django.test import TestCase, override_settings
+from django.utils import timezone
+from rest_framework.test import APITestCase
+
+from . import cola_correo
+from .models import CorreoSaliente
+
+
+class _SesionSMTP(socketserver.StreamRequestHandler):
+    """SMTP mínimo (sin TLS ni autenticación) para probar el envío real por socket."""
+
+    def _responder(self, linea):
+        self.wfile.write(linea.encode('ascii') + b'\r\n')
+
+    def handle(self):
+        servidor = self.server
+        with servidor.lock:
+            servidor.conexiones += 1
+        self._responder('220 local ESMTP')
+        destinatarios = []
+        while True:
+            linea = self.rfile.readline()
+            if not linea:
+                return
+            comando = linea.decode('utf-8', 'replace').strip()
+            verbo = comando[:4].upper()
+            if verbo in ('EHLO', 'HELO'):
+                self._responder('250 local')
+            elif verbo == 'MAIL':
+                destinatarios = []
+                self._responder('250 OK')
+            elif verbo == 'RCPT':
+                direccion = comando.split(':', 1)[1].strip(' <>')
+                if direccion in servidor.rechazar:
+                    self._responder('550 no such mailbox')
+                else:
+                    destinatarios.append(direccion)
+                    self._responder('250 OK')
+            elif verbo == 'DATA':
+                self._responder('354 fin con .')
+                while self.rfile.readline() not in (b'.\r\n', b''):
+                    pass
+                with servidor.lock:
+                    servidor.mensajes.extend(destinatarios)
+                self._responder('250 OK')
+            elif verbo == 'QUIT':
+                self._responder('221 bye')
+                return
+            else:  # RSET, NOOP
+                self._responder('250 OK')
+
+
+class _ServidorSMTP(socketserver.ThreadingTCPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(self):
+        super().__init__(('127.0.0.1', 0), _SesionSMTP)
+        self.lock = threading.Lock()
+        self.conexiones = 0
+        self.mensajes = []
+        self.rechazar = set()
+
+
+class ColaCorreoSMTPTests(TestCase):
+    def setUp(self):
+        self.servidor = _ServidorSMTP()
+        threading.Thread(target=self.servidor.serve_forever, daemon=True).start()
+        self.addCleanup(self.servidor.server_close)
+        self.addCleanup(self.servidor.shutdown)
+        smtp = override_settings(
+            EMAIL_BACKEND='django.core.mail.backends.smtp.EmailBackend',
+            EMAIL_HOST='127.0.0.1', EMAIL_PORT=self.servidor.server_address[1],
+            EMAIL_USE_TLS=False, EMAIL_HOST_USER='', EMAIL_HOST_PASSWORD='',
+            DEFAULT_FROM_EMAIL='tienda@example.com', MENSAJES_CORREO_MAX_INTENTOS=2,
+        )
+        smtp.enable()
+        self.addCleanup(smtp.disable)
+
+    def _encolar(self, *direcciones):
+        return [cola_correo.encolar('Hola', 'Cuerpo', [d]) for d in direcciones]
+
+    def test_batch_goes_over_one_connection(self):
+        self._encolar(*[f'c{i}@example.com' for i in range(5)])
+        self.assertEqual(cola_correo.procesar(), {'enviados': 5, 'reintentos': 0, 'fallidos': 0})
+        self.assertEqual(self.servidor.conexiones, 1)
+        self.assertEqual(len(self.servidor.mensajes), 5)
+        self.assertEqual(CorreoSaliente.objects.filter(estado='enviado').count(), 5)
+
+    def test_failed_message_is_retried_with_backoff_then_fails(self):
+        malo, bueno = self._encolar('malo@example.com', 'bueno@example.com')
+        self.servidor.rechazar.add('malo@example.com')
+        antes = timezone.now()
+        with self.assertLogs('mensajes.cola_correo', 'WARNING'):
+            self.assertEqual(cola_correo.procesar(), {'enviados': 1, 'reintentos': 1, 'fallidos': 0})
+        malo.refresh_from_db()
+        self.assertEqual((malo.estado, malo.intentos), ('pendiente', 1))
+        self.assertGreater(malo.proximo_intento, antes + timedelta(seconds=40))
+        self.assertIn('SMTPRecipientsRefused', malo.ultimo_error)
+        # la sesión se reabre tras el fallo para no arrastrar un estado roto
+        self.assertEqual(self.servidor.conexiones, 2)
+        self.assertEqual(self.servidor.mensajes, ['bueno@example.com'])
+
+        self.assertEqual(cola_correo.procesar()['reintentos'], 0)  # aún no toca
+        with self.assertLogs('mensajes.cola_correo', 'WARNING'):
+            resultado = cola_correo.procesar(ahora=malo.proximo_intento + timedelta(seconds=1))
+        self.assertEqual(resultado['fallidos'], 1)
+        malo.refresh_from_db()
+        self.assertEqual(malo.estado, 'fallido')
+
+    def test_server_down_reschedules_whole_batch(self):
+        self._encolar('a@example.com', 'b@example.com')
+        with socket.socket() as libre:
+            libre.bind(('127.0.0.1', 0))
+            puerto = libre.getsockname()[1]
+        with override_settings(EMAIL_PORT=puerto), self.assertLogs('mensajes.cola_correo', 'WARNING'):
+            self.assertEqual(cola_correo.procesar()['reintentos'], 2)
+        self.assertEqual(CorreoSaliente.objects.filter(estado='pendiente', intentos=1).count(), 2)
+
+
+class EnvioEncoladoAPITests(APITestCase):
+    def setUp(self):
+        from usuarios.models import Usuario
+        self.empleado = Usuario.objects.create_user(username='cor_emp', password='x', email='ce@example.com', rol='empleado')
+        self.cliente = Usuario.objects.create_user(username='cor_cli', password='x', email='cc@example.com', rol='cliente')
+
+    def test_invoice_email_returns_job_and_worker_sends_pdf(self):
+        from facturacion.models import Factura
+        factura = Factura.objects.create(cliente=self.cliente, total=0, metodo_pago='efectivo')
+        self.client.force_authenticate(self.empleado)
+        resp = self.client.post(f'/api/facturas/facturas/enviar-email/{factura.id}/')
+        self.assertEqual(resp.status_code, 202, resp.content)
+        self.assertEqual(len(mail.outbox), 0)
+
+        correo_id = resp.json()['correo_id']
+        self.assertEqual(self.client.get(f'/api/mensajes/correos/{correo_id}/').json()['estado'], 'pendiente')
+        self.assertEqual(cola_correo.drenar()['enviados'], 1)
+        self.assertEqual(mail.outbox[0].to, ['cc@example.com'])
+        self.assertEqual(mail.outbox[0].attachments[0][0], f'factura_{factura.id}.pdf')
+        factura.refresh_from_db()
+        self.assertTrue(factura.correo_enviado)
+        self.assertEqual(self.client.get(f'/api/mensajes/correos/{correo_id}/').json()['estado'], 'enviado')
+        self.assertEqual(self.client.get('/api/mensajes/correos/estado/').json()['por_estado']['enviado'], 1)
+
+    def test_password_recovery_is_queued(self):
+        from io import StringIO
+        from django.core.management import call_command
+        resp = self.client.post('/api/usuarios/recuperar/', {'email': 'cc@example.com'}, format='json')
+        self.assertEqual(resp.status_code, 202, resp.content)
+        self.assertEqual(len(mail.outbox), 0)
+        call_command('enviar_correos', stdout=StringIO())
+        self.assertEqual(len(mail.outbox), 1)
+        self.assertEqual(self.client.get(f"/api/mensajes/correos/{resp.json()['correo_id']}/").status_code, 401)
@@ -1,8 +1,9 @@
 from rest_framework import routers
-from .views import MensajeViewSet, ResenaViewSet
+from .views import MensajeViewSet, ResenaViewSet, CorreoSalienteViewSet
 
 router = routers.DefaultRouter()
 router.register(r'mensajes', MensajeViewSet)
 router.register(r'resenas', ResenaViewSet)
+router.register(r'correos', CorreoSalienteViewSet)
 
 urlpatterns = router.urls
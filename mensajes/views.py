@@ -1,6 +1,10 @@
 from rest_framework import viewsets
-from .models import Mensaje, Resena
-from .serializers import MensajeSerializer, ResenaSerializer
+from rest_framework.decorators import action
+from rest_framework.response import Response
+from inventario.permissions import EsEmpleadoOPermisoAdmin
+from .models import Mensaje, Resena, CorreoSaliente
+from .serializers import MensajeSerializer, ResenaSerializer, CorreoSalienteSerializer
+from . import cola_correo
 
 class MensajeViewSet(viewsets.ModelViewSet):
     queryset = Mensaje.objects.all().order_by('-fecha_envio')
@@ -9,3 +13,23 @@ class MensajeViewSet(viewsets.ModelViewSet):
 class ResenaViewSet(viewsets.ModelViewSet):
     queryset = Resena.objects.all().order_by('-fecha')
     serializer_class = ResenaSerializer
+
+
+class CorreoSalienteViewSet(viewsets.ReadOnlyModelViewSet):
+    """Estado de los correos encolados (el id lo devuelven las vistas que encolan)."""
+    queryset = CorreoSaliente.objects.all().order_by('-creado_en')
+    serializer_class = CorreoSalienteSerializer
+    permission_classes = [EsEmpleadoOPermisoAdmin]
+
+    def get_queryset(self):
+        qs = super().get_queryset()
+        for campo in ('estado', 'lote'):
+            valor = self.request.query_params.get(campo)
+            if valor:
+                qs = qs.filter(**{campo: valor})
+        return qs
+
+    @action(detail=False, methods=['get'])
+    def estado(self, request):
+        """Correos por estado, listos para enviar y contadores del worker de este proceso."""
+        return Response(cola_correo.info())
@@ -60,3 +60,14 @@ class DetallePedidoAdmin(admin.ModelAdmin):
     def subtotal(self, obj):
         return obj.cantidad * obj.medicamento.precio_venta if obj.medicamento else 0
     subtotal.short_description = 'Subtotal'
+
+
+from .models import ReservaStock
+
+
+@admin.register(ReservaStock)
+class ReservaStockAdmin(admin.ModelAdmin):
+    list_display = ('id', 'pedido', 'medicamento', 'cantidad', 'creada_en', 'expira_en')
+    list_filter = ('expira_en',)
+    search_fields = ('pedido__cliente__username', 'medicamento__nombre')
+    raw_id_fields = ('pedido', 'medicamento')
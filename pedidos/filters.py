@@ -0,0 +1,51 @@
+"""Filtros por parámetros de consulta para los listados de pedidos."""
+from datetime import datetime, time, timedelta
+
+from django.db.models import Q
+from django.utils import timezone
+from django.utils.dateparse import parse_date, parse_datetime
+from rest_framework.exceptions import ValidationError
+
+
+def _instante(valor, campo):
+    """``(datetime, solo_fecha)`` a partir de una fecha o fecha-hora ISO."""
+    try:
+        dia = parse_date(valor)
+        momento = datetime.combine(dia, time.min) if dia is not None else parse_datetime(valor)
+    except ValueError:
+        momento = None
+    if momento is None:
+        raise ValidationError({campo: 'Use el formato AAAA-MM-DD o una fecha-hora ISO.'})
+    if timezone.is_naive(momento):
+        momento = timezone.make_aware(momento)
+    return momento, dia is not None
+
+
+def apply_pedido_filters(qs, params):
+    estado = params.get('estado')
+    cliente = params.get('cliente')
+    fecha_from = params.get('fecha_from')
+    fecha_to = params.get('fecha_to')
+    buscar = params.get('buscar')
+
+    if estado:
+        qs = qs.filter(estado=estado)
+    if cliente:
+        qs = qs.filter(cliente_id=cliente)
+    # rangos abiertos sobre la columna (no ``__date``): así el índice de fecha sirve
+    if fecha_from:
+        qs = qs.filter(fecha_creacion__gte=_instante(fecha_from, 'fecha_from')[0])
+    if fecha_to:
+        momento, solo_fecha = _instante(fecha_to, 'fecha_to')
+        if solo_fecha:
+            # una fecha sola incluye el día entero
+            qs = qs.filter(fecha_creacion__lt=momento + timedelta(days=1))
+        else:
+            qs = qs.filter(fecha_creacion__lte=momento)
+    if buscar:
+        condicion = Q(cliente__username__icontains=buscar)
+        if buscar.isdigit():
+            condicion |= Q(pk=int(buscar))
+        qs = qs.filter(condicion)
+
+    return qs
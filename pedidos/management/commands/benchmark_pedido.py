@@ -0,0 +1,69 @@
+"""Benchmark de la creación y actualización de un pedido con muchas líneas.
+
+Crea ``--lineas`` medicamentos y mide, dentro de una transacción que se
+revierte al final:
+
+- ``fila a fila``: el camino anterior (un ``get`` del medicamento y un
+  ``DetallePedido.save()`` por línea)
+- ``crear``: ``PedidoSerializer.create`` (una lectura de precios, un
+  ``bulk_create`` de detalles y la reserva por conjuntos)
+- ``reemplazar``: ``PedidoSerializer.update`` con detalles nuevos
+
+    python manage.py benchmark_pedido --lineas 200
+"""
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+from django.test.utils import CaptureQueriesContext
+
+from droguerias.models import Drogueria
+from inventario.models import Medicamento
+from pedidos.models import DetallePedido, Pedido
+from pedidos.serializers import PedidoSerializer
+from usuarios.models import Usuario
+
+
+class Command(BaseCommand):
+    help = "Mide crear y reemplazar los detalles de un pedido de N líneas."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--lineas', type=int, default=200)
+
+    def _medir(self, etapa, lineas, funcion):
+        with CaptureQueriesContext(connection) as consultas:
+            inicio = time.perf_counter()
+            resultado = funcion()
+            segundos = time.perf_counter() - inicio
+        self.stdout.write(f"{etapa:<12} {lineas} líneas en {segundos * 1000:.1f} ms, {len(consultas)} consultas")
+        return resultado
+
+    def handle(self, *args, **options):
+        lineas = options['lineas']
+
+        with transaction.atomic():
+            drogueria = Drogueria.objects.create(nombre='Sucursal BENCHPED', codigo='BENCHPED')
+            cliente = Usuario.objects.create_user(username='bench_pedido', password='x', email='bench_pedido@example.com', rol='cliente')
+            meds = Medicamento.objects.bulk_create(
+                Medicamento(nombre=f'Bench pedido {i}', precio_venta=1000 + i, stock_actual=1000, drogueria=drogueria)
+                for i in range(lineas)
+            )
+            detalles = [{'medicamento_id': m.pk, 'cantidad': 1 + i % 3} for i, m in enumerate(meds)]
+
+            def fila_a_fila():
+                pedido = Pedido.objects.create(cliente=cliente)
+                for d in detalles:
+                    medicamento = Medicamento.objects.get(pk=d['medicamento_id'])
+                    DetallePedido.objects.create(pedido=pedido, medicamento=medicamento, cantidad=d['cantidad'])
+
+            def guardar(instancia=None, cantidad=1):
+                datos = {'cliente': cliente.pk, 'detalles_data': [dict(d, cantidad=cantidad) for d in detalles]}
+                serializer = PedidoSerializer(instancia, data=datos, partial=instancia is not None)
+                serializer.is_valid(raise_exception=True)
+                return serializer.save()
+
+            self._medir('fila a fila', lineas, fila_a_fila)
+            pedido = self._medir('crear', lineas, guardar)
+            self._medir('reemplazar', lineas, lambda: guardar(pedido, cantidad=2))
+
+            transaction.set_rollback(True)
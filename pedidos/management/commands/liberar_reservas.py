@@ -0,0 +1,36 @@
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections
+
+from inventario import auditoria
+from pedidos.reservas import LOTE_BARRIDO, barrer
+
+
+class Command(BaseCommand):
+    help = "Libera las reservas de stock vencidas de pedidos pendientes (cron cada minuto, o --cada N como proceso)."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--lote', type=int, default=LOTE_BARRIDO, help='Reservas por transacción.')
+        parser.add_argument('--cada', type=float, default=0, help='Repetir cada N segundos en lugar de salir.')
+
+    def _barrer(self, lote):
+        informe = barrer(lote=lote)
+        if informe['reservas_liberadas']:
+            auditoria.registrar(action='reservas_vencidas_liberadas', model_name='ReservaStock', data=informe)
+            self.stdout.write(self.style.SUCCESS(
+                f"Reservas: {informe['reservas_liberadas']} liberadas de {informe['pedidos']} pedidos "
+                f"en {informe['segundos']} s."
+            ))
+        return informe
+
+    def handle(self, *args, **options):
+        if not options['cada']:
+            informe = self._barrer(options['lote'])
+            if not informe['reservas_liberadas']:
+                self.stdout.write("Reservas: ninguna vencida.")
+            return
+        while True:
+            close_old_connections()
+            self._barrer(options['lote'])
+            time.sleep(options['cada'])
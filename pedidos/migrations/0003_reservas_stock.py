@@ -0,0 +1,29 @@
+# Generated by Django 5.2.8 on 2026-10-18 12:34
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('inventario', '0015_transferencias'),
+        ('pedidos', '0002_initial'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ReservaStock',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('cantidad', models.PositiveIntegerField()),
+                ('creada_en', models.DateTimeField(auto_now_add=True)),
+                ('expira_en', models.DateTimeField(blank=True, null=True)),
+                ('medicamento', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='reservas_pedido', to='inventario.medicamento')),
+                ('pedido', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='reservas', to='pedidos.pedido')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['expira_en'], name='reserva_expira_idx')],
+            },
+        ),
+    ]
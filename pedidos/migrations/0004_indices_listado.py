@@ -0,0 +1,23 @@
+# Generated by Django 5.2.8 on 2026-10-18 12:41
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('pedidos', '0003_reservas_stock'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='pedido',
+            index=models.Index(fields=['fecha_creacion', 'id'], name='pedido_fecha_id_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='pedido',
+            index=models.Index(fields=['estado', 'fecha_creacion', 'id'], name='pedido_estado_fecha_idx'),
+        ),
+    ]
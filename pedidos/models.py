@@ -15,6 +15,13 @@ class Pedido(models.Model):
     estado = models.CharField(max_length=20, choices=ESTADOS, default="pendiente")
     total = models.DecimalField(max_digits=10, decimal_places=2, default=Decimal('0.00'))
 
+    class Meta:
+        indexes = [
+            # listado más reciente primero y paginación por cursor (KeysetPagination)
+            models.Index(fields=['fecha_creacion', 'id'], name='pedido_fecha_id_idx'),
+            models.Index(fields=['estado', 'fecha_creacion', 'id'], name='pedido_estado_fecha_idx'),
+        ]
+
     def __str__(self):
         cliente_nombre = self.cliente.username if self.cliente else "Cliente eliminado"
         return f"Pedido #{self.id} - {cliente_nombre}"
@@ -33,3 +40,25 @@ class DetallePedido(models.Model):
 
     def __str__(self):
         return f"{self.medicamento.nombre} x {self.cantidad}"
+
+
+class ReservaStock(models.Model):
+    """Unidades apartadas para un pedido (``Medicamento.stock_reservado``) hasta ``expira_en``.
+
+    Mientras el pedido está pendiente la reserva vence; al procesarlo deja de
+    vencer (``expira_en = None``). Ver ``pedidos/reservas.py``.
+    """
+    pedido = models.ForeignKey(Pedido, on_delete=models.CASCADE, related_name="reservas")
+    medicamento = models.ForeignKey(Medicamento, on_delete=models.CASCADE, related_name="reservas_pedido")
+    cantidad = models.PositiveIntegerField()
+    creada_en = models.DateTimeField(auto_now_add=True)
+    expira_en = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        indexes = [
+            # el barrido recorre solo el rango vencido del índice
+            models.Index(fields=['expira_en'], name='reserva_expira_idx'),
+        ]
+
+    def __str__(self):
+        return f"Reserva pedido #{self.pedido_id}: {self.medicamento_id} x{self.cantidad}"
@@ -0,0 +1,237 @@
+"""Reservas de stock con vencimiento para los pedidos.
+
+Antes dos clientes podían comprar la última unidad: crear un pedido no
+apartaba nada. Ahora, al crearlo, las cantidades de sus detalles se
+reservan con ``stock.reservar_varios`` (``UPDATE`` condicional, todo o
+nada) y se guarda una ``ReservaStock`` por medicamento con ``expira_en``:
+
+- ``pendiente``: la reserva vence a los ``PEDIDOS_RESERVA_MINUTOS`` minutos
+- ``procesado``: la reserva se conserva y deja de vencer
+- ``entregado``: la reserva se consume (salida de inventario)
+- ``procesado``/``entregado`` tras vencer: se vuelve a reservar lo que falte de
+  los detalles (``reponer``); sin disponible, el cambio se rechaza
+- ``cancelado`` o vencida: las unidades vuelven a estar disponibles
+
+``barrer()`` (``manage.py liberar_reservas``, en cron o con ``--cada`` como
+proceso aparte) libera las vencidas por lotes recorriendo el índice de
+``expira_en``. El pedido queda ``pendiente``; solo si
+``PEDIDOS_CANCELAR_VENCIDOS`` está activo (por defecto no) se cancelan los
+pendientes que se quedaron sin reserva, con un registro de auditoría por pedido.
+"""
+import threading
+import time
+from collections import defaultdict
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Count, Sum
+from django.utils import timezone
+
+from inventario import auditoria, stock
+
+RESERVA_MINUTOS = getattr(settings, 'PEDIDOS_RESERVA_MINUTOS', 30)
+LOTE_BARRIDO = getattr(settings, 'PEDIDOS_RESERVA_LOTE', 1000)
+CANCELAR_VENCIDOS = getattr(settings, 'PEDIDOS_CANCELAR_VENCIDOS', False)
+
+
+class _Contadores:
+    """Operaciones hechas por este proceso (el estado vigente sale de la base, ver ``info``)."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.reservadas = 0
+        self.rechazadas = 0
+        self.vencidas = 0
+        self.canceladas = 0
+        self.consumidas = 0
+
+    def sumar(self, campo, n=1):
+        with self._lock:
+            setattr(self, campo, getattr(self, campo) + n)
+
+    def info(self):
+        with self._lock:
+            return {
+                'reservadas': self.reservadas,
+                'rechazadas_sin_stock': self.rechazadas,
+                'liberadas_vencidas': self.vencidas,
+                'liberadas_canceladas': self.canceladas,
+                'consumidas': self.consumidas,
+            }
+
+
+contadores = _Contadores()
+
+
+def _cantidades(pares):
+    total = defaultdict(int)
+    for medicamento_id, cantidad in pares:
+        total[medicamento_id] += cantidad
+    return dict(total)
+
+
+def reservar(pedido, pares, ahora=None):
+    """Reserva ``pares`` (``(medicamento_id, cantidad)``) para ``pedido``. Todo o nada.
+
+    Lanza ``stock.StockInsuficiente`` (con ``faltantes``) si algún
+    medicamento no tiene disponible.
+    """
+    from .models import ReservaStock
+
+    cantidades = _cantidades(pares)
+    if not cantidades:
+        return []
+    ahora = ahora or timezone.now()
+    vence = None if pedido.estado == 'procesado' else ahora + timedelta(minutes=RESERVA_MINUTOS)
+    with transaction.atomic():
+        try:
+            stock.reservar_varios(cantidades)
+        except stock.StockInsuficiente:
+            contadores.sumar('rechazadas')
+            raise
+        reservas = ReservaStock.objects.bulk_create([
+            ReservaStock(pedido=pedido, medicamento_id=pk, cantidad=n, expira_en=vence)
+            for pk, n in cantidades.items()
+        ])
+    contadores.sumar('reservadas', len(reservas))
+    return reservas
+
+
+def _liberar(reservas, motivo):
+    """Devuelve al disponible las ``reservas`` (queryset) y las borra. Devuelve cuántas eran."""
+    from .models import ReservaStock
+
+    filas = list(reservas.select_for_update().values_list('id', 'medicamento_id', 'cantidad'))
+    if not filas:
+        return 0
+    stock.liberar_varios(_cantidades((m, n) for _, m, n in filas))
+    ReservaStock.objects.filter(pk__in=[i for i, _, _ in filas]).delete()
+    contadores.sumar(motivo, len(filas))
+    return len(filas)
+
+
+def liberar(pedido):
+    """Libera todas las reservas del pedido (cancelación o cambio de detalles)."""
+    with transaction.atomic():
+        return _liberar(pedido.reservas.all(), 'canceladas')
+
+
+def consumir(pedido, usuario=None):
+    """Pedido entregado: lo reservado sale del inventario y la reserva desaparece."""
+    from inventario.movimientos import registrar_lote
+
+    with transaction.atomic():
+        filas = list(pedido.reservas.select_for_update().values_list('medicamento_id', 'cantidad'))
+        if not filas:
+            return 0
+        stock.liberar_varios(_cantidades(filas))
+        pedido.reservas.all().delete()
+        registrar_lote([
+            {'medicamento_id': m, 'tipo_movimiento': 'salida', 'cantidad': n, 'observacion': f'Pedido #{pedido.pk}'}
+            for m, n in _cantidades(filas).items()
+        ], usuario=usuario)
+    contadores.sumar('consumidas', len(filas))
+    return len(filas)
+
+
+def reponer(pedido, ahora=None):
+    """Reserva lo que les falta a los detalles del pedido (su reserva venció y se liberó).
+
+    Lanza ``stock.StockInsuficiente`` si ya no hay disponible.
+    """
+    with transaction.atomic():
+        faltan = _cantidades(pedido.detalles.values_list('medicamento_id', 'cantidad'))
+        for medicamento_id, cantidad in pedido.reservas.select_for_update().values_list('medicamento_id', 'cantidad'):
+            faltan[medicamento_id] = faltan.get(medicamento_id, 0) - cantidad
+        return reservar(pedido, [(m, n) for m, n in faltan.items() if n > 0], ahora)
+
+
+def al_cambiar_estado(pedido, anterior, usuario=None):
+    """Ajusta las reservas cuando el pedido pasa de ``anterior`` a ``pedido.estado``.
+
+    Lanza ``stock.StockInsuficiente`` si hay que reponer una reserva vencida y
+    no queda disponible.
+    """
+    if pedido.estado == anterior:
+        return
+    if pedido.estado == 'cancelado':
+        liberar(pedido)
+    elif pedido.estado == 'procesado':
+        reponer(pedido)
+        pedido.reservas.update(expira_en=None)
+    elif pedido.estado == 'entregado':
+        reponer(pedido)
+        consumir(pedido, usuario)
+
+
+def _cancelar_sin_reserva(pedido_ids):
+    """Cancela los pedidos pendientes de ``pedido_ids`` sin ninguna reserva viva."""
+    from .models import Pedido, ReservaStock
+
+    cancelar = list(
+        Pedido.objects.select_for_update().filter(pk__in=pedido_ids, estado='pendiente')
+        .exclude(pk__in=ReservaStock.objects.filter(pedido_id__in=pedido_ids).values('pedido_id'))
+        .values_list('pk', flat=True)
+    )
+    if not cancelar:
+        return 0
+    Pedido.objects.filter(pk__in=cancelar).update(estado='cancelado')
+    for pk in cancelar:
+        auditoria.registrar(
+            action='pedido_cancelado_por_vencimiento', model_name='Pedido', object_id=pk,
+            message=f'Reserva vencida tras {RESERVA_MINUTOS} minutos',
+        )
+    return len(cancelar)
+
+
+def barrer(ahora=None, lote=None, cancelar=None):
+    """Libera las reservas vencidas, ``lote`` por transacción. Devuelve un resumen.
+
+    Con ``cancelar`` (por defecto ``PEDIDOS_CANCELAR_VENCIDOS``) también
+    cancela los pedidos pendientes que se quedaron sin reserva.
+    """
+    from .models import ReservaStock
+
+    inicio = time.monotonic()
+    ahora = ahora or timezone.now()
+    lote = lote or LOTE_BARRIDO
+    cancelar = CANCELAR_VENCIDOS if cancelar is None else cancelar
+    liberadas, canceladas, pedidos = 0, 0, set()
+    while True:
+        with transaction.atomic():
+            # rango sobre reserva_expira_idx; skip_locked: dos barredores no se pisan
+            ids = list(
+                ReservaStock.objects.select_for_update(skip_locked=True)
+                .filter(expira_en__lte=ahora).order_by('expira_en')
+                .values_list('id', 'pedido_id')[:lote]
+            )
+            if not ids:
+                break
+            liberadas += _liberar(ReservaStock.objects.filter(pk__in=[i for i, _ in ids]), 'vencidas')
+            tocados = {p for _, p in ids}
+            if cancelar:
+                canceladas += _cancelar_sin_reserva(tocados)
+            pedidos |= tocados
+        if len(ids) < lote:
+            break
+    return {
+        'reservas_liberadas': liberadas,
+        'pedidos': len(pedidos),
+        'pedidos_cancelados': canceladas,
+        'segundos': round(time.monotonic() - inicio, 3),
+    }
+
+
+def info(ahora=None):
+    """Reservas vivas y vencidas sin barrer (de la base) más los contadores del proceso."""
+    from .models import ReservaStock
+
+    ahora = ahora or timezone.now()
+    vivas = ReservaStock.objects.aggregate(reservas=Count('id'), unidades=Sum('cantidad'), pedidos=Count('pedido', distinct=True))
+    return {
+        'activas': {k: v or 0 for k, v in vivas.items()},
+        'vencidas_pendientes': ReservaStock.objects.filter(expira_en__lte=ahora).count(),
+        'proceso': contadores.info(),
+    }
+
@@ -1,21 +1,63 @@
+from django.db import transaction
 from rest_framework import serializers
 from .models import Pedido, DetallePedido
+from . import reservas
+from inventario.models import Medicamento
+from inventario.mixins import optimizar_queryset
+from inventario.stock import StockInsuficiente
 from inventario.serializer import MedicamentoSerializer
 from usuarios.models import Usuario
 from decimal import Decimal
 
+_BLOQUE = 500
+
+
 class DetallePedidoSerializer(serializers.ModelSerializer):
     medicamento = MedicamentoSerializer(read_only=True)
-    medicamento_id = serializers.PrimaryKeyRelatedField(
-        queryset=MedicamentoSerializer.Meta.model.objects.all(),
-        source="medicamento",
-        write_only=True
-    )
+    # id plano: todos los medicamentos del pedido se leen juntos en _construir_detalles
+    medicamento_id = serializers.IntegerField(min_value=1, write_only=True)
 
     class Meta:
         model = DetallePedido
         fields = ["id", "medicamento", "medicamento_id", "cantidad", "subtotal"]
 
+
+class DetallePedidoResumenSerializer(serializers.ModelSerializer):
+    """Detalle compacto para los listados: id y nombre del medicamento en vez del objeto completo."""
+    medicamento_nombre = serializers.CharField(source="medicamento.nombre", read_only=True)
+
+    class Meta:
+        model = DetallePedido
+        fields = ["id", "medicamento", "medicamento_nombre", "cantidad", "subtotal"]
+        read_only_fields = fields
+
+
+def _construir_detalles(detalles_data):
+    """``DetallePedido`` sin guardar y el total del pedido, con una sola consulta de precios.
+
+    Lanza ``ValidationError`` si algún medicamento no existe.
+    """
+    ids = {d["medicamento_id"] for d in detalles_data}
+    precios = dict(Medicamento.objects.filter(pk__in=ids).values_list("pk", "precio_venta")) if ids else {}
+    faltan = sorted(ids - set(precios))
+    if faltan:
+        raise serializers.ValidationError({"detalles_data": f"Medicamentos inexistentes: {faltan}"})
+
+    nuevos, total = [], Decimal("0.00")
+    for d in detalles_data:
+        subtotal = precios[d["medicamento_id"]] * d["cantidad"]
+        nuevos.append(DetallePedido(medicamento_id=d["medicamento_id"], cantidad=d["cantidad"], subtotal=subtotal))
+        total += subtotal
+    return nuevos, total
+
+
+def _sin_stock(error):
+    """``ValidationError`` con el disponible de cada medicamento sin stock."""
+    return serializers.ValidationError({"detalles_data": {
+        pk: f"Stock insuficiente: disponibles {disponible}" for pk, disponible in error.faltantes.items()
+    } or str(error)})
+
+
 class PedidoSerializer(serializers.ModelSerializer):
     detalles = DetallePedidoSerializer(many=True, read_only=True)
     detalles_data = DetallePedidoSerializer(many=True, write_only=True, required=False)
@@ -26,43 +68,70 @@ class PedidoSerializer(serializers.ModelSerializer):
     class Meta:
         model = Pedido
         fields = ["id", "cliente", "fecha_creacion", "estado", "total", "detalles", "detalles_data"]
+        # el total sale siempre de los detalles
+        read_only_fields = ["total"]
+
+    def _guardar_detalles(self, pedido, nuevos):
+        """Inserta los detalles con ``bulk_create`` (el subtotal ya viene calculado) y reserva su stock."""
+        for d in nuevos:
+            d.pedido = pedido
+        DetallePedido.objects.bulk_create(nuevos, batch_size=_BLOQUE)
+        if pedido.estado != "cancelado":
+            self._reservar(pedido, nuevos)
+
+    def _reservar(self, pedido, nuevos):
+        """Aparta el stock de los detalles; sin disponible, el pedido entero se rechaza."""
+        try:
+            reservas.reservar(pedido, [(d.medicamento_id, d.cantidad) for d in nuevos])
+        except StockInsuficiente as e:
+            raise _sin_stock(e)
+
+    def _usuario(self):
+        request = self.context.get("request")
+        return getattr(request, "user", None) if request and request.user.is_authenticated else None
+
+    def _releer(self, pedido):
+        """El pedido con sus detalles precargados para la respuesta (consultas fijas)."""
+        return optimizar_queryset(Pedido.objects.filter(pk=pedido.pk), PedidoSerializer).get()
 
     def create(self, validated_data):
-        detalles_data = validated_data.pop("detalles_data", [])
-        cliente = validated_data.get("cliente")
-        pedido = Pedido.objects.create(cliente=cliente, **validated_data)
-        total = Decimal('0.00')
-
-        for detalle_data in detalles_data:
-            medicamento = detalle_data["medicamento"]
-            cantidad = detalle_data["cantidad"]
-            subtotal = medicamento.precio_venta * cantidad
-            DetallePedido.objects.create(
-                pedido=pedido, medicamento=medicamento, cantidad=cantidad, subtotal=subtotal
-            )
-            total += subtotal
-
-        pedido.total = total
-        pedido.save()
-        return pedido
+        nuevos, total = _construir_detalles(validated_data.pop("detalles_data", []))
+        with transaction.atomic():
+            pedido = Pedido.objects.create(total=total, **validated_data)
+            self._guardar_detalles(pedido, nuevos)
+        return self._releer(pedido)
 
     def update(self, instance, validated_data):
-        detalles_data = validated_data.pop("detalles_data", [])
-        instance.estado = validated_data.get("estado", instance.estado)
-        instance.save()
-
-        if detalles_data:
-            instance.detalles.all().delete()
-            total = 0
-            for detalle_data in detalles_data:
-                medicamento = detalle_data["medicamento"]
-                cantidad = detalle_data["cantidad"]
-                subtotal = medicamento.precio_venta * cantidad
-                DetallePedido.objects.create(
-                    pedido=instance, medicamento=medicamento, cantidad=cantidad, subtotal=subtotal
-                )
-                total += subtotal
-            instance.total = total
-            instance.save()
-
-        return instance
+        detalles_data = validated_data.pop("detalles_data", None)
+        anterior = instance.estado
+        with transaction.atomic():
+            instance.estado = validated_data.get("estado", instance.estado)
+            campos = ["estado"]
+
+            # detalles_data con líneas: los detalles se reemplazan (vacío o ausente los conserva)
+            if detalles_data:
+                nuevos, instance.total = _construir_detalles(detalles_data)
+                campos.append("total")
+                instance.detalles.all().delete()
+                # las reservas siguen a los detalles nuevos
+                reservas.liberar(instance)
+                self._guardar_detalles(instance, nuevos)
+
+            instance.save(update_fields=campos)
+            try:
+                reservas.al_cambiar_estado(instance, anterior, usuario=self._usuario())
+            except StockInsuficiente as e:
+                # la reserva venció y ya no hay con qué reponerla
+                raise _sin_stock(e)
+        return self._releer(instance)
+
+
+class PedidoResumenSerializer(serializers.ModelSerializer):
+    """Pedido para listados paginados (``?expand=medicamento`` usa ``PedidoSerializer``)."""
+    cliente_nombre = serializers.CharField(source="cliente.username", read_only=True)
+    detalles = DetallePedidoResumenSerializer(many=True, read_only=True)
+
+    class Meta:
+        model = Pedido
+        fields = ["id", "cliente", "cliente_nombre", "fecha_creacion", "estado", "total", "detalles"]
+        read_only_fields = fields
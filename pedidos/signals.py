@@ -0,0 +1,10 @@
+from django.db.models.signals import pre_delete
+from django.dispatch import receiver
+from .models import Pedido
+from . import reservas
+
+
+@receiver(pre_delete, sender=Pedido)
+def pedido_liberar_reservas(sender, instance: Pedido, **kwargs):
+    # el CASCADE borraría las reservas sin devolver su stock
+    reservas.liberar(instance)
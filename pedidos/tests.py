@@ -1,3 +1,296 @@
-from django.test import TestCase
+from rest_framework.test import APITestCase
+from usuarios.models import Usuario
+from droguerias.models import Drogueria
+from inventario.models import Categoria, Medicamento
+from .models import Pedido, DetallePedido
 
-# Create your tests here.
+
+class PedidoQueryCountTests(APITestCase):
+    def setUp(self):
+        self.cliente = Usuario.objects.create_user(username='cli', password='x', email='cli@example.com', rol='cliente')
+        self.d1 = Drogueria.objects.create(codigo='P1', nombre='Pedidos')
+        self.cat = Categoria.objects.create(nombre='Analgésicos')
+        self.meds = [
+            Medicamento.objects.create(nombre=f'PM{i}', precio_venta=5.0, stock_actual=50, categoria=self.cat, drogueria=self.d1)
+            for i in range(4)
+        ]
+        self._crear_pedidos(3)
+        self.client.force_authenticate(self.cliente)
+
+    def _crear_pedidos(self, n):
+        for _ in range(n):
+            pedido = Pedido.objects.create(cliente=self.cliente)
+            for med in self.meds:
+                DetallePedido.objects.create(pedido=pedido, medicamento=med, cantidad=2)
+
+    def test_pedido_listings_use_constant_queries(self):
+        # pedidos + detalles (prefetch con medicamento/categoria/drogueria en JOIN)
+        with self.assertNumQueries(2):
+            resp = self.client.get('/api/pedidos/crud/')
+        self.assertEqual(resp.status_code, 200)
+        self.assertEqual(len(resp.json()), 3)
+        # paginado: count + página + detalles
+        with self.assertNumQueries(3):
+            resp = self.client.get('/api/pedidos/listar/')
+        self.assertEqual(resp.status_code, 200)
+        self.assertEqual(len(resp.json()['results']), 3)
+
+        self._crear_pedidos(4)
+        with self.assertNumQueries(2):
+            self.client.get('/api/pedidos/crud/')
+        for url in ('/api/pedidos/listar/', '/api/pedidos/listar/?expand=medicamento'):
+            with self.subTest(url=url, pedidos=7):
+                with self.assertNumQueries(3):
+                    self.client.get(url)
+
+
+class ListaPedidosTests(APITestCase):
+    def setUp(self):
+        from datetime import datetime
+        from django.utils import timezone
+        self.c1 = Usuario.objects.create_user(username='lista1', password='x', email='lista1@example.com', rol='cliente')
+        self.c2 = Usuario.objects.create_user(username='lista2', password='x', email='lista2@example.com', rol='cliente')
+        d1 = Drogueria.objects.create(codigo='L1', nombre='Listado')
+        self.med = Medicamento.objects.create(nombre='LM1', precio_venta=4, stock_actual=50, drogueria=d1)
+        self.pedidos = []
+        for i, (cliente, estado) in enumerate([(self.c1, 'pendiente'), (self.c1, 'entregado'), (self.c2, 'pendiente')]):
+            pedido = Pedido.objects.create(cliente=cliente, estado=estado)
+            DetallePedido.objects.create(pedido=pedido, medicamento=self.med, cantidad=i + 1)
+            self.pedidos.append(pedido)
+        # fecha_creacion es auto_now_add: fijarla después
+        for pedido, dia in zip(self.pedidos, (1, 15, 28)):
+            Pedido.objects.filter(pk=pedido.pk).update(fecha_creacion=timezone.make_aware(datetime(2026, 2, dia, 10)))
+        self.client.force_authenticate(self.c1)
+
+    def _ids(self, query=''):
+        resp = self.client.get(f'/api/pedidos/listar/{query}')
+        self.assertEqual(resp.status_code, 200, resp.content)
+        return [p['id'] for p in resp.json()['results']]
+
+    def test_compact_details_and_expand(self):
+        data = self.client.get('/api/pedidos/listar/').json()
+        self.assertEqual(data['count'], 3)
+        detalle = data['results'][0]['detalles'][0]
+        self.assertEqual(detalle['medicamento'], self.med.id)
+        self.assertEqual(detalle['medicamento_nombre'], 'LM1')
+        self.assertEqual(data['results'][0]['cliente_nombre'], 'lista2')
+
+        detalle = self.client.get('/api/pedidos/listar/?expand=medicamento').json()['results'][0]['detalles'][0]
+        self.assertEqual(detalle['medicamento']['nombre'], 'LM1')
+        self.assertIn('drogueria', detalle['medicamento'])
+        self.assertEqual(self.client.get('/api/pedidos/listar/?expand=todo').status_code, 400)
+
+    def test_filters_and_pages(self):
+        p1, p2, p3 = (p.id for p in self.pedidos)
+        self.assertEqual(self._ids(), [p3, p2, p1])
+        self.assertEqual(self._ids('?estado=pendiente'), [p3, p1])
+        self.assertEqual(self._ids(f'?cliente={self.c1.id}'), [p2, p1])
+        self.assertEqual(self._ids('?fecha_from=2026-02-15&fecha_to=2026-02-15'), [p2])
+        self.assertEqual(self._ids('?fecha_to=2026-02-14'), [p1])
+        self.assertEqual(self._ids('?buscar=lista2'), [p3])
+        for malo in ('ayer', '2026-02-30'):
+            self.assertEqual(self.client.get(f'/api/pedidos/listar/?fecha_from={malo}').status_code, 400)
+        self.assertEqual(self.client.get(f'/api/pedidos/crud/?cliente={self.c2.id}').json()[0]['id'], p3)
+
+        pagina = self.client.get('/api/pedidos/listar/?page_size=2').json()
+        self.assertEqual(len(pagina['results']), 2)
+        self.assertIsNotNone(pagina['next'])
+        cursor = self.client.get('/api/pedidos/listar/?paginacion=cursor&page_size=2').json()
+        siguiente = self.client.get(cursor['next']).json()
+        self.assertEqual([p['id'] for p in siguiente['results']], [p1])
+
+
+class ReservaPedidoTests(APITestCase):
+    def setUp(self):
+        self.cliente = Usuario.objects.create_user(username='res', password='x', email='res@example.com', rol='cliente')
+        self.emp = Usuario.objects.create_user(username='res_emp', password='x', email='res_emp@example.com', rol='empleado')
+        self.d1 = Drogueria.objects.create(codigo='R1', nombre='Reservas')
+        self.m1 = Medicamento.objects.create(nombre='RM1', precio_venta=5, stock_actual=3, drogueria=self.d1)
+        self.m2 = Medicamento.objects.create(nombre='RM2', precio_venta=2, stock_actual=10, drogueria=self.d1)
+        self.client.force_authenticate(self.cliente)
+
+    def _pedir(self, *lineas):
+        return self.client.post('/api/pedidos/crud/', {
+            'cliente': self.cliente.id,
+            'detalles_data': [{'medicamento_id': m.id, 'cantidad': n} for m, n in lineas],
+        }, format='json')
+
+    def _stock(self, med):
+        med.refresh_from_db()
+        return med.stock_actual, med.stock_reservado
+
+    def test_create_reserves_and_last_unit_cannot_be_sold_twice(self):
+        from .models import ReservaStock
+        resp = self._pedir((self.m1, 2), (self.m2, 4))
+        self.assertEqual(resp.status_code, 201, resp.content)
+        self.assertEqual(self._stock(self.m1), (3, 2))
+        self.assertEqual(self._stock(self.m2), (10, 4))
+        self.assertTrue(all(r.expira_en for r in ReservaStock.objects.all()))
+
+        resp = self._pedir((self.m2, 1), (self.m1, 2))  # solo queda 1 de m1
+        self.assertEqual(resp.status_code, 400)
+        self.assertIn(str(self.m1.id), resp.json()['detalles_data'])
+        self.assertEqual(Pedido.objects.count(), 1)
+        self.assertEqual(self._stock(self.m2), (10, 4))
+
+    def test_state_transitions(self):
+        from inventario.models import MovimientoInventario
+        from .models import ReservaStock
+        pedido_id = self._pedir((self.m1, 2)).json()['id']
+        self.client.patch(f'/api/pedidos/crud/{pedido_id}/', {'estado': 'procesado'}, format='json')
+        self.assertEqual(list(ReservaStock.objects.values_list('expira_en', flat=True)), [None])
+
+        resp = self.client.patch(f'/api/pedidos/crud/{pedido_id}/', {'estado': 'entregado'}, format='json')
+        self.assertEqual(resp.status_code, 200, resp.content)
+        self.assertEqual(self._stock(self.m1), (1, 0))
+        self.assertFalse(ReservaStock.objects.exists())
+        self.assertTrue(MovimientoInventario.objects.filter(medicamento=self.m1, tipo_movimiento='salida', cantidad=2).exists())
+
+        pedido_id = self._pedir((self.m1, 1)).json()['id']
+        self.assertEqual(self._stock(self.m1), (1, 1))
+        self.client.delete(f'/api/pedidos/crud/{pedido_id}/')
+        self.assertEqual(self._stock(self.m1), (1, 0))
+
+    def test_sweeper_releases_expired_and_counts(self):
+        from datetime import timedelta
+        from io import StringIO
+        from django.core.management import call_command
+        from django.utils import timezone
+        from . import reservas
+        from .models import ReservaStock
+        vencido = self._pedir((self.m1, 1), (self.m2, 2)).json()['id']
+        en_proceso = self._pedir((self.m1, 1)).json()['id']
+        vigente = self._pedir((self.m2, 3)).json()['id']
+        ReservaStock.objects.filter(pedido_id=vencido).update(expira_en=timezone.now() - timedelta(minutes=1))
+        Pedido.objects.filter(pk=en_proceso).update(estado='procesado')
+        ReservaStock.objects.filter(pedido_id=en_proceso).update(expira_en=None)
+
+        antes = reservas.contadores.info()['liberadas_vencidas']
+        informe = reservas.barrer(lote=1)  # varios lotes
+        self.assertEqual((informe['reservas_liberadas'], informe['pedidos']), (2, 1))
+        self.assertEqual(reservas.contadores.info()['liberadas_vencidas'] - antes, 2)
+        self.assertEqual(self._stock(self.m1), (3, 1))
+        self.assertEqual(self._stock(self.m2), (10, 3))
+        self.assertEqual(informe['pedidos_cancelados'], 0)
+        estados = dict(Pedido.objects.values_list('id', 'estado'))
+        # sin PEDIDOS_CANCELAR_VENCIDOS el pedido solo pierde la reserva
+        self.assertEqual((estados[vencido], estados[en_proceso], estados[vigente]), ('pendiente', 'procesado', 'pendiente'))
+        call_command('liberar_reservas', stdout=StringIO())  # nada más que barrer
+
+        self.client.force_authenticate(self.emp)
+        info = self.client.get('/api/pedidos/reservas-stats/').json()
+        self.assertEqual(info['activas'], {'reservas': 2, 'unidades': 4, 'pedidos': 2})
+        self.assertEqual(info['vencidas_pendientes'], 0)
+        self.assertIn('liberadas_vencidas', info['proceso'])
+        self.client.force_authenticate(self.cliente)
+        self.assertEqual(self.client.get('/api/pedidos/reservas-stats/').status_code, 403)
+
+    def test_sweeper_cancels_expired_orders_only_when_enabled(self):
+        from datetime import timedelta
+        from django.utils import timezone
+        from inventario.auditoria import cola
+        from inventario.models import AuditLog
+        from . import reservas
+        from .models import ReservaStock
+        vencido = self._pedir((self.m1, 1), (self.m2, 2)).json()['id']
+        a_medias = self._pedir((self.m1, 1), (self.m2, 1)).json()['id']
+        ReservaStock.objects.filter(pedido_id=vencido).update(expira_en=timezone.now() - timedelta(minutes=1))
+        # solo vence una de sus dos reservas: conserva la otra y sigue pendiente
+        ReservaStock.objects.filter(pedido_id=a_medias, medicamento=self.m1).update(expira_en=timezone.now() - timedelta(minutes=1))
+
+        with self.captureOnCommitCallbacks(execute=True):
+            informe = reservas.barrer(lote=1, cancelar=True)
+        cola.flush()
+        self.assertEqual((informe['reservas_liberadas'], informe['pedidos_cancelados']), (3, 1))
+        estados = dict(Pedido.objects.values_list('id', 'estado'))
+        self.assertEqual((estados[vencido], estados[a_medias]), ('cancelado', 'pendiente'))
+        self.assertEqual(
+            list(AuditLog.objects.filter(action='pedido_cancelado_por_vencimiento').values_list('model_name', 'object_id')),
+            [('Pedido', vencido)],
+        )
+
+    def test_order_whose_reservation_expired_is_reserved_again_when_delivered(self):
+        from datetime import timedelta
+        from django.utils import timezone
+        from inventario.models import MovimientoInventario
+        from . import reservas
+        from .models import ReservaStock
+        pedido_id = self._pedir((self.m1, 2), (self.m2, 1)).json()['id']
+        ReservaStock.objects.update(expira_en=timezone.now() - timedelta(minutes=1))
+        reservas.barrer()
+        self.assertEqual(Pedido.objects.get(pk=pedido_id).estado, 'pendiente')
+        self.assertEqual(self._stock(self.m1), (3, 0))
+
+        # mientras tanto otro cliente se lleva dos unidades de m1
+        otro = self._pedir((self.m1, 2)).json()['id']
+        self.client.force_authenticate(self.emp)
+        resp = self.client.patch(f'/api/pedidos/crud/{pedido_id}/', {'estado': 'entregado'}, format='json')
+        self.assertEqual(resp.status_code, 400)
+        self.assertIn(str(self.m1.id), resp.json()['detalles_data'])
+        self.assertEqual(Pedido.objects.get(pk=pedido_id).estado, 'pendiente')
+        self.assertEqual((self._stock(self.m1), self._stock(self.m2)), ((3, 2), (10, 0)))
+
+        self.client.delete(f'/api/pedidos/crud/{otro}/')
+        resp = self.client.patch(f'/api/pedidos/crud/{pedido_id}/', {'estado': 'entregado'}, format='json')
+        self.assertEqual(resp.status_code, 200, resp.content)
+        self.assertEqual((self._stock(self.m1), self._stock(self.m2)), ((1, 0), (9, 0)))
+        self.assertEqual(
+            sorted(MovimientoInventario.objects.filter(tipo_movimiento='salida').values_list('medicamento_id', 'cantidad')),
+            [(self.m1.id, 2), (self.m2.id, 1)],
+        )
+
+
+class PedidoEscrituraTests(APITestCase):
+    def setUp(self):
+        self.cliente = Usuario.objects.create_user(username='esc', password='x', email='esc@example.com', rol='cliente')
+        self.d1 = Drogueria.objects.create(codigo='E1', nombre='Escritura')
+        self.meds = Medicamento.objects.bulk_create(
+            Medicamento(nombre=f'EM{i}', precio_venta=10 + i, stock_actual=100, drogueria=self.d1) for i in range(60)
+        )
+        self.client.force_authenticate(self.cliente)
+
+    def _datos(self, meds, cantidad=2):
+        return {'cliente': self.cliente.id, 'detalles_data': [{'medicamento_id': m.id, 'cantidad': cantidad} for m in meds]}
+
+    def test_create_uses_constant_queries(self):
+        from django.db import connection
+        from django.test.utils import CaptureQueriesContext
+        consultas = []
+        for n in (1, 3, 60):  # el primero calienta cachés de un solo uso
+            with CaptureQueriesContext(connection) as ctx:
+                resp = self.client.post('/api/pedidos/crud/', self._datos(self.meds[:n]), format='json')
+            self.assertEqual(resp.status_code, 201, resp.content)
+            self.assertEqual(len(resp.json()['detalles']), n)
+            consultas.append(len(ctx))
+        self.assertEqual(consultas[1], consultas[2])
+
+        pedido = Pedido.objects.get(pk=resp.json()['id'])
+        self.assertEqual(pedido.total, sum(m.precio_venta * 2 for m in self.meds))
+        self.assertEqual(pedido.detalles.get(medicamento=self.meds[5]).subtotal, 30)
+
+    def test_custom_views_do_not_duplicate_details(self):
+        resp = self.client.post('/api/pedidos/crear/', self._datos(self.meds[:2]), format='json')
+        self.assertEqual(resp.status_code, 201, resp.content)
+        pedido = Pedido.objects.get(pk=resp.json()['id'])
+        self.assertEqual(pedido.detalles.count(), 2)
+
+        resp = self.client.put(f'/api/pedidos/actualizar/{pedido.id}/', self._datos(self.meds[2:5], cantidad=1), format='json')
+        self.assertEqual(resp.status_code, 200, resp.content)
+        self.assertEqual(sorted(pedido.detalles.values_list('medicamento_id', flat=True)), [m.id for m in self.meds[2:5]])
+        self.assertEqual(resp.json()['total'], '39.00')
+        self.assertEqual(Medicamento.objects.get(pk=self.meds[0].pk).stock_reservado, 0)
+
+        # una lista vacía no borra los detalles
+        resp = self.client.put(f'/api/pedidos/actualizar/{pedido.id}/', {'detalles_data': []}, format='json')
+        self.assertEqual(resp.status_code, 200, resp.content)
+        self.assertEqual(pedido.detalles.count(), 3)
+        self.assertEqual(resp.json()['total'], '39.00')
+        self.assertEqual(Medicamento.objects.get(pk=self.meds[2].pk).stock_reservado, 1)
+
+    def test_unknown_medicamento_writes_nothing(self):
+        datos = self._datos(self.meds[:2])
+        datos['detalles_data'].append({'medicamento_id': 999999, 'cantidad': 1})
+        resp = self.client.post('/api/pedidos/crud/', datos, format='json')
+        self.assertEqual(resp.status_code, 400)
+        self.assertIn('999999', str(resp.json()['detalles_data']))
+        self.assertFalse(Pedido.objects.exists())
@@ -1,6 +1,6 @@
 from django.urls import path, include
 from rest_framework.routers import DefaultRouter
-from .views import PedidoViewSet, CrearPedidoView, ListaPedidosView, ActualizarPedidoView
+from .views import PedidoViewSet, CrearPedidoView, ListaPedidosView, ActualizarPedidoView, ReservasStatsView
 
 router = DefaultRouter()
 router.register(r'crud', PedidoViewSet, basename='pedido')
@@ -13,4 +13,5 @@ urlpatterns = [
     path('crear/', CrearPedidoView.as_view(), name='pedido_crear'),
     path('listar/', ListaPedidosView.as_view(), name='pedido_listar'),
     path('actualizar/<int:pk>/', ActualizarPedidoView.as_view(), name='pedido_actualizar'),
+    path('reservas-stats/', ReservasStatsView.as_view(), name='pedido_reservas_stats'),
 ]
@@ -1,13 +1,19 @@
 from rest_framework import status, generics, permissions, viewsets
 from rest_framework.views import APIView
 from rest_framework.response import Response
-from .models import Pedido, DetallePedido
-from .serializers import PedidoSerializer
+from rest_framework.exceptions import ValidationError
+from .models import Pedido
+from .serializers import PedidoSerializer, PedidoResumenSerializer
+from .filters import apply_pedido_filters
+from . import reservas
+from inventario.permissions import EsEmpleadoOPermisoAdmin
+from inventario.mixins import EagerLoadingMixin
+from inventario.pagination import PageOrCursorPagination
 
 # =========================
 # 🔹 CRUD AUTOMÁTICO (ViewSet)
 # =========================
-class PedidoViewSet(viewsets.ModelViewSet):
+class PedidoViewSet(EagerLoadingMixin, viewsets.ModelViewSet):
     """
     CRUD completo para pedidos con soporte automático:
     - listar
@@ -20,10 +26,15 @@ class PedidoViewSet(viewsets.ModelViewSet):
     serializer_class = PedidoSerializer
     permission_classes = [permissions.IsAuthenticatedOrReadOnly]
 
+    def get_queryset(self):
+        # mismos filtros que /listar/ (?estado, ?cliente, ?fecha_from, ?fecha_to, ?buscar)
+        return apply_pedido_filters(super().get_queryset(), self.request.query_params)
+
     def perform_destroy(self, instance):
-        """Inactivar pedido en lugar de eliminar físicamente."""
+        """Inactivar pedido en lugar de eliminar físicamente (y liberar su stock reservado)."""
         instance.estado = "cancelado"
         instance.save()
+        reservas.liberar(instance)
 
 # =========================
 # 🔹 CREAR PEDIDO PERSONALIZADO
@@ -35,44 +46,48 @@ class CrearPedidoView(APIView):
     {
         "cliente": 1,
         "detalles_data": [
-            {"medicamento": 2, "cantidad": 3},
-            {"medicamento": 5, "cantidad": 1}
+            {"medicamento_id": 2, "cantidad": 3},
+            {"medicamento_id": 5, "cantidad": 1}
         ]
     }
     """
     permission_classes = [permissions.IsAuthenticatedOrReadOnly]
 
     def post(self, request):
-        serializer = PedidoSerializer(data=request.data)
+        # el serializer crea los detalles (una lectura de precios y un bulk_create)
+        serializer = PedidoSerializer(data=request.data, context={"request": request})
         if serializer.is_valid():
-            pedido = serializer.save()
-
-            # Crear detalles manualmente si vienen en el cuerpo
-            detalles_data = request.data.get("detalles_data", [])
-            for d in detalles_data:
-                DetallePedido.objects.create(
-                    pedido=pedido,
-                    medicamento_id=d.get("medicamento"),
-                    cantidad=d.get("cantidad", 1)
-                )
-
-            return Response(PedidoSerializer(pedido).data, status=status.HTTP_201_CREATED)
+            serializer.save()
+            return Response(serializer.data, status=status.HTTP_201_CREATED)
 
         return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
 
 # =========================
 # 🔹 LISTAR PEDIDOS
 # =========================
-class ListaPedidosView(APIView):
+class ListaPedidosView(EagerLoadingMixin, generics.ListAPIView):
     """
-    Lista todos los pedidos con sus detalles.
+    Lista paginada de pedidos, más recientes primero.
+    Filtros: ?estado=, ?cliente=, ?fecha_from=, ?fecha_to= (AAAA-MM-DD o ISO), ?buscar=
+    Cada detalle trae solo id y nombre del medicamento; ?expand=medicamento
+    devuelve el medicamento completo. ?paginacion=cursor para recorrer el historial.
     """
     permission_classes = [permissions.IsAuthenticatedOrReadOnly]
+    queryset = Pedido.objects.all()
+    pagination_class = PageOrCursorPagination
+    keyset_field = "fecha_creacion"
+    expandibles = {"medicamento"}
 
-    def get(self, request):
-        pedidos = Pedido.objects.all().order_by("-fecha_creacion")
-        serializer = PedidoSerializer(pedidos, many=True)
-        return Response(serializer.data, status=status.HTTP_200_OK)
+    def get_serializer_class(self):
+        expand = {e for e in self.request.query_params.get("expand", "").split(",") if e}
+        desconocidos = expand - self.expandibles
+        if desconocidos:
+            raise ValidationError({"expand": f"Valores no admitidos: {sorted(desconocidos)}"})
+        return PedidoSerializer if expand else PedidoResumenSerializer
+
+    def get_queryset(self):
+        qs = super().get_queryset().order_by("-fecha_creacion", "-id")
+        return apply_pedido_filters(qs, self.request.query_params)
 
 # =========================
 # 🔹 ACTUALIZAR PEDIDO + DETALLES
@@ -88,22 +103,22 @@ class ActualizarPedidoView(APIView):
             pedido = Pedido.objects.get(pk=pk)
         except Pedido.DoesNotExist:
             return Response({"error": "Pedido no encontrado"}, status=status.HTTP_404_NOT_FOUND)
-
-        serializer = PedidoSerializer(pedido, data=request.data, partial=True)
+        # con "detalles_data" no vacío el serializer reemplaza los detalles
+        # con "detalles_data" (aunque venga vacío) el serializer reemplaza los detalles
+        serializer = PedidoSerializer(pedido, data=request.data, partial=True, context={"request": request})
         if serializer.is_valid():
-            pedido = serializer.save()
+            serializer.save()
+            return Response(serializer.data, status=status.HTTP_200_OK)
 
-            # Si hay detalles, se reemplazan
-            detalles_data = request.data.get("detalles_data", None)
-            if detalles_data is not None:
-                pedido.detalles.all().delete() # type: ignore
-                for d in detalles_data:
-                    DetallePedido.objects.create(
-                        pedido=pedido,
-                        medicamento_id=d.get("medicamento"),
-                        cantidad=d.get("cantidad", 1)
-                    )
+        return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
 
-            return Response(PedidoSerializer(pedido).data, status=status.HTTP_200_OK)
 
-        return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+# =========================
+# 🔹 ESTADO DE LAS RESERVAS DE STOCK
+# =========================
+class ReservasStatsView(APIView):
+    """Reservas activas, vencidas sin barrer y contadores de reservas/liberaciones."""
+    permission_classes = [EsEmpleadoOPermisoAdmin]
+
+    def get(self, request):
+        return Response(reservas.info(), status=status.HTTP_200_OK)
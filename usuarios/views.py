@@ -1,6 +1,5 @@
 # usuarios/views.py
 import uuid
-from django.core.mail import send_mail
 from django.conf import settings
 from django.contrib.auth import authenticate
 from rest_framework import status, viewsets, permissions
@@ -10,6 +9,7 @@ from rest_framework.decorators import api_view, permission_classes
 from rest_framework_simplejwt.tokens import RefreshToken
 from .models import Usuario, Rol
 from .serializer import UsuarioSerializer, RolSerializer
+from mensajes import cola_correo
 
 
 # =========================
@@ -164,15 +164,18 @@ def solicitar_recuperacion(request):
     Droguería MIMS 💊
     """
 
-    send_mail(
-        subject=asunto,
-        message=mensaje,
-        from_email=settings.EMAIL_HOST_USER,
-        recipient_list=[email],
-        fail_silently=False,
+    # se envía desde la cola (manage.py enviar_correos): la respuesta no espera al servidor SMTP
+    correo = cola_correo.encolar(
+        asunto=asunto,
+        cuerpo=mensaje,
+        destinatarios=[email],
+        remitente=settings.EMAIL_HOST_USER,
     )
 
-    return Response({"mensaje": "Correo de recuperación enviado correctamente."}, status=200)
+    return Response(
+        {"mensaje": "Correo de recuperación en camino.", "correo_id": correo.id},
+        status=status.HTTP_202_ACCEPTED,
+    )
 
 
 @api_view(["POST"])